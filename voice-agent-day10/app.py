@@ -1,28 +1,117 @@
 # app.py
 from flask import Flask, render_template, request, jsonify
-import os
 import uuid
-import json
 from datetime import datetime
+import atexit
+import os
+import sys
+from session_archive import SessionArchive, valid_id
+from scoring import Scorer, Leaderboard
+from scenarios import ScenarioService
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# the shared metrics and tracing modules live next to the day folders
+sys.path.insert(0, os.path.join(os.path.dirname(BASE_DIR), "voice-agent-metrics"))
+sys.path.insert(0, os.path.join(os.path.dirname(BASE_DIR), "voice-agent-tracing"))
+from metrics import instrument
+from tracing import trace_turns
 
 app = Flask(__name__)
-SAVED_DIR = "saved_sessions"
-if not os.path.exists(SAVED_DIR):
-    os.makedirs(SAVED_DIR)
+metrics = instrument(app, "day10")
+trace_turns(app, "day10")
+SAVED_DIR = os.path.join(BASE_DIR, "saved_sessions")
+archive = SessionArchive()
+# sessions saved as one json file each before the archive existed
+archive.import_directory(SAVED_DIR)
+# round scores cached by content hash, and the leaderboard built from them
+scorer = Scorer(os.path.join(archive.path, "scores.sqlite3"))
+leaderboard = Leaderboard()
+leaderboard.rebuild(archive, scorer)
+# scenario pool, and which scenarios each player has had
+scenarios = ScenarioService(os.path.join(archive.path, "scenarios.sqlite3"))
+atexit.register(scenarios.close)
 
 # simple endpoint to save session
 @app.route("/save_session", methods=["POST"])
 def save_session():
-    data = request.json
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"ok": False, "error": "expected a json object"}), 400
     sid = data.get("session_id") or str(uuid.uuid4())
-    filename = f"{SAVED_DIR}/{sid}.json"
-    with open(filename, "w", encoding="utf-8") as f:
-        json.dump({
+    if not valid_id(sid):
+        return jsonify({"ok": False, "error": "invalid session_id"}), 400
+    rounds = data.get("rounds") or []
+    if not isinstance(rounds, list) or not all(
+            isinstance(r, dict) and all(isinstance(r.get(field) or "", str) for field in ("transcript", "scenario"))
+            for r in rounds):
+        return jsonify({"ok": False, "error": "rounds must be a list of objects with text transcript and scenario"}), 400
+    # unchanged is true when the session matched what was already saved
+    with metrics.phase("disk"):
+        written = archive.save({
             "saved_at": datetime.utcnow().isoformat()+"z",
             "session_id": sid,
             "data": data
-        }, f, ensure_ascii=False, indent=2)
-    return jsonify({"ok": True, "session_id": sid, "file": filename})
+        })
+    score = scorer.score(data)
+    if written:
+        leaderboard.add(sid, str(data.get("player_name") or ""), score["score"])
+    # "file" is now the archive segment the session is stored in
+    return jsonify({"ok": True, "session_id": sid, "file": archive.location(sid), "unchanged": not written,
+                    "score": score["score"]})
+
+# list saved sessions, newest first; ?player=&min_rounds=&before=&before_id=&limit=
+@app.route("/sessions")
+def list_sessions():
+    sessions = archive.list(
+        player=request.args.get("player"),
+        min_rounds=request.args.get("min_rounds", type=int),
+        before=request.args.get("before"),
+        before_id=request.args.get("before_id"),
+        limit=request.args.get("limit", 50, type=int)
+    )
+    # pass the last saved_at and session_id back as ?before=&before_id= for the next page
+    last = sessions[-1] if sessions else {}
+    return jsonify({"sessions": sessions, "next_before": last.get("saved_at"), "next_before_id": last.get("session_id")})
+
+@app.route("/sessions/<session_id>")
+def get_session(session_id):
+    record = archive.get(session_id)
+    if record is None:
+        return jsonify({"ok": False, "error": "session not found"}), 404
+    return jsonify(record)
+
+# per-round scores for a saved session
+@app.route("/sessions/<session_id>/score")
+def session_score(session_id):
+    record = archive.get(session_id)
+    if record is None:
+        return jsonify({"ok": False, "error": "session not found"}), 404
+    return jsonify({"session_id": session_id, **scorer.score(record["data"])})
+
+# top players; ?by=best|average&limit=&min_sessions=
+@app.route("/leaderboard")
+def get_leaderboard():
+    by = request.args.get("by", "best")
+    if by not in ("best", "average"):
+        return jsonify({"ok": False, "error": "by must be best or average"}), 400
+    players = leaderboard.top(
+        limit=min(max(request.args.get("limit", 10, type=int), 1), 100),
+        by=by,
+        min_sessions=request.args.get("min_sessions", 1, type=int)
+    )
+    return jsonify({"by": by, "players": players})
+
+# a scenario the player hasn't had yet; ?player=&tag=&difficulty=1-3
+@app.route("/scenarios/next")
+def next_scenario():
+    difficulty = request.args.get("difficulty", type=int)
+    if difficulty is not None and difficulty not in (1, 2, 3):
+        return jsonify({"ok": False, "error": "difficulty must be 1, 2 or 3"}), 400
+    scenario = scenarios.next(request.args.get("player", ""), tag=request.args.get("tag") or None,
+                              difficulty=difficulty)
+    if scenario is None:
+        return jsonify({"ok": False, "error": "no scenario matches"}), 404
+    return jsonify(scenario)
 
 @app.route("/")
 def index():
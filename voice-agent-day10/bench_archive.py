@@ -0,0 +1,115 @@
+"""Session archive at 1M saved sessions.
+
+Bulk-loads SESSIONS synthetic sessions, then times fetching by id, listing
+the newest sessions, searching by player and paging deep into the list.
+"before" is the old layout, one pretty-printed JSON file per session, where
+listing or searching means globbing and parsing every file; it is measured
+on FILE_SESSIONS files.
+
+Run with: python bench_archive.py
+"""
+import glob
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from session_archive import SessionArchive
+
+SESSIONS = 1_000_000
+FILE_SESSIONS = 20_000
+BATCH = 10_000
+PLAYERS = 50_000
+LOOKUPS = 2000
+SCENARIO = "you are a waiter informing a customer that their order escaped the kitchen."
+START = datetime(2025, 1, 1)
+
+
+def make_record(n, rng):
+    rounds = [{"scenario": SCENARIO, "transcript": f"line {n} " * rng.randint(5, 30),
+               "reaction": "decent flow, but i'd love more commitment.", "tags": ["expanded", "absurdist"],
+               "tone": "neutral"} for _ in range(rng.randint(1, 5))]
+    session_id = f"s_{n:07d}"
+    saved_at = (START + timedelta(seconds=n * 7)).isoformat() + "z"
+    data = {"session_id": session_id, "player_name": f"Player {rng.randrange(PLAYERS)}",
+            "current_round": len(rounds), "max_rounds": 5, "rounds": rounds, "phase": "done"}
+    return {"saved_at": saved_at, "session_id": session_id, "data": data}
+
+
+def per_call(fn, count):
+    start = time.perf_counter()
+    for n in range(count):
+        fn(n)
+    return (time.perf_counter() - start) * 1e6 / count
+
+
+def disk_usage(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def before(path):
+    rng = random.Random(41)
+    directory = os.path.join(path, "saved_sessions")
+    os.makedirs(directory)
+    for n in range(FILE_SESSIONS):
+        record = make_record(n, rng)
+        with open(os.path.join(directory, f"{record['session_id']}.json"), "w", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False, indent=2)
+
+    def search(player):
+        found = []
+        for name in glob.glob(os.path.join(directory, "*.json")):
+            with open(name, encoding="utf-8") as f:
+                record = json.load(f)
+            if record["data"]["player_name"].lower() == player.lower():
+                found.append(record)
+        return sorted(found, key=lambda record: record["saved_at"], reverse=True)[:50]
+
+    start = time.perf_counter()
+    search("Player 7")
+    search_ms = (time.perf_counter() - start) * 1000
+    print(f"  before: {FILE_SESSIONS:,} files, {disk_usage(directory) / 2**20:.0f} MiB; "
+          f"search or list = glob + parse all: {search_ms:.0f} ms")
+
+
+def after(path):
+    archive = SessionArchive(os.path.join(path, "archive"))
+    rng = random.Random(41)
+    start = time.perf_counter()
+    for first in range(0, SESSIONS, BATCH):
+        archive.save_many([make_record(n, rng) for n in range(first, first + BATCH)])
+    load_s = time.perf_counter() - start
+    print(f"  after : {SESSIONS:,} sessions archived in {load_s:.0f} s, {disk_usage(archive.path) / 2**20:.0f} MiB")
+
+    ids = [f"s_{rng.randrange(SESSIONS):07d}" for _ in range(LOOKUPS)]
+    players = [f"Player {rng.randrange(PLAYERS)}" for _ in range(LOOKUPS)]
+    # (saved_at, session_id) of the last session on a page
+    cursors = [((START + timedelta(seconds=n * 7)).isoformat() + "z", f"s_{n:07d}")
+               for n in (rng.randrange(SESSIONS) for _ in range(LOOKUPS))]
+    assert archive.get(ids[0])["session_id"] == ids[0]
+    print(f"    get by id            : {per_call(lambda n: archive.get(ids[n]), LOOKUPS):7.1f} us")
+    print(f"    newest 50            : {per_call(lambda n: archive.list(), LOOKUPS):7.1f} us")
+    print(f"    search player        : {per_call(lambda n: archive.list(player=players[n]), LOOKUPS):7.1f} us")
+    print(f"    page at random depth : {per_call(lambda n: archive.list(before=cursors[n][0], before_id=cursors[n][1]), LOOKUPS):7.1f} us")
+    print(f"    single save          : {per_call(lambda n: archive.save(make_record(SESSIONS + n, rng)), LOOKUPS):7.1f} us")
+
+    # Paging two at a time through sessions saved at the same moment sees each once
+    tied = [dict(make_record(n, rng), saved_at="2999-01-01T00:00:00z") for n in range(2 * SESSIONS, 2 * SESSIONS + 5)]
+    archive.save_many(tied)
+    seen, page = [], archive.list(limit=2)
+    while page and page[0]["saved_at"] == tied[0]["saved_at"]:
+        seen += [session["session_id"] for session in page if session["saved_at"] == tied[0]["saved_at"]]
+        page = archive.list(before=page[-1]["saved_at"], before_id=page[-1]["session_id"], limit=2)
+    assert sorted(seen) == sorted(record["session_id"] for record in tied), seen
+
+
+def main():
+    with tempfile.TemporaryDirectory() as path:
+        before(path)
+        after(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""Concurrent save_session throughput.
+
+PLAYERS simulated clients each play ROUNDS rounds and save after every
+round, and save again with nothing changed RESAVES times (the page
+re-saving on reconnect or retry). Three write paths are timed with 1, 8
+and 32 threads:
+
+  before       the old handler: open <sid>.json with "w" and json.dump into
+               it (no fsync, not atomic, concurrent saves interleave)
+  file+rename  one file per session done safely: serialize in memory, write
+               a temp file, fsync, os.replace, with a lock per id
+  archive      SessionArchive.save(): group-committed appends with one fsync
+               per batch, unchanged saves skipped by content hash
+
+Then checks that the archive holds each session's last save, that unchanged
+saves were skipped, that bad ids are refused, and that a torn append at the
+end of a segment is harmless. Exits non-zero if a check fails.
+
+Run with: python bench_save_session.py
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from session_archive import SessionArchive
+
+PLAYERS = 200
+ROUNDS = 5
+RESAVES = 1
+THREADS = (1, 8, 32)
+SCENARIO = "you are a barista who has to explain to a customer that the coffee machine has become sentient."
+
+
+def workload(seed=42):
+    """Save requests as (session_id, data), interleaved across players the way they'd arrive"""
+    rng = random.Random(seed)
+    streams = []
+    for player in range(PLAYERS):
+        session = {"session_id": f"s_{player:05d}", "player_name": f"Player {player}", "current_round": 0,
+                   "max_rounds": ROUNDS, "rounds": [], "phase": "intro"}
+        saves = []
+        for n in range(ROUNDS):
+            session["rounds"].append({"scenario": SCENARIO, "transcript": f"take {n} " * rng.randint(20, 80),
+                                      "reaction": "that was bold.", "tags": ["absurdist"], "tone": "positive"})
+            session["current_round"] = n + 1
+            session["phase"] = "done" if n + 1 == ROUNDS else "awaiting_improv"
+            for _ in range(1 + RESAVES):
+                saves.append((session["session_id"], json.loads(json.dumps(session))))
+        streams.append(saves)
+    saves = []
+    while streams:
+        stream = rng.choice(streams)
+        saves.append(stream.pop(0))
+        if not stream:
+            streams.remove(stream)
+    return saves
+
+
+def record(sid, data):
+    return {"saved_at": time.strftime("%Y-%m-%dT%H:%M:%S") + "z", "session_id": sid, "data": data}
+
+
+def old_save(directory):
+    def save(sid, data):
+        with open(os.path.join(directory, f"{sid}.json"), "w", encoding="utf-8") as f:
+            json.dump(record(sid, data), f, ensure_ascii=False, indent=2)
+    return save
+
+
+def file_rename_save(directory):
+    locks = defaultdict(threading.Lock)
+    locks_lock = threading.Lock()
+
+    def save(sid, data):
+        body = json.dumps(record(sid, data), ensure_ascii=False).encode()
+        with locks_lock:
+            lock = locks[sid]
+        with lock:
+            path = os.path.join(directory, f"{sid}.json")
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(body)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+    return save
+
+
+def archive_save(archive):
+    return lambda sid, data: archive.save(record(sid, data))
+
+
+def run(save, saves, threads):
+    """saves/sec; each player's saves stay in order on one worker, as from one browser tab"""
+    by_player = defaultdict(list)
+    for sid, data in saves:
+        by_player[sid].append(data)
+
+    def play(sid):
+        for data in by_player[sid]:
+            save(sid, data)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(play, by_player))
+    return len(saves) / (time.perf_counter() - start)
+
+
+def main(path):
+    saves = workload()
+    failures = []
+
+    def check(ok, message):
+        if not ok:
+            failures.append(message)
+
+    print(f"{PLAYERS} players x {ROUNDS} rounds, each saved {1 + RESAVES}x: {len(saves)} saves")
+    print(f"  {'threads':>8} {'before':>12} {'file+rename':>12} {'archive':>12}   (saves/s)")
+    last = None
+    for threads in THREADS:
+        rates = []
+        for name, make in (("before", lambda d: old_save(d)), ("rename", lambda d: file_rename_save(d))):
+            directory = os.path.join(path, f"{name}-{threads}")
+            os.makedirs(directory)
+            rates.append(run(make(directory), saves, threads))
+        archive = SessionArchive(os.path.join(path, f"archive-{threads}"))
+        rates.append(run(archive_save(archive), saves, threads))
+        print(f"  {threads:>8} " + " ".join(f"{rate:>12,.0f}" for rate in rates))
+        last = archive
+
+    expected = {}
+    for sid, data in saves:
+        expected[sid] = data
+    check(all(last.get(sid)["data"] == data for sid, data in expected.items()),
+          "archive doesn't hold each session's last save")
+    sid, data = saves[-1]
+    check(last.save(record(sid, data)) is False, "unchanged save was written")
+    reordered = dict(reversed(list(data.items())))
+    check(last.save(record(sid, reordered)) is False, "same data with keys reordered was written")
+    check(last.save(record(sid, dict(data, phase="changed"))) is True, "changed save was skipped")
+    for bad in ("../etc/passwd", "a/b", "", "x" * 65, None):
+        try:
+            last.save(record(bad, data))
+            check(False, f"invalid id {bad!r} accepted")
+        except ValueError:
+            pass
+
+    # A crash mid-append leaves a partial body the index never points to
+    segment = last._segment_path(last._segment)
+    with open(segment, "ab") as f:
+        f.write(b"\x78\x9c torn")
+    reopened = SessionArchive(last.path)
+    check(all(reopened.get(s)["data"]["session_id"] == s for s in expected), "torn tail broke reads")
+    check(reopened.save(record("s_new", dict(data, session_id="s_new"))) is True, "save after torn tail failed")
+    check(reopened.get("s_new")["data"]["session_id"] == "s_new", "save after torn tail not readable")
+
+    for failure in failures:
+        print(f"  FAIL {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as path:
+        status = main(path)
+    sys.exit(status)
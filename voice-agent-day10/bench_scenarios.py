@@ -0,0 +1,112 @@
+"""/scenarios/next with 1M players and a 100k scenario pool.
+
+Fills the pool (timed), gives PLAYERS players a few rounds' history each
+plus HEAVY players thousands (so their seen sets are bitmaps), then times
+next() for random players with and without tag/difficulty filters and
+reports percentiles; p99 must stay under 1 ms. Also checks a player never
+gets a repeat, filters are respected, a player who has had every match
+starts over, and seen sets survive a restart. Exits non-zero if a check
+fails.
+
+Run with: python bench_scenarios.py
+"""
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+from scenarios import ScenarioService
+
+PLAYERS = 1_000_000
+HEAVY = 1000
+HEAVY_ROUNDS = 5000
+LOOKUPS = 20_000
+POOL = 100_000
+
+
+def rss_mib():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return {p: samples[min(len(samples) - 1, int(len(samples) * p / 100))] for p in (50, 99, 99.9)}
+
+
+def main(path):
+    failures = []
+
+    def check(ok, message):
+        if not ok:
+            failures.append(message)
+
+    start = time.perf_counter()
+    service = ScenarioService(os.path.join(path, "scenarios.sqlite3"), target=POOL, flush_interval=0.05)
+    initial = len(service)
+    while len(service) < POOL:
+        time.sleep(0.01)
+    fill_s = time.perf_counter() - start
+    print(f"pool: {initial:,} scenarios at start, {len(service):,} after background refill ({fill_s:.1f} s)")
+
+    rng = random.Random(44)
+    rss = rss_mib()
+    start = time.perf_counter()
+    for player in range(PLAYERS):
+        for _ in range(1 + player % 5):
+            service.next(f"player {player}", rng=rng)
+    load_s = time.perf_counter() - start
+    for player in range(HEAVY):
+        for _ in range(HEAVY_ROUNDS):
+            service.next(f"heavy {player}", rng=rng)
+    print(f"{PLAYERS:,} players with 1-5 rounds + {HEAVY:,} with {HEAVY_ROUNDS:,}: "
+          f"{PLAYERS * 3 / load_s:,.0f} next()/s while loading, +{rss_mib() - rss:.0f} MiB")
+
+    tags = service.tag_names()
+    filters = [(None, None), (None, 2), ("sports", None), ("horror", 3)]
+    for label, make_player in (("light players", lambda: f"player {rng.randrange(PLAYERS)}"),
+                               ("heavy players", lambda: f"heavy {rng.randrange(HEAVY)}")):
+        for tag, difficulty in filters:
+            samples = []
+            for _ in range(LOOKUPS):
+                player = make_player()
+                t0 = time.perf_counter()
+                service.next(player, tag=tag, difficulty=difficulty, rng=rng)
+                samples.append((time.perf_counter() - t0) * 1e6)
+            p = percentiles(samples)
+            check(p[99] < 1000, f"{label} tag={tag} difficulty={difficulty}: p99 {p[99]:.0f} us")
+            print(f"  {label:14s} tag={str(tag):8s} difficulty={str(difficulty):4s} "
+                  f"p50 {p[50]:6.1f} us  p99 {p[99]:6.1f} us  p99.9 {p[99.9]:6.1f} us")
+
+    got = [service.next("checker", rng=rng)["id"] for _ in range(20_000)]
+    check(len(set(got)) == len(got), "a player got a repeat")
+    for tag in tags[:4]:
+        for difficulty in (1, 2, 3):
+            scenario = service.next("checker", tag=tag, difficulty=difficulty, rng=rng)
+            if scenario:
+                check(tag in scenario["tags"] and scenario["difficulty"] == difficulty, f"filter {tag}/{difficulty}")
+    # Few scenarios match; the player runs through them all then starts over
+    rare = min(((tag, difficulty) for tag in tags for difficulty in (1, 2, 3)),
+               key=lambda key: len(service._candidates.get(key, ())))
+    matches = len(service._candidates[rare])
+    run = [service.next("completionist", tag=rare[0], difficulty=rare[1], rng=rng)["id"] for _ in range(matches + 1)]
+    check(len(set(run[:matches])) == matches, "repeat before every match was had")
+
+    app_player = "player 12345"
+    seen = service.seen_count(app_player)
+    service.close()
+    reopened = ScenarioService(os.path.join(path, "scenarios.sqlite3"), target=POOL)
+    check(reopened.seen_count(app_player) == seen, "seen set lost on restart")
+    check(reopened.seen_count("checker") >= 20_000, "bitmap seen set lost on restart")
+    reopened.close()
+
+    for failure in failures:
+        print(f"  FAIL {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as path:
+        status = main(path)
+    sys.exit(status)
@@ -0,0 +1,147 @@
+"""Scoring 100k archived sessions, and the leaderboard built from them.
+
+Archives SESSIONS synthetic sessions (rounds with timings, fillers and
+scenario words), then times Leaderboard.rebuild(): cold with one process
+(on SERIAL_SESSIONS sessions), cold with the process pool, and again with
+every score cached. Then times leaderboard reads and incremental updates,
+and checks the pooled scores match in-process ones and the leaderboard
+matches a from-scratch recompute. Exits non-zero if a check fails.
+
+Run with: python bench_scoring.py
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from scoring import Leaderboard, Scorer, score_session
+from session_archive import SessionArchive
+
+SESSIONS = 100_000
+SERIAL_SESSIONS = 10_000
+BATCH = 10_000
+PLAYERS = 20_000
+READS = 2000
+SCENARIOS = [
+    "you are a barista who has to tell a customer that their latte is actually a portal to another dimension.",
+    "you are a time-travelling tour guide explaining smartphones to someone from the 1800s.",
+    "you are a waiter informing a customer that their order escaped the kitchen.",
+    "you are returning a cursed object to a skeptical shop owner.",
+    "you are a spaceship captain negotiating parking rules with an asteroid.",
+]
+VOCABULARY = ("the a i so and then portal latte kitchen order customer smartphone asteroid parking cursed "
+              "shop owner dimension honestly wait what look listen sir madam please never always maybe "
+              "absolutely ridiculous escape captain tour guide plants").split()
+FILLERS = ["um", "uh", "like", "you know", "basically"]
+START = datetime(2025, 1, 1)
+
+
+def make_record(n, rng):
+    rounds = []
+    for _ in range(rng.randint(1, 5)):
+        words = [rng.choice(VOCABULARY) if rng.random() > 0.08 else rng.choice(FILLERS)
+                 for _ in range(rng.randint(8, 150))]
+        rounds.append({"scenario": rng.choice(SCENARIOS), "transcript": " ".join(words),
+                       "reaction": "that was bold.", "tags": ["expanded"], "tone": "supportive",
+                       "duration_ms": int(len(words) * rng.uniform(250, 900)),
+                       "latency_ms": rng.randint(300, 9000)})
+    data = {"session_id": f"s_{n:07d}", "player_name": f"Player {rng.randrange(PLAYERS)}",
+            "current_round": len(rounds), "max_rounds": 5, "rounds": rounds, "phase": "done"}
+    return {"saved_at": (START + timedelta(seconds=n * 7)).isoformat() + "z", "session_id": data["session_id"],
+            "data": data}
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main(path):
+    failures = []
+
+    def check(ok, message):
+        if not ok:
+            failures.append(message)
+
+    archive = SessionArchive(os.path.join(path, "archive"), fsync=False)
+    rng = random.Random(43)
+    records = {}
+    for first in range(0, SESSIONS, BATCH):
+        batch = [make_record(n, rng) for n in range(first, first + BATCH)]
+        archive.save_many(batch)
+        records.update((record["session_id"], record) for record in batch[:50])
+    print(f"{SESSIONS:,} archived sessions, {PLAYERS:,} players ({os.cpu_count()} CPUs)")
+
+    small = SessionArchive(os.path.join(path, "small"), fsync=False)
+    small.save_many([archive.get(f"s_{n:07d}") for n in range(SERIAL_SESSIONS)])
+    _, serial_s = timed(lambda: Leaderboard().rebuild(small, Scorer(workers=1)))
+    print(f"  cold, 1 process   : {SERIAL_SESSIONS / serial_s:9,.0f} sessions/s ({SERIAL_SESSIONS:,} sessions)")
+
+    scorer = Scorer(os.path.join(path, "scores.sqlite3"))
+    leaderboard = Leaderboard()
+    _, pool_s = timed(lambda: leaderboard.rebuild(archive, scorer))
+    print(f"  cold, pool        : {SESSIONS / pool_s:9,.0f} sessions/s ({pool_s:.1f} s for {SESSIONS:,})")
+    warm = Leaderboard()
+    _, warm_s = timed(lambda: warm.rebuild(archive, scorer))
+    print(f"  cached (restart)  : {SESSIONS / warm_s:9,.0f} sessions/s ({warm_s:.1f} s)")
+    check(warm.top(50) == leaderboard.top(50), "cached rebuild differs from cold")
+
+    for session_id, record in records.items():
+        check(scorer.score(record["data"]) == score_session(record["data"]),
+              f"cached score for {session_id} differs from in-process")
+
+    # From-scratch leaderboard, by player name (scores come from the cache)
+    rows = list(archive.hashes())
+    scores = scorer.score_many([archive.get(session_id)["data"] for session_id, _, _ in rows],
+                               [digest for _, _, digest in rows])
+    best, totals = defaultdict(float), defaultdict(list)
+    for (_, player_name, _), result in zip(rows, scores):
+        totals[player_name].append(result["score"])
+        best[player_name] = max(best[player_name], result["score"])
+    expected = sorted(best, key=lambda name: (best[name], sum(totals[name]) / len(totals[name])), reverse=True)[:10]
+    check([p["player_name"] for p in leaderboard.top(10)] == expected, "top 10 by best differs from recompute")
+
+    # Ranking after a save, then repeat reads until the next one
+    ids = list(records)
+    start = time.perf_counter()
+    for n in range(200):
+        leaderboard.add(ids[n % len(ids)], records[ids[n % len(ids)]]["data"]["player_name"], 50.0 + n % 7)
+        leaderboard.top(10)
+    ranked_us = (time.perf_counter() - start) * 1e6 / 200
+    start = time.perf_counter()
+    for _ in range(READS):
+        leaderboard.top(10)
+    top_us = (time.perf_counter() - start) * 1e6 / READS
+    start = time.perf_counter()
+    for n in range(200):
+        leaderboard.add(ids[n % len(ids)], records[ids[n % len(ids)]]["data"]["player_name"], 50.0 + n % 7)
+        leaderboard.top(10, by="average", min_sessions=3)
+    average_us = (time.perf_counter() - start) * 1e6 / 200
+
+    # A re-saved session replaces its score rather than adding another
+    session_id, record = next(iter(records.items()))
+    player = record["data"]["player_name"]
+    before = next(p for p in leaderboard.top(PLAYERS) if p["player_name"] == player)
+    start = time.perf_counter()
+    for n in range(READS):
+        leaderboard.add(session_id, player, 100.0 if n % 2 else 0.0)
+    add_us = (time.perf_counter() - start) * 1e6 / READS
+    after = next(p for p in leaderboard.top(PLAYERS) if p["player_name"] == player)
+    check(after["sessions"] == before["sessions"] and after["best"] == 100.0, "re-saved session counted twice")
+
+    print(f"  top 10 by best    : {ranked_us:9.0f} us after a save, {top_us:.1f} us until the next")
+    print(f"  top 10 by average : {average_us:9.0f} us after a save")
+    print(f"  add() (re-save)   : {add_us:9.1f} us")
+    for failure in failures:
+        print(f"  FAIL {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as path:
+        status = main(path)
+    sys.exit(status)
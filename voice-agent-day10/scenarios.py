@@ -0,0 +1,376 @@
+"""Improv scenarios, served so a player doesn't get the same one twice.
+
+Scenarios are composed as "you are <role> <goal>[, <complication>]." Each
+part carries tags, and goals and complications add difficulty (1 easy to 3
+hard). Scenario ids index a fixed permutation of every combination (after
+the hand-written classics, ids 0-5), so an id means the same scenario
+across restarts and pool sizes. The pool starts with POOL_INITIAL
+scenarios and a background thread extends it to POOL_TARGET, and beyond
+whenever a player has used up most of what matches their filters.
+
+What each player has seen is kept as a sorted array of ids while that is
+smaller than a bitmap over the pool, and as a bitmap once it isn't, so a
+player who has played a handful of rounds costs a few ids rather than a
+12 KiB bitmap.
+next() samples a random candidate and re-draws if it was seen; only a
+player who has seen nearly everything falls back to scanning. Seen sets are
+written behind to SQLite by the same background thread.
+"""
+import bisect
+import os
+import random
+import sqlite3
+import threading
+from array import array
+
+POOL_INITIAL = 20_000
+POOL_TARGET = int(os.getenv("SCENARIO_POOL", "100000"))
+REFILL_BATCH = 10_000
+# Re-draws before next() scans the candidates for an unseen one
+DRAWS = 16
+# A player who has seen this share of their candidates triggers a refill
+LOW_WATER = 0.75
+FLUSH_INTERVAL = 5.0
+
+CLASSICS = [
+    ("you are a barista who has to tell a customer that their latte is actually a portal to another dimension.",
+     ("workplace", "food", "fantasy")),
+    ("you are a time-travelling tour guide explaining smartphones to someone from the 1800s.",
+     ("historical", "tech", "travel")),
+    ("you are a waiter informing a customer that their order escaped the kitchen.", ("workplace", "food", "absurdist")),
+    ("you are returning a cursed object to a skeptical shop owner.", ("fantasy", "horror")),
+    ("you are a spaceship captain negotiating parking rules with an asteroid.", ("sci-fi", "absurdist")),
+    ("you are a proud parent bragging about your child's ability to talk to plants.", ("family", "absurdist")),
+]
+
+ROLES = [
+    ("a barista", ("workplace", "food")), ("a night-shift security guard", ("workplace", "crime")),
+    ("a substitute teacher", ("school",)), ("a wedding planner", ("romance", "workplace")),
+    ("a spaceship captain", ("sci-fi",)), ("a medieval blacksmith", ("historical",)),
+    ("a retired superhero", ("fantasy",)), ("a nervous magician", ("fantasy", "music")),
+    ("a museum tour guide", ("historical", "travel")), ("a detective with no sense of direction", ("crime",)),
+    ("a pirate who gets seasick", ("historical", "travel")), ("a royal food taster", ("historical", "food")),
+    ("a lighthouse keeper", ("travel",)), ("a customer service robot", ("tech", "sci-fi")),
+    ("a professional dog walker", ("animals",)), ("a ghost who is bad at haunting", ("horror", "fantasy")),
+    ("a game show host", ("workplace", "music")), ("a football coach", ("sports",)),
+    ("a yoga instructor", ("sports",)), ("a dentist", ("workplace",)),
+    ("a vampire accountant", ("horror", "workplace")), ("a wizard's apprentice", ("fantasy", "school")),
+    ("a zookeeper", ("animals", "workplace")), ("an overly honest estate agent", ("workplace",)),
+    ("a flight attendant", ("travel", "workplace")), ("a struggling opera singer", ("music",)),
+    ("a grandparent", ("family",)), ("a teenager", ("family", "school")),
+    ("a time traveller from the year 3000", ("sci-fi", "historical")), ("a cowboy", ("historical",)),
+    ("a librarian", ("school", "workplace")), ("a chef on a cooking show", ("food", "workplace")),
+    ("a park ranger", ("animals", "travel")), ("a startup founder", ("tech", "workplace")),
+    ("a marathon runner", ("sports",)), ("an alien tourist", ("sci-fi", "travel")),
+    ("a knight", ("historical", "fantasy")), ("a hotel concierge", ("travel", "workplace")),
+    ("a fortune teller", ("fantasy",)), ("a roller-derby referee", ("sports",)),
+    ("a taxi driver", ("travel", "workplace")), ("a mad scientist", ("sci-fi", "horror")),
+    ("a lifeguard", ("sports", "workplace")), ("a ballet dancer", ("music", "sports")),
+    ("a farmer", ("animals", "food")), ("a king who has just been dethroned", ("historical",)),
+    ("a mime who has finally decided to talk", ("absurdist",)), ("a crossing guard", ("school",)),
+    ("a submarine cook", ("food", "travel")), ("a talk-radio host", ("music", "workplace")),
+]
+
+# (goal, tags, extra difficulty)
+GOALS = [
+    ("telling a customer their order has escaped", ("absurdist", "food"), 0),
+    ("explaining smartphones to someone from the 1800s", ("tech", "historical"), 0),
+    ("asking your neighbour to return a borrowed volcano", ("absurdist",), 0),
+    ("returning a cursed object to a skeptical shop owner", ("fantasy", "horror"), 0),
+    ("negotiating parking rules with an asteroid", ("sci-fi", "absurdist"), 1),
+    ("bragging about your child's ability to talk to plants", ("family",), 0),
+    ("interviewing for a job you are clearly not qualified for", ("workplace",), 0),
+    ("breaking up with someone over a misunderstanding about soup", ("romance", "food"), 1),
+    ("convincing a cat to sign a lease", ("animals", "absurdist"), 1),
+    ("apologising to a tree you accidentally insulted", ("absurdist",), 0),
+    ("teaching a dragon table manners", ("fantasy",), 1),
+    ("selling a haunted house to a very excited family", ("horror", "family"), 0),
+    ("explaining to the police why you are wearing a wedding dress in a pool", ("crime", "romance"), 1),
+    ("giving a pep talk to a team that has never won a game", ("sports",), 0),
+    ("announcing that the office party has been replaced by a tax seminar", ("workplace",), 0),
+    ("returning from a holiday that lasted forty years", ("travel",), 1),
+    ("hosting a dinner party where every dish is invisible", ("food", "absurdist"), 1),
+    ("confessing that you have been the school mascot all along", ("school",), 0),
+    ("explaining why the spaceship is now a submarine", ("sci-fi",), 1),
+    ("reviewing a restaurant that only serves ice", ("food",), 0),
+    ("persuading a ghost to move out politely", ("horror",), 0),
+    ("training a robot to understand sarcasm", ("tech",), 1),
+    ("calming down a crowd after the fireworks went sideways", ("absurdist",), 0),
+    ("proposing marriage in the middle of a fire drill", ("romance",), 1),
+    ("teaching grandma to use a video call", ("family", "tech"), 0),
+    ("leading a museum tour when all the exhibits have gone missing", ("crime", "historical"), 1),
+    ("judging a talent show where every act is a sneeze", ("music", "absurdist"), 1),
+    ("solving a murder where the only witness is a parrot", ("crime", "animals"), 1),
+    ("explaining a board game with three hundred rules", ("family",), 1),
+    ("pitching an app that tells you when it is raining outside", ("tech", "workplace"), 0),
+    ("welcoming aliens to a small-town bake sale", ("sci-fi", "food"), 0),
+    ("recording a nature documentary about a very boring pigeon", ("animals",), 0),
+    ("defending your thesis on why socks go missing", ("school", "absurdist"), 1),
+    ("complaining to a genie about a badly granted wish", ("fantasy",), 0),
+    ("hosting a cooking show when the oven is sentient", ("food", "sci-fi"), 1),
+    ("giving a eulogy for a houseplant", ("family",), 0),
+    ("negotiating a peace treaty between two rival bakeries", ("food", "historical"), 1),
+    ("auditioning for a musical with a song about taxes", ("music",), 0),
+    ("describing your dream to a sleep scientist who keeps falling asleep", ("absurdist",), 1),
+    ("coaching a snail for the olympics", ("sports", "animals"), 0),
+    ("checking in a guest who insists they are royalty", ("travel", "historical"), 0),
+    ("reporting live from a sandcastle-building championship", ("sports",), 0),
+    ("explaining to a knight what a vending machine is", ("historical", "tech"), 0),
+    ("talking a friend out of adopting forty goats", ("animals", "family"), 0),
+    ("running a support group for retired villains", ("fantasy", "crime"), 1),
+    ("returning a library book that is eighty years overdue", ("school", "historical"), 0),
+    ("breaking the news that the wedding cake has been eaten by a bear", ("romance", "animals"), 1),
+    ("pitching a horror movie to a studio that only makes cartoons", ("horror", "workplace"), 1),
+    ("trying to return a time machine without a receipt", ("sci-fi", "workplace"), 0),
+    ("hosting a séance to contact a very rude ancestor", ("horror", "family"), 1),
+]
+
+# (complication, tags, extra difficulty)
+COMPLICATIONS = [
+    ("but you can only speak in questions", ("absurdist",), 2),
+    ("while slowly realising you are the villain", ("crime",), 1),
+    ("but everyone else in the room is a cat", ("animals", "absurdist"), 1),
+    ("while hiding a sneeze that will not come", (), 1),
+    ("but you are terrified of the colour blue", (), 1),
+    ("while your ex keeps walking past", ("romance",), 1),
+    ("in the middle of an earthquake", (), 1),
+    ("while wearing shoes that are far too small", (), 1),
+    ("but you have just won the lottery and can't say so", (), 1),
+    ("while someone is timing you with an egg timer", (), 1),
+    ("but you must rhyme every sentence", ("music",), 2),
+    ("while you are being live-streamed to a million people", ("tech",), 1),
+    ("but you have forgotten your own name", (), 1),
+    ("while narrating your own actions in the third person", (), 2),
+    ("in a whisper, because a baby is sleeping", ("family",), 1),
+    ("but every third word must be 'banana'", ("absurdist", "food"), 2),
+    ("while riding a unicycle", ("sports",), 1),
+    ("during a power cut", (), 1),
+    ("but you are secretly a spy", ("crime",), 1),
+    ("while your mother listens in", ("family",), 1),
+    ("in the style of a nature documentary", ("animals",), 1),
+    ("but you speak only in clichés", (), 2),
+    ("while a marching band passes by", ("music",), 1),
+    ("as if it were the most romantic moment of your life", ("romance",), 1),
+    ("as if it were a horror movie", ("horror",), 1),
+    ("as if you were on a cooking competition", ("food",), 1),
+    ("as if it were a sports commentary", ("sports",), 1),
+    ("while trying to keep a straight face", (), 1),
+    ("but you are an extremely slow robot", ("tech", "sci-fi"), 2),
+    ("while carrying a very large cake", ("food",), 1),
+    ("but you can't use the letter 's'", (), 2),
+    ("while the room slowly fills with balloons", ("absurdist",), 1),
+    ("but you are convinced it is the year 1700", ("historical",), 1),
+    ("while your phone keeps ringing", ("tech",), 1),
+    ("but you have the hiccups", (), 1),
+    ("in the style of a shakespearean tragedy", ("historical",), 2),
+    ("while being chased by a goose", ("animals",), 1),
+    ("but gravity keeps switching off", ("sci-fi", "absurdist"), 1),
+    ("as if you were a detective in a noir film", ("crime",), 1),
+    ("while on a rollercoaster", ("travel",), 1),
+]
+
+# Every combination, complications counting "none" (index 0)
+SPACE = len(ROLES) * len(GOALS) * (len(COMPLICATIONS) + 1)
+# Multiplier for the id -> combination permutation; coprime with SPACE
+_STRIDE = 7919
+
+
+def make_scenario(scenario_id):
+    """(text, tags, difficulty) for a scenario id"""
+    if scenario_id < len(CLASSICS):
+        text, tags = CLASSICS[scenario_id]
+        return text, tags, 1
+    combo = (scenario_id - len(CLASSICS)) * _STRIDE % SPACE
+    combo, complication = divmod(combo, len(COMPLICATIONS) + 1)
+    role, goal = divmod(combo, len(GOALS))
+    role_text, role_tags = ROLES[role]
+    goal_text, goal_tags, difficulty = GOALS[goal]
+    text = f"you are {role_text} {goal_text}"
+    tags = set(role_tags) | set(goal_tags)
+    if complication:
+        complication_text, complication_tags, extra = COMPLICATIONS[complication - 1]
+        text += f", {complication_text}"
+        tags |= set(complication_tags)
+        difficulty += extra
+    # Up to 3 points from the goal and complication: 0-1 is easy, 2 medium, 3 hard
+    return text + ".", tuple(sorted(tags)), max(1, min(difficulty, 3))
+
+
+def _has(seen, scenario_id):
+    if isinstance(seen, bytearray):
+        byte = scenario_id >> 3
+        return byte < len(seen) and seen[byte] >> (scenario_id & 7) & 1
+    position = bisect.bisect_left(seen, scenario_id)
+    return position < len(seen) and seen[position] == scenario_id
+
+
+def _add(seen, scenario_id, pool_size):
+    """Mark scenario_id seen; returns the (possibly converted) container"""
+    if isinstance(seen, array):
+        position = bisect.bisect_left(seen, scenario_id)
+        if position < len(seen) and seen[position] == scenario_id:
+            return seen
+        if (len(seen) + 1) * seen.itemsize <= pool_size // 8 + 1:
+            seen.insert(position, scenario_id)
+            return seen
+        bitmap = bytearray(pool_size // 8 + 1)
+        for existing in seen:
+            bitmap[existing >> 3] |= 1 << (existing & 7)
+        seen = bitmap
+    if scenario_id >> 3 >= len(seen):
+        seen.extend(bytes((scenario_id >> 3) - len(seen) + 1))
+    seen[scenario_id >> 3] |= 1 << (scenario_id & 7)
+    return seen
+
+
+def _count(seen):
+    if isinstance(seen, bytearray):
+        return sum(bin(byte).count("1") for byte in seen)
+    return len(seen)
+
+
+class ScenarioService:
+    def __init__(self, path=None, initial=POOL_INITIAL, target=POOL_TARGET, flush_interval=FLUSH_INTERVAL):
+        """`path` is the SQLite file seen sets are written to (None keeps them in memory only)"""
+        self.target = min(target, len(CLASSICS) + SPACE)
+        self.texts = []
+        self.tags = []
+        self.difficulty = bytearray()
+        # Candidate ids per filter: (tag or None, difficulty or None) -> array
+        self._candidates = {}
+        # player key -> sorted array('I') of ids, or bytearray bitmap
+        self._seen = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        # Set by next() when a player is running out of unseen candidates
+        self._want_more = False
+        self._closed = False
+        self.path = path
+        # Read by next() under the lock; the background thread writes through its own connection
+        self._db = None
+        if path:
+            self._db = self._connect()
+            with self._db:
+                self._db.execute("CREATE TABLE IF NOT EXISTS seen (player TEXT PRIMARY KEY, ids BLOB NOT NULL) "
+                                 "WITHOUT ROWID")
+        self._writer = None
+        self._extend(min(initial, self.target))
+        self.flush_interval = flush_interval
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def __len__(self):
+        return len(self.texts)
+
+    def _extend(self, count):
+        """Append the next `count` scenarios to the pool"""
+        start = len(self.texts)
+        count = min(count, len(CLASSICS) + SPACE - start)
+        made = [make_scenario(scenario_id) for scenario_id in range(start, start + count)]
+        groups = {}
+        for scenario_id, (_, tags, difficulty) in enumerate(made, start):
+            for key in [(None, None), (None, difficulty)] + [(tag, None) for tag in tags] + \
+                       [(tag, difficulty) for tag in tags]:
+                groups.setdefault(key, array("I")).append(scenario_id)
+        with self._lock:
+            self.texts.extend(text for text, _, _ in made)
+            self.tags.extend(tags for _, tags, _ in made)
+            self.difficulty.extend(difficulty for _, _, difficulty in made)
+            for key, ids in groups.items():
+                self._candidates.setdefault(key, array("I")).extend(ids)
+
+    def tag_names(self):
+        return sorted({tag for tag, difficulty in self._candidates if tag and difficulty is None})
+
+    def _load(self, key):
+        """The player's seen set (lock held), from SQLite if not yet in memory"""
+        seen = self._seen.get(key)
+        if seen is None:
+            row = self._db and self._db.execute("SELECT ids FROM seen WHERE player = ?", (key,)).fetchone()
+            if row:
+                ids = row[0]
+                seen = bytearray(ids[1:]) if ids[:1] == b"b" else array("I", ids[1:])
+            else:
+                seen = array("I")
+            self._seen[key] = seen
+        return seen
+
+    def next(self, player, tag=None, difficulty=None, rng=random):
+        """{'id', 'text', 'tags', 'difficulty'} for a scenario this player
+        hasn't had (matching tag and difficulty if given), or None if nothing
+        matches. A player who has had every match starts over."""
+        key = (player or "").strip().casefold()
+        with self._lock:
+            candidates = self._candidates.get((tag, difficulty))
+            if not candidates:
+                return None
+            seen = self._load(key)
+            chosen = None
+            for _ in range(DRAWS):
+                scenario_id = candidates[rng.randrange(len(candidates))]
+                if not _has(seen, scenario_id):
+                    chosen = scenario_id
+                    break
+            if chosen is None:
+                # Mostly seen: scan from a random point, and ask for more scenarios
+                start = rng.randrange(len(candidates))
+                chosen = next((candidates[n % len(candidates)] for n in range(start, start + len(candidates))
+                               if not _has(seen, candidates[n % len(candidates)])), None)
+                self._want_more = True
+                self._wake.set()
+                if chosen is None:
+                    seen = self._seen[key] = array("I")
+                    chosen = candidates[start]
+            elif isinstance(seen, array) and len(seen) > LOW_WATER * len(candidates):
+                self._want_more = True
+                self._wake.set()
+            if key:
+                self._seen[key] = _add(seen, chosen, len(self.texts))
+                self._dirty.add(key)
+            return {"id": chosen, "text": self.texts[chosen], "tags": list(self.tags[chosen]),
+                    "difficulty": self.difficulty[chosen]}
+
+    def seen_count(self, player):
+        with self._lock:
+            return _count(self._load((player or "").strip().casefold()))
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            if len(self.texts) < self.target:
+                self._extend(min(REFILL_BATCH, self.target - len(self.texts)))
+                self._wake.set()
+            elif self._want_more:
+                self._want_more = False
+                self._extend(REFILL_BATCH)
+            self.flush()
+
+    def flush(self):
+        """Write changed seen sets to SQLite"""
+        if self._db is None:
+            return
+        with self._lock:
+            rows = []
+            for key in self._dirty:
+                seen = self._seen[key]
+                rows.append((key, (b"b" if isinstance(seen, bytearray) else b"a") + bytes(seen)))
+            self._dirty.clear()
+        if rows:
+            if self._writer is None:
+                self._writer = self._connect()
+            with self._writer:
+                self._writer.executemany("INSERT OR REPLACE INTO seen VALUES (?, ?)", rows)
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+        self._thread.join()
+        self.flush()
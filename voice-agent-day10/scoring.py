@@ -0,0 +1,269 @@
+"""Scores for improv rounds, and the leaderboard built from them.
+
+Each round is scored on:
+  words per minute    spoken words over the time from first speech to
+                      "end scene" (rounds carry duration_ms)
+  filler rate         share of words that are fillers ("um", "like",
+                      "you know", ...)
+  keyword overlap     share of the scenario's content words the player used
+  vocabulary          distinct words / words
+  latency             seconds from the scene starting to the first speech
+                      (rounds carry latency_ms)
+and those are combined into a 0-100 round score. Rounds saved before
+timings were recorded have no wpm or latency; the score is then weighted
+over the other measures. A session's score is the mean of its rounds.
+
+Scores are a pure function of the session data, so Scorer caches them in
+SQLite keyed by the archive's content hash and only scores sessions it
+hasn't seen. Large batches are scored in a process pool.
+
+Leaderboard keeps per-player totals and bests that are updated as each
+session is saved (a re-saved session replaces its earlier score), so
+reading it never rescans sessions; ranking is one pass over players, and
+its result is reused until the next save.
+"""
+import heapq
+import json
+import os
+import re
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from session_archive import content_hash
+
+FILLERS = {"um", "umm", "uh", "uhh", "er", "erm", "ah", "hmm", "mm", "like", "basically", "actually", "literally"}
+FILLER_PHRASES = {("you", "know"), ("i", "mean"), ("kind", "of"), ("sort", "of")}
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "for", "from", "has", "have", "how", "in", "is", "it",
+    "its", "of", "on", "or", "that", "the", "their", "them", "they", "this", "to", "was", "who", "with", "you",
+    "your", "about", "into", "some", "someone", "what", "when", "which", "while", "can", "could", "would", "will"
+}
+# Transcripts the page records for rounds with nothing said
+NO_SPEECH = {"(skipped)", "(no audio)"}
+WEIGHTS = {"relevance": 0.3, "fluency": 0.25, "vocabulary": 0.2, "pace": 0.15, "responsiveness": 0.1}
+# Comfortable speaking pace, and where the pace score falls to zero
+PACE = (110, 170)
+PACE_LIMITS = (40, 260)
+# Latency (seconds) that still scores full marks, and that scores zero
+LATENCY = (2.0, 10.0)
+# Batches smaller than this are scored in-process; a pool isn't worth starting
+POOL_MIN = 256
+CHUNK = 256
+
+_WORD = re.compile(r"[a-z0-9']+")
+
+
+def _words(text):
+    # Anything but a string (a hand-edited or old session's field) has no words
+    return _WORD.findall(text.lower()) if isinstance(text, str) else []
+
+
+def _stem(word):
+    return word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+
+
+def _keywords(scenario):
+    return {_stem(word) for word in _words(scenario) if len(word) > 2 and word not in STOPWORDS}
+
+
+def _ramp(value, full, zero):
+    """1 at `full`, falling linearly to 0 at `zero` (either side)"""
+    if zero > full:
+        return max(0.0, min(1.0, (zero - value) / (zero - full)))
+    return max(0.0, min(1.0, (value - zero) / (full - zero)))
+
+
+def score_round(round_):
+    transcript = round_.get("transcript")
+    if not isinstance(transcript, str):
+        transcript = ""
+    words = [] if transcript.strip() in NO_SPEECH else _words(transcript)
+    result = {"words": len(words), "wpm": None, "filler_rate": None, "keyword_overlap": None,
+              "vocabulary": None, "latency_s": None, "score": 0.0}
+    if not words:
+        return result
+    fillers = sum(word in FILLERS for word in words)
+    fillers += sum(pair in FILLER_PHRASES for pair in zip(words, words[1:]))
+    keywords = _keywords(round_.get("scenario"))
+    overlap = len(keywords & {_stem(word) for word in words}) / len(keywords) if keywords else None
+    result["filler_rate"] = round(fillers / len(words), 4)
+    result["vocabulary"] = round(len(set(words)) / len(words), 4)
+    components = {"fluency": max(0.0, 1 - result["filler_rate"] * 5), "vocabulary": result["vocabulary"]}
+    if overlap is not None:
+        result["keyword_overlap"] = round(overlap, 4)
+        # Using half the scenario's keywords is full marks
+        components["relevance"] = min(1.0, overlap * 2)
+    duration = round_.get("duration_ms")
+    if isinstance(duration, (int, float)) and duration > 0:
+        result["wpm"] = round(len(words) * 60000 / duration, 1)
+        wpm = result["wpm"]
+        components["pace"] = (1.0 if PACE[0] <= wpm <= PACE[1] else
+                              _ramp(wpm, PACE[0], PACE_LIMITS[0]) if wpm < PACE[0] else
+                              _ramp(wpm, PACE[1], PACE_LIMITS[1]))
+    latency = round_.get("latency_ms")
+    if isinstance(latency, (int, float)) and latency >= 0:
+        result["latency_s"] = round(latency / 1000, 2)
+        components["responsiveness"] = _ramp(result["latency_s"], *LATENCY)
+    weight = sum(WEIGHTS[name] for name in components)
+    result["score"] = round(100 * sum(WEIGHTS[name] * value for name, value in components.items()) / weight, 1)
+    return result
+
+
+def score_session(data):
+    """{'score', 'rounds': [per-round scores]} for a session's data"""
+    rounds = [score_round(round_) for round_ in (data or {}).get("rounds") or [] if isinstance(round_, dict)]
+    score = round(sum(r["score"] for r in rounds) / len(rounds), 1) if rounds else 0.0
+    return {"score": score, "rounds": rounds}
+
+
+def _score_chunk(datas):
+    return [score_session(data) for data in datas]
+
+
+class Scorer:
+    def __init__(self, path=None, workers=None):
+        """`path` is the SQLite cache file (None keeps it in memory)"""
+        self.workers = workers or os.cpu_count() or 1
+        self._db = sqlite3.connect(path or ":memory:", check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS scores (hash BLOB PRIMARY KEY, result TEXT NOT NULL) "
+                             "WITHOUT ROWID")
+
+    def cached(self, digests):
+        """{hash: result} for those of `digests` already scored"""
+        digests = list(digests)
+        found = {}
+        with self._lock:
+            for start in range(0, len(digests), 500):
+                chunk = digests[start:start + 500]
+                marks = ",".join("?" * len(chunk))
+                rows = self._db.execute(f"SELECT hash, result FROM scores WHERE hash IN ({marks})", chunk)
+                found.update((digest, json.loads(result)) for digest, result in rows)
+        return found
+
+    def score_many(self, datas, digests=None):
+        """Scores for a list of session data, in order, from the cache where
+        possible. `digests` are their content hashes if already known."""
+        digests = list(digests) if digests is not None else [content_hash(data) for data in datas]
+        results = self.cached(digests)
+        missing = {}
+        for digest, data in zip(digests, datas):
+            if digest not in results:
+                missing.setdefault(digest, data)
+        if missing:
+            todo = list(missing.values())
+            if len(todo) < POOL_MIN or self.workers == 1:
+                scored = _score_chunk(todo)
+            else:
+                chunks = [todo[start:start + CHUNK] for start in range(0, len(todo), CHUNK)]
+                with ProcessPoolExecutor(self.workers) as pool:
+                    scored = [result for chunk in pool.map(_score_chunk, chunks) for result in chunk]
+            fresh = dict(zip(missing, scored))
+            with self._lock, self._db:
+                self._db.executemany("INSERT OR REPLACE INTO scores VALUES (?, ?)",
+                                     [(digest, json.dumps(result, separators=(",", ":")))
+                                      for digest, result in fresh.items()])
+            results.update(fresh)
+        return [results[digest] for digest in digests]
+
+    def score(self, data, digest=None):
+        return self.score_many([data], None if digest is None else [digest])[0]
+
+
+class Leaderboard:
+    def __init__(self):
+        # session_id -> (player key, score)
+        self._sessions = {}
+        # player key (name casefolded) -> {'player_name', 'sessions', 'total', 'best', 'scores': {session_id: score}}
+        self._players = {}
+        self._lock = threading.Lock()
+        # top() results until the next add(), keyed by its arguments
+        self._top = {}
+
+    def _remove(self, session_id):
+        previous = self._sessions.pop(session_id, None)
+        if previous is None:
+            return
+        key, score = previous
+        player = self._players[key]
+        del player["scores"][session_id]
+        if not player["scores"]:
+            del self._players[key]
+            return
+        player["total"] -= score
+        if score == player["best"]:
+            player["best"] = max(player["scores"].values())
+
+    def add(self, session_id, player_name, score):
+        """Record a session's score, replacing any earlier score for it.
+        Sessions without a player name don't rank."""
+        with self._lock:
+            self._top.clear()
+            self._remove(session_id)
+            key = (player_name or "").strip().casefold()
+            if not key:
+                return
+            self._sessions[session_id] = (key, score)
+            player = self._players.get(key)
+            if player is None:
+                player = self._players[key] = {"player_name": player_name.strip(), "total": 0.0, "best": score,
+                                               "scores": {}}
+            player["scores"][session_id] = score
+            player["total"] += score
+            player["best"] = max(player["best"], score)
+
+    def top(self, limit=10, by="best", min_sessions=1):
+        """[{'player_name', 'sessions', 'average', 'best'}] for the top players by 'best' or 'average'"""
+        with self._lock:
+            cached = self._top.get((limit, by, min_sessions))
+            if cached is not None:
+                return cached
+            players = [p for p in self._players.values() if len(p["scores"]) >= min_sessions]
+            if by == "average":
+                ranked = heapq.nlargest(limit, players, key=lambda p: (p["total"] / len(p["scores"]), p["best"]))
+            else:
+                ranked = heapq.nlargest(limit, players, key=lambda p: (p["best"], p["total"] / len(p["scores"])))
+            top = self._top[(limit, by, min_sessions)] = [
+                {"player_name": p["player_name"], "sessions": len(p["scores"]),
+                 "average": round(p["total"] / len(p["scores"]), 1), "best": p["best"]} for p in ranked]
+            return top
+
+    def __len__(self):
+        return len(self._players)
+
+    def rebuild(self, archive, scorer, batch=20000):
+        """Load every archived session's score; only sessions the scorer
+        hasn't cached are read from the archive and scored"""
+        rows = list(archive.hashes())
+        for start in range(0, len(rows), batch):
+            chunk = rows[start:start + batch]
+            results = scorer.cached(digest for _, _, digest in chunk if digest is not None)
+            # Sessions archived before hashes were kept are hashed here
+            digests = {session_id: digest for session_id, _, digest in chunk}
+            missing = [session_id for session_id, digest in digests.items() if digest not in results]
+            if missing:
+                datas = [archive.get(session_id)["data"] for session_id in missing]
+                for session_id, data in zip(missing, datas):
+                    digests[session_id] = digests[session_id] or content_hash(data)
+                try:
+                    fresh = scorer.score_many(datas, [digests[session_id] for session_id in missing])
+                except Exception:
+                    # One unscorable session mustn't stop the server starting:
+                    # score them one at a time and leave out those that fail
+                    fresh = []
+                    for session_id, data in zip(missing, datas):
+                        try:
+                            fresh.append(scorer.score(data, digests[session_id]))
+                        except Exception as e:
+                            print(f"not ranking session {session_id}: {e!r}")
+                            fresh.append(None)
+                results.update((digests[session_id], result) for session_id, result in zip(missing, fresh)
+                               if result is not None)
+            for session_id, player_name, _ in chunk:
+                result = results.get(digests[session_id])
+                if result is not None:
+                    self.add(session_id, player_name, result["score"])
+        return len(rows)
@@ -0,0 +1,291 @@
+"""Archive of saved improv sessions.
+
+Session bodies are zlib-compressed JSON appended to packed segment files
+(a new segment is started every SEGMENT_SIZE bytes). A SQLite index maps
+session_id to the body's segment, offset and length, and also holds
+player_name, saved_at and round count, with B-tree indexes so fetching a
+session, listing recent ones and searching by player are O(log n) however
+many sessions are stored. Saving a session again appends a new body and
+repoints its index row. One process writes the archive; any number of
+threads may read it.
+
+Writes are crash-safe without rewriting anything: a body is appended and
+fsynced before the index row pointing at it is committed, so the index only
+ever refers to complete bodies (a torn append is just unreferenced bytes at
+the end of a segment). Concurrent save() calls are group-committed: whichever
+caller finds no commit in progress takes everything queued and commits it
+with one fsync and one transaction, in arrival order, so saves of the same
+id land in the order they were made. Each row keeps a BLAKE2b hash of the
+session data, and a save whose data hasn't changed since the last one is
+skipped, since clients re-save after every round.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import zlib
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "session_archive"))
+SEGMENT_SIZE = 64 * 1024 * 1024
+# fsync segments before committing the index (turn off only for throwaway data)
+ARCHIVE_FSYNC = os.getenv("ARCHIVE_FSYNC", "1") != "0"
+SESSION_ID = re.compile(r"[A-Za-z0-9_-]{1,64}")
+# Most sessions one list/search call returns
+MAX_LIST = 200
+
+_COLUMNS = "session_id, player_name, saved_at, rounds"
+
+
+def valid_id(session_id):
+    return isinstance(session_id, str) and SESSION_ID.fullmatch(session_id) is not None
+
+
+def _canonical(data):
+    # Sorted keys, so the same session always serializes (and hashes) the
+    # same whatever order the client sent its fields in
+    return json.dumps(data or {}, separators=(",", ":"), ensure_ascii=False, sort_keys=True)
+
+
+def content_hash(data):
+    """The hash stored for session data, e.g. to key caches derived from it"""
+    return hashlib.blake2b(_canonical(data).encode(), digest_size=16).digest()
+
+
+def _encode(record):
+    """(compressed body, hash of the session data) for a saved-session record;
+    the data is serialized once for both"""
+    data = _canonical(record.get("data"))
+    digest = hashlib.blake2b(data.encode(), digest_size=16).digest()
+    body = (f'{{"saved_at":{json.dumps(record["saved_at"])},"session_id":{json.dumps(record["session_id"])},'
+            f'"data":{data}}}')
+    return zlib.compress(body.encode(), 6), digest
+
+
+class SessionArchive:
+    def __init__(self, path=ARCHIVE_DIR, segment_size=SEGMENT_SIZE, fsync=ARCHIVE_FSYNC):
+        self.path = path
+        self.segment_size = segment_size
+        self.fsync = fsync
+        os.makedirs(os.path.join(path, "segments"), exist_ok=True)
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        # save() calls waiting for a group commit, and whether one is running
+        self._cond = threading.Condition()
+        self._pending = []
+        self._committing = False
+        self._readers = {}
+        self._readers_lock = threading.Lock()
+        db = self._db()
+        with db:
+            db.execute("CREATE TABLE IF NOT EXISTS sessions ("
+                       "session_id TEXT PRIMARY KEY, player_name TEXT NOT NULL, saved_at TEXT NOT NULL, "
+                       "rounds INTEGER NOT NULL, segment INTEGER NOT NULL, offset INTEGER NOT NULL, "
+                       "length INTEGER NOT NULL) WITHOUT ROWID")
+            db.execute("CREATE INDEX IF NOT EXISTS sessions_saved_at ON sessions (saved_at)")
+            db.execute("CREATE INDEX IF NOT EXISTS sessions_player ON sessions (player_name COLLATE NOCASE, saved_at)")
+            # Archives created before content hashes were kept
+            if "hash" not in [column[1] for column in db.execute("PRAGMA table_info(sessions)")]:
+                db.execute("ALTER TABLE sessions ADD COLUMN hash BLOB")
+        row = db.execute("SELECT MAX(segment) FROM sessions").fetchone()
+        self._segment = row[0] or 1
+        self._writer = None
+
+    def _db(self):
+        """Per-thread connection to the index"""
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(os.path.join(self.path, "index.sqlite3"), timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            # FULL syncs the WAL on each commit, so an acknowledged save survives power loss
+            db.execute(f"PRAGMA synchronous={'FULL' if self.fsync else 'NORMAL'}")
+        return db
+
+    def _segment_path(self, segment):
+        return os.path.join(self.path, "segments", f"seg-{segment:06d}.dat")
+
+    def _append(self, blob):
+        """Append a body to the current segment (write lock held); returns (segment, offset)"""
+        if self._writer is None:
+            self._writer = open(self._segment_path(self._segment), "ab")
+        offset = self._writer.tell()
+        if offset and offset + len(blob) > self.segment_size:
+            self._sync()
+            self._writer.close()
+            self._segment += 1
+            self._writer = open(self._segment_path(self._segment), "ab")
+            offset = 0
+        self._writer.write(blob)
+        return self._segment, offset
+
+    def _sync(self):
+        self._writer.flush()
+        if self.fsync:
+            os.fsync(self._writer.fileno())
+
+    @staticmethod
+    def _row(record):
+        data = record.get("data") or {}
+        return (record["session_id"], str(data.get("player_name") or ""), record["saved_at"],
+                len(data.get("rounds") or []))
+
+    def _commit(self, records):
+        """Write records in order, skipping any whose data is unchanged; returns
+        a list of True (written) / False (unchanged), one per record"""
+        written, rows, latest = [], [], {}
+        with self._write_lock:
+            db = self._db()
+            for record in records:
+                session_id = record["session_id"]
+                if not valid_id(session_id):
+                    raise ValueError(f"invalid session_id {session_id!r}")
+                blob, digest = _encode(record)
+                if session_id not in latest:
+                    row = db.execute("SELECT hash FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+                    latest[session_id] = row and row[0]
+                if latest[session_id] == digest:
+                    written.append(False)
+                    continue
+                latest[session_id] = digest
+                segment, offset = self._append(blob)
+                rows.append(self._row(record) + (segment, offset, len(blob), digest))
+                written.append(True)
+            if rows:
+                # Bodies must be on disk before the index points at them
+                self._sync()
+                with db:
+                    db.executemany("INSERT OR REPLACE INTO sessions (session_id, player_name, saved_at, rounds, "
+                                   "segment, offset, length, hash) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        return written
+
+    def save_many(self, records):
+        """Store saved-session records ({'session_id', 'saved_at', 'data'}) in
+        one transaction; returns how many were written (unchanged ones aren't).
+        Raises ValueError, writing nothing, if any session_id is invalid."""
+        if not records:
+            return 0
+        return sum(self._commit(records))
+
+    def save(self, record):
+        """Store one record durably; returns False if its data was unchanged.
+
+        The caller is queued, and waits while another caller commits the
+        queue, so concurrent saves share fsyncs.
+        """
+        if not valid_id(record.get("session_id")):
+            raise ValueError(f"invalid session_id {record.get('session_id')!r}")
+        entry = {"record": record, "done": False}
+        with self._cond:
+            self._pending.append(entry)
+            while not entry["done"]:
+                if self._committing:
+                    self._cond.wait()
+                    continue
+                batch, self._pending = self._pending, []
+                self._committing = True
+                self._cond.release()
+                try:
+                    results = self._commit([queued["record"] for queued in batch])
+                except BaseException as error:
+                    results = [error] * len(batch)
+                finally:
+                    self._cond.acquire()
+                    self._committing = False
+                    for queued, result in zip(batch, results):
+                        queued["result"], queued["done"] = result, True
+                    self._cond.notify_all()
+        if isinstance(entry["result"], Exception):
+            raise entry["result"]
+        return entry["result"]
+
+    def _read(self, segment, offset, length):
+        with self._readers_lock:
+            fd = self._readers.get(segment)
+            if fd is None:
+                fd = self._readers[segment] = os.open(self._segment_path(segment), os.O_RDONLY)
+        return os.pread(fd, length, offset)
+
+    def get(self, session_id):
+        """The saved-session record, or None"""
+        row = self._db().execute("SELECT segment, offset, length FROM sessions WHERE session_id = ?",
+                                 (session_id,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(zlib.decompress(self._read(*row)))
+
+    def location(self, session_id):
+        """The segment file holding the session's latest body, or None"""
+        row = self._db().execute("SELECT segment FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return None if row is None else self._segment_path(row[0])
+
+    def list(self, player=None, min_rounds=None, before=None, before_id=None, limit=50):
+        """Session summaries, newest first (ties on saved_at by session_id,
+        descending).
+
+        `player` matches the name case-insensitively; `before` and
+        `before_id` are the saved_at and session_id of the last session on
+        the previous page (keyset pagination, so deep pages cost the same as
+        the first). Without `before_id`, sessions saved at exactly `before`
+        are skipped.
+        """
+        where, params = [], []
+        if player:
+            where.append("player_name = ? COLLATE NOCASE")
+            params.append(player)
+        if before and before_id:
+            # The indexes end in the primary key, so this is still one range scan
+            where.append("(saved_at, session_id) < (?, ?)")
+            params += [before, before_id]
+        elif before:
+            where.append("saved_at < ?")
+            params.append(before)
+        if min_rounds:
+            where.append("rounds >= ?")
+            params.append(min_rounds)
+        sql = f"SELECT {_COLUMNS} FROM sessions"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY saved_at DESC, session_id DESC LIMIT ?"
+        params.append(min(max(limit, 1), MAX_LIST))
+        rows = self._db().execute(sql, params).fetchall()
+        return [dict(zip(("session_id", "player_name", "saved_at", "rounds"), row)) for row in rows]
+
+    def hashes(self):
+        """(session_id, player_name, content hash) for every session; the hash
+        is None for sessions archived before hashes were kept"""
+        yield from self._db().execute("SELECT session_id, player_name, hash FROM sessions")
+
+    def count(self):
+        return self._db().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def import_directory(self, directory):
+        """Archive every <session_id>.json left by the old one-file-per-session saves; returns how many"""
+        if not os.path.isdir(directory):
+            return 0
+        db = self._db()
+
+        def archived(session_id):
+            return db.execute("SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)).fetchone() is not None
+
+        records = []
+        for name in sorted(os.listdir(directory)):
+            # Files are named after their session, so ones imported on an earlier start aren't read again
+            if not name.endswith(".json") or archived(name[:-len(".json")]):
+                continue
+            # A save cut short by a crash leaves a truncated file; skip it and import the rest
+            try:
+                with open(os.path.join(directory, name), encoding="utf-8") as f:
+                    record = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"not importing {name}: {e}")
+                continue
+            if not isinstance(record, dict) or not isinstance(record.get("saved_at"), str):
+                print(f"not importing {name}: not a saved session")
+                continue
+            records.append(record)
+        records = [record for record in records if valid_id(record.get("session_id"))
+                   and not archived(record["session_id"])]
+        if records:
+            self.save_many(records)
+        return len(records)
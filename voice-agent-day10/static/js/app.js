@@ -142,6 +142,7 @@ function setupSpeech() {
   recognition.maxAlternatives = 1;
 
   recognition.onresult = (e) => {
+    if (session.phase === "awaiting_improv" && firstSpeechAt === null) firstSpeechAt = Date.now();
     interimTranscript = "";
     for (let i = e.resultIndex; i < e.results.length; i++) {
       const res = e.results[i];
@@ -303,14 +304,28 @@ function hostSay(text) {
 /* ---------- round system ---------- */
 
 let currentScenario = "";
+// when the scene was shown and the player first spoke (ms), for the server's wpm + latency scores
+let sceneStartedAt = null;
+let firstSpeechAt = null;
 
-function pickScenario() {
+function pickLocalScenario() {
   const used = session.rounds.map(r=>r.scenario);
   const remaining = SCENARIOS.filter(s=>!used.includes(s));
   return remaining.length ? pickRandom(remaining) : pickRandom(SCENARIOS);
 }
 
-function startRound() {
+// ask the server for one this player hasn't had; fall back to the built-in list if it can't answer
+async function pickScenario() {
+  try {
+    const res = await fetch("scenarios/next?player=" + encodeURIComponent(session.player_name || session.session_id));
+    if (res.ok) return (await res.json()).text;
+  } catch (e) {
+    console.warn("scenario fetch failed", e);
+  }
+  return pickLocalScenario();
+}
+
+async function startRound() {
   session.phase = "awaiting_improv";
   session.current_round++;
 
@@ -319,8 +334,10 @@ function startRound() {
     return;
   }
 
-  currentScenario = pickScenario();
+  currentScenario = await pickScenario();
+  firstSpeechAt = null;
   scenarioArea.textContent = `round ${session.current_round}: ${currentScenario}`;
+  sceneStartedAt = Date.now();
 
   finalTranscript = "";
   interimTranscript = "";
@@ -336,14 +353,19 @@ function onEndScene() {
 
   const userText = finalTranscript.trim() || "(no audio)";
   const analysis = analyze(userText);
-
-  recordRound({
+  const round = {
     scenario: currentScenario,
     transcript: userText,
     reaction: analysis.text,
     tags: analysis.tags,
     tone: analysis.tone
-  });
+  };
+  if (firstSpeechAt !== null) {
+    round.duration_ms = Date.now() - firstSpeechAt;
+    round.latency_ms = firstSpeechAt - sceneStartedAt;
+  }
+
+  recordRound(round);
 
   renderScoreboard();
   // speak reaction after a small delay for natural pacing
@@ -475,7 +497,7 @@ function summary() {
 
 async function saveSession() {
   try {
-    const res = await fetch("/save_session", {
+    const res = await fetch("save_session", {
       method:"POST",
       headers:{"content-type":"application/json"},
       body: JSON.stringify({...session, summary: summary()})
@@ -483,7 +505,7 @@ async function saveSession() {
     const j = await res.json();
     if (j.ok) {
       sessionIdSpan.textContent = "saved: " + j.session_id;
-      alert("session saved.");
+      alert(`session saved. score: ${j.score}/100`);
     } else {
       alert("save failed");
     }
@@ -1,26 +1,28 @@
 from flask import Flask, request, jsonify, render_template, send_from_directory
-import json
 import os
+import sys
 from datetime import datetime
 from flask_cors import CORS
 
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# The shared document store, metrics and tracing live next to the day folders
+sys.path.insert(0, os.path.join(os.path.dirname(BASE_DIR), "voice-agent-docstore"))
+sys.path.insert(0, os.path.join(os.path.dirname(BASE_DIR), "voice-agent-metrics"))
+sys.path.insert(0, os.path.join(os.path.dirname(BASE_DIR), "voice-agent-tracing"))
+from docstore import DocumentStore
+from metrics import instrument
+from tracing import trace_turns
+
 app = Flask(__name__, static_folder="static", template_folder="templates")
+metrics = instrument(app, "day3")
+trace_turns(app, "day3")
 CORS(app)
 
-DATA_FILE = "wellness_log.json"
-
-def read_logs():
-    if not os.path.exists(DATA_FILE):
-        return []
-    with open(DATA_FILE, "r", encoding="utf-8") as f:
-        try:
-            return json.load(f)
-        except:
-            return []
-
-def write_logs(logs):
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(logs, f, indent=2)
+# Imported once into the store, then left as it is
+DATA_FILE = os.path.join(BASE_DIR, "wellness_log.json")
+STORE_DIR = os.getenv("DOCSTORE_DIR", os.path.join(BASE_DIR, "store"))
+store = DocumentStore(STORE_DIR)
+checkins = store.collection("checkins", legacy_file=DATA_FILE)
 
 @app.route("/")
 def index():
@@ -28,9 +30,8 @@ def index():
 
 @app.route("/api/history", methods=["GET"])
 def history():
-    logs = read_logs()
-    last = logs[-1] if logs else None
-    return jsonify({"last": last, "count": len(logs)})
+    last = checkins.find(limit=1, reverse=True)
+    return jsonify({"last": last[0] if last else None, "count": len(checkins)})
 
 @app.route("/api/checkin", methods=["POST"])
 def checkin():
@@ -43,14 +44,13 @@ def checkin():
         "objectives": data.get("objectives", []),
         "summary": data.get("summary", "")
     }
-    logs = read_logs()
-    logs.append(entry)
-    write_logs(logs)
+    with metrics.phase("disk"):
+        entry = checkins.get(checkins.put(entry))
     return jsonify({"ok": True, "entry": entry})
 
 @app.route("/static/<path:path>")
 def static_files(path):
-    return send_from_directory("static", path)
+    return send_from_directory(app.static_folder, path)
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000)
@@ -16,7 +16,7 @@ let ttsSpeaking = false
 
 
 async function fetchLast(){
-  const r = await fetch("/api/history")
+  const r = await fetch("api/history")
   const j = await r.json()
   last = j.last
   lastEntryEl.textContent = last ? JSON.stringify(last,null,2) : "no previous check-in"
@@ -234,7 +234,7 @@ function finalizeAndSend(){
     summary: session.summary
   }
 
-  fetch("/api/checkin",{
+  fetch("api/checkin",{
     method:"POST",
     headers:{"content-type":"application/json"},
     body:JSON.stringify(payload)
@@ -273,7 +273,7 @@ stopBtn.addEventListener("click", ()=>{
 })
 
 downloadBtn.addEventListener("click", async ()=>{
-  const r = await fetch("/api/history")
+  const r = await fetch("api/history")
   const j = await r.json()
   const blob = new Blob([JSON.stringify(j,null,2)],{type:"application/json"})
   const a = document.createElement("a")
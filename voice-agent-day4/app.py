@@ -1,11 +1,23 @@
 from flask import Flask, request, jsonify, render_template, send_from_directory
 from flask_cors import CORS
-import json, os, re
+import json, os, re, sys
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# The shared metrics, tracing and speculation modules live next to the day folders
+sys.path.insert(0, os.path.join(os.path.dirname(BASE_DIR), "voice-agent-metrics"))
+sys.path.insert(0, os.path.join(os.path.dirname(BASE_DIR), "voice-agent-tracing"))
+sys.path.insert(0, os.path.join(os.path.dirname(BASE_DIR), "voice-agent-speculation"))
+from metrics import instrument
+from tracing import trace_turns
+from speculation import speculate
 
 app = Flask(__name__, template_folder="templates", static_folder="static")
+metrics = instrument(app, "day4")
+trace_turns(app, "day4")
 CORS(app)
 
-DATA_PATH = os.path.join("shared-data", "day4_tutor_content.json")
+SHARED_DIR = os.path.join(BASE_DIR, "shared-data")
+DATA_PATH = os.path.join(SHARED_DIR, "day4_tutor_content.json")
 with open(DATA_PATH, "r", encoding="utf-8") as f:
     CONTENT = json.load(f)
 
@@ -43,7 +55,7 @@ def index():
 
 @app.route("/shared-data/<path:p>")
 def shared(p):
-    return send_from_directory("shared-data", p)
+    return send_from_directory(SHARED_DIR, p)
 
 @app.route("/api/mode", methods=["POST"])
 def api_mode():
@@ -74,9 +86,9 @@ def api_mode():
 
     return jsonify({"ok": True, "text": text, "voice": voice, "concept": c})
 
-@app.route("/api/respond", methods=["POST"])
-def api_respond():
-    body = request.json or {}
+def score_answer(body):
+    """Feedback on a quiz or teach-back answer, with the URL of it spoken
+    (changes nothing, so it can be worked out from an interim transcript)"""
     mode = body.get("mode")
     cid = body.get("concept_id")
     user_text = (body.get("user_text") or "")
@@ -84,50 +96,58 @@ def api_respond():
 
     summary = c["summary"]
 
-    if mode == "quiz":
-        keys = keywords_from_summary(summary)
-        toks = tokenize(user_text)
-        matches = sum(k in toks for k in keys)
-        score = min(100, int((matches / (len(keys) or 1)) * 100))
+    with metrics.phase("intent"):
+        if mode == "quiz":
+            keys = keywords_from_summary(summary)
+            toks = tokenize(user_text)
+            matches = sum(k in toks for k in keys)
+            score = min(100, int((matches / (len(keys) or 1)) * 100))
+
+            if score >= 60: fb = "good answer — important points covered."
+            elif score >= 30: fb = "partial answer — try adding more details."
+            else: fb = "not quite — focus on the main idea."
 
-        if score >= 60: fb = "good answer — important points covered."
-        elif score >= 30: fb = "partial answer — try adding more details."
-        else: fb = "not quite — focus on the main idea."
+            return {"ok": True, "feedback": fb, "score": score, "voice": "alicia", "tts_url": tts_url(fb, "alicia")}
 
-        return jsonify({"ok": True, "feedback": fb, "score": score, "voice": "alicia"})
+        if mode == "teach_back":
+            keys = keywords_from_summary(summary)
+            toks = tokenize(user_text)
+            kw = sum(k in toks for k in keys) / (len(keys) or 1)
+            jac = jaccard(keys, toks)
+            length = min(1, len(user_text.split())/25)
+            score = int((0.5*kw + 0.3*jac + 0.2*length)*100)
 
-    if mode == "teach_back":
-        keys = keywords_from_summary(summary)
-        toks = tokenize(user_text)
-        kw = sum(k in toks for k in keys) / (len(keys) or 1)
-        jac = jaccard(keys, toks)
-        length = min(1, len(user_text.split())/25)
-        score = int((0.5*kw + 0.3*jac + 0.2*length)*100)
+            if score >= 75: fb = "great explanation! clear and complete."
+            elif score >= 45: fb = "decent explanation — add a bit more detail."
+            else: fb = "try again — focus more on key ideas."
 
-        if score >= 75: fb = "great explanation! clear and complete."
-        elif score >= 45: fb = "decent explanation — add a bit more detail."
-        else: fb = "try again — focus more on key ideas."
+            return {"ok": True, "feedback": fb, "score": score, "voice": "ken", "tts_url": tts_url(fb, "ken")}
 
-        return jsonify({"ok": True, "feedback": fb, "score": score, "voice": "ken"})
+    return {"ok": False}
 
-    return jsonify({"ok": False}), 400
+speculator = speculate(app, "day4", lambda body: (score_answer(body), None), "user_text")
+
+@app.route("/api/respond", methods=["POST"])
+def api_respond():
+    result = speculator.answer(request.json or {})
+    return jsonify(result), 200 if result["ok"] else 400
 
 from urllib.parse import quote
 
+TTS_DEMO = "https://murf-ai-tts-demoserver.onrender.com/api/voice"
+
+def tts_url(text, voice):
+    encoded_text = quote(text)
+    encoded_voice = quote(voice)
+    return f"{TTS_DEMO}?text={encoded_text}&voice={encoded_voice}"
+
 @app.route("/api/tts", methods=["POST"])
 def api_tts():
     body = request.json or {}
     text = body.get("text", "")
     voice = body.get("voice", "matthew")
 
-    DEMO = "https://murf-ai-tts-demoserver.onrender.com/api/voice"
-
-    encoded_text = quote(text)
-    encoded_voice = quote(voice)
-
-    url = f"{DEMO}?text={encoded_text}&voice={encoded_voice}"
-
-    return jsonify({"ok": True, "url": url})
+    return jsonify({"ok": True, "url": tts_url(text, voice)})
 
 
 
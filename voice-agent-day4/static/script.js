@@ -16,6 +16,9 @@ let currentMode = null
 let listening = false
 let speaking = false
 let speechLock = false
+// answer being worked out from interim transcripts, and audio fetched for replies
+let utterance = null
+const prefetchedAudio = new Map()
 
 // UI
 function setHtmlMode(mode){
@@ -30,21 +33,34 @@ function setHtmlMode(mode){
 // ---------------------------
 // TTS FIXED + VOICE SWITCHING
 // ---------------------------
-async function playTTS(text, voice = "matthew") {
+function prefetchTTS(url) {
+  if (!url || prefetchedAudio.has(url)) return;
+  const audio = new Audio(url);
+  audio.preload = "auto";
+  prefetchedAudio.set(url, audio);
+}
+
+async function playTTS(text, voice = "matthew", turn = null, url = null) {
   try {
-    const res = await fetch("/api/tts", {
-      method: "POST",
-      headers: { "content-type": "application/json" },
-      body: JSON.stringify({ text, voice })
-    });
-
-    const j = await res.json();
-    if (!j.ok || !j.url) {
-      console.log("TTS failed:", j);
-      return;
+    if (!url) {
+      const res = await (turn ? turn.fetch : fetch)("api/tts", {
+        method: "POST",
+        headers: { "content-type": "application/json" },
+        body: JSON.stringify({ text, voice })
+      });
+
+      const j = await res.json();
+      if (!j.ok || !j.url) {
+        console.log("TTS failed:", j);
+        return;
+      }
+      url = j.url;
     }
 
-    const audio = new Audio(j.url);
+    // fetched already if it was the speculated reply
+    const audio = prefetchedAudio.get(url) || new Audio(url);
+    audio.currentTime = 0;
+    if (turn) turn.play(audio);
     await audio.play();
 
   } catch (err) {
@@ -61,6 +77,7 @@ async function playTTS(text, voice = "matthew") {
       u.pitch = 0.9;
     }
 
+    if (turn) turn.speak(u);
     window.speechSynthesis.speak(u);
   }
 }
@@ -81,7 +98,7 @@ function createRecognition(){
   const r = new R()
   r.lang = "en-US"
   r.continuous = true
-  r.interimResults = false
+  r.interimResults = true
   return r
 }
 
@@ -100,9 +117,19 @@ async function startListening(){
   recognition.onresult = async ev => {
     if(speaking) return
 
-    const txt = ev.results[ev.results.length-1][0].transcript.trim()
+    const result = ev.results[ev.results.length-1]
+    const txt = result[0].transcript.trim()
     transcript.textContent = txt
 
+    if(!result.isFinal){
+      // work the answer out (and fetch its audio) while they are still talking
+      if(txt && (currentMode === "quiz" || currentMode === "teach_back")){
+        if(!utterance) utterance = voiceSpeculation.utterance(reply => prefetchTTS(reply.tts_url))
+        utterance.interim({ mode:currentMode, concept_id:conceptSelect.value, user_text:txt })
+      }
+      return
+    }
+
     if(currentMode === null){
       const pick = fuzzyModeFromText(txt)
       if(pick){
@@ -147,6 +174,7 @@ async function startListening(){
   try{
     recognition.start()
     listening=true
+    voiceTrace.listening()
   }catch(e){
     listening=false
   }
@@ -162,27 +190,37 @@ function stopListening(){
 
 // quiz
 async function handleQuiz(txt){
-  const r = await fetch("/api/respond", {
+  const turn = voiceTrace.turn()
+  let body = { mode:"quiz", concept_id:conceptSelect.value, user_text:txt }
+  if(utterance) body = utterance.final(body)
+  utterance = null
+  const r = await turn.fetch("api/respond", {
     method:"POST",
     headers:{ "content-type":"application/json" },
-    body:JSON.stringify({ mode:"quiz", concept_id:conceptSelect.value, user_text:txt })
+    body:JSON.stringify(body)
   })
   const j = await r.json()
   feedbackBox.textContent = `score: ${j.score}\n\n${j.feedback}`
-  await playTTS(j.feedback, "alicia")
+  await playTTS(j.feedback, "alicia", turn, j.tts_url)
+  turn.finish()
   startListening()
 }
 
 // teach
 async function handleTeach(txt){
-  const r = await fetch("/api/respond", {
+  const turn = voiceTrace.turn()
+  let body = { mode:"teach_back", concept_id:conceptSelect.value, user_text:txt }
+  if(utterance) body = utterance.final(body)
+  utterance = null
+  const r = await turn.fetch("api/respond", {
     method:"POST",
     headers:{ "content-type":"application/json" },
-    body:JSON.stringify({ mode:"teach_back", concept_id:conceptSelect.value, user_text:txt })
+    body:JSON.stringify(body)
   })
   const j = await r.json()
   feedbackBox.textContent = `score: ${j.score}\n\n${j.feedback}`
-  await playTTS(j.feedback, "ken")
+  await playTTS(j.feedback, "ken", turn, j.tts_url)
+  turn.finish()
   startListening()
 }
 
@@ -195,7 +233,7 @@ async function setMode(mode){
   feedbackBox.textContent = "No feedback yet"
   assistant.textContent = "..."
 
-  const r = await fetch("/api/mode", {
+  const r = await fetch("api/mode", {
     method:"POST",
     headers:{ "content-type":"application/json" },
     body:JSON.stringify({ mode, concept_id:conceptSelect.value })
@@ -214,7 +252,7 @@ async function setMode(mode){
 
 // render concept
 function renderConcept(){
-  fetch("/shared-data/day4_tutor_content.json")
+  fetch("shared-data/day4_tutor_content.json")
   .then(r=>r.json())
   .then(arr=>{
     const c = arr.find(x=>x.id===conceptSelect.value) || arr[0]
@@ -227,7 +265,7 @@ function renderConcept(){
 // GREETING — FIXED AUTOPLAY
 // ---------------------------
 async function _greetNow(){
-  const r = await fetch("/api/mode",{
+  const r = await fetch("api/mode",{
     method:"POST",
     headers:{ "content-type":"application/json" },
     body:JSON.stringify({ mode:"greet" })
@@ -254,7 +292,7 @@ stopMic.onclick = ()=> stopListening()
 conceptSelect.onchange = ()=> renderConcept()
 
 // initial load
-fetch("/shared-data/day4_tutor_content.json")
+fetch("shared-data/day4_tutor_content.json")
 .then(r=>r.json())
 .then(arr=>{
   conceptSelect.innerHTML=""
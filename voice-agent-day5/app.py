@@ -2,32 +2,41 @@ from flask import Flask, request, jsonify, send_from_directory
 from flask_cors import CORS
 import json
 import os
+import sys
 from datetime import datetime
 import requests
 
+# File paths
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# The shared document store, metrics, tracing and speculation live next to the day folders
+sys.path.insert(0, os.path.join(os.path.dirname(BASE_DIR), 'voice-agent-docstore'))
+sys.path.insert(0, os.path.join(os.path.dirname(BASE_DIR), 'voice-agent-metrics'))
+sys.path.insert(0, os.path.join(os.path.dirname(BASE_DIR), 'voice-agent-tracing'))
+sys.path.insert(0, os.path.join(os.path.dirname(BASE_DIR), 'voice-agent-speculation'))
+from docstore import DocumentStore
+from metrics import instrument
+from tracing import trace_turns
+from speculation import speculate
+
 app = Flask(__name__, static_folder='static')
+metrics = instrument(app, 'day5')
+trace_turns(app, 'day5')
 CORS(app)
 
-# File paths
-FAQ_FILE = 'faq.json'
-LEAD_FILE = 'lead_data.json'
-MEETING_SLOTS_FILE = 'meeting_slots.json'
-MEETING_FILE = 'meeting.json'
-
-# Initialize files if they don't exist
-def init_files():
-    if not os.path.exists(LEAD_FILE):
-        with open(LEAD_FILE, 'w') as f:
-            json.dump([], f)
-    if not os.path.exists(MEETING_FILE):
-        with open(MEETING_FILE, 'w') as f:
-            json.dump([], f)
-
-init_files()
+FAQ_FILE = os.path.join(BASE_DIR, 'faq.json')
+MEETING_SLOTS_FILE = os.path.join(BASE_DIR, 'meeting_slots.json')
+# Old whole-file stores, imported once into the document store
+LEAD_FILE = os.path.join(BASE_DIR, 'lead_data.json')
+MEETING_FILE = os.path.join(BASE_DIR, 'meeting.json')
+STORE_DIR = os.getenv('DOCSTORE_DIR', os.path.join(BASE_DIR, 'store'))
+
+store = DocumentStore(STORE_DIR)
+leads = store.collection('leads', legacy_file=LEAD_FILE)
+meetings = store.collection('meetings', legacy_file=MEETING_FILE)
 
 @app.route('/')
 def index():
-    return send_from_directory('static', 'index.html')
+    return send_from_directory(app.static_folder, 'index.html')
 
 @app.route('/api/faq', methods=['GET'])
 def get_faq():
@@ -39,49 +48,55 @@ def get_faq():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/query', methods=['POST'])
-def query_faq():
-    """Answer questions using FAQ"""
-    data = request.json
+def answer_query(data):
+    """Answer a question using the FAQ (changes nothing, so it can be
+    worked out from an interim transcript)"""
     query = data.get('query', '').lower()
-    
-    try:
+
+    with metrics.phase('intent'):
         with open(FAQ_FILE, 'r') as f:
             faq = json.load(f)
-        
+
         # Simple keyword matching
         if any(word in query for word in ['what', 'do', 'does', 'about', 'razorpay']):
-            return jsonify({'answer': faq['company']['description']})
-        
+            return {'answer': faq['company']['description']}
+
         if any(word in query for word in ['feature', 'features', 'capability', 'capabilities']):
             features = ', '.join(faq['features'])
-            return jsonify({'answer': f"Our key features include: {features}"})
-        
+            return {'answer': f"Our key features include: {features}"}
+
         if any(word in query for word in ['price', 'pricing', 'cost', 'charge']):
-            return jsonify({'answer': faq['pricing']['description']})
-        
+            return {'answer': faq['pricing']['description']}
+
         if any(word in query for word in ['who', 'for whom', 'target', 'customers']):
             target = ', '.join(faq['target_audience'])
-            return jsonify({'answer': f"Razorpay is perfect for: {target}"})
-        
+            return {'answer': f"Razorpay is perfect for: {target}"}
+
         if any(word in query for word in ['free', 'trial', 'demo']):
             for q in faq['common_faqs']:
                 if 'trial' in q['question'].lower():
-                    return jsonify({'answer': q['answer']})
-        
+                    return {'answer': q['answer']}
+
         if any(word in query for word in ['integrate', 'integration', 'setup']):
             for q in faq['common_faqs']:
                 if 'integrate' in q['question'].lower():
-                    return jsonify({'answer': q['answer']})
-        
+                    return {'answer': q['answer']}
+
         if any(word in query for word in ['support', 'help', 'customer']):
             for q in faq['common_faqs']:
                 if 'support' in q['question'].lower():
-                    return jsonify({'answer': q['answer']})
-        
+                    return {'answer': q['answer']}
+
         # Default response
-        return jsonify({'answer': "I can help you with information about what Razorpay does, our features, pricing, who we serve, and common questions. What would you like to know?"})
-    
+        return {'answer': "I can help you with information about what Razorpay does, our features, pricing, who we serve, and common questions. What would you like to know?"}
+
+speculator = speculate(app, 'day5', lambda data: (answer_query(data), None), 'query')
+
+@app.route('/api/query', methods=['POST'])
+def query_faq():
+    """Answer questions using FAQ"""
+    try:
+        return jsonify(speculator.answer(request.json))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -91,9 +106,6 @@ def save_lead():
     data = request.json
     
     try:
-        with open(LEAD_FILE, 'r') as f:
-            leads = json.load(f)
-        
         lead = {
             'timestamp': datetime.now().isoformat(),
             'name': data.get('name', ''),
@@ -105,10 +117,8 @@ def save_lead():
             'timeline': data.get('timeline', '')
         }
         
-        leads.append(lead)
-        
-        with open(LEAD_FILE, 'w') as f:
-            json.dump(leads, f, indent=2)
+        with metrics.phase('disk'):
+            leads.put(lead)
         
         return jsonify({'success': True, 'lead': lead})
     
@@ -131,9 +141,6 @@ def book_meeting():
     data = request.json
     
     try:
-        with open(MEETING_FILE, 'r') as f:
-            meetings = json.load(f)
-        
         meeting = {
             'timestamp': datetime.now().isoformat(),
             'name': data.get('name', ''),
@@ -143,10 +150,8 @@ def book_meeting():
             'time': data.get('time', '')
         }
         
-        meetings.append(meeting)
-        
-        with open(MEETING_FILE, 'w') as f:
-            json.dump(meetings, f, indent=2)
+        with metrics.phase('disk'):
+            meetings.put(meeting)
         
         return jsonify({'success': True, 'meeting': meeting})
     
@@ -4,6 +4,7 @@ class VoiceSDR{
         this.agentSpeaking=false;
         this.state="intent";
         this.currentField=null;
+        this.utterance=null; // faq answer being worked out from interim transcripts
 
         this.lead={
             name:"",company:"",email:"",role:"",
@@ -39,12 +40,22 @@ class VoiceSDR{
         this.recognition=new SR();
         this.recognition.lang="en-IN";
         this.recognition.continuous=true;
-        this.recognition.interimResults=false;
+        this.recognition.interimResults=true;
 
         this.recognition.onresult=(e)=>{
             if(this.agentSpeaking) return;  // NEVER listen when bot talks
-            let text=e.results[e.results.length-1][0].transcript.toLowerCase().trim();
+            let result=e.results[e.results.length-1];
+            let text=result[0].transcript.toLowerCase().trim();
             if(text.length<2) return;
+            if(!result.isFinal){
+                // have the answer ready if this is heading for a faq question
+                let type=this.state==="intent" && !this.isEnd(text) ? this.faqType(text) : null;
+                if(type){
+                    if(!this.utterance) this.utterance=voiceSpeculation.utterance();
+                    this.utterance.interim({query:type});
+                }
+                return;
+            }
             this.add("user",text);
             this.route(text);
         };
@@ -55,7 +66,7 @@ class VoiceSDR{
     }
 
     enableMic(){
-        try{ this.recognition.start(); }catch{}
+        try{ this.recognition.start(); voiceTrace.listening(); }catch{}
     }
 
     disableMic(){
@@ -77,11 +88,8 @@ class VoiceSDR{
 
         if(this.state==="lead") return this.leadCapture(t);
 
-        if(this.askRazorpay(t)) return this.faq("razorpay overview");
-
-        if(this.askPricing(t)) return this.faq("pricing");
-
-        if(this.askFeatures(t)) return this.faq("features");
+        let type=this.faqType(t);
+        if(type) return this.faq(type);
 
         if(this.startOnboarding(t)){
             this.state="lead";
@@ -100,16 +108,28 @@ class VoiceSDR{
     askFeatures(t){ return /(features|services|capabilities|offer|benefits)/.test(t); }
     startOnboarding(t){ return /(start onboarding|onboard|get started|begin onboarding)/.test(t); }
 
+    faqType(t){
+        if(this.askRazorpay(t)) return "razorpay overview";
+        if(this.askPricing(t)) return "pricing";
+        if(this.askFeatures(t)) return "features";
+        return null;
+    }
+
     /* ================= FAQ ================= */
 
     async faq(type){
-        let res=await fetch("/api/query",{
+        const turn=voiceTrace.turn();
+        let body={query:type};
+        if(this.utterance) body=this.utterance.final(body);
+        this.utterance=null;
+        let res=await turn.fetch("api/query",{
             method:"POST",
             headers:{"Content-Type":"application/json"},
-            body:JSON.stringify({query:type})
+            body:JSON.stringify(body)
         });
         let data=await res.json();
-        await this.speak(data.answer);
+        await this.speak(data.answer,turn);
+        turn.finish();
         this.speakThenListen("you can ask pricing, features, or say start onboarding.");
     }
 
@@ -164,7 +184,7 @@ class VoiceSDR{
 
     /* ================= SPEAK — FINAL MIC FIX ================= */
 
-    async speak(text){
+    async speak(text,turn=null){
         this.add("agent",text);
         this.agentSpeaking=true;
         this.disableMic();
@@ -173,6 +193,7 @@ class VoiceSDR{
             let u=new SpeechSynthesisUtterance(text);
             u.lang="en-IN";u.rate=0.95;u.pitch=1;
             u.onend=r;
+            if(turn) turn.speak(u);
             speechSynthesis.speak(u);
         });
     }
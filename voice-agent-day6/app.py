@@ -6,10 +6,21 @@ Run with: python app.py
 
 from flask import Flask, send_from_directory, jsonify, request
 from flask_cors import CORS
-import json
+import os
+import sys
 from datetime import datetime
 
+# index.html and its assets sit next to this script
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# The shared metrics and tracing modules live next to the day folders
+sys.path.insert(0, os.path.join(os.path.dirname(BASE_DIR), 'voice-agent-metrics'))
+sys.path.insert(0, os.path.join(os.path.dirname(BASE_DIR), 'voice-agent-tracing'))
+from metrics import instrument
+from tracing import trace_turns
+
 app = Flask(__name__)
+instrument(app, 'day6')
+trace_turns(app, 'day6')
 CORS(app)
 
 # Sample fraud cases database
@@ -83,12 +94,12 @@ fraud_cases = [
 @app.route('/')
 def index():
     """Serve the main HTML page"""
-    return send_from_directory('.', 'index.html')
+    return send_from_directory(BASE_DIR, 'index.html')
 
 @app.route('/<path:path>')
 def serve_static(path):
     """Serve static files (CSS, JS)"""
-    return send_from_directory('.', path)
+    return send_from_directory(BASE_DIR, path)
 
 @app.route('/api/cases', methods=['GET'])
 def get_cases():
@@ -114,11 +125,7 @@ def update_case(case_id):
         fraud_cases[case_index]['outcomeNote'] = data.get('outcomeNote', fraud_cases[case_index]['outcomeNote'])
         fraud_cases[case_index]['updatedAt'] = datetime.now().isoformat()
         
-        print(f"\n{'='*60}")
-        print(f"CASE UPDATED: {case_id}")
-        print(f"{'='*60}")
-        print(json.dumps(fraud_cases[case_index], indent=2))
-        print(f"{'='*60}\n")
+        print(f"Case {case_id} updated: {fraud_cases[case_index]['status']}")
         
         return jsonify({
             "success": True,
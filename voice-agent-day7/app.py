@@ -6,28 +6,64 @@ from flask import Flask, render_template, request, jsonify
 import threading
 import time
 import os
+import sys
+from functools import partial
+
+# Data files live next to this script, whatever directory it is started from
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# The shared document store, metrics, tracing and speculation live next to the day folders
+sys.path.insert(0, os.path.join(os.path.dirname(BASE_DIR), 'voice-agent-docstore'))
+sys.path.insert(0, os.path.join(os.path.dirname(BASE_DIR), 'voice-agent-metrics'))
+sys.path.insert(0, os.path.join(os.path.dirname(BASE_DIR), 'voice-agent-tracing'))
+sys.path.insert(0, os.path.join(os.path.dirname(BASE_DIR), 'voice-agent-speculation'))
+from docstore import DocumentStore
+from metrics import instrument
+from tracing import trace_turns
+from speculation import speculate
 
 app = Flask(__name__)
+metrics = instrument(app, 'day7')
+trace_turns(app, 'day7')
 app.secret_key = 'grocery-voice-agent-ultra-premium'
 
+CATALOG_FILE = os.path.join(BASE_DIR, 'catalog.json')
+RECIPES_FILE = os.path.join(BASE_DIR, 'recipes.json')
+# Old whole-file stores, imported once into the document store
+CART_FILE = os.path.join(BASE_DIR, 'cart.json')
+ORDERS_HISTORY_FILE = os.path.join(BASE_DIR, 'orders_history.json')
+STORE_DIR = os.getenv('DOCSTORE_DIR', os.path.join(BASE_DIR, 'store'))
+CART_ID = 'current'
+STATUS_FLOW = ["received", "confirmed", "being_prepared", "out_for_delivery", "delivered"]
+# Random order numbers are drawn from here; a few tries always find a free one
+ORDER_NUMBERS = (10_000_000, 99_999_999)
+ORDER_ID_TRIES = 10
+
 # Load data
-with open('catalog.json', 'r') as f:
+with open(CATALOG_FILE, 'r') as f:
     catalog = json.load(f)
 
-with open('recipes.json', 'r') as f:
+with open(RECIPES_FILE, 'r') as f:
     recipes = json.load(f)
 
-# Initialize data files
-def initialize_data_files():
-    if not os.path.exists('cart.json'):
-        with open('cart.json', 'w') as f:
-            json.dump({"items": [], "total": 0}, f)
-    
-    if not os.path.exists('orders_history.json'):
-        with open('orders_history.json', 'w') as f:
-            json.dump([], f)
+store = DocumentStore(STORE_DIR)
+carts = store.collection('carts')
+orders = store.collection('orders', key='order_id', indexes=('status',), legacy_file=ORDERS_HISTORY_FILE)
+if CART_ID not in carts and os.path.exists(CART_FILE):
+    with open(CART_FILE, 'r') as f:
+        carts.put({'id': CART_ID, **json.load(f)})
+
+def new_order_id():
+    """An order id not yet used. Worked out without writing anything, since
+    a speculated "place order" must change nothing until it is taken."""
+    for _ in range(ORDER_ID_TRIES):
+        order_id = f"ORD{random.randint(*ORDER_NUMBERS)}"
+        if order_id not in orders:
+            return order_id
+    raise RuntimeError(f"no free order id after {ORDER_ID_TRIES} tries")
 
-initialize_data_files()
+def advance_status(order):
+    index = STATUS_FLOW.index(order['status'])
+    return {'status': STATUS_FLOW[min(index + 1, len(STATUS_FLOW) - 1)]}
 
 class VoiceAgent:
     def __init__(self):
@@ -36,9 +72,20 @@ class VoiceAgent:
         self.greeting_count = 0
     
     def process_message(self, user_input):
+        response, action, cart, changes = self.plan_message(user_input)
+        self.commit(changes)
+        return response, action
+    
+    def plan_message(self, user_input):
+        """(response, action, cart, changes): what process_message answers
+        and the cart it leaves, without changing anything yet; commit(changes)
+        makes the changes. (Answers are worked out ahead of time from interim
+        transcripts this way, see voice-agent-speculation.)"""
         user_input = user_input.lower().strip()
         response = ""
         action = None
+        # (kind, value) in the order they are to be made
+        changes = []
         
         # Enhanced greetings with variety
         if any(word in user_input for word in ['hello', 'hi', 'hey', 'start', 'good morning', 'good afternoon']):
@@ -58,11 +105,11 @@ class VoiceAgent:
         
         # Recipe-based ordering
         elif 'ingredients for' in user_input or 'make me' in user_input or 'i want to make' in user_input:
-            response = self._handle_recipe_request(user_input)
+            response = self._handle_recipe_request(user_input, changes)
         
         # Add specific item
         elif any(word in user_input for word in ['add', 'i want', 'get me', 'need', 'give me', 'i need', 'can i get']):
-            response = self._handle_add_item(user_input)
+            response = self._handle_add_item(user_input, changes)
         
         # View cart
         elif any(word in user_input for word in ['cart', 'what\'s in my cart', 'view cart', 'show cart', 'my cart']):
@@ -70,11 +117,11 @@ class VoiceAgent:
         
         # Remove item
         elif any(word in user_input for word in ['remove', 'delete', 'take out']):
-            response = self._handle_remove_item(user_input)
+            response = self._handle_remove_item(user_input, changes)
         
         # Place order
         elif any(word in user_input for word in ['place order', 'checkout', 'done', 'finish', 'that\'s all', 'ready to checkout']):
-            response, action = self._place_order()
+            response, action = self._place_order(changes)
         
         # Order tracking
         elif any(word in user_input for word in ['where is my order', 'order status', 'track', 'delivered', 'status']):
@@ -94,15 +141,29 @@ class VoiceAgent:
         else:
             response = "🤔 I can help you: • 🛒 Add items to cart • 📋 View your cart • 🗑️ Remove items • ✅ Place orders • 📦 Track orders • 📖 Get recipe ingredients (try 'ingredients for pasta' 🍝)"
         
-        self.conversation_history.append({
+        changes.append(('history', {
             'user': user_input,
             'agent': response,
             'timestamp': datetime.datetime.now().isoformat()
-        })
+        }))
         
-        return response, action
+        carts_saved = [value for kind, value in changes if kind == 'cart']
+        cart = carts_saved[-1] if carts_saved else self._load_cart()
+        return response, action, cart, changes
     
-    def _handle_recipe_request(self, user_input):
+    def commit(self, changes):
+        for kind, value in changes:
+            if kind == 'cart':
+                with metrics.phase('disk'):
+                    carts.put({'id': CART_ID, **value})
+            elif kind == 'order':
+                with metrics.phase('disk'):
+                    orders.put(value)
+                self.current_order_id = value['order_id']
+            elif kind == 'history':
+                self.conversation_history.append(value)
+    
+    def _handle_recipe_request(self, user_input, changes):
         cart = self._load_cart()
         added_items = []
         
@@ -121,13 +182,13 @@ class VoiceAgent:
                             })
                         added_items.append(f"🍴 {matching_item['name']}")
                 
-                self._save_cart(cart)
+                self._save_cart(cart, changes)
                 return f"👨‍🍳 Perfect! I've gathered everything you need for {recipe_name}: {', '.join(added_items)}. They're now in your cart! Ready to cook up something amazing! 🎉"
         
         available_recipes = ", ".join([f"'{r}'" for r in recipes.keys()])
         return f"📖 I can help you with these delicious recipes: {available_recipes}. Just say 'ingredients for [recipe name]' and I'll work my magic! ✨"
     
-    def _handle_add_item(self, user_input):
+    def _handle_add_item(self, user_input, changes):
         cart = self._load_cart()
         added_items = []
         
@@ -152,7 +213,7 @@ class VoiceAgent:
                 break
         
         if added_items:
-            self._save_cart(cart)
+            self._save_cart(cart, changes)
             responses = [
                 f"✅ Awesome! I've added to your cart: {', '.join(added_items)}. Your cart total is now ₹{cart['total']}. Keep the goodies coming! 🎊",
                 f"🎯 Perfect choice! {', '.join(added_items)} are now in your cart. Total: ₹{cart['total']}. What's next? 🌟",
@@ -163,7 +224,7 @@ class VoiceAgent:
             sample_items = random.sample([item['name'] for item in catalog], 3)
             return f"🤷 I couldn't find that item. No worries! Try something like 'add {sample_items[0]}' or 'get me {sample_items[1]}'. You can also click items in the catalog! 📚"
     
-    def _handle_remove_item(self, user_input):
+    def _handle_remove_item(self, user_input, changes):
         cart = self._load_cart()
         removed_items = []
         
@@ -173,7 +234,7 @@ class VoiceAgent:
                 removed_items.append(f"❌ {item['name']}")
         
         if removed_items:
-            self._save_cart(cart)
+            self._save_cart(cart, changes)
             return f"🗑️ Got it! I've removed from your cart: {', '.join(removed_items)}. Your cart has been updated! 🔄"
         else:
             return "🤔 I couldn't find that item in your cart. Here's what's currently in your cart: " + self._get_cart_summary()
@@ -197,13 +258,13 @@ class VoiceAgent:
         
         return random.choice(cart_responses)
     
-    def _place_order(self):
+    def _place_order(self, changes):
         cart = self._load_cart()
         if not cart['items']:
             return "🛒 Your cart is empty! Let's add some delicious items first. Try 'add milk' or 'get me bread' - I know you'll find something amazing! 🌈", None
         
         total = sum(item['price'] * item['quantity'] for item in cart['items'])
-        order_id = f"ORD{random.randint(1000, 9999)}"
+        order_id = new_order_id()
         
         order = {
             "order_id": order_id,
@@ -213,20 +274,11 @@ class VoiceAgent:
             "status": "received"
         }
         
-        with open('order.json', 'w') as f:
-            json.dump(order, f, indent=2)
-        
-        with open('orders_history.json', 'r') as f:
-            orders_history = json.load(f)
-        orders_history.append(order)
-        with open('orders_history.json', 'w') as f:
-            json.dump(orders_history, f, indent=2)
+        changes.append(('order', order))
         
         cart['items'] = []
         cart['total'] = 0
-        self._save_cart(cart)
-        
-        self.current_order_id = order_id
+        self._save_cart(cart, changes)
         
         order_responses = [
             f"🎉 CONGRATULATIONS! Your order #{order_id} has been placed successfully! 🚀 Total: ₹{total}. You can track your order anytime by asking 'where is my order?' 📦 We're excited to get your items to you!",
@@ -238,62 +290,45 @@ class VoiceAgent:
         return response, "order_placed"
     
     def _get_order_status(self):
-        try:
-            with open('orders_history.json', 'r') as f:
-                orders = json.load(f)
-            
-            if not orders:
-                return "📦 You haven't placed any orders yet. But I'm excited to help you create your first order! 🛒 What would you like to add to your cart? 🌟"
-            
-            latest_order = orders[-1]
-            status = latest_order['status']
-            order_id = latest_order['order_id']
-            total = latest_order['total']
-            
-            status_messages = {
-                "received": "📥 We've received your order and our team is preparing it with care! Should be confirmed very soon! ⏳",
-                "confirmed": "✅ Your order has been confirmed and is being processed! Our team is hand-picking your items! 👨‍🍳",
-                "being_prepared": "👨‍🍳 Our expert team is carefully preparing your groceries for delivery! Everything's looking fresh and perfect! 🌱",
-                "out_for_delivery": "🚚 EXCITING NEWS! Your order is out for delivery! Should arrive at your doorstep soon! 🎊",
-                "delivered": "🎉 DELIVERED! Your order has been successfully delivered. Thank you for shopping with us! We can't wait to serve you again! 🌈"
-            }
-            
-            items_count = len(latest_order['items'])
-            return f"📦 Order #{order_id} ({items_count} items, ₹{total}): {status_messages.get(status, status)}"
+        latest = orders.find(limit=1, reverse=True)
+        if not latest:
+            return "📦 You haven't placed any orders yet. But I'm excited to help you create your first order! 🛒 What would you like to add to your cart? 🌟"
+        
+        latest_order = latest[0]
+        status = latest_order['status']
+        order_id = latest_order['order_id']
+        total = latest_order['total']
+        
+        status_messages = {
+            "received": "📥 We've received your order and our team is preparing it with care! Should be confirmed very soon! ⏳",
+            "confirmed": "✅ Your order has been confirmed and is being processed! Our team is hand-picking your items! 👨‍🍳",
+            "being_prepared": "👨‍🍳 Our expert team is carefully preparing your groceries for delivery! Everything's looking fresh and perfect! 🌱",
+            "out_for_delivery": "🚚 EXCITING NEWS! Your order is out for delivery! Should arrive at your doorstep soon! 🎊",
+            "delivered": "🎉 DELIVERED! Your order has been successfully delivered. Thank you for shopping with us! We can't wait to serve you again! 🌈"
+        }
         
-        except FileNotFoundError:
-            return "📦 You haven't placed any orders yet. But that's okay - every great shopping journey starts with a first order! 🛒 What would you like to add? 🌟"
+        items_count = len(latest_order['items'])
+        return f"📦 Order #{order_id} ({items_count} items, ₹{total}): {status_messages.get(status, status)}"
     
     def _load_cart(self):
-        try:
-            with open('cart.json', 'r') as f:
-                return json.load(f)
-        except FileNotFoundError:
+        cart = carts.get(CART_ID)
+        if cart is None:
             return {"items": [], "total": 0}
+        # The stored cart is read-only; callers change a copy and save it
+        return {"items": [dict(item) for item in cart['items']], "total": cart['total']}
     
-    def _save_cart(self, cart):
+    def _save_cart(self, cart, changes):
         cart['total'] = sum(item['price'] * item['quantity'] for item in cart['items'])
-        with open('cart.json', 'w') as f:
-            json.dump(cart, f, indent=2)
+        changes.append(('cart', cart))
 
 def start_status_updater():
     def update_statuses():
         while True:
             time.sleep(30)
             try:
-                with open('orders_history.json', 'r') as f:
-                    orders = json.load(f)
-                
-                status_flow = ["received", "confirmed", "being_prepared", "out_for_delivery", "delivered"]
-                
-                for order in orders:
-                    if order['status'] != "delivered":
-                        current_index = status_flow.index(order['status'])
-                        if current_index < len(status_flow) - 1:
-                            order['status'] = status_flow[current_index + 1]
-                
-                with open('orders_history.json', 'w') as f:
-                    json.dump(orders, f, indent=2)
+                pending = [order['order_id'] for status in STATUS_FLOW[:-1] for order in orders.find(status=status)]
+                for order_id in pending:
+                    orders.update(order_id, advance_status)
                 
             except Exception as e:
                 print(f"Error updating statuses: {e}")
@@ -305,23 +340,28 @@ start_status_updater()
 
 agent = VoiceAgent()
 
+def answer_message(data):
+    with metrics.phase('intent'):
+        response, action, cart, changes = agent.plan_message(data.get('message', ''))
+    return {
+        'response': response,
+        'action': action,
+        'cart': cart
+    }, partial(agent.commit, changes)
+
+def cart_and_latest_order():
+    # What a planned answer depends on; if either changes it is planned again
+    return carts.get(CART_ID), orders.find(limit=1, reverse=True)
+
+speculator = speculate(app, 'day7', answer_message, 'message', state=cart_and_latest_order)
+
 @app.route('/')
 def index():
     return render_template('index.html', catalog=catalog)
 
 @app.route('/api/message', methods=['POST'])
 def handle_message():
-    data = request.json
-    user_input = data.get('message', '')
-    
-    response, action = agent.process_message(user_input)
-    cart = agent._load_cart()
-    
-    return jsonify({
-        'response': response,
-        'action': action,
-        'cart': cart
-    })
+    return jsonify(speculator.answer(request.json))
 
 @app.route('/api/cart', methods=['GET'])
 def get_cart():
@@ -330,29 +370,17 @@ def get_cart():
 
 @app.route('/api/orders/current', methods=['GET'])
 def get_current_order():
-    try:
-        with open('order.json', 'r') as f:
-            order = json.load(f)
-        return jsonify(order)
-    except FileNotFoundError:
-        return jsonify({"error": "No current order"})
+    latest = orders.find(limit=1, reverse=True)
+    if latest:
+        return jsonify(latest[0])
+    return jsonify({"error": "No current order"})
 
 @app.route('/api/status/update', methods=['POST'])
 def manual_status_update():
     try:
-        with open('orders_history.json', 'r') as f:
-            orders = json.load(f)
-        
-        if orders:
-            latest_order = orders[-1]
-            status_flow = ["received", "confirmed", "being_prepared", "out_for_delivery", "delivered"]
-            current_index = status_flow.index(latest_order['status'])
-            if current_index < len(status_flow) - 1:
-                latest_order['status'] = status_flow[current_index + 1]
-            
-            with open('orders_history.json', 'w') as f:
-                json.dump(orders, f, indent=2)
-            
+        latest = orders.find(limit=1, reverse=True)
+        if latest:
+            latest_order = orders.update(latest[0]['order_id'], advance_status)
             return jsonify({"success": True, "new_status": latest_order['status']})
     
     except Exception as e:
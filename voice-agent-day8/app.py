@@ -1,19 +1,41 @@
-from flask import Flask, render_template, request, jsonify, session
-import requests
+from flask import Flask, render_template, request, jsonify, session, Response, stream_with_context
 import os
+import sys
 from dotenv import load_dotenv
-from game_state import GameState
+from session_store import SessionStore, new_session
+from snapshots import SnapshotStore
+from stream_parser import StateUpdateParser
+from llm_client import LLMClient
+import copy
 import json
 import uuid
+from functools import lru_cache
+
+# The shared metrics and tracing modules live next to the day folders
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'voice-agent-metrics'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'voice-agent-tracing'))
+from metrics import instrument
+from tracing import trace_turns
 
 load_dotenv()
 
 app = Flask(__name__)
-app.secret_key = os.urandom(24)
+metrics = instrument(app, 'day8')
+trace_turns(app, 'day8')
+# Every worker process must sign session cookies with the same key
+app.secret_key = os.getenv('FLASK_SECRET_KEY') or os.urandom(24)
+
+# Game states per session, persisted and shared between worker processes
+game_sessions = SessionStore()
+
+# Checkpoints of adventures, written on /save and before /start resets one
+snapshots = SnapshotStore()
 
-# Store game states per session
-game_sessions = {}
+# Pooled, rate-limited client shared by every request in this process
+llm = LLMClient()
 
+# Static instructions. Kept byte-identical across turns (nothing is formatted
+# into it) so upstream prompt caches can reuse the prefix.
 SYSTEM_PROMPT = """You are an expert Game Master running an immersive Dark Fantasy D&D-style adventure. 
 
 YOUR ROLE:
@@ -49,28 +71,33 @@ STATE UPDATE FORMAT:
 When the game state changes, include this at the END of your response:
 
 [STATE_UPDATE]
-{{
-  "player": {{"hp": 85, "inventory": ["torch", "magic sword"]}},
-  "location": {{"name": "Dark Cave", "description": "A damp cave"}},
-  "events": {{"description": "Found a magic sword", "importance": "major"}},
-  "quests": [{{"name": "Quest Name", "objectives": [{{"task": "task", "completed": true}}]}}]
-}}
+{
+  "player": {"hp": 85, "inventory": ["torch", "magic sword"]},
+  "location": {"name": "Dark Cave", "description": "A damp cave"},
+  "events": {"description": "Found a magic sword", "importance": "major"},
+  "quests": [{"name": "Quest Name", "objectives": [{"task": "task", "completed": true}]}]
+}
 [/STATE_UPDATE]
 
-Only include the fields that have CHANGED. If nothing changed, don't include STATE_UPDATE.
+Only include the fields that have CHANGED. If nothing changed, don't include STATE_UPDATE."""
 
-CURRENT GAME STATE:
+# Per-turn part, sent just before the player's latest message
+STATE_PROMPT = """CURRENT GAME STATE:
 {game_state}
 
 Now, continue the adventure!"""
 
+def current_session_id():
+    if 'session_id' not in session:
+        session['session_id'] = str(uuid.uuid4())
+    return session['session_id']
+
 def get_game_state(session_id):
-    if session_id not in game_sessions:
-        game_sessions[session_id] = {
-            'state': GameState(),
-            'messages': []
-        }
-    return game_sessions[session_id]
+    return game_sessions.get_or_create(session_id)
+
+def save_game_state(session_id, game_session):
+    with metrics.phase('disk'):
+        game_sessions.put(session_id, game_session)
 
 def extract_state_update(text):
     """Extract state update from GM response"""
@@ -88,21 +115,153 @@ def extract_state_update(text):
             pass
     return text, None
 
+@lru_cache(maxsize=1024)
+def _render_state_prompt(summary):
+    return STATE_PROMPT.format(game_state=summary)
+
+def render_state_prompt(game_state):
+    # get_summary() hands back the same string until the state version
+    # changes, so this is a cache hit on every turn without a STATE_UPDATE
+    return _render_state_prompt(game_state.get_summary())
+
+def apply_state_update(game_session, updates):
+    """Apply a STATE_UPDATE and journal it so the turn can be replayed"""
+    # update_state() keeps references to new NPCs/quests, so journal a copy
+    game_session['journal'].append([len(game_session['messages']), copy.deepcopy(updates)])
+    game_session['state'].update_state(updates)
+
+def build_messages(game_session):
+    """System prompt with the current state plus the (budgeted) chat history"""
+    state_prompt = render_state_prompt(game_session['state'])
+    # Older turns are folded into a summary to stay within the token budget
+    return game_session['context'].build(SYSTEM_PROMPT, game_session['messages'], state_prompt)
+
+def completion_payload(messages, stream=False):
+    return {
+        "model": "llama-3.3-70b-versatile",
+        "messages": messages,
+        "max_tokens": 1000,
+        "temperature": 0.8,
+        "stream": stream
+    }
+
+def chat_completion(messages, stream=False):
+    """POST to the chat completions API"""
+    return llm.post(completion_payload(messages, stream), stream=stream)
+
+def begin_turn(game_session, user_message):
+    """Add the player's message; returns the messages to send upstream"""
+    game_session['messages'].append({
+        'role': 'user',
+        'content': user_message
+    })
+    return build_messages(game_session)
+
+def abandon_turn(session_id):
+    """Undo begin_turn() when no reply comes back: the player's message, and
+    any STATE_UPDATE streamed before the failure, are dropped by reloading
+    the session as last saved"""
+    game_sessions.forget(session_id)
+
+def finish_turn(session_id, game_session, gm_message):
+    """Apply the GM reply's STATE_UPDATE, add the reply to the history and
+    save; returns the reply as shown to the player"""
+    clean_message, state_updates = extract_state_update(gm_message)
+    
+    if state_updates:
+        try:
+            apply_state_update(game_session, state_updates)
+        except Exception as e:
+            print(f"Error updating state: {e}")
+            # Continue without state update
+    
+    # Add GM message to history (with STATE_UPDATE removed)
+    game_session['messages'].append({
+        'role': 'assistant',
+        'content': clean_message
+    })
+    save_game_state(session_id, game_session)
+    metrics.turn(session_id)
+    return clean_message
+
+class StreamedTurn:
+    """SSE events for one streamed GM reply: feed() each content delta as it
+    arrives, then finish(). Shared by the Flask and async handlers."""
+
+    def __init__(self, session_id, game_session, client_version, client_state_id):
+        self.session_id = session_id
+        self.game_session = game_session
+        self.parser = StateUpdateParser()
+        self.applied = False
+        # Version the client will hold after applying the patches sent so far
+        self.since_version, self.since_state_id = client_version, client_state_id
+
+    def feed(self, content):
+        events = []
+        visible = self.parser.feed(content)
+        if visible:
+            events.append(sse('token', {'text': visible}))
+        if self.parser.closed and not self.applied:
+            self.applied = True
+            if self.parser.updates:
+                state = self.game_session['state']
+                apply_state_update(self.game_session, self.parser.updates)
+                events.append(sse('state', state.get_state_delta(self.since_version, self.since_state_id)))
+                self.since_version, self.since_state_id = state.version, state.state_id
+        return events
+
+    def finish(self):
+        """Final events; records the reply and saves the session"""
+        events = []
+        tail = self.parser.finish()
+        if tail:
+            events.append(sse('token', {'text': tail}))
+        clean_message = self.parser.text
+        self.game_session['messages'].append({
+            'role': 'assistant',
+            'content': clean_message
+        })
+        save_game_state(self.session_id, self.game_session)
+        metrics.turn(self.session_id)
+        done = {'message': clean_message}
+        done.update(self.game_session['state'].get_state_delta(self.since_version, self.since_state_id))
+        events.append(sse('done', done))
+        return events
+
+def iter_stream_content(api_response):
+    """Yield content deltas from an OpenAI-style SSE completion stream"""
+    # chunk_size=None hands over data as it arrives instead of filling 512-byte reads
+    for line in api_response.iter_lines(chunk_size=None):
+        if not line.startswith(b"data:"):
+            continue
+        data = line[len(b"data:"):].strip()
+        if data == b"[DONE]":
+            break
+        delta = json.loads(data)['choices'][0].get('delta', {})
+        if delta.get('content'):
+            yield delta['content']
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 @app.route('/')
 def index():
     # Create a new session ID if not exists
-    if 'session_id' not in session:
-        session['session_id'] = str(uuid.uuid4())
+    current_session_id()
     return render_template('index.html')
 
 @app.route('/start', methods=['POST'])
 def start_game():
-    session_id = session.get('session_id')
-    game_session = get_game_state(session_id)
+    session_id = current_session_id()
+    
+    # Keep a checkpoint of the adventure being abandoned
+    previous = game_sessions.get(session_id)
+    if previous and len(previous['messages']) > 1:
+        with metrics.phase('disk'):
+            snapshots.save(session_id, previous)
     
     # Reset game state
-    game_session['state'] = GameState()
-    game_session['messages'] = []
+    game_session = new_session()
     
     initial_message = """You stand at the entrance to the Ancient Forest. The sun is setting, casting long shadows between the towering trees. A cool mist rolls along the forest floor, and you hear strange, melodic sounds echoing from deep within the woods.
 
@@ -116,94 +275,55 @@ What do you do?"""
         'role': 'assistant',
         'content': initial_message
     })
+    save_game_state(session_id, game_session)
     
     return jsonify({
         'message': initial_message,
-        'game_state': game_session['state'].get_state_dict()
+        'game_state': game_session['state'].get_state_dict(),
+        'state_id': game_session['state'].state_id,
+        'version': game_session['state'].version
     })
 
 @app.route('/send_message', methods=['POST'])
 def send_message():
     try:
-        session_id = session.get('session_id')
+        session_id = current_session_id()
         game_session = get_game_state(session_id)
         
         user_message = request.json.get('message', '')
+        # Last state the client has seen, so only the difference is sent back
+        client_version = request.json.get('version')
+        client_state_id = request.json.get('state_id')
         
         if not user_message:
             return jsonify({'error': 'No message provided'}), 400
         
-        print(f"Received message: {user_message}")
-        
-        # Add user message to history
-        game_session['messages'].append({
-            'role': 'user',
-            'content': user_message
-        })
-        
-        print("Preparing API request")
-        
-        # Prepare messages with system prompt
-        system_prompt = SYSTEM_PROMPT.format(
-            game_state=game_session['state'].get_summary()
-        )
-        
-        messages = [
-            {"role": "system", "content": system_prompt}
-        ] + game_session['messages']
-        
-        print(f"Sending {len(messages)} messages to API")
+        # Add user message to history, and prepare messages with system prompt
+        messages = begin_turn(game_session, user_message)
         
         # Call Groq API using requests
-        api_response = requests.post(
-            "https://api.groq.com/openai/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {os.getenv('GROQ_API_KEY')}",
-                "Content-Type": "application/json"
-            },
-            json={
-                "model": "llama-3.3-70b-versatile",
-                "messages": messages,
-                "max_tokens": 1000,
-                "temperature": 0.8
-            },
-            timeout=30
-        )
+        with metrics.phase('llm'):
+            api_response = chat_completion(messages)
         
         if api_response.status_code != 200:
             error_detail = api_response.json() if api_response.text else {"error": "Unknown error"}
             print(f"API Error: {api_response.status_code} - {error_detail}")
+            abandon_turn(session_id)
             return jsonify({'error': f'API returned error: {error_detail}'}), api_response.status_code
         
         response_data = api_response.json()
         gm_message = response_data['choices'][0]['message']['content']
-        print(f"Received response from API")
-        
-        # Extract and apply state updates
-        clean_message, state_updates = extract_state_update(gm_message)
-        
-        if state_updates:
-            try:
-                game_session['state'].update_state(state_updates)
-                print(f"State updated: {state_updates}")
-            except Exception as e:
-                print(f"Error updating state: {e}")
-                # Continue without state update
         
-        # Add GM message to history (with STATE_UPDATE removed)
-        game_session['messages'].append({
-            'role': 'assistant',
-            'content': clean_message
-        })
+        clean_message = finish_turn(session_id, game_session, gm_message)
         
-        return jsonify({
-            'message': clean_message,
-            'game_state': game_session['state'].get_state_dict()
-        })
+        response = {'message': clean_message}
+        response.update(game_session['state'].get_state_delta(client_version, client_state_id))
+        return jsonify(response)
     
     except Exception as e:
         error_msg = str(e)
         print(f"Error details: {error_msg}")
+        abandon_turn(current_session_id())
         
         # Check if it's an API key issue
         if "api_key" in error_msg.lower() or "authentication" in error_msg.lower():
@@ -216,11 +336,84 @@ def send_message():
         # Generic error
         return jsonify({'error': f'API Error: {error_msg}'}), 500
 
+@app.route('/send_message_stream', methods=['POST'])
+def send_message_stream():
+    """Like /send_message, but streams the GM's narration as server-sent events.
+
+    Events: "token" for each piece of narrative text, "state" when the
+    STATE_UPDATE block has been applied, then "done" with the final message
+    (or "error").
+    """
+    session_id = current_session_id()
+    game_session = get_game_state(session_id)
+    
+    user_message = request.json.get('message', '')
+    client_version = request.json.get('version')
+    client_state_id = request.json.get('state_id')
+    
+    if not user_message:
+        return jsonify({'error': 'No message provided'}), 400
+    
+    messages = begin_turn(game_session, user_message)
+    
+    def generate():
+        turn = StreamedTurn(session_id, game_session, client_version, client_state_id)
+        try:
+            # Until the last delta is in, however fast the client reads
+            with metrics.phase('llm'), chat_completion(messages, stream=True) as api_response:
+                if api_response.status_code != 200:
+                    abandon_turn(session_id)
+                    yield sse('error', {'error': f'API returned error: {api_response.status_code}'})
+                    return
+                for content in iter_stream_content(api_response):
+                    yield from turn.feed(content)
+        except Exception as e:
+            print(f"Error details: {e}")
+            abandon_turn(session_id)
+            yield sse('error', {'error': f'API Error: {e}'})
+            return
+        yield from turn.finish()
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/save', methods=['POST'])
+def save_game():
+    session_id = current_session_id()
+    game_session = get_game_state(session_id)
+    with metrics.phase('disk'):
+        snapshot_id = snapshots.save(session_id, game_session)
+    return jsonify({'snapshot_id': snapshot_id})
+
+@app.route('/snapshots', methods=['GET'])
+def list_snapshots():
+    return jsonify({'snapshots': snapshots.list(current_session_id())})
+
+@app.route('/load', methods=['POST'])
+def load_game():
+    session_id = current_session_id()
+    snapshot_id = request.json.get('snapshot_id', '')
+    try:
+        game_session = snapshots.load(session_id, snapshot_id)
+    except (ValueError, FileNotFoundError):
+        return jsonify({'error': 'Snapshot not found'}), 404
+    save_game_state(session_id, game_session)
+    last_gm = next((m['content'] for m in reversed(game_session['messages']) if m['role'] == 'assistant'), '')
+    return jsonify({
+        'message': last_gm,
+        'game_state': game_session['state'].get_state_dict(),
+        'state_id': game_session['state'].state_id,
+        'version': game_session['state'].version
+    })
+
 @app.route('/get_state', methods=['GET'])
 def get_state():
-    session_id = session.get('session_id')
+    session_id = current_session_id()
     game_session = get_game_state(session_id)
-    return jsonify(game_session['state'].get_state_dict())
+    since = request.args.get('since', type=int)
+    if since is None:
+        return jsonify(game_session['state'].get_state_dict())
+    return jsonify(game_session['state'].get_state_delta(since, request.args.get('state_id')))
 
 @app.route('/text_to_speech', methods=['POST'])
 def text_to_speech():
@@ -0,0 +1,179 @@
+"""Async handlers for the LLM-bound endpoints, mounted by the shared ASGI host.
+
+/send_message and /send_message_stream spend almost all their time waiting
+on the chat completions API. Served through the Flask app each of those
+waits holds a worker thread; these versions await AsyncLLMClient instead,
+so one event loop can have any number of turns in flight. Everything else
+about a turn (history, STATE_UPDATE handling, saving) is the Flask app's
+own code, and the session cookie is the Flask app's signed cookie, so the
+two can serve the same player interchangeably. Loading and saving the
+session (SQLite, compression, fsync) runs in a worker thread
+(asyncio.to_thread) so it doesn't stall the other turns on the loop.
+
+make_routes(agent) takes the loaded app module and returns Starlette
+routes; the host puts them ahead of the mounted Flask app. They are timed
+into the Flask app's metrics, under the same routes, and traced like the
+Flask app's requests (voice-agent-tracing, which app.py puts on the path).
+"""
+import asyncio
+import json
+import uuid
+from time import perf_counter
+
+from itsdangerous import BadSignature
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+import tracing
+from llm_client import AsyncLLMClient
+
+
+async def _iter_content(lines):
+    """Content deltas from the lines of an OpenAI-style SSE completion stream"""
+    async for line in lines:
+        if not line.startswith("data:"):
+            continue
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            break
+        delta = json.loads(data)['choices'][0].get('delta', {})
+        if delta.get('content'):
+            yield delta['content']
+
+
+def make_routes(agent):
+    flask_app = agent.app
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    cookie_name = flask_app.config["SESSION_COOKIE_NAME"]
+    max_age = int(flask_app.permanent_session_lifetime.total_seconds())
+    metrics = agent.metrics
+    clients = {}
+
+    def llm():
+        # One per event loop (a uvicorn worker has one), created on first use
+        loop = asyncio.get_running_loop()
+        if loop not in clients:
+            clients[loop] = AsyncLLMClient()
+        return clients[loop]
+
+    def session_id(request):
+        """(session id, cookie value to set if the session is new)"""
+        data = {}
+        cookie = request.cookies.get(cookie_name)
+        if cookie:
+            try:
+                data = serializer.loads(cookie, max_age=max_age)
+            except BadSignature:
+                data = {}
+        if 'session_id' in data:
+            return data['session_id'], None
+        data['session_id'] = str(uuid.uuid4())
+        return data['session_id'], serializer.dumps(data)
+
+    def respond(response, cookie):
+        # Set the way Flask would set it, so either side can read it back
+        if cookie:
+            interface = flask_app.session_interface
+            response.set_cookie(cookie_name, cookie, path=interface.get_cookie_path(flask_app),
+                                domain=interface.get_cookie_domain(flask_app),
+                                secure=interface.get_cookie_secure(flask_app),
+                                httponly=interface.get_cookie_httponly(flask_app),
+                                samesite=interface.get_cookie_samesite(flask_app))
+        return response
+
+    async def send_message(request):
+        sid, cookie = session_id(request)
+        body = await request.json()
+        user_message = body.get('message', '')
+        if not user_message:
+            return respond(JSONResponse({'error': 'No message provided'}, 400), cookie)
+        game_session = await asyncio.to_thread(agent.get_game_state, sid)
+        messages = agent.begin_turn(game_session, user_message)
+        try:
+            with metrics.phase('llm'):
+                response_data = await llm().post(agent.completion_payload(messages))
+        except Exception as e:
+            status = getattr(getattr(e, 'response', None), 'status_code', 500)
+            print(f"Error details: {e}")
+            agent.abandon_turn(sid)
+            return respond(JSONResponse({'error': f'API Error: {e}'}, status), cookie)
+        gm_message = response_data['choices'][0]['message']['content']
+        clean_message = await asyncio.to_thread(agent.finish_turn, sid, game_session, gm_message)
+        response = {'message': clean_message}
+        response.update(game_session['state'].get_state_delta(body.get('version'), body.get('state_id')))
+        return respond(JSONResponse(response), cookie)
+
+    async def send_message_stream(request):
+        sid, cookie = session_id(request)
+        body = await request.json()
+        user_message = body.get('message', '')
+        if not user_message:
+            return respond(JSONResponse({'error': 'No message provided'}, 400), cookie)
+        game_session = await asyncio.to_thread(agent.get_game_state, sid)
+        messages = agent.begin_turn(game_session, user_message)
+
+        async def generate():
+            turn = agent.StreamedTurn(sid, game_session, body.get('version'), body.get('state_id'))
+            try:
+                with metrics.phase('llm'):
+                    async with llm().stream(agent.completion_payload(messages, stream=True)) as api_response:
+                        if api_response.status_code != 200:
+                            agent.abandon_turn(sid)
+                            yield agent.sse('error', {'error': f'API returned error: {api_response.status_code}'})
+                            return
+                        async for content in _iter_content(api_response.aiter_lines()):
+                            for event in turn.feed(content):
+                                yield event
+            except Exception as e:
+                print(f"Error details: {e}")
+                agent.abandon_turn(sid)
+                yield agent.sse('error', {'error': f'API Error: {e}'})
+                return
+            for event in await asyncio.to_thread(turn.finish):
+                yield event
+
+        return respond(StreamingResponse(generate(), media_type='text/event-stream',
+                                         headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}), cookie)
+
+    async def traced_body(body, span, status):
+        # A stream's llm phase runs while its body is sent
+        try:
+            with tracing.active(span):
+                async for chunk in body:
+                    yield chunk
+        finally:
+            tracing.finish(span, status)
+
+    def timed(path, handler):
+        """handler, counted in flight and timed until its response is ready
+        (for a stream, until it starts), and traced until it has been sent,
+        like the Flask app's requests"""
+        async def timed_handler(request):
+            metrics.in_flight.inc()
+            start = perf_counter()
+            status = '500'
+            span = tracing.start(metrics.name, request.headers.get(tracing.TURN_HEADER), f'POST {path}')
+            try:
+                with tracing.active(span):
+                    response = await handler(request)
+                status = str(response.status_code)
+            except BaseException:
+                if span is not None:
+                    tracing.finish(span, status)
+                raise
+            finally:
+                metrics.in_flight.dec()
+                metrics.request(path, request.method, status, perf_counter() - start)
+            if span is not None:
+                response.headers[tracing.SAMPLED_HEADER] = '1'
+                if isinstance(response, StreamingResponse):
+                    response.body_iterator = traced_body(response.body_iterator, span, status)
+                else:
+                    tracing.finish(span, status)
+            return response
+        return Route(path, timed_handler, methods=['POST'])
+
+    return [
+        timed('/send_message', send_message),
+        timed('/send_message_stream', send_message_stream),
+    ]
@@ -0,0 +1,51 @@
+"""Request size and latency of full-history vs token-budgeted prompts.
+
+Run with: python bench_context_window.py
+"""
+import statistics
+import time
+
+import requests
+
+from context_window import ContextWindow
+from game_state import GameState
+from mock_llm_server import MockLLMServer
+
+TURNS = 500
+
+
+class FullHistory:
+    """What send_message() did before: system prompt plus every message"""
+
+    def build(self, system_prompt, history):
+        return [{"role": "system", "content": system_prompt}] + history
+
+
+def run(server, context, http):
+    state = GameState()
+    history = []
+    sizes = []
+    latencies = []
+    for turn in range(TURNS):
+        history.append({"role": "user", "content": f"I search the ruins for clues, attempt number {turn}."})
+        messages = context.build(state.get_summary(), history)
+        start = time.perf_counter()
+        response = http.post(server.url, json={"model": "mock", "messages": messages}, timeout=30)
+        latencies.append(time.perf_counter() - start)
+        sizes.append(len(response.request.body))
+        history.append({"role": "assistant", "content": response.json()["choices"][0]["message"]["content"]})
+    return sizes, latencies
+
+
+def report(name, sizes, latencies):
+    latencies = sorted(latencies)
+    print(f"  {name:12s} last request {sizes[-1] / 1024:7.1f} KiB, total {sum(sizes) / 1024 / 1024:6.1f} MiB, "
+          f"p50 {statistics.median(latencies) * 1000:6.1f} ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:6.1f} ms")
+
+
+if __name__ == "__main__":
+    with MockLLMServer() as server, requests.Session() as http:
+        print(f"{TURNS} turns against {server.url}")
+        report("full history", *run(server, FullHistory(), http))
+        report("budgeted", *run(server, ContextWindow(), http))
@@ -0,0 +1,104 @@
+"""Benchmarks for GameState over long sessions.
+
+Run with: python bench_game_state.py
+"""
+import copy
+import gc
+import json
+import tempfile
+import time
+import tracemalloc
+
+from game_state import GameState
+
+TURNS = 10000
+
+
+def make_update(turn):
+    """A typical STATE_UPDATE: small player change, an event, sometimes an NPC or quest"""
+    update = {
+        "player": {"hp": 100 - turn % 40, "gold": 25 + turn},
+        "events": {"description": f"Turn {turn}: the adventure continues", "importance": "minor"}
+    }
+    if turn % 10 == 0:
+        update["npcs"] = [{"name": f"Stranger {turn % 50}", "attitude": "wary", "met": True}]
+    if turn % 25 == 0:
+        update["quests"] = [{"name": f"Errand {turn % 20}", "description": "Run an errand",
+                             "status": "active", "objectives": []}]
+    return update
+
+
+def apply_patch(doc, patch):
+    """Minimal RFC 6902 add/replace, mirroring applyStatePatch() in main.js"""
+    for op in patch:
+        if op["path"] == "":
+            doc = copy.deepcopy(op["value"])
+            continue
+        keys = [k.replace("~1", "/").replace("~0", "~") for k in op["path"][1:].split("/")]
+        target = doc
+        for key in keys[:-1]:
+            target = target[int(key)] if isinstance(target, list) else target[key]
+        last = keys[-1]
+        if isinstance(target, list):
+            if last == "-":
+                target.append(copy.deepcopy(op["value"]))
+            else:
+                target[int(last)] = copy.deepcopy(op["value"])
+        else:
+            target[last] = copy.deepcopy(op["value"])
+    return doc
+
+
+def bench_full_vs_patch(log_dir):
+    state = GameState(event_log_dir=log_dir)
+    client = copy.deepcopy(state.get_state_dict())
+    version = state.version
+
+    full_bytes = patch_bytes = 0
+    full_time = patch_time = 0.0
+    for turn in range(TURNS):
+        state.update_state(make_update(turn))
+
+        start = time.perf_counter()
+        full_payload = json.dumps({"game_state": state.get_state_dict()})
+        full_time += time.perf_counter() - start
+        full_bytes += len(full_payload)
+
+        start = time.perf_counter()
+        delta = state.get_state_delta(version, state.state_id)
+        patch_payload = json.dumps(delta)
+        patch_time += time.perf_counter() - start
+        patch_bytes += len(patch_payload)
+
+        client = apply_patch(client, delta["patch"])
+        version = delta["version"]
+
+    assert client == state.get_state_dict(), "patched client state diverged"
+
+    print(f"{TURNS} turns")
+    print(f"  full state : {full_bytes / TURNS:10.0f} B/turn  {full_time / TURNS * 1e6:8.1f} us/turn")
+    print(f"  json patch : {patch_bytes / TURNS:10.0f} B/turn  {patch_time / TURNS * 1e6:8.1f} us/turn")
+
+
+def soak_event_memory(log_dir):
+    """Session memory should level off once the event log starts compacting"""
+    state = GameState(event_log_dir=log_dir)
+    gc.collect()
+    tracemalloc.start()
+    print("event log soak")
+    checkpoints = (1000, 10000, 50000, 100000)
+    for turn in range(checkpoints[-1]):
+        state.update_state({"events": {"description": f"Turn {turn}", "importance": "major" if turn % 7 == 0 else "minor"}})
+        if turn + 1 in checkpoints:
+            gc.collect()
+            current, _ = tracemalloc.get_traced_memory()
+            print(f"  {turn + 1:7d} events: {current / 1024:8.1f} KiB traced, "
+                  f"{len(json.dumps(state.get_state_dict()))} B state")
+    tracemalloc.stop()
+    assert sum(1 for _ in state.iter_events()) == checkpoints[-1] + 1
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as log_dir:
+        bench_full_vs_patch(log_dir)
+        soak_event_memory(log_dir)
@@ -0,0 +1,79 @@
+"""Load test for the shared LLM client against a local mock server.
+
+The mock answers every 7th request with a 429 and makes every 11th one
+slow. Compares a fresh requests.post per call (what send_message() used
+to do) with the pooled LLMClient and the asyncio AsyncLLMClient.
+
+Run with: python bench_llm_client.py
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from llm_client import AsyncLLMClient, LLMClient
+from mock_llm_server import MockLLMServer
+
+CALLS = 400
+CONCURRENCY = 32
+PAYLOAD = {"model": "mock", "messages": [{"role": "user", "content": "I light the torch."}]}
+
+
+def new_server():
+    return MockLLMServer(rate_limit_every=7, slow_every=11, slow_latency=0.2)
+
+
+def report(name, server, elapsed, failures, client=None):
+    line = (f"  {name:14s} {CALLS / elapsed:7.1f} calls/s, {failures:3d} failed, "
+            f"{server.rate_limited:3d} x 429 served, {len(server.connections):3d} connections")
+    if client:
+        latency = client.latency
+        line += (f", retries {client.retries}, p50 <= {latency.percentile(0.5) * 1000:.0f} ms, "
+                 f"p99 <= {latency.percentile(0.99) * 1000:.0f} ms")
+    print(line)
+
+
+def bench_unpooled():
+    with new_server() as server:
+        def call(_):
+            return requests.post(server.url, json=PAYLOAD, timeout=30).status_code
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(CONCURRENCY) as pool:
+            statuses = list(pool.map(call, range(CALLS)))
+        report("requests.post", server, time.perf_counter() - start, sum(s != 200 for s in statuses))
+
+
+def bench_pooled():
+    with new_server() as server:
+        client = LLMClient(url=server.url, max_concurrency=8, rate=1000, burst=50)
+
+        def call(_):
+            return client.post(PAYLOAD).status_code
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(CONCURRENCY) as pool:
+            statuses = list(pool.map(call, range(CALLS)))
+        report("LLMClient", server, time.perf_counter() - start, sum(s != 200 for s in statuses), client)
+
+
+def bench_async():
+    with new_server() as server:
+        async def run():
+            client = AsyncLLMClient(url=server.url, max_concurrency=8, rate=1000, burst=50)
+            results = await asyncio.gather(*(client.post(PAYLOAD) for _ in range(CALLS)),
+                                           return_exceptions=True)
+            await client.aclose()
+            return client, sum(isinstance(r, Exception) for r in results)
+
+        start = time.perf_counter()
+        client, failures = asyncio.run(run())
+        report("AsyncLLMClient", server, time.perf_counter() - start, failures, client)
+
+
+if __name__ == "__main__":
+    print(f"{CALLS} calls, {CONCURRENCY} callers")
+    bench_unpooled()
+    bench_pooled()
+    bench_async()
@@ -0,0 +1,68 @@
+"""Per-turn prompt build time and prefix reuse.
+
+"before" rebuilds the summary and formats the state into the middle of the
+system prompt on every turn; "after" is build_messages() as used by the app.
+Every third turn carries a STATE_UPDATE, the rest leave the state alone.
+
+Run with: python bench_prompt.py
+"""
+import json
+import os
+import tempfile
+import time
+
+TURNS = 2000
+
+
+def common_prefix(a, b):
+    size = min(len(a), len(b))
+    for i in range(size):
+        if a[i] != b[i]:
+            return i
+    return size
+
+
+def run(build, game_session):
+    previous = b""
+    build_time = 0.0
+    reused = sent = 0
+    for turn in range(TURNS):
+        game_session['messages'].append({'role': 'user', 'content': f"I press on through the fog ({turn})."})
+        if turn % 3 == 0:
+            game_session['state'].update_state({"player": {"gold": turn}})
+        start = time.perf_counter()
+        messages = build(game_session)
+        build_time += time.perf_counter() - start
+        body = json.dumps({"messages": messages}).encode()
+        reused += common_prefix(previous, body)
+        sent += len(body)
+        previous = body
+        game_session['messages'].append({'role': 'assistant', 'content': "The fog thickens. " * 12 + "What do you do?"})
+    return build_time / TURNS, reused / sent
+
+
+def main():
+    import app
+    from game_state import GameState
+    from session_store import new_session
+
+    legacy_prompt = app.SYSTEM_PROMPT.replace("{", "{{").replace("}", "}}") + "\n\n" + app.STATE_PROMPT
+
+    def build_before(game_session):
+        state = game_session['state']
+        system_prompt = legacy_prompt.format(game_state=GameState._build_summary(state))
+        return game_session['context'].build(system_prompt, game_session['messages'])
+
+    for name, build in (("before", build_before), ("after", app.build_messages)):
+        per_turn, reuse = run(build, new_session())
+        print(f"  {name:7s} {per_turn * 1e6:6.1f} us/turn to build, {reuse * 100:5.1f}% of request bytes "
+              f"shared with the previous request's prefix")
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as path:
+        os.environ["SESSION_DIR"] = path
+        import game_state
+        game_state.EVENT_LOG_DIR = path
+        print(f"{TURNS} turns")
+        main()
@@ -0,0 +1,82 @@
+"""Load/save latency and multi-process throughput of the session store.
+
+Run with: python bench_session_store.py
+"""
+import multiprocessing
+import random
+import statistics
+import tempfile
+import time
+
+import game_state
+from session_store import SessionStore, dump_session, new_session
+
+SESSIONS = 2000
+TURNS_PER_SESSION = 30
+WORKERS = 4
+OPS_PER_WORKER = 5000
+
+
+def make_session(turns):
+    game_session = new_session()
+    for turn in range(turns):
+        game_session['messages'].append({'role': 'user', 'content': f"I search the ruins ({turn})."})
+        game_session['messages'].append({'role': 'assistant', 'content': "Dust and bones. " * 20 + "What do you do?"})
+        game_session['state'].update_state({
+            "player": {"gold": turn},
+            "events": {"description": f"Searched the ruins ({turn})", "importance": "minor"}
+        })
+    game_session['context'].build("system prompt", game_session['messages'])
+    return game_session
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def worker(path, seed, results):
+    """One 'worker process': get a session, play a turn, save it"""
+    store = SessionStore(path, cache_size=200)
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    for _ in range(OPS_PER_WORKER):
+        session_id = f"session-{rng.randrange(SESSIONS)}"
+        game_session = store.get(session_id)
+        game_session['state'].update_state({"player": {"hp": rng.randrange(100)}})
+        store.put(session_id, game_session)
+    results.put(time.perf_counter() - start)
+
+
+def main(path):
+    template = make_session(TURNS_PER_SESSION)
+    print(f"{SESSIONS} sessions of {TURNS_PER_SESSION} turns, {len(dump_session(template))} B each on disk")
+
+    store = SessionStore(path, cache_size=100)
+    saves = [timed(store.put, f"session-{i}", template) for i in range(SESSIONS)]
+    print(f"  save          : p50 {statistics.median(saves) * 1e6:7.0f} us")
+
+    uncached = SessionStore(path, cache_size=0)
+    cold = [timed(uncached.get, f"session-{i}") for i in range(SESSIONS)]
+    warm_store = SessionStore(path)
+    warm_store.get("session-0")
+    warm = [timed(warm_store.get, "session-0") for _ in range(1000)]
+    print(f"  load (disk)   : p50 {statistics.median(cold) * 1e6:7.0f} us")
+    print(f"  load (cached) : p50 {statistics.median(warm) * 1e6:7.0f} us")
+
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=worker, args=(path, seed, results)) for seed in range(WORKERS)]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - start
+    print(f"  {WORKERS} workers     : {WORKERS * OPS_PER_WORKER / elapsed:7.0f} get+put/s total")
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as path:
+        game_state.EVENT_LOG_DIR = path
+        main(path)
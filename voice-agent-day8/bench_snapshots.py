@@ -0,0 +1,70 @@
+"""Snapshot/restore time and replay check for a 10,000-turn session.
+
+Run with: python bench_snapshots.py
+"""
+import copy
+import os
+import tempfile
+import time
+
+import game_state
+from snapshots import SnapshotStore, replay
+from session_store import new_session
+
+TURNS = 10000
+
+
+def play_turn(game_session, turn):
+    game_session['messages'].append({'role': 'user', 'content': f"I follow the melody deeper ({turn})."})
+    updates = {"player": {"gold": turn % 500}, "events": {"description": f"Went deeper ({turn})",
+                                                          "importance": "major" if turn % 9 == 0 else "minor"}}
+    if turn % 13 == 0:
+        updates["npcs"] = [{"name": f"Wisp {turn % 40}", "attitude": "curious"}]
+    game_session['journal'].append([len(game_session['messages']), copy.deepcopy(updates)])
+    game_session['state'].update_state(updates)
+    game_session['messages'].append({'role': 'assistant', 'content': "The trees lean closer. " * 8 + "What do you do?"})
+
+
+def disk_usage(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main(path):
+    game_session = new_session()
+    for turn in range(TURNS):
+        play_turn(game_session, turn)
+    game_session['context'].build("system", game_session['messages'])
+
+    store = SnapshotStore(os.path.join(path, "snapshots"))
+    first, first_ms = timed(store.save, "bench", game_session)
+    size_first = disk_usage(store.path)
+    play_turn(game_session, TURNS)
+    second, second_ms = timed(store.save, "bench", game_session)
+    added = disk_usage(store.path) - size_first
+
+    restored, restore_ms = timed(SnapshotStore(store.path).load, "bench", second)
+    _, warm_restore_ms = timed(store.load, "bench", second)
+    assert restored['messages'] == game_session['messages']
+    assert restored['state'].get_state_dict() == game_session['state'].get_state_dict()
+
+    replayed, replay_ms = timed(replay, restored['journal'], None, restored['state'].started_at, path)
+    assert replayed.get_state_dict() == game_session['state'].get_state_dict()
+
+    print(f"{TURNS} turns, {len(game_session['messages'])} messages")
+    print(f"  first snapshot   : {first_ms:7.1f} ms, {size_first / 1024:7.1f} KiB")
+    print(f"  next snapshot    : {second_ms:7.1f} ms, {added / 1024:7.1f} KiB added (rest shared)")
+    print(f"  restore (cold)   : {restore_ms:7.1f} ms")
+    print(f"  restore (warm)   : {warm_restore_ms:7.1f} ms (history blocks shared in memory)")
+    print(f"  replay all turns : {replay_ms:7.1f} ms (state matches)")
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as path:
+        game_state.EVENT_LOG_DIR = path
+        main(path)
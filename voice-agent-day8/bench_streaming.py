@@ -0,0 +1,86 @@
+"""Time-to-first-word of /send_message vs /send_message_stream.
+
+Runs the Flask app in-process against a local fake SSE server whose reply
+ends in a STATE_UPDATE block, and checks the block never reaches the client.
+
+Run with: python bench_streaming.py
+"""
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from mock_llm_server import MockLLMServer
+
+REPLY = ("You step into the clearing. Moonlight spills over a shattered altar, and a hooded "
+         "figure turns toward you, clutching a lantern that burns with green fire. "
+         "What do you do?\n\n"
+         "[STATE_UPDATE]\n"
+         '{"player": {"gold": 40}, "events": {"description": "Met the lantern bearer", "importance": "major"}}\n'
+         "[/STATE_UPDATE]")
+TURNS = 20
+
+
+def read_events(response, start):
+    """Yield (event, data, seconds since start) from a streamed SSE response"""
+    buffer = b""
+    for chunk in response.response:
+        buffer += chunk
+        while b"\n\n" in buffer:
+            raw, buffer = buffer.split(b"\n\n", 1)
+            lines = dict(line.split(": ", 1) for line in raw.decode().split("\n"))
+            yield lines["event"], json.loads(lines["data"]), time.perf_counter() - start
+
+
+def main():
+    with MockLLMServer(reply=REPLY, token_delay=0.01) as server:
+        os.environ["GROQ_API_URL"] = server.url
+        os.environ["LLM_RATE_LIMIT"] = "1000"
+        import app
+        client = app.app.test_client()
+        client.get('/')
+        start = client.post('/start').get_json()
+        version, state_id = start['version'], start['state_id']
+
+        blocking = []
+        for _ in range(TURNS):
+            began = time.perf_counter()
+            data = client.post('/send_message', json={'message': 'I approach', 'version': version,
+                                                      'state_id': state_id}).get_json()
+            blocking.append(time.perf_counter() - began)
+            version, state_id = data['version'], data['state_id']
+
+        first_word = []
+        total = []
+        for _ in range(TURNS):
+            began = time.perf_counter()
+            response = client.post('/send_message_stream', json={'message': 'I approach', 'version': version,
+                                                                 'state_id': state_id}, buffered=False)
+            shown = ""
+            got_state = False
+            for event, data, elapsed in read_events(response, began):
+                if event == 'token':
+                    if not shown:
+                        first_word.append(elapsed)
+                    shown += data['text']
+                elif event == 'state':
+                    got_state = True
+                elif event == 'done':
+                    total.append(elapsed)
+                    version, state_id = data['version'], data['state_id']
+            assert "STATE_UPDATE" not in shown and "{" not in shown, shown
+            assert got_state
+
+    print(f"{TURNS} turns, {len(server.chunks())} deltas {server.token_delay * 1000:.0f} ms apart")
+    print(f"  blocking  : first word after {statistics.median(blocking) * 1000:7.1f} ms (p50)")
+    print(f"  streaming : first word after {statistics.median(first_word) * 1000:7.1f} ms (p50), "
+          f"done after {statistics.median(total) * 1000:7.1f} ms")
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as log_dir:
+        import game_state
+        game_state.EVENT_LOG_DIR = log_dir
+        os.environ["SESSION_DIR"] = log_dir
+        main()
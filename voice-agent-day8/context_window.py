@@ -0,0 +1,132 @@
+import os
+import re
+from collections import deque
+from functools import lru_cache
+
+# Rough token budget for everything sent to the chat API on one turn
+TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+# Most recent messages that are always sent in full
+RECENT_MESSAGES = int(os.getenv("CONTEXT_RECENT_MESSAGES", "8"))
+# Cap for the running "story so far" summary of folded turns
+SUMMARY_TOKENS = int(os.getenv("CONTEXT_SUMMARY_TOKENS", "800"))
+
+# Once over budget, fold down to this fraction of it. Folding in batches
+# keeps the summary (and so the prompt prefix) unchanged for several turns.
+FOLD_TARGET = 0.8
+
+# Per-message overhead of the chat format (role, separators)
+MESSAGE_OVERHEAD = 4
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+@lru_cache(maxsize=4096)
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token for English prose)"""
+    return len(text) // 4 + 1
+
+
+def _fold_line(message):
+    """One summary line for a message that no longer fits in the window"""
+    speaker = "Player" if message["role"] == "user" else "GM"
+    text = " ".join(message["content"].split())
+    text = _SENTENCE_END.split(text, 1)[0]
+    if len(text) > 200:
+        text = text[:197] + "..."
+    return f"- {speaker}: {text}"
+
+
+class ContextWindow:
+    """Fits the system prompt and chat history into a token budget.
+
+    The system prompt is always sent, the latest messages are sent in full
+    and anything older is folded, oldest first, into a running summary.
+    State is kept between turns so each call only looks at new messages.
+
+    Messages are ordered so the request only changes at its end from one
+    turn to the next: system prompt, summary, history, then the per-turn
+    state prompt just before the player's latest message.
+    """
+
+    def __init__(self, budget=TOKEN_BUDGET, recent_messages=RECENT_MESSAGES, summary_tokens=SUMMARY_TOKENS):
+        self.budget = budget
+        self.recent_messages = recent_messages
+        self.summary_tokens = summary_tokens
+        self.reset()
+
+    def reset(self):
+        # history[:self.folded] lives only in the summary
+        self.folded = 0
+        self._token_counts = []
+        self._window_tokens = 0
+        self._summary_lines = deque()
+        self._summary_size = 0
+        self._summary_text = None
+
+    def to_dict(self):
+        return {
+            "folded": self.folded,
+            "token_counts": self._token_counts,
+            "summary_lines": list(self._summary_lines)
+        }
+
+    @classmethod
+    def from_dict(cls, data, **kwargs):
+        window = cls(**kwargs)
+        window.folded = data["folded"]
+        window._token_counts = data["token_counts"]
+        window._window_tokens = sum(window._token_counts[window.folded:])
+        window._summary_lines = deque(data["summary_lines"])
+        window._summary_size = sum(estimate_tokens(line) for line in window._summary_lines)
+        window._summary_text = None
+        return window
+
+    def _count(self, message):
+        return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD
+
+    def _fold(self, history):
+        line = _fold_line(history[self.folded])
+        self._summary_lines.append(line)
+        self._summary_size += estimate_tokens(line)
+        while self._summary_size > self.summary_tokens and len(self._summary_lines) > 1:
+            self._summary_size -= estimate_tokens(self._summary_lines.popleft())
+        self._window_tokens -= self._token_counts[self.folded]
+        self.folded += 1
+        self._summary_text = None
+
+    def summary(self):
+        if not self._summary_lines:
+            return None
+        if self._summary_text is None:
+            self._summary_text = "STORY SO FAR (earlier turns, condensed):\n" + "\n".join(self._summary_lines)
+        return self._summary_text
+
+    def build(self, system_prompt, history, state_prompt=None):
+        """Messages to send for this turn"""
+        if len(history) < len(self._token_counts):
+            # History was replaced (e.g. a new game); start over
+            self.reset()
+        for message in history[len(self._token_counts):]:
+            count = self._count(message)
+            self._token_counts.append(count)
+            self._window_tokens += count
+
+        fixed = estimate_tokens(system_prompt) + MESSAGE_OVERHEAD
+        if state_prompt:
+            fixed += estimate_tokens(state_prompt) + MESSAGE_OVERHEAD
+
+        def total():
+            return fixed + self._summary_size + MESSAGE_OVERHEAD + self._window_tokens
+
+        if total() > self.budget:
+            while len(history) - self.folded > self.recent_messages and total() > self.budget * FOLD_TARGET:
+                self._fold(history)
+
+        messages = [{"role": "system", "content": system_prompt}]
+        summary = self.summary()
+        if summary:
+            messages.append({"role": "system", "content": summary})
+        window = history[self.folded:]
+        if not state_prompt:
+            return messages + window
+        return messages + window[:-1] + [{"role": "system", "content": state_prompt}] + window[-1:]
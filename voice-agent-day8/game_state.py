@@ -1,8 +1,60 @@
 import json
+import os
+import uuid
+from collections import deque
 from datetime import datetime
 
+# Sections that are plain dicts; changes are tracked per key
+DICT_SECTIONS = ("player", "location", "world_info")
+# Sections that are lists of dicts; changes are tracked per index
+LIST_SECTIONS = ("npcs", "quests")
+
+# Event log tiers: the newest events stay in state["events"], older ones are
+# folded into per-chapter digests and the full history is spilled to disk
+RECENT_EVENTS = 20
+CHAPTER_SIZE = 50
+MAX_CHAPTERS = 10
+EVENT_LOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "event_logs")
+
+
+def _name_key(name):
+    """Index key for an item's name. The LLM sometimes sends a list or dict
+    as a name; those can't be dict keys, so they're keyed by their JSON
+    (tagged, so it can't match a string name)"""
+    try:
+        hash(name)
+        return name
+    except TypeError:
+        return ("json", json.dumps(name, sort_keys=True))
+
 class GameState:
-    def __init__(self):
+    def __init__(self, event_log_dir=None, started_at=None):
+        # Identifies this state instance so clients can tell a reset apart
+        # from an ordinary version bump
+        self.state_id = uuid.uuid4().hex[:8]
+        # Timestamp of the opening event; passing it in makes replays reproducible
+        self.started_at = started_at or datetime.now().isoformat()
+        self.version = 0
+        # ("player", "hp") -> version it was last written in
+        self._dirty = {}
+        # section -> [(created_version, modified_version), ...] per element
+        self._item_versions = {}
+        self.event_log_dir = event_log_dir or EVENT_LOG_DIR
+        # Digests of compacted chapters, oldest dropped first (still on disk)
+        self.chapters = deque(maxlen=MAX_CHAPTERS)
+        # Number of events moved out of state["events"] into the on-disk log
+        self.events_spilled = 0
+        # How many of the first spilled events aren't in this state's log
+        # (restored from a snapshot whose log had gone); the log starts after them
+        self.events_lost = 0
+        # Version each in-memory event was added in, parallel to state["events"]
+        self._event_versions = [0]
+        # Version of the last compaction; clients older than this get the
+        # whole recent-events window instead of appends
+        self._events_compacted_version = 0
+        # get_summary() result and the version it was built for
+        self._summary = None
+        self._summary_version = None
         self.state = {
             "player": {
                 "name": "Adventurer",
@@ -33,7 +85,7 @@ class GameState:
             ],
             "events": [
                 {
-                    "timestamp": datetime.now().isoformat(),
+                    "timestamp": self.started_at,
                     "description": "Adventure begins at the Ancient Forest entrance",
                     "importance": "major"
                 }
@@ -56,56 +108,176 @@ class GameState:
                 "weather": "misty"
             }
         }
+        for section in LIST_SECTIONS:
+            self._item_versions[section] = [(0, 0)] * len(self.state[section])
+        self._reindex()
+    
+    def _reindex(self):
+        """Rebuild the name -> position maps for npcs and quests.
+
+        The lists in self.state stay the source of truth (and the serialized
+        shape); these maps only replace the linear scans by name.
+        """
+        self._index = {}
+        for section in ("npcs", "quests"):
+            index = {}
+            for position, item in enumerate(self.state[section]):
+                # First match wins, like the old linear search
+                index.setdefault(_name_key(item.get("name")), position)
+            self._index[section] = index
+        self._active_quests = {
+            position for position, quest in enumerate(self.state["quests"])
+            if quest.get("status") == "active"
+        }
+    
+    def _upsert(self, section, updated):
+        """Merge an item into a section by name, appending it if it's new"""
+        items = self.state[section]
+        name = _name_key(updated.get("name"))
+        position = self._index[section].get(name)
+        if position is None:
+            position = len(items)
+            items.append(updated)
+            self._index[section][name] = position
+        else:
+            items[position].update(updated)
+        self._mark_item(section, position)
+        if section == "quests":
+            if items[position].get("status") == "active":
+                self._active_quests.add(position)
+            else:
+                self._active_quests.discard(position)
     
     def get_state(self):
-        return json.dumps(self.state, indent=2)
+        return json.dumps(self.state, separators=(",", ":"))
     
     def get_state_dict(self):
         return self.state
     
+    def to_dict(self):
+        """Everything needed to restore this GameState, as plain JSON types"""
+        return {
+            "state_id": self.state_id,
+            "started_at": self.started_at,
+            "version": self.version,
+            "state": self.state,
+            "dirty": [[section, key, version] for (section, key), version in self._dirty.items()],
+            "item_versions": self._item_versions,
+            "chapters": list(self.chapters),
+            "events_spilled": self.events_spilled,
+            "events_lost": self.events_lost,
+            "event_versions": self._event_versions,
+            "events_compacted_version": self._events_compacted_version
+        }
+    
+    @classmethod
+    def from_dict(cls, data, event_log_dir=None):
+        game_state = cls(event_log_dir, data.get("started_at"))
+        game_state.state_id = data["state_id"]
+        game_state.version = data["version"]
+        game_state.state = data["state"]
+        game_state._dirty = {(section, key): version for section, key, version in data["dirty"]}
+        game_state._item_versions = {
+            section: [tuple(pair) for pair in versions]
+            for section, versions in data["item_versions"].items()
+        }
+        game_state.chapters.extend(data["chapters"])
+        game_state.events_spilled = data["events_spilled"]
+        game_state.events_lost = data.get("events_lost", 0)
+        game_state._event_versions = data["event_versions"]
+        game_state._events_compacted_version = data["events_compacted_version"]
+        game_state._reindex()
+        return game_state
+    
+    def _mark_keys(self, section, keys):
+        for key in keys:
+            self._dirty[(section, key)] = self.version
+    
+    def _mark_item(self, section, index):
+        versions = self._item_versions[section]
+        if index < len(versions):
+            versions[index] = (versions[index][0], self.version)
+        else:
+            versions.append((self.version, self.version))
+    
+    def get_patch(self, since_version, state_id=None):
+        """JSON patch (RFC 6902) taking a client from since_version to now.
+
+        Falls back to replacing the whole document when the client's copy
+        belongs to another state instance or is ahead of this one.
+        """
+        if state_id != self.state_id or since_version is None or since_version > self.version:
+            return [{"op": "replace", "path": "", "value": self.state}]
+        
+        patch = []
+        for (section, key), version in self._dirty.items():
+            if version > since_version:
+                # JSON pointer escaping for keys containing "~" or "/"
+                token = str(key).replace("~", "~0").replace("/", "~1")
+                patch.append({"op": "add", "path": f"/{section}/{token}", "value": self.state[section][key]})
+        
+        events = self.state["events"]
+        if self._events_compacted_version > since_version:
+            patch.append({"op": "replace", "path": "/events", "value": events})
+        else:
+            # Between compactions events are append-only, so only the tail can be new
+            first = len(events)
+            while first > 0 and self._event_versions[first - 1] > since_version:
+                first -= 1
+            patch.extend({"op": "add", "path": "/events/-", "value": event} for event in events[first:])
+        
+        for section in LIST_SECTIONS:
+            items = self.state[section]
+            versions = self._item_versions[section]
+            for index, (created, modified) in enumerate(versions):
+                if created > since_version:
+                    patch.append({"op": "add", "path": f"/{section}/-", "value": items[index]})
+                elif modified > since_version:
+                    patch.append({"op": "replace", "path": f"/{section}/{index}", "value": items[index]})
+        return patch
+    
+    def get_state_delta(self, since_version=None, state_id=None):
+        """Payload for the client: versioned patch against its last known state"""
+        return {
+            "state_id": self.state_id,
+            "version": self.version,
+            "patch": self.get_patch(since_version, state_id)
+        }
+    
     def update_state(self, updates):
         """Update specific parts of the state"""
+        self.version += 1
         try:
             if "player" in updates and isinstance(updates["player"], dict):
                 self.state["player"].update(updates["player"])
+                self._mark_keys("player", updates["player"])
             
             if "location" in updates and isinstance(updates["location"], dict):
                 self.state["location"].update(updates["location"])
+                self._mark_keys("location", updates["location"])
             
             if "npcs" in updates:
                 if isinstance(updates["npcs"], list):
                     for updated_npc in updates["npcs"]:
                         if isinstance(updated_npc, dict):
-                            found = False
-                            for npc in self.state["npcs"]:
-                                if npc.get("name") == updated_npc.get("name"):
-                                    npc.update(updated_npc)
-                                    found = True
-                                    break
-                            if not found:
-                                self.state["npcs"].append(updated_npc)
+                            self._upsert("npcs", updated_npc)
             
             if "events" in updates:
                 if isinstance(updates["events"], list):
-                    self.state["events"].extend(updates["events"])
+                    for event in updates["events"]:
+                        self._append_event(event)
                 elif isinstance(updates["events"], dict):
-                    self.state["events"].append(updates["events"])
+                    self._append_event(updates["events"])
             
             if "quests" in updates:
                 if isinstance(updates["quests"], list):
                     for updated_quest in updates["quests"]:
                         if isinstance(updated_quest, dict):
-                            found = False
-                            for quest in self.state["quests"]:
-                                if quest.get("name") == updated_quest.get("name"):
-                                    quest.update(updated_quest)
-                                    found = True
-                                    break
-                            if not found:
-                                self.state["quests"].append(updated_quest)
+                            self._upsert("quests", updated_quest)
             
             if "world_info" in updates and isinstance(updates["world_info"], dict):
                 self.state["world_info"].update(updates["world_info"])
+                self._mark_keys("world_info", updates["world_info"])
         except Exception as e:
             print(f"Error updating state: {e}")
             # Continue without crashing
@@ -116,7 +288,76 @@ class GameState:
             "description": description,
             "importance": importance
         }
-        self.state["events"].append(event)
+        self.version += 1
+        self._append_event(event)
+    
+    def _append_event(self, event):
+        events = self.state["events"]
+        events.append(event)
+        self._event_versions.append(self.version)
+        if len(events) >= RECENT_EVENTS + CHAPTER_SIZE:
+            self._compact_events()
+    
+    def _compact_events(self):
+        """Move the oldest chapter of events to disk, keeping only its digest"""
+        events = self.state["events"]
+        chapter = events[:CHAPTER_SIZE]
+        del events[:CHAPTER_SIZE]
+        del self._event_versions[:CHAPTER_SIZE]
+        
+        os.makedirs(self.event_log_dir, exist_ok=True)
+        with open(self._event_log_path(), "a") as f:
+            for event in chapter:
+                f.write(json.dumps(event) + "\n")
+        
+        major = [e for e in chapter if isinstance(e, dict) and e.get("importance") == "major"]
+        self.chapters.append({
+            "chapter": self.events_spilled // CHAPTER_SIZE + 1,
+            "first_event": self.events_spilled,
+            "event_count": len(chapter),
+            "major_events": major,
+            "minor_count": len(chapter) - len(major)
+        })
+        self.events_spilled += len(chapter)
+        self._events_compacted_version = self.version
+    
+    def _event_log_path(self):
+        return os.path.join(self.event_log_dir, f"{self.state_id}.jsonl")
+    
+    def branch(self):
+        """Give this state a new state_id and its own event log, holding just
+        the events spilled so far, so it no longer shares a log with the
+        state it was copied from (a restored snapshot carries on from here
+        while the abandoned timeline's events stay in the old log)"""
+        old_path = self._event_log_path()
+        self.state_id = uuid.uuid4().hex[:8]
+        logged = self.events_spilled - self.events_lost
+        if not logged:
+            return
+        try:
+            src = open(old_path)
+        except FileNotFoundError:
+            # Carry on with the spilled history empty rather than not at all
+            print(f"Event log {old_path} is missing; continuing without its {logged} events")
+            self.events_lost = self.events_spilled
+            return
+        os.makedirs(self.event_log_dir, exist_ok=True)
+        with src, open(self._event_log_path(), "w") as dst:
+            for position, line in enumerate(src):
+                if position >= logged:
+                    break
+                dst.write(line)
+    
+    def iter_events(self, start=0):
+        """Lazily yield the full event history from `start`, disk first then memory"""
+        if max(start, self.events_lost) < self.events_spilled:
+            with open(self._event_log_path()) as f:
+                for position, line in enumerate(f, self.events_lost):
+                    if position >= self.events_spilled:
+                        break
+                    if position >= start:
+                        yield json.loads(line)
+        yield from self.state["events"][max(start - self.events_spilled, 0):]
     
     def get_character_sheet(self):
         player = self.state["player"]
@@ -132,33 +373,38 @@ class GameState:
         }
     
     def get_active_quests(self):
-        return [q for q in self.state["quests"] if q["status"] == "active"]
+        quests = self.state["quests"]
+        return [quests[position] for position in sorted(self._active_quests)]
     
     def get_summary(self):
-        """Get a concise summary for the LLM"""
+        """Get a concise summary for the LLM (rebuilt only when the version changes)"""
+        if self._summary_version != self.version or self._summary is None:
+            self._summary = self._build_summary()
+            self._summary_version = self.version
+        return self._summary
+    
+    def _build_summary(self):
         player = self.state["player"]
         location = self.state["location"]
         active_quests = self.get_active_quests()
         recent_events = self.state["events"][-3:] if len(self.state["events"]) > 0 else []
         
-        summary = f"""
-CURRENT GAME STATE:
-Player: {player['name']} (Level {player['level']} {player['class']})
-HP: {player['hp']}/{player['max_hp']} | Status: {player['status']}
-Gold: {player['gold']} | Inventory: {', '.join(player['inventory'])}
-
-Location: {location['name']}
-Description: {location['description']}
-
-Active Quests: {len(active_quests)}
-"""
-        if active_quests:
-            for quest in active_quests:
-                summary += f"\n- {quest['name']}: {quest['description']}"
+        lines = [
+            "CURRENT GAME STATE:",
+            f"Player: {player['name']} (Level {player['level']} {player['class']})",
+            f"HP: {player['hp']}/{player['max_hp']} | Status: {player['status']}",
+            f"Gold: {player['gold']} | Inventory: {', '.join(player['inventory'])}",
+            "",
+            f"Location: {location['name']}",
+            f"Description: {location['description']}",
+            "",
+            f"Active Quests: {len(active_quests)}",
+            ""
+        ]
+        lines.extend(f"- {quest['name']}: {quest['description']}" for quest in active_quests)
         
         if recent_events:
-            summary += f"\n\nRecent Events:"
-            for event in recent_events:
-                summary += f"\n- {event['description']}"
+            lines.extend(["", "Recent Events:"])
+            lines.extend(f"- {event['description']}" for event in recent_events)
         
-        return summary.strip()
\ No newline at end of file
+        return "\n".join(lines).strip()
@@ -0,0 +1,305 @@
+"""Shared client for the chat completions API.
+
+One LLMClient per process keeps a pool of keep-alive connections and puts
+every upstream call through the same limits: a concurrency cap, a token
+bucket for the provider's request rate, and jittered retries on 429/5xx.
+AsyncLLMClient offers the same behaviour on asyncio (httpx) for async hosts.
+"""
+import asyncio
+import contextlib
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+
+import requests
+from requests.adapters import HTTPAdapter
+
+GROQ_API_URL = os.getenv("GROQ_API_URL", "https://api.groq.com/openai/v1/chat/completions")
+# Concurrent upstream calls allowed per process
+MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+# Sustained requests per second (0 or less: no limit, the default; set it
+# to the provider's limit for the key), and how many may go out back to back
+RATE_LIMIT = float(os.getenv("LLM_RATE_LIMIT", "0"))
+RATE_BURST = int(os.getenv("LLM_RATE_BURST", "10"))
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+# (connect, read) timeouts in seconds
+TIMEOUT = (5, 30)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 8.0
+
+
+class TokenBucket:
+    """Thread-safe token bucket; acquire() blocks until a token is free.
+    A rate of 0 or less never blocks."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """Take a token now if possible, else return how long to wait"""
+        if self.rate <= 0:
+            return 0
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        while True:
+            wait = self._reserve()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        while True:
+            wait = self._reserve()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram (seconds), cheap enough for every call"""
+
+    BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32, float("inf"))
+
+    def __init__(self):
+        self.counts = [0] * len(self.BUCKETS)
+        self.total = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        index = bisect_left(self.BUCKETS, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.total += seconds
+            self.count += 1
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-th quantile"""
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.BUCKETS, self.counts):
+            seen += count
+            if count and seen >= target:
+                return bound
+        return 0.0
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "count": self.count,
+                "mean": self.total / self.count if self.count else 0.0,
+                "buckets": dict(zip(map(str, self.BUCKETS), self.counts))
+            }
+
+
+def backoff_delay(attempt, retry_after=None):
+    """Full-jitter exponential backoff, honouring Retry-After (in seconds, up
+    to BACKOFF_CAP) when given; an HTTP date gets the usual backoff"""
+    if retry_after:
+        try:
+            delay = float(retry_after)
+        except ValueError:
+            delay = None
+        if delay is not None and delay >= 0:
+            return min(delay, BACKOFF_CAP)
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+class _BaseClient:
+    def __init__(self, url=None, api_key=None, max_concurrency=MAX_CONCURRENCY,
+                 rate=RATE_LIMIT, burst=RATE_BURST, max_retries=MAX_RETRIES, timeout=TIMEOUT):
+        self.url = url or GROQ_API_URL
+        self.api_key = api_key or os.getenv("GROQ_API_KEY")
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.bucket = TokenBucket(rate, burst)
+        self.latency = LatencyHistogram()
+        self.calls = 0
+        self.retries = 0
+        self.rate_limited = 0
+
+    @property
+    def headers(self):
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+
+    def _should_retry(self, status, attempt):
+        if status == 429:
+            self.rate_limited += 1
+        if status in RETRY_STATUSES and attempt < self.max_retries:
+            self.retries += 1
+            return True
+        return False
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "latency": self.latency.snapshot()
+        }
+
+
+class LLMClient(_BaseClient):
+    """Blocking client over a pooled requests.Session"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+
+    def post(self, payload, stream=False):
+        """POST a completion request.
+
+        Returns the final response, which may still be an error status once
+        retries run out. For streamed calls the concurrency slot is held
+        until the response is closed.
+        """
+        self._slots.acquire()
+        try:
+            response = self._send(payload, stream)
+        except Exception:
+            self._slots.release()
+            raise
+        if not stream:
+            self._slots.release()
+            return response
+
+        close = response.close
+        released = []
+
+        def close_and_release():
+            try:
+                close()
+            finally:
+                if not released:
+                    released.append(True)
+                    self._slots.release()
+
+        response.close = close_and_release
+        return response
+
+    def _send(self, payload, stream):
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            start = time.perf_counter()
+            try:
+                response = self.session.post(self.url, headers=self.headers, json=payload,
+                                             timeout=self.timeout, stream=stream)
+            except requests.ConnectionError:
+                if attempt >= self.max_retries:
+                    raise
+                self.retries += 1
+                time.sleep(backoff_delay(attempt))
+                attempt += 1
+                continue
+            # Time to response headers for streamed calls
+            self.latency.observe(time.perf_counter() - start)
+            self.calls += 1
+            if not self._should_retry(response.status_code, attempt):
+                return response
+            delay = backoff_delay(attempt, response.headers.get("Retry-After"))
+            response.close()
+            time.sleep(delay)
+            attempt += 1
+
+
+class AsyncLLMClient(_BaseClient):
+    """asyncio client over a pooled httpx.AsyncClient; create it inside the event loop"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # Imported here so the blocking client works without httpx installed
+        import httpx
+        connect, read = self.timeout
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read, connect=connect),
+            limits=httpx.Limits(max_connections=self.max_concurrency,
+                                max_keepalive_connections=self.max_concurrency)
+        )
+        self._transport_errors = (httpx.TransportError,)
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+
+    async def post(self, payload):
+        """POST a completion request and return the parsed JSON body (or raise)"""
+        async with self._slots:
+            attempt = 0
+            while True:
+                await self.bucket.acquire_async()
+                start = time.perf_counter()
+                try:
+                    response = await self.client.post(self.url, headers=self.headers, json=payload)
+                except self._transport_errors:
+                    if attempt >= self.max_retries:
+                        raise
+                    self.retries += 1
+                    await asyncio.sleep(backoff_delay(attempt))
+                    attempt += 1
+                    continue
+                self.latency.observe(time.perf_counter() - start)
+                self.calls += 1
+                if not self._should_retry(response.status_code, attempt):
+                    response.raise_for_status()
+                    return response.json()
+                await asyncio.sleep(backoff_delay(attempt, response.headers.get("Retry-After")))
+                attempt += 1
+
+    @contextlib.asynccontextmanager
+    async def stream(self, payload):
+        """Streamed completion request: `async with client.stream(payload) as
+        response` gives the httpx response once its headers are in, after
+        retries (check its status code). The concurrency slot is held until
+        the block exits."""
+        async with self._slots:
+            attempt = 0
+            while True:
+                await self.bucket.acquire_async()
+                start = time.perf_counter()
+                request = self.client.build_request("POST", self.url, headers=self.headers, json=payload)
+                try:
+                    response = await self.client.send(request, stream=True)
+                except self._transport_errors:
+                    if attempt >= self.max_retries:
+                        raise
+                    self.retries += 1
+                    await asyncio.sleep(backoff_delay(attempt))
+                    attempt += 1
+                    continue
+                # Time to response headers
+                self.latency.observe(time.perf_counter() - start)
+                self.calls += 1
+                if not self._should_retry(response.status_code, attempt):
+                    break
+                await response.aclose()
+                await asyncio.sleep(backoff_delay(attempt, response.headers.get("Retry-After")))
+                attempt += 1
+            try:
+                yield response
+            finally:
+                await response.aclose()
+
+    async def aclose(self):
+        await self.client.aclose()
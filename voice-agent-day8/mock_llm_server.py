@@ -0,0 +1,120 @@
+"""Local stand-in for the chat completions API, used by the benchmarks.
+
+Latency is modelled as a fixed base plus a per-KiB "prefill" cost so that
+larger prompts take longer, like they do upstream. Requests with
+"stream": true get an SSE stream of small deltas, `token_delay` apart.
+Every `rate_limit_every`-th request is answered with a 429 and every
+`slow_every`-th one takes an extra `slow_latency` seconds.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPLY = ("The torchlight trembles as something vast shifts in the dark beyond the trees. "
+         "Roots twist underfoot and a cold wind carries a half-remembered melody. "
+         "What do you do?")
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Room for a burst of concurrent connects from the load tests
+    request_queue_size = 256
+
+
+class MockLLMServer:
+    def __init__(self, base_latency=0.002, latency_per_kb=0.0005, reply=REPLY, token_delay=0.0,
+                 rate_limit_every=0, slow_every=0, slow_latency=0.5):
+        self.base_latency = base_latency
+        self.latency_per_kb = latency_per_kb
+        self.reply = reply
+        self.token_delay = token_delay
+        self.rate_limit_every = rate_limit_every
+        self.slow_every = slow_every
+        self.slow_latency = slow_latency
+        self.requests = 0
+        self.rate_limited = 0
+        self.connections = set()
+        self.request_bytes = 0
+        self._lock = threading.Lock()
+        self._server = _Server(("127.0.0.1", 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/v1/chat/completions"
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                with mock._lock:
+                    mock.requests += 1
+                    mock.request_bytes += len(body)
+                    mock.connections.add(self.client_address)
+                    number = mock.requests
+                if mock.rate_limit_every and number % mock.rate_limit_every == 0:
+                    with mock._lock:
+                        mock.rate_limited += 1
+                    self._reply(429, {"error": {"message": "Rate limit reached"}}, {"Retry-After": "0.05"})
+                    return
+                delay = mock.base_latency + mock.latency_per_kb * len(body) / 1024
+                if mock.slow_every and number % mock.slow_every == 0:
+                    delay += mock.slow_latency
+                time.sleep(delay)
+                if json.loads(body or b"{}").get("stream"):
+                    self._stream()
+                    return
+                if mock.token_delay:
+                    # Non-streaming callers wait for the whole generation
+                    time.sleep(mock.token_delay * len(mock.chunks()))
+                self._reply(200, {"choices": [{"message": {"role": "assistant", "content": mock.reply}}]})
+
+            def _reply(self, status, body, headers=None):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _stream(self):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for chunk in mock.chunks():
+                    event = {"choices": [{"delta": {"content": chunk}}]}
+                    self._write_chunk(f"data: {json.dumps(event)}\n\n".encode())
+                    time.sleep(mock.token_delay)
+                self._write_chunk(b"data: [DONE]\n\n")
+                self._write_chunk(b"")
+
+            def _write_chunk(self, data):
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+    def chunks(self):
+        """The reply cut into token-sized deltas (which may split the tags)"""
+        return [self.reply[i:i + 5] for i in range(0, len(self.reply), 5)]
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,155 @@
+"""Durable game session storage shared by all worker processes.
+
+Sessions are hashed onto SESSION_SHARDS SQLite files so writers for
+different sessions rarely contend for the same database lock. Each process
+keeps an LRU of decoded sessions in front of that; a cached entry is reused
+only while its revision still matches the row on disk, so a session updated
+by another worker is always reloaded.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from context_window import ContextWindow
+from game_state import GameState
+
+SESSION_DIR = os.getenv("SESSION_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "sessions"))
+SESSION_SHARDS = int(os.getenv("SESSION_SHARDS", "8"))
+# Decoded sessions kept in memory per process
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "1000"))
+
+
+def new_session():
+    return {
+        'state': GameState(),
+        'messages': [],
+        'context': ContextWindow(),
+        # [turn, updates] for every STATE_UPDATE applied, in order; see snapshots.replay()
+        'journal': []
+    }
+
+
+def dump_session(game_session):
+    """Compact binary form of a game session: zlib-compressed minified JSON"""
+    data = {
+        'state': game_session['state'].to_dict(),
+        'messages': game_session['messages'],
+        'context': game_session['context'].to_dict(),
+        'journal': game_session['journal']
+    }
+    return zlib.compress(json.dumps(data, separators=(",", ":")).encode(), 1)
+
+
+def load_session(blob):
+    data = json.loads(zlib.decompress(blob))
+    return {
+        'state': GameState.from_dict(data['state']),
+        'messages': data['messages'],
+        'context': ContextWindow.from_dict(data['context']),
+        'journal': data.get('journal', [])
+    }
+
+
+class SessionStore:
+    def __init__(self, path=SESSION_DIR, shards=SESSION_SHARDS, cache_size=SESSION_CACHE_SIZE):
+        self.path = path
+        self.shards = shards
+        self.cache_size = cache_size
+        # session_id -> (revision, game_session)
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._local = threading.local()
+        os.makedirs(path, exist_ok=True)
+        for shard in range(shards):
+            self._connection(shard)
+
+    def shard_for(self, session_id):
+        # crc32 rather than hash() so every process agrees on the shard
+        return zlib.crc32(session_id.encode()) % self.shards
+
+    def _connection(self, shard):
+        """Per-thread connection to one shard file"""
+        connections = getattr(self._local, "connections", None)
+        if connections is None:
+            connections = self._local.connections = {}
+        if shard not in connections:
+            db = sqlite3.connect(os.path.join(self.path, f"shard-{shard:02d}.sqlite3"), timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("CREATE TABLE IF NOT EXISTS sessions ("
+                       "id TEXT PRIMARY KEY, rev INTEGER NOT NULL, updated_at REAL NOT NULL, body BLOB NOT NULL)")
+            connections[shard] = db
+        return connections[shard]
+
+    def _cache_put(self, session_id, revision, game_session):
+        with self._cache_lock:
+            self._cache[session_id] = (revision, game_session)
+            self._cache.move_to_end(session_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def get(self, session_id):
+        """The stored session, or None"""
+        db = self._connection(self.shard_for(session_id))
+        row = db.execute("SELECT rev FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        if row is None:
+            return None
+        with self._cache_lock:
+            cached = self._cache.get(session_id)
+            if cached and cached[0] == row[0]:
+                self._cache.move_to_end(session_id)
+                return cached[1]
+        row = db.execute("SELECT rev, body FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        if row is None:
+            return None
+        game_session = load_session(row[1])
+        self._cache_put(session_id, row[0], game_session)
+        return game_session
+
+    def get_or_create(self, session_id):
+        game_session = self.get(session_id)
+        if game_session is None:
+            game_session = new_session()
+            self.put(session_id, game_session)
+        return game_session
+
+    def put(self, session_id, game_session):
+        blob = dump_session(game_session)
+        db = self._connection(self.shard_for(session_id))
+        with db:
+            row = db.execute(
+                "INSERT INTO sessions (id, rev, updated_at, body) VALUES (?, 1, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET rev = rev + 1, updated_at = excluded.updated_at, body = excluded.body "
+                "RETURNING rev",
+                (session_id, time.time(), blob)
+            ).fetchone()
+        self._cache_put(session_id, row[0], game_session)
+
+    def forget(self, session_id):
+        """Drop this process's copy, e.g. one changed by a turn that failed;
+        the next get() reloads the session as last saved"""
+        with self._cache_lock:
+            self._cache.pop(session_id, None)
+
+    def delete(self, session_id):
+        db = self._connection(self.shard_for(session_id))
+        with db:
+            db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+        with self._cache_lock:
+            self._cache.pop(session_id, None)
+
+    def purge_older_than(self, seconds):
+        """Drop sessions nobody has touched for `seconds`; returns how many"""
+        cutoff = time.time() - seconds
+        removed = 0
+        for shard in range(self.shards):
+            db = self._connection(shard)
+            with db:
+                removed += db.execute("DELETE FROM sessions WHERE updated_at < ?", (cutoff,)).rowcount
+        with self._cache_lock:
+            self._cache.clear()
+        return removed
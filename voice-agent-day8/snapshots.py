@@ -0,0 +1,203 @@
+"""Save/load snapshots of game sessions, and deterministic replay.
+
+A snapshot is a small manifest pointing at content-addressed chunks: one
+for the GameState, one for the context window, and fixed-size blocks of
+the message history and STATE_UPDATE journal. History only ever grows, so
+successive snapshots of a session share every block but the last and a
+new snapshot writes just the chunks that changed.
+
+Replay a session from the command line:
+
+    python snapshots.py list <session_id>
+    python snapshots.py replay <session_id> <snapshot_id> [--turn N]
+"""
+import argparse
+import copy
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+
+from context_window import ContextWindow
+from game_state import GameState
+
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "snapshots"))
+# Messages (or journal entries) per history block
+BLOCK_SIZE = 256
+# Full blocks whose chunk hash is remembered between snapshots
+SEALED_BLOCKS = 4096
+# Decoded history blocks kept in memory for restores
+DECODED_BLOCKS = 1024
+
+_ID = re.compile(r"^[0-9A-Za-z_-]+$")
+
+
+def _encode(value):
+    return json.dumps(value, separators=(",", ":")).encode()
+
+
+class SnapshotStore:
+    def __init__(self, path=SNAPSHOT_DIR):
+        self.path = path
+        # Full blocks already written: (kind, index, id of first item) ->
+        # (chunk hash, the block's items). Items are checked by identity, so a
+        # history that was reloaded or rewound is simply hashed again.
+        self._sealed = OrderedDict()
+        # chunk hash -> decoded history block. Messages and journal entries
+        # are never modified once appended, so restored sessions can share
+        # these lists' items instead of decoding them again.
+        self._decoded = OrderedDict()
+
+    def _chunk_path(self, digest):
+        return os.path.join(self.path, "chunks", digest[:2], digest)
+
+    def _manifest_dir(self, session_id):
+        if not _ID.match(session_id):
+            raise ValueError(f"Invalid session id: {session_id!r}")
+        return os.path.join(self.path, "manifests", session_id)
+
+    def _put_chunk(self, raw):
+        digest = hashlib.blake2b(raw, digest_size=16).hexdigest()
+        path = self._chunk_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(zlib.compress(raw, 1))
+            os.replace(tmp, path)
+        return digest
+
+    def _get_chunk(self, digest):
+        with open(self._chunk_path(digest), "rb") as f:
+            return json.loads(zlib.decompress(f.read()))
+
+    def _put_blocks(self, kind, items):
+        digests = []
+        for index, start in enumerate(range(0, len(items), BLOCK_SIZE)):
+            block = items[start:start + BLOCK_SIZE]
+            key = (kind, index, id(block[0]))
+            sealed = self._sealed.get(key)
+            if sealed and len(sealed[1]) == len(block) and all(a is b for a, b in zip(sealed[1], block)):
+                self._sealed.move_to_end(key)
+                digests.append(sealed[0])
+                continue
+            digest = self._put_chunk(_encode(block))
+            if len(block) == BLOCK_SIZE:
+                self._sealed[key] = (digest, block)
+                if len(self._sealed) > SEALED_BLOCKS:
+                    self._sealed.popitem(last=False)
+            self._remember_block(digest, block)
+            digests.append(digest)
+        return digests
+
+    def _remember_block(self, digest, block):
+        self._decoded[digest] = block
+        self._decoded.move_to_end(digest)
+        if len(self._decoded) > DECODED_BLOCKS:
+            self._decoded.popitem(last=False)
+
+    def _get_blocks(self, digests):
+        items = []
+        for digest in digests:
+            block = self._decoded.get(digest)
+            if block is None:
+                block = self._get_chunk(digest)
+            self._remember_block(digest, block)
+            items.extend(block)
+        return items
+
+    def save(self, session_id, game_session):
+        """Write a snapshot and return its id"""
+        state = game_session['state']
+        context = game_session['context'].to_dict()
+        manifest = {
+            "session_id": session_id,
+            "created_at": time.time(),
+            "turns": len(game_session['messages']),
+            "state": self._put_chunk(_encode(state.to_dict())),
+            "context": self._put_chunk(_encode(context)),
+            "messages": self._put_blocks("messages", game_session['messages']),
+            "journal": self._put_blocks("journal", game_session['journal'])
+        }
+        snapshot_id = f"{manifest['turns']:06d}-{uuid.uuid4().hex[:8]}"
+        directory = self._manifest_dir(session_id)
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"{snapshot_id}.json"), "w") as f:
+            json.dump(manifest, f)
+        return snapshot_id
+
+    def manifest(self, session_id, snapshot_id):
+        if not _ID.match(snapshot_id):
+            raise ValueError(f"Invalid snapshot id: {snapshot_id!r}")
+        with open(os.path.join(self._manifest_dir(session_id), f"{snapshot_id}.json")) as f:
+            return json.load(f)
+
+    def list(self, session_id):
+        """Snapshot ids for a session, oldest first"""
+        directory = self._manifest_dir(session_id)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(name[:-len(".json")] for name in os.listdir(directory) if name.endswith(".json"))
+
+    def load(self, session_id, snapshot_id, branch=True):
+        """Rebuild the game session stored in a snapshot. With branch=False
+        (to inspect it, not play on) its state keeps the snapshot's state_id
+        and event log, and nothing is written."""
+        manifest = self.manifest(session_id, snapshot_id)
+        messages = self._get_blocks(manifest["messages"])
+        journal = self._get_blocks(manifest["journal"])
+        state = GameState.from_dict(self._get_chunk(manifest["state"]))
+        if branch:
+            # The snapshot's state_id may have spilled more events since; carry
+            # on in a log of its own rather than after the abandoned timeline's
+            state.branch()
+        return {
+            'state': state,
+            'messages': messages,
+            'context': ContextWindow.from_dict(self._get_chunk(manifest["context"])),
+            'journal': journal
+        }
+
+
+def replay(journal, turn=None, started_at=None, event_log_dir=None):
+    """Rebuild the GameState as it was once the first `turn` messages had been
+    exchanged, by re-applying the journaled STATE_UPDATEs to a fresh state"""
+    state = GameState(event_log_dir, started_at)
+    for applied_at, updates in journal:
+        # applied_at is the index the GM reply carrying the update was stored at
+        if turn is not None and applied_at >= turn:
+            break
+        state.update_state(copy.deepcopy(updates))
+    return state
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and replay day8 game snapshots")
+    commands = parser.add_subparsers(dest="command", required=True)
+    list_parser = commands.add_parser("list", help="list snapshots of a session")
+    list_parser.add_argument("session_id")
+    replay_parser = commands.add_parser("replay", help="rebuild the game state at a turn")
+    replay_parser.add_argument("session_id")
+    replay_parser.add_argument("snapshot_id")
+    replay_parser.add_argument("--turn", type=int, help="message count to replay up to (default: all)")
+    args = parser.parse_args()
+
+    store = SnapshotStore()
+    if args.command == "list":
+        for snapshot_id in store.list(args.session_id):
+            print(snapshot_id)
+        return
+
+    game_session = store.load(args.session_id, args.snapshot_id, branch=False)
+    with tempfile.TemporaryDirectory() as log_dir:
+        state = replay(game_session['journal'], args.turn, game_session['state'].started_at, log_dir)
+        print(json.dumps(state.get_state_dict(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
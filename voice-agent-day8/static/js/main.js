@@ -2,6 +2,11 @@ let recognition;
 let isRecording = false;
 let isMuted = false;
 
+// Local copy of the world state, kept in sync with JSON patches from the server
+let gameState = null;
+let stateId = null;
+let stateVersion = null;
+
 // Initialize Speech Recognition
 if ('webkitSpeechRecognition' in window || 'SpeechRecognition' in window) {
     const SpeechRecognition = window.SpeechRecognition || window.webkitSpeechRecognition;
@@ -97,7 +102,7 @@ muteBtn.addEventListener('click', () => {
 // Functions
 async function startGame() {
     try {
-        const response = await fetch('/start', {
+        const response = await fetch('start', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
@@ -115,7 +120,10 @@ async function startGame() {
         addMessage('gm', data.message);
         
         // Update game state
-        updateGameState(data.game_state);
+        gameState = data.game_state;
+        stateId = data.state_id;
+        stateVersion = data.version;
+        updateGameState(gameState);
         
         // Speak the initial message
         speakText(data.message);
@@ -127,6 +135,7 @@ async function startGame() {
 
 async function sendMessage(message) {
     if (!message.trim()) return;
+    const turn = voiceTrace.turn();
     
     // Disable inputs
     setInputsEnabled(false);
@@ -138,30 +147,54 @@ async function sendMessage(message) {
     const thinkingId = addThinkingIndicator();
     
     try {
-        const response = await fetch('/send_message', {
+        const response = await turn.fetch('send_message_stream', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
             },
-            body: JSON.stringify({ message })
+            body: JSON.stringify({ message, version: stateVersion, state_id: stateId })
         });
         
-        const data = await response.json();
-        
-        // Remove thinking indicator
-        removeThinkingIndicator(thinkingId);
-        
-        if (data.error) {
+        if (!response.ok) {
+            const data = await response.json();
+            removeThinkingIndicator(thinkingId);
             alert('Error: ' + data.error);
-        } else {
-            // Add GM response
-            addMessage('gm', data.message);
-            
-            // Update game state
-            updateGameState(data.game_state);
-            
-            // Speak the GM's response
-            speakText(data.message);
+            return;
+        }
+        
+        // Narration streams in as server-sent events
+        let contentDiv = null;
+        let thinking = true;
+        await readEventStream(response, (event, data) => {
+            if (thinking) {
+                removeThinkingIndicator(thinkingId);
+                thinking = false;
+            }
+            if (event === 'token') {
+                if (!contentDiv) {
+                    contentDiv = addMessage('gm', '');
+                }
+                contentDiv.textContent += data.text;
+                storyContainer.scrollTop = storyContainer.scrollHeight;
+            } else if (event === 'state') {
+                applyStatePatch(data);
+                updateGameState(gameState);
+            } else if (event === 'done') {
+                if (!contentDiv) {
+                    contentDiv = addMessage('gm', '');
+                }
+                contentDiv.textContent = data.message;
+                applyStatePatch(data);
+                updateGameState(gameState);
+                
+                // Speak the GM's response
+                speakText(data.message, turn);
+            } else if (event === 'error') {
+                alert('Error: ' + data.error);
+            }
+        });
+        if (thinking) {
+            removeThinkingIndicator(thinkingId);
         }
     } catch (error) {
         console.error('Error sending message:', error);
@@ -169,6 +202,7 @@ async function sendMessage(message) {
         alert('Failed to send message. Please try again.');
     } finally {
         setInputsEnabled(true);
+        turn.finish();
     }
 }
 
@@ -192,6 +226,31 @@ function addMessage(type, content) {
     
     // Scroll to bottom
     storyContainer.scrollTop = storyContainer.scrollHeight;
+    
+    return contentDiv;
+}
+
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const raw = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            let event = 'message';
+            let data = '';
+            raw.split('\n').forEach(line => {
+                if (line.startsWith('event: ')) event = line.slice(7);
+                else if (line.startsWith('data: ')) data += line.slice(6);
+            });
+            onEvent(event, JSON.parse(data));
+        }
+    }
 }
 
 function addThinkingIndicator() {
@@ -224,6 +283,25 @@ function removeThinkingIndicator(id) {
     }
 }
 
+function applyStatePatch(data) {
+    data.patch.forEach(op => {
+        if (op.path === '') {
+            gameState = op.value;
+            return;
+        }
+        const keys = op.path.slice(1).split('/').map(key => key.replace(/~1/g, '/').replace(/~0/g, '~'));
+        const last = keys.pop();
+        const target = keys.reduce((obj, key) => obj[key], gameState);
+        if (Array.isArray(target) && last === '-') {
+            target.push(op.value);
+        } else {
+            target[last] = op.value;
+        }
+    });
+    stateId = data.state_id;
+    stateVersion = data.version;
+}
+
 function updateGameState(state) {
     // Update character sheet
     document.getElementById('char-name').textContent = state.player.name;
@@ -321,6 +399,7 @@ function startRecording() {
         voiceBtn.classList.add('recording');
         voiceBtn.querySelector('.voice-text').textContent = 'Release to Stop';
         recognition.start();
+        voiceTrace.listening();
     }
 }
 
@@ -341,7 +420,7 @@ function setInputsEnabled(enabled) {
     textInput.disabled = !enabled;
 }
 
-function speakText(text) {
+function speakText(text, turn = null) {
     // Check if muted
     if (isMuted) {
         console.log('Voice is muted');
@@ -384,6 +463,7 @@ function speakText(text) {
             }
         };
         
+        if (turn) turn.speak(utterance);
         speechSynthesis.speak(utterance);
     } else {
         console.log('Text-to-speech not supported in this browser');
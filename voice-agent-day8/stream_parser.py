@@ -0,0 +1,77 @@
+import json
+
+OPEN_TAG = "[STATE_UPDATE]"
+CLOSE_TAG = "[/STATE_UPDATE]"
+
+
+class StateUpdateParser:
+    """Splits a streamed GM reply into narrative text and the STATE_UPDATE block.
+
+    feed() returns the part of each chunk that is safe to show the player.
+    Text that could be the start of the delimiter is held back until the
+    next chunk settles it, so the tag never reaches the browser. Once the
+    closing tag arrives the JSON is parsed and exposed as `updates`.
+    """
+
+    def __init__(self):
+        self._visible = []
+        self._pending = ""
+        self._block = None
+        self.closed = False
+        self.updates = None
+
+    def feed(self, chunk):
+        if self.closed:
+            return ""
+        if self._block is not None:
+            self._feed_block(chunk)
+            return ""
+
+        buffer = self._pending + chunk
+        start = buffer.find(OPEN_TAG)
+        if start != -1:
+            visible = buffer[:start]
+            self._pending = ""
+            self._block = ""
+            self._feed_block(buffer[start + len(OPEN_TAG):])
+        else:
+            keep = self._partial_tag_length(buffer)
+            visible = buffer[:len(buffer) - keep]
+            self._pending = buffer[len(buffer) - keep:]
+        self._visible.append(visible)
+        return visible
+
+    def _feed_block(self, chunk):
+        # Only the tail can complete a tag that wasn't there before
+        search_from = max(len(self._block) - len(CLOSE_TAG), 0)
+        self._block += chunk
+        end = self._block.find(CLOSE_TAG, search_from)
+        if end == -1:
+            return
+        self.closed = True
+        try:
+            self.updates = json.loads(self._block[:end].strip())
+        except json.JSONDecodeError:
+            self.updates = None
+        self._block = ""
+
+    @staticmethod
+    def _partial_tag_length(buffer):
+        """Length of the longest suffix of buffer that is a prefix of OPEN_TAG"""
+        for size in range(min(len(OPEN_TAG) - 1, len(buffer)), 0, -1):
+            if buffer.endswith(OPEN_TAG[:size]):
+                return size
+        return 0
+
+    def finish(self):
+        """Flush held-back text; returns any of it that turned out to be narrative"""
+        tail = ""
+        if self._block is None and not self.closed:
+            tail = self._pending
+            self._visible.append(tail)
+        self._pending = ""
+        return tail
+
+    @property
+    def text(self):
+        return "".join(self._visible).strip()
@@ -0,0 +1,135 @@
+"""Streaming replies: the STATE_UPDATE block never reaches the player.
+
+The parser is fed the reply split at every possible point; the endpoint is
+run in-process against a local fake SSE server (mock_llm_server.py) that
+streams the same reply a few characters at a time.
+
+Run with: python -m pytest test_streaming.py
+"""
+import copy
+import importlib.util
+import json
+import os
+import sys
+
+import pytest
+
+from mock_llm_server import MockLLMServer
+from stream_parser import StateUpdateParser
+
+NARRATIVE = ("You step into the clearing. A hooded figure turns toward you, clutching a "
+             "lantern that burns with green fire. What do you do?")
+UPDATES = {"player": {"gold": 40}, "events": {"description": "Met the lantern bearer", "importance": "major"}}
+REPLY = f"{NARRATIVE}\n\n[STATE_UPDATE]\n{json.dumps(UPDATES)}\n[/STATE_UPDATE]"
+
+
+def feed_all(chunks):
+    parser = StateUpdateParser()
+    shown = "".join(parser.feed(chunk) for chunk in chunks) + parser.finish()
+    return parser, shown
+
+
+@pytest.mark.parametrize("split", range(1, len(REPLY)))
+def test_tag_split_anywhere_is_hidden(split):
+    parser, shown = feed_all([REPLY[:split], REPLY[split:]])
+    assert "[" not in shown and "{" not in shown
+    assert parser.text == NARRATIVE
+    assert parser.updates == UPDATES
+
+
+def test_one_character_at_a_time():
+    parser, shown = feed_all(list(REPLY))
+    assert shown.strip() == NARRATIVE
+    assert parser.updates == UPDATES
+
+
+def test_reply_without_block_is_all_shown():
+    text = "Nothing happens. [STATE"
+    parser, shown = feed_all(list(text))
+    assert shown == text and parser.updates is None
+
+
+def test_bad_json_is_hidden_and_ignored():
+    parser, shown = feed_all([NARRATIVE, "[STATE_UPDATE]{not json[/STATE_UPDATE]"])
+    assert shown == NARRATIVE and parser.updates is None
+
+
+@pytest.fixture(scope="module")
+def llm_server():
+    with MockLLMServer(reply=REPLY, token_delay=0.001) as server:
+        yield server
+
+
+@pytest.fixture(scope="module")
+def day8(tmp_path_factory, llm_server):
+    """app.py, run against llm_server with its data in a temporary directory"""
+    data_dir = tmp_path_factory.mktemp("day8")
+    env = {"GROQ_API_URL": llm_server.url, "SESSION_DIR": str(data_dir / "sessions"),
+           "SNAPSHOT_DIR": str(data_dir / "snapshots")}
+    saved = {name: os.environ.get(name) for name in env}
+    os.environ.update(env)
+    import game_state
+    game_state.EVENT_LOG_DIR = str(data_dir / "event_logs")
+    # Under a name of its own, so other apps' tests can import theirs
+    spec = importlib.util.spec_from_file_location("day8_app", os.path.join(os.path.dirname(__file__), "app.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    yield module
+    for name, value in saved.items():
+        if value is None:
+            os.environ.pop(name, None)
+        else:
+            os.environ[name] = value
+
+
+@pytest.fixture
+def client(day8):
+    return day8.app.test_client()
+
+
+def read_events(response):
+    for raw in response.get_data(as_text=True).split("\n\n"):
+        if raw:
+            lines = dict(line.split(": ", 1) for line in raw.split("\n"))
+            yield lines["event"], json.loads(lines["data"])
+
+
+def test_stream_endpoint_hides_block_and_applies_it(client):
+    start = client.post("/start").get_json()
+    response = client.post("/send_message_stream", json={
+        "message": "I approach", "version": start["version"], "state_id": start["state_id"]})
+    events = list(read_events(response))
+    names = [name for name, _ in events]
+    shown = "".join(data["text"] for name, data in events if name == "token")
+
+    assert names[0] == "token" and names[-1] == "done" and "state" in names
+    assert shown.strip() == NARRATIVE
+    done = events[-1][1]
+    assert done["message"] == NARRATIVE
+    assert client.get("/get_state").get_json()["player"]["gold"] == 40
+
+
+def test_blocking_endpoint_says_the_same(client):
+    client.post("/start")
+    data = client.post("/send_message", json={"message": "I approach"}).get_json()
+    assert data["message"] == NARRATIVE
+
+
+@pytest.mark.parametrize("endpoint", ["/send_message", "/send_message_stream"])
+def test_failed_turn_leaves_no_trace(day8, client, llm_server, monkeypatch, endpoint):
+    client.post("/start")
+    with client.session_transaction() as session:
+        session_id = session["session_id"]
+    before = copy.deepcopy(day8.get_game_state(session_id)["messages"])
+
+    # Every attempt is rate limited, so the turn fails once retries run out
+    monkeypatch.setattr(llm_server, "rate_limit_every", 1)
+    response = client.post(endpoint, json={"message": "I approach"})
+    assert response.status_code == 429 or "event: error" in response.get_data(as_text=True)
+    assert day8.get_game_state(session_id)["messages"] == before
+
+    monkeypatch.setattr(llm_server, "rate_limit_every", 0)
+    client.post("/send_message", json={"message": "I approach"})
+    roles = [message["role"] for message in day8.get_game_state(session_id)["messages"]]
+    assert roles == ["assistant", "user", "assistant"]
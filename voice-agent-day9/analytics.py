@@ -0,0 +1,182 @@
+"""Columnar rollups of orders for the analytics endpoints.
+
+Each order adds one row to a set of NumPy columns (timestamp, total,
+customer code, units) and one row per line item to the line columns
+(product code, quantity, revenue). Ids are turned into small integer codes
+on the way in, so every aggregate is a vectorised bincount or reduction
+over plain arrays instead of a pass over order dicts. Columns grow by
+doubling, so adding an order is amortised O(1).
+
+Timestamps are the wall-clock time in each order's created_at, counted in
+seconds as if it were UTC, so seconds // 86400 is the calendar day the
+order was placed on.
+"""
+import calendar
+import threading
+from datetime import date, datetime
+
+import numpy as np
+
+ORDER_COLUMNS = {"timestamp": np.int64, "total": np.int64, "customer": np.int32, "units": np.int32}
+LINE_COLUMNS = {"product": np.int32, "quantity": np.int32, "revenue": np.int64}
+DAY = 86400
+# The session id the app falls back to when a client sends none; everyone
+# without one shares it, so it doesn't identify a customer
+ANONYMOUS_CUSTOMER = "default"
+
+
+def _seconds(created_at):
+    return calendar.timegm(datetime.fromisoformat(created_at).timetuple())
+
+
+class _Columns:
+    """Same-length growable arrays"""
+
+    def __init__(self, dtypes, capacity=1024):
+        self.size = 0
+        self.arrays = {name: np.empty(capacity, dtype) for name, dtype in dtypes.items()}
+
+    def _reserve(self, count):
+        capacity = len(next(iter(self.arrays.values())))
+        if self.size + count <= capacity:
+            return
+        capacity = max(capacity * 2, self.size + count)
+        for name, array in self.arrays.items():
+            grown = np.empty(capacity, array.dtype)
+            grown[:self.size] = array[:self.size]
+            self.arrays[name] = grown
+
+    def append(self, **values):
+        self._reserve(1)
+        for name, value in values.items():
+            self.arrays[name][self.size] = value
+        self.size += 1
+
+    def extend(self, **columns):
+        count = len(next(iter(columns.values())))
+        self._reserve(count)
+        for name, values in columns.items():
+            self.arrays[name][self.size:self.size + count] = values
+        self.size += count
+
+    def __getitem__(self, name):
+        return self.arrays[name][:self.size]
+
+
+class OrderRollup:
+    def __init__(self):
+        self.orders = _Columns(ORDER_COLUMNS)
+        self.lines = _Columns(LINE_COLUMNS)
+        # id -> code, and the ids in code order
+        self.product_codes = {}
+        self.products = []
+        self.customer_codes = {}
+        self.customers = []
+        self._lock = threading.Lock()
+
+    def _code(self, codes, names, name):
+        code = codes.get(name)
+        if code is None:
+            code = codes[name] = len(names)
+            names.append(name)
+        return code
+
+    def add(self, order):
+        """Fold one order (as stored in the ledger) into the columns"""
+        with self._lock:
+            units = 0
+            for item in order['items']:
+                quantity = item.get('quantity', 1)
+                units += quantity
+                self.lines.append(product=self._code(self.product_codes, self.products, item['product_id']),
+                                  quantity=quantity, revenue=item['price'] * quantity)
+            # Orders placed anonymously, or before customers were recorded,
+            # count as one-off customers
+            customer = order.get('customer')
+            if not customer or customer == ANONYMOUS_CUSTOMER:
+                customer = f"order:{order['id']}"
+            self.orders.append(timestamp=_seconds(order['created_at']), total=order['total'],
+                               customer=self._code(self.customer_codes, self.customers, customer), units=units)
+
+    def extend(self, orders, lines, products, customers):
+        """Bulk-load pre-coded columns: `orders` and `lines` map column name
+        to array, `products` and `customers` are the ids for codes 0..n"""
+        with self._lock:
+            for name in products:
+                self._code(self.product_codes, self.products, name)
+            for name in customers:
+                self._code(self.customer_codes, self.customers, name)
+            self.orders.extend(**orders)
+            self.lines.extend(**lines)
+
+    def __len__(self):
+        return self.orders.size
+
+    def _snapshot(self):
+        # Views of the filled part; later appends write past their end (or
+        # into a new array), so these stay consistent without holding the lock
+        with self._lock:
+            return ({name: self.orders[name] for name in ORDER_COLUMNS},
+                    {name: self.lines[name] for name in LINE_COLUMNS}, list(self.products))
+
+    def revenue_by_day(self, start=None, end=None):
+        """[{'date', 'orders', 'revenue'}] for each day with orders, between
+        the `start` and `end` dates (inclusive, either may be None)"""
+        orders, _, _ = self._snapshot()
+        if not len(orders["timestamp"]):
+            return []
+        days = orders["timestamp"] // DAY
+        mask = np.ones(len(days), bool)
+        if start is not None:
+            mask &= days >= (start - date(1970, 1, 1)).days
+        if end is not None:
+            mask &= days <= (end - date(1970, 1, 1)).days
+        days = days[mask]
+        if not len(days):
+            return []
+        first = days.min()
+        counts = np.bincount(days - first)
+        revenue = np.bincount(days - first, weights=orders["total"][mask])
+        present = np.flatnonzero(counts)
+        epoch = date(1970, 1, 1).toordinal()
+        return [
+            {"date": date.fromordinal(epoch + int(first + offset)).isoformat(),
+             "orders": int(counts[offset]), "revenue": int(revenue[offset])}
+            for offset in present
+        ]
+
+    def top_products(self, limit=10, by="revenue"):
+        """Best-selling products by 'revenue' or 'quantity'"""
+        _, lines, products = self._snapshot()
+        if not len(lines["product"]):
+            return []
+        quantity = np.bincount(lines["product"], weights=lines["quantity"], minlength=len(products))
+        revenue = np.bincount(lines["product"], weights=lines["revenue"], minlength=len(products))
+        key = revenue if by == "revenue" else quantity
+        limit = min(limit, len(key))
+        top = np.argpartition(-key, limit - 1)[:limit]
+        top = top[np.argsort(-key[top], kind="stable")]
+        return [{"product_id": products[code], "quantity": int(quantity[code]), "revenue": int(revenue[code])}
+                for code in top if key[code] > 0]
+
+    def summary(self):
+        """Order count, revenue, average basket and repeat-customer rates"""
+        orders, _, _ = self._snapshot()
+        count = len(orders["total"])
+        if not count:
+            return {"orders": 0, "revenue": 0, "average_order_value": 0, "average_basket_size": 0,
+                    "customers": 0, "repeat_customer_rate": 0, "repeat_order_share": 0}
+        per_customer = np.bincount(orders["customer"])
+        customers = int(np.count_nonzero(per_customer))
+        repeat = per_customer >= 2
+        revenue = int(orders["total"].sum())
+        return {
+            "orders": count,
+            "revenue": revenue,
+            "average_order_value": round(revenue / count, 2),
+            "average_basket_size": round(float(orders["units"].mean()), 2),
+            "customers": customers,
+            # Share of customers with more than one order, and of orders they placed
+            "repeat_customer_rate": round(int(repeat.sum()) / customers, 4),
+            "repeat_order_share": round(int(per_customer[repeat].sum()) / count, 4)
+        }
@@ -1,11 +1,27 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, redirect, send_file
 from flask_cors import CORS
-import json
+import atexit
 import os
-from datetime import datetime
-import uuid
+import sys
+import threading
+import requests
+from datetime import date, datetime
+from catalog_index import CatalogIndex, SORTS
+from query_parser import QueryParser
+from order_ledger import OrderLedger
+from cart_store import CartStore
+from image_cache import ImageCache, NotAnImage, THUMB_WIDTHS
+from analytics import OrderRollup
+
+# The shared metrics and tracing modules live next to the day folders
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'voice-agent-metrics'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'voice-agent-tracing'))
+from metrics import instrument
+from tracing import trace_turns
 
 app = Flask(__name__)
+metrics = instrument(app, 'day9')
+trace_turns(app, 'day9')
 CORS(app)
 
 # Product Catalog with realistic image URLs
@@ -136,44 +152,109 @@ PRODUCTS = [
     }
 ]
 
-# In-memory cart storage (per session)
-carts = {}
+# Indexes over PRODUCTS, built once
+CATALOG = CatalogIndex(PRODUCTS)
+PARSER = QueryParser(CATALOG)
+
+# How categories read in chat replies, when the plural of the name won't do
+CATEGORY_LABELS = {"tshirt": "t-shirts"}
+# Products returned with a chat reply
+CHAT_RESULTS = 12
+
+# Page size for /api/catalog when none is given, and the most a client may ask for
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
 
-# Orders file
-ORDERS_FILE = "orders.json"
+# Carts per session; set CART_DB to keep carts pushed out of memory
+carts = CartStore()
+if carts.path:
+    atexit.register(carts.flush)
 
-def load_orders():
-    if os.path.exists(ORDERS_FILE):
-        with open(ORDERS_FILE, 'r') as f:
-            return json.load(f)
-    return []
+# Local thumbnails of product images, served by /img/<product_id>
+images = ImageCache()
+# How long browsers may reuse a thumbnail before revalidating its ETag
+IMAGE_MAX_AGE = 24 * 3600
 
-def save_orders(orders):
-    with open(ORDERS_FILE, 'w') as f:
-        json.dump(orders, f, indent=2)
+# Orders from before the ledger, imported into it on first start
+ORDERS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "orders.json")
+orders = OrderLedger(legacy_file=ORDERS_FILE)
+# Columnar totals over every order, kept current as orders commit
+rollup = OrderRollup()
+orders.subscribe(rollup.add)
+# Longest Idempotency-Key header accepted on /api/orders
+MAX_IDEMPOTENCY_KEY = 255
+
+def find_product(user_message):
+    """The product a chat message names, by name or id, or by a description
+    that fits exactly one product ("I want a black hoodie"); a description
+    has to say what kind of product, not just a colour or a price"""
+    for product in PRODUCTS:
+        if product['name'].lower() in user_message or product['id'] in user_message:
+            return product
+    slots = PARSER.parse(user_message)
+    if 'category' in slots:
+        result = CATALOG.query(**slots, limit=2, facets=False)
+        if result['total'] == 1:
+            return result['products'][0]
+    return None
+
+def describe_query(slots):
+    """Plain-English summary of parsed slots, e.g. 'black hoodies under ₹2000'"""
+    words = []
+    if 'size' in slots:
+        words.append(f"size {slots['size'].upper()}")
+    if 'color' in slots:
+        words.append(slots['color'])
+    category = slots.get('category')
+    if not category:
+        words.append("products")
+    elif category in CATEGORY_LABELS:
+        words.append(CATEGORY_LABELS[category])
+    elif category.endswith('s'):
+        words.append(category)
+    elif category.endswith(('ch', 'sh', 'x')):
+        words.append(f"{category}es")
+    else:
+        words.append(f"{category}s")
+    if 'min_price' in slots and 'max_price' in slots:
+        words.append(f"between ₹{slots['min_price']} and ₹{slots['max_price']}")
+    elif 'max_price' in slots:
+        words.append(f"under ₹{slots['max_price']}")
+    elif 'min_price' in slots:
+        words.append(f"over ₹{slots['min_price']}")
+    return ' '.join(words)
+
+@app.route('/')
+def index():
+    return send_file(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'index.html'))
 
 @app.route('/api/catalog', methods=['GET'])
 def get_catalog():
     """ACP-style catalog endpoint"""
     category = request.args.get('category')
-    max_price = request.args.get('max_price', type=int)
     color = request.args.get('color')
+    size = request.args.get('size')
+    min_price = request.args.get('min_price', type=int)
+    max_price = request.args.get('max_price', type=int)
+    sort = request.args.get('sort')
+    page = max(request.args.get('page', 1, type=int), 1)
+    page_size = min(max(request.args.get('page_size', DEFAULT_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
     
-    filtered_products = PRODUCTS.copy()
-    
-    if category:
-        filtered_products = [p for p in filtered_products if p['category'].lower() == category.lower()]
-    
-    if max_price:
-        filtered_products = [p for p in filtered_products if p['price'] <= max_price]
-    
-    if color:
-        filtered_products = [p for p in filtered_products if p.get('color', '').lower() == color.lower()]
+    if sort and sort not in SORTS:
+        return jsonify({"error": f"Unknown sort '{sort}'. Use one of: {', '.join(SORTS)}"}), 400
     
-    return jsonify({
-        "products": filtered_products,
-        "total": len(filtered_products)
-    })
+    result = CATALOG.query(
+        category=category,
+        color=color,
+        size=size,
+        min_price=min_price,
+        max_price=max_price,
+        sort=sort,
+        offset=(page - 1) * page_size,
+        limit=page_size
+    )
+    result.update({"page": page, "page_size": page_size})
+    return jsonify(result)
 
 @app.route('/api/chat', methods=['POST'])
 def chat():
@@ -182,115 +263,85 @@ def chat():
     user_message = data.get('message', '').lower()
     session_id = data.get('session_id', 'default')
     
-    # Initialize cart for session
-    if session_id not in carts:
-        carts[session_id] = []
-    
     response_text = ""
     products_to_show = []
     
     # Product browsing queries
-    if any(word in user_message for word in ['show', 'browse', 'looking for', 'find', 'search', 'see']):
-        if 'mug' in user_message or 'coffee' in user_message:
-            products_to_show = [p for p in PRODUCTS if p['category'] == 'mug']
-            response_text = f"I found {len(products_to_show)} amazing coffee mugs for you. "
-        elif 'tshirt' in user_message or 't-shirt' in user_message or 'shirt' in user_message:
-            products_to_show = [p for p in PRODUCTS if p['category'] == 'tshirt']
-            if 'under' in user_message:
-                try:
-                    price = int(''.join(filter(str.isdigit, user_message)))
-                    products_to_show = [p for p in products_to_show if p['price'] <= price]
-                except:
-                    pass
-            response_text = f"I found {len(products_to_show)} stylish t-shirts for you. "
-        elif 'hoodie' in user_message:
-            products_to_show = [p for p in PRODUCTS if p['category'] == 'hoodie']
-            if 'black' in user_message:
-                products_to_show = [p for p in products_to_show if p['color'] == 'black']
-            response_text = f"I found {len(products_to_show)} cozy hoodies for you. "
-        elif 'bottle' in user_message or 'water' in user_message:
-            products_to_show = [p for p in PRODUCTS if p['category'] == 'bottle']
-            response_text = f"I found {len(products_to_show)} water bottles for you. "
-        elif 'bag' in user_message:
-            products_to_show = [p for p in PRODUCTS if 'bag' in p['category']]
-            response_text = f"I found {len(products_to_show)} bags for you. "
-        elif 'watch' in user_message:
-            products_to_show = [p for p in PRODUCTS if p['category'] == 'watch']
-            response_text = f"Check out our premium smartwatches. "
-        elif 'shoe' in user_message:
-            products_to_show = [p for p in PRODUCTS if p['category'] == 'shoes']
-            response_text = f"Here are our comfortable running shoes. "
-        elif 'headphone' in user_message:
-            products_to_show = [p for p in PRODUCTS if p['category'] == 'headphones']
-            response_text = f"Check out our wireless headphones. "
-        elif 'backpack' in user_message:
-            products_to_show = [p for p in PRODUCTS if p['category'] == 'backpack']
-            response_text = f"Here's our travel backpack collection. "
+    if any(word in user_message for word in ['show', 'browse', 'looking for', 'find', 'search', 'see']) and 'cart' not in user_message:
+        slots = PARSER.parse(user_message)
+        if slots:
+            result = CATALOG.query(**slots, limit=CHAT_RESULTS, facets=False)
+            products_to_show = result['products']
+            if result['total']:
+                response_text = f"I found {result['total']} {describe_query(slots)} for you. "
+            else:
+                response_text = f"Sorry, we don't have any {describe_query(slots)} right now. "
         else:
             products_to_show = PRODUCTS[:6]
             response_text = "Here are some of our trending products. "
     
+    # Remove from cart
+    elif any(word in user_message for word in ['remove', 'delete', 'take out']):
+        matched_product = find_product(user_message)
+        if matched_product and carts.remove(session_id, matched_product['id']) is not None:
+            response_text = f"Removed {matched_product['name']} from your cart."
+        else:
+            response_text = "I couldn't find that product in your cart."
+    
     # Cart operations
     elif any(word in user_message for word in ['add to cart', 'add', 'i want', "i'll take", "i'll buy"]):
-        matched_product = None
-        for product in PRODUCTS:
-            if product['name'].lower() in user_message or product['id'] in user_message:
-                matched_product = product
-                break
-        
+        matched_product = find_product(user_message)
         if matched_product:
-            carts[session_id].append({
-                "product_id": matched_product['id'],
-                "name": matched_product['name'],
-                "price": matched_product['price'],
-                "quantity": 1,
-                "image": matched_product['image']
-            })
+            carts.add(session_id, matched_product)
             response_text = f"Added {matched_product['name']} to your cart. It costs ₹{matched_product['price']}. Say 'checkout' when you're ready to place your order."
         else:
             response_text = "I couldn't identify which product you want to add. Could you please be more specific?"
     
     # View cart
     elif 'cart' in user_message or 'what do i have' in user_message:
-        cart_items = carts[session_id]
-        if cart_items:
-            total = sum(item['price'] * item['quantity'] for item in cart_items)
-            items_text = ', '.join([f"{item['name']} for ₹{item['price']}" for item in cart_items])
-            response_text = f"Your cart has: {items_text}. Total: ₹{total}. Say 'checkout' to place your order."
+        cart = carts.snapshot(session_id)
+        if cart['items']:
+            items_text = ', '.join([
+                f"{item['name']} for ₹{item['price']}" if item['quantity'] == 1
+                else f"{item['quantity']} {item['name']} at ₹{item['price']} each"
+                for item in cart['items']
+            ])
+            response_text = f"Your cart has: {items_text}. Total: ₹{cart['total']}. Say 'checkout' to place your order."
         else:
             response_text = "Your cart is empty. Browse our products and add items you like!"
     
     # Checkout
     elif 'checkout' in user_message or 'place order' in user_message or 'buy now' in user_message:
-        cart_items = carts[session_id]
-        if cart_items:
-            order_id = str(uuid.uuid4())[:8]
-            total = sum(item['price'] * item['quantity'] for item in cart_items)
-            
-            order = {
-                "id": order_id,
-                "items": cart_items,
-                "total": total,
-                "currency": "INR",
-                "status": "CONFIRMED",
-                "created_at": datetime.now().isoformat()
-            }
-            
-            orders = load_orders()
-            orders.append(order)
-            save_orders(orders)
+        # Taking the cart in one step means a repeated "checkout" can't order it twice
+        cart = carts.clear(session_id)
+        if cart['items']:
+            total = cart['total']
             
-            carts[session_id] = []
-            
-            response_text = f"Order confirmed! Your order ID is {order_id}. Total amount: ₹{total}. Thank you for shopping with us!"
+            try:
+                with metrics.phase('disk'):
+                    order, _ = orders.append({
+                        "items": cart['items'],
+                        "total": total,
+                        "currency": "INR",
+                        "status": "CONFIRMED",
+                        # Only a session the client named identifies a customer
+                        "customer": data.get('session_id'),
+                        "created_at": datetime.now().isoformat()
+                    })
+            except Exception as e:
+                # No order was placed, so the customer keeps their cart
+                print(f"Error details: {e}")
+                carts.restore(session_id, cart['items'])
+                response_text = "Sorry, I couldn't place your order just now. Your cart is still here, so please try checking out again."
+            else:
+                response_text = f"Order confirmed! Your order ID is {order['id']}. Total amount: ₹{total}. Thank you for shopping with us!"
         else:
             response_text = "Your cart is empty. Add some items first before checking out."
     
     # View last order
     elif 'last order' in user_message or 'recent order' in user_message or 'what did i buy' in user_message:
-        orders = load_orders()
-        if orders:
-            last_order = orders[-1]
+        if orders.count():
+            last_order = orders.last()[0]
             items_text = ', '.join([f"{item['name']}" for item in last_order['items']])
             response_text = f"Your last order with ID {last_order['id']} included: {items_text}. Total: ₹{last_order['total']}."
         else:
@@ -298,15 +349,10 @@ def chat():
     
     # Order history
     elif 'order history' in user_message or 'all orders' in user_message or 'my orders' in user_message:
-        orders = load_orders()
-        if orders:
-            response_text = f"You have placed {len(orders)} orders. "
-            if len(orders) <= 3:
-                for order in orders:
-                    response_text += f"Order {order['id']}: ₹{order['total']}. "
-            else:
-                for order in orders[-3:]:
-                    response_text += f"Order {order['id']}: ₹{order['total']}. "
+        if orders.count():
+            response_text = f"You have placed {orders.count()} orders. "
+            for order in orders.last(3):
+                response_text += f"Order {order['id']}: ₹{order['total']}. "
         else:
             response_text = "You haven't placed any orders yet."
     
@@ -314,6 +360,7 @@ def chat():
     else:
         response_text = "Hello! Welcome to our voice-powered store. You can browse products by saying things like 'Show me mugs' or 'I want a black hoodie'. Try using your voice or type below!"
     
+    metrics.turn(session_id)
     return jsonify({
         "response": response_text,
         "products": products_to_show
@@ -328,14 +375,20 @@ def create_order():
     if not line_items:
         return jsonify({"error": "No items in order"}), 400
     
-    order_id = str(uuid.uuid4())[:8]
+    # Retries carrying the same key get the original order back
+    idempotency_key = request.headers.get('Idempotency-Key')
+    if idempotency_key is not None and not 0 < len(idempotency_key) <= MAX_IDEMPOTENCY_KEY:
+        return jsonify({"error": f"Idempotency-Key must be 1-{MAX_IDEMPOTENCY_KEY} characters"}), 400
+    
     total = 0
     order_items = []
     
     for item in line_items:
-        product = next((p for p in PRODUCTS if p['id'] == item['product_id']), None)
+        quantity = item.get('quantity', 1)
+        if not isinstance(quantity, int) or quantity < 1:
+            return jsonify({"error": "quantity must be a positive integer"}), 400
+        product = CATALOG.get(item['product_id'])
         if product:
-            quantity = item.get('quantity', 1)
             order_items.append({
                 "product_id": product['id'],
                 "name": product['name'],
@@ -345,25 +398,130 @@ def create_order():
             })
             total += product['price'] * quantity
     
-    order = {
-        "id": order_id,
-        "items": order_items,
-        "total": total,
-        "currency": "INR",
-        "status": "CONFIRMED",
-        "created_at": datetime.now().isoformat()
-    }
+    with metrics.phase('disk'):
+        order, created = orders.append({
+            "items": order_items,
+            "total": total,
+            "currency": "INR",
+            "status": "CONFIRMED",
+            "customer": data.get('session_id'),
+            "created_at": datetime.now().isoformat()
+        }, idempotency_key)
     
-    orders = load_orders()
-    orders.append(order)
-    save_orders(orders)
-    
-    return jsonify(order)
+    response = jsonify(order)
+    if not created:
+        response.headers['Idempotent-Replayed'] = 'true'
+    return response
 
 @app.route('/api/orders', methods=['GET'])
 def get_orders():
-    """Get all orders"""
-    return jsonify(load_orders())
+    """Orders, newest first, one page at a time"""
+    page = max(request.args.get('page', 1, type=int), 1)
+    page_size = min(max(request.args.get('page_size', DEFAULT_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    return jsonify({
+        "orders": orders.page((page - 1) * page_size, page_size),
+        "total": orders.count(),
+        "page": page,
+        "page_size": page_size
+    })
+
+@app.route('/api/analytics/summary', methods=['GET'])
+def analytics_summary():
+    """Order count, revenue, average basket and repeat-customer rates"""
+    return jsonify(rollup.summary())
+
+@app.route('/api/analytics/revenue', methods=['GET'])
+def analytics_revenue():
+    """Revenue and order count per day (?from=YYYY-MM-DD&to=YYYY-MM-DD)"""
+    try:
+        start = request.args.get('from')
+        end = request.args.get('to')
+        start = date.fromisoformat(start) if start else None
+        end = date.fromisoformat(end) if end else None
+    except ValueError:
+        return jsonify({"error": "from and to must be YYYY-MM-DD dates"}), 400
+    return jsonify({"days": rollup.revenue_by_day(start, end)})
+
+@app.route('/api/analytics/top-products', methods=['GET'])
+def analytics_top_products():
+    """Best sellers (?by=revenue|quantity&limit=N)"""
+    by = request.args.get('by', 'revenue')
+    if by not in ('revenue', 'quantity'):
+        return jsonify({"error": "by must be 'revenue' or 'quantity'"}), 400
+    limit = min(max(request.args.get('limit', 10, type=int), 1), MAX_PAGE_SIZE)
+    return jsonify({"products": rollup.top_products(limit, by)})
+
+def cart_session_id():
+    data = request.get_json(silent=True) or {}
+    return data.get('session_id') or request.args.get('session_id', 'default')
+
+@app.route('/api/cart', methods=['GET'])
+def get_cart():
+    """Cart contents with total and item count"""
+    return jsonify(carts.snapshot(cart_session_id()))
+
+@app.route('/api/cart', methods=['DELETE'])
+def clear_cart():
+    carts.clear(cart_session_id())
+    return jsonify(carts.snapshot(cart_session_id()))
+
+@app.route('/api/cart/items', methods=['POST'])
+def add_cart_item():
+    """Add a product, merging with its line if already in the cart"""
+    data = request.get_json(silent=True) or {}
+    product = CATALOG.get(data.get('product_id'))
+    if product is None:
+        return jsonify({"error": "Unknown product"}), 404
+    quantity = data.get('quantity', 1)
+    if not isinstance(quantity, int) or quantity < 1:
+        return jsonify({"error": "quantity must be a positive integer"}), 400
+    return jsonify(carts.add(cart_session_id(), product, quantity))
+
+@app.route('/api/cart/items/<product_id>', methods=['PUT'])
+def update_cart_item(product_id):
+    """Set a line's quantity; 0 removes it"""
+    quantity = (request.get_json(silent=True) or {}).get('quantity')
+    if not isinstance(quantity, int) or quantity < 0:
+        return jsonify({"error": "quantity must be a non-negative integer"}), 400
+    cart = carts.set_quantity(cart_session_id(), product_id, quantity)
+    if cart is None:
+        return jsonify({"error": "Product not in cart"}), 404
+    return jsonify(cart)
+
+@app.route('/api/cart/items/<product_id>', methods=['DELETE'])
+def remove_cart_item(product_id):
+    cart = carts.remove(cart_session_id(), product_id)
+    if cart is None:
+        return jsonify({"error": "Product not in cart"}), 404
+    return jsonify(cart)
+
+@app.route('/img/<product_id>', methods=['GET'])
+def product_image(product_id):
+    """Cached thumbnail of a product image (?w= one of THUMB_WIDTHS)"""
+    product = CATALOG.get(product_id)
+    if product is None or not product.get('image'):
+        return jsonify({"error": "Unknown product"}), 404
+    width = request.args.get('w', THUMB_WIDTHS[0], type=int)
+    if width not in THUMB_WIDTHS:
+        return jsonify({"error": f"w must be one of {', '.join(map(str, THUMB_WIDTHS))}"}), 400
+    
+    fmt = 'webp' if 'image/webp' in request.headers.get('Accept', '') else 'jpeg'
+    try:
+        thumb = images.thumbnail(product['image'], width, fmt)
+    except (requests.RequestException, ValueError):
+        # CDN unreachable from here; let the browser try it directly
+        return redirect(product['image'])
+    except NotAnImage:
+        return jsonify({"error": "Image not available"}), 404
+    
+    response = send_file(images.blob_path(thumb['digest']), mimetype=thumb['type'], etag=thumb['digest'],
+                         max_age=IMAGE_MAX_AGE, conditional=True)
+    response.vary.add('Accept')
+    return response
 
 if __name__ == '__main__':
+    # Fill the thumbnail cache in the background so first views are local;
+    # only in the reloader's child, which is the process serving requests
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        threading.Thread(target=images.warm, args=([p['image'] for p in PRODUCTS],), daemon=True).start()
     app.run(debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,139 @@
+"""Analytics queries over 10M synthetic orders.
+
+The rollup is bulk-loaded from generated columns, then each query is
+timed. "python loops" answers the same questions with loops over order dicts,
+the way they would be computed from the ledger's list. That is run on
+BASELINE_ORDERS orders only, since 10M order dicts don't fit in memory
+here, and the results are checked against the rollup on the same orders.
+Incremental add() throughput is measured separately.
+
+Run with: python bench_analytics.py
+"""
+import calendar
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from analytics import OrderRollup, DAY
+
+ORDERS = 10_000_000
+BASELINE_ORDERS = 500_000
+INCREMENTAL_ORDERS = 100_000
+PRODUCTS = 500
+CUSTOMERS = 2_000_000
+DAYS = 365
+START = datetime(2025, 1, 1)
+EPOCH = datetime(1970, 1, 1)
+
+
+def make_columns(count, seed=40):
+    rng = np.random.default_rng(seed)
+    prices = rng.integers(199, 5000, PRODUCTS)
+    lines_per_order = rng.integers(1, 5, count)
+    line_count = int(lines_per_order.sum())
+    product = rng.zipf(1.3, line_count) % PRODUCTS
+    quantity = rng.integers(1, 4, line_count)
+    revenue = prices[product] * quantity
+    # Which order each line belongs to, to total the orders
+    owner = np.repeat(np.arange(count), lines_per_order)
+    total = np.bincount(owner, weights=revenue, minlength=count).astype(np.int64)
+    units = np.bincount(owner, weights=quantity, minlength=count).astype(np.int32)
+    timestamp = calendar.timegm(START.timetuple()) + np.sort(rng.integers(0, DAYS * DAY, count))
+    customer = (rng.zipf(1.5, count) + rng.integers(0, CUSTOMERS, count)) % CUSTOMERS
+    orders = {"timestamp": timestamp, "total": total, "customer": customer.astype(np.int32), "units": units}
+    lines = {"product": product.astype(np.int32), "quantity": quantity.astype(np.int32), "revenue": revenue}
+    return orders, lines, owner
+
+
+def load(orders, lines):
+    rollup = OrderRollup()
+    rollup.extend(orders, lines, [f"p{i}" for i in range(PRODUCTS)], [f"c{i}" for i in range(CUSTOMERS)])
+    return rollup
+
+
+def as_dicts(orders, lines, owner, count):
+    """The first `count` orders as ledger-style dicts"""
+    dicts = []
+    end = int(np.searchsorted(owner, count))
+    items = defaultdict(list)
+    for position in range(end):
+        items[int(owner[position])].append({"product_id": f"p{lines['product'][position]}",
+                                            "price": int(lines['revenue'][position] // lines['quantity'][position]),
+                                            "quantity": int(lines['quantity'][position])})
+    for n in range(count):
+        dicts.append({"id": f"ORD{n:08d}", "items": items[n], "total": int(orders["total"][n]),
+                      "customer": f"c{orders['customer'][n]}",
+                      "created_at": (EPOCH + timedelta(seconds=int(orders["timestamp"][n]))).isoformat()})
+    return dicts
+
+
+def python_queries(dicts):
+    revenue = defaultdict(int)
+    for order in dicts:
+        revenue[order['created_at'][:10]] += order['total']
+    sales = Counter()
+    for order in dicts:
+        for item in order['items']:
+            sales[item['product_id']] += item['price'] * item['quantity']
+    top = sales.most_common(10)
+    per_customer = Counter(order['customer'] for order in dicts)
+    repeat = sum(1 for n in per_customer.values() if n >= 2) / len(per_customer)
+    basket = sum(sum(item['quantity'] for item in order['items']) for order in dicts) / len(dicts)
+    return revenue, top, repeat, basket
+
+
+def timed(fn, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return result, (time.perf_counter() - start) * 1000 / repeat
+
+
+def report(label, rollup, queries):
+    print(f"  {label}")
+    for name, fn in queries:
+        _, ms = timed(lambda: fn(rollup), 3)
+        print(f"    {name:28s} {ms:8.1f} ms")
+
+
+QUERIES = [
+    ("revenue by day (all)", lambda rollup: rollup.revenue_by_day()),
+    ("revenue by day (one month)", lambda rollup: rollup.revenue_by_day(START.date() + timedelta(days=90),
+                                                                         START.date() + timedelta(days=120))),
+    ("top 10 products", lambda rollup: rollup.top_products(10)),
+    ("summary (basket, repeat)", lambda rollup: rollup.summary())
+]
+
+
+def main():
+    (orders, lines, owner), build_ms = timed(lambda: make_columns(ORDERS))
+    rollup, load_ms = timed(lambda: load(orders, lines))
+    size = sum(array.nbytes for array in orders.values()) + sum(array.nbytes for array in lines.values())
+    print(f"{ORDERS:,} orders, {len(lines['product']):,} line items, {size / 2**20:.0f} MiB of columns "
+          f"(generated in {build_ms / 1000:.1f} s, loaded in {load_ms:.0f} ms)")
+    report("rollup, 10M orders", rollup, QUERIES)
+
+    dicts = as_dicts(orders, lines, owner, BASELINE_ORDERS)
+    start = time.perf_counter()
+    incremental = OrderRollup()
+    for order in dicts[:INCREMENTAL_ORDERS]:
+        incremental.add(order)
+    add_rate = INCREMENTAL_ORDERS / (time.perf_counter() - start)
+    print(f"  add(): {add_rate:,.0f} orders/s incrementally")
+
+    baseline = OrderRollup()
+    for order in dicts:
+        baseline.add(order)
+    (revenue, top, repeat, basket), python_ms = timed(lambda: python_queries(dicts))
+    summary = baseline.summary()
+    assert sum(revenue.values()) == sum(day["revenue"] for day in baseline.revenue_by_day())
+    assert [product_id for product_id, _ in top] == [p["product_id"] for p in baseline.top_products(10)]
+    assert round(repeat, 4) == summary["repeat_customer_rate"] and round(basket, 2) == summary["average_basket_size"]
+    report(f"rollup, {BASELINE_ORDERS:,} orders", baseline, QUERIES)
+    print(f"  python loops, {BASELINE_ORDERS:,} orders: {python_ms:8.1f} ms for all four (results match)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Cart memory and speed with 1M anonymous sessions.
+
+Every session chats once; a third of them add one to four products, often
+the same one twice, and look at their cart. "before" is the old dict of
+line-item lists, which got an entry for every session that ever chatted;
+"after" is CartStore with its default CART_MAX.
+
+Run with: python bench_carts.py
+"""
+import gc
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from cart_store import CartStore
+
+SESSIONS = 1_000_000
+SHOPPER_EVERY = 3
+PRODUCTS = [
+    {"id": f"p{i}", "name": f"Product {i}", "price": 199 + 100 * i, "image": f"https://cdn.example/{i}.jpg"}
+    for i in range(12)
+]
+
+
+def traffic():
+    rng = random.Random(38)
+    for n in range(SESSIONS):
+        session_id = f"session_{n:07d}"
+        picks = []
+        if n % SHOPPER_EVERY == 0:
+            picks = [rng.choice(PRODUCTS) for _ in range(rng.randint(1, 4))]
+        yield session_id, picks
+
+
+def before():
+    carts = {}
+    for session_id, picks in traffic():
+        if session_id not in carts:
+            carts[session_id] = []
+        for product in picks:
+            carts[session_id].append({"product_id": product['id'], "name": product['name'],
+                                      "price": product['price'], "quantity": 1, "image": product['image']})
+        if picks:
+            sum(item['price'] * item['quantity'] for item in carts[session_id])
+    return carts
+
+
+def after(store):
+    for session_id, picks in traffic():
+        for product in picks:
+            store.add(session_id, product)
+        if picks:
+            store.snapshot(session_id)["total"]
+    return store
+
+
+def measure(name, fn, *args):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    kept = fn(*args)
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {name:22s}: {current / 2**20:7.1f} MiB held, {len(kept):8,} carts, "
+          f"{SESSIONS / elapsed:9,.0f} sessions/s (traced)")
+    return kept
+
+
+def main():
+    print(f"{SESSIONS:,} sessions, 1 in {SHOPPER_EVERY} adding to a cart")
+    measure("before", before)
+    kept = measure("after", after, CartStore())
+    with tempfile.TemporaryDirectory() as path:
+        spilled = measure("after, spill to SQLite", after, CartStore(path=os.path.join(path, "carts.sqlite3")))
+        db_carts = spilled._db().execute("SELECT COUNT(*) FROM carts").fetchone()[0]
+        print(f"  {'':22s}  {db_carts:,} older carts kept on disk, "
+              f"{os.path.getsize(os.path.join(path, 'carts.sqlite3')) / 2**20:.1f} MiB")
+    assert len(kept) == kept.max_carts
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Catalog query latency on a synthetic 1M-product catalog.
+
+"linear" is the list-comprehension filtering /api/catalog used to do on
+every request (plus a sort and a slice for the first page); "indexed" is
+CatalogIndex.query() as used by the app, facet counts included.
+
+Run with: python bench_catalog.py
+"""
+import random
+import time
+
+from catalog_index import CatalogIndex
+
+PRODUCTS = 1_000_000
+PAGE_SIZE = 20
+CATEGORIES = ["mug", "tshirt", "hoodie", "bottle", "bag", "watch", "shoes", "headphones", "backpack"]
+COLORS = ["white", "black", "gray", "brown", "blue", "silver", "beige", "red", "green"]
+SIZES = ["XS", "S", "M", "L", "XL"]
+
+QUERIES = [
+    {"category": "hoodie"},
+    {"category": "tshirt", "color": "black", "size": "M"},
+    {"category": "mug", "max_price": 500},
+    {"color": "blue", "min_price": 1000, "max_price": 2000, "sort": "price_asc"},
+    {"category": "shoes", "sort": "price_desc"},
+    {"sort": "name"}
+]
+
+
+def make_products(count):
+    rng = random.Random(9)
+    products = []
+    for i in range(count):
+        category = rng.choice(CATEGORIES)
+        product = {
+            "id": f"{category}-{i:07d}",
+            "name": f"{rng.choice(COLORS).title()} {category.title()} {rng.randrange(100000)}",
+            "price": rng.randrange(99, 10000),
+            "currency": "INR",
+            "category": category,
+            "color": rng.choice(COLORS)
+        }
+        if category in ("tshirt", "hoodie", "shoes"):
+            product["size"] = rng.choice(SIZES)
+        products.append(product)
+    return products
+
+
+def linear_query(products, category=None, color=None, size=None, min_price=None, max_price=None, sort=None):
+    filtered = products
+    if category:
+        filtered = [p for p in filtered if p['category'].lower() == category.lower()]
+    if color:
+        filtered = [p for p in filtered if p.get('color', '').lower() == color.lower()]
+    if size:
+        filtered = [p for p in filtered if p.get('size', '').lower() == size.lower()]
+    if min_price is not None:
+        filtered = [p for p in filtered if p['price'] >= min_price]
+    if max_price is not None:
+        filtered = [p for p in filtered if p['price'] <= max_price]
+    if sort == "name":
+        filtered = sorted(filtered, key=lambda p: p['name'].lower())
+    elif sort:
+        filtered = sorted(filtered, key=lambda p: p['price'], reverse=sort == "price_desc")
+    return {"products": filtered[:PAGE_SIZE], "total": len(filtered)}
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return result, (time.perf_counter() - start) * 1000 / repeat
+
+
+def main():
+    products = make_products(PRODUCTS)
+    start = time.perf_counter()
+    index = CatalogIndex(products)
+    print(f"{PRODUCTS} products, index built in {time.perf_counter() - start:.1f} s, page size {PAGE_SIZE}")
+
+    for query in QUERIES:
+        linear, linear_ms = timed(lambda: linear_query(products, **query), 3)
+        indexed, indexed_ms = timed(lambda: index.query(limit=PAGE_SIZE, **query), 10)
+        assert indexed["total"] == linear["total"]
+        if query.get("sort", "name") != "name":
+            assert [p["price"] for p in indexed["products"]] == [p["price"] for p in linear["products"]]
+        elif "sort" not in query:
+            assert indexed["products"] == linear["products"]
+        label = ", ".join(f"{key}={value}" for key, value in query.items())
+        print(f"  {label:60s} linear {linear_ms:7.1f} ms  indexed {indexed_ms:6.1f} ms  "
+              f"({indexed['total']} matches)")
+
+
+if __name__ == "__main__":
+    main()
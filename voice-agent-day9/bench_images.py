@@ -0,0 +1,101 @@
+"""/img/<product_id> against a local stand-in for the image CDNs.
+
+Points every product at FixtureImageServer, then checks and times:
+warming the whole catalog in a process pool, cold and cached requests,
+WebP vs JPEG by Accept header, ETag revalidation, that every image was
+fetched from the "CDN" only once, and the redirect when a CDN is down.
+Exits non-zero if a check fails.
+
+Run with: python bench_images.py
+"""
+import io
+import os
+import sys
+import tempfile
+import time
+
+from PIL import Image
+
+from fixture_image_server import FixtureImageServer
+
+REQUESTS = 500
+WEBP = {"Accept": "image/avif,image/webp,*/*"}
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main(cdn):
+    import app
+    from image_cache import THUMB_WIDTHS, FORMATS
+
+    for product in app.PRODUCTS:
+        product['image'] = cdn.url(f"{product['id']}.jpg")
+        cdn.image(f"{product['id']}.jpg")
+    cdn.image("direct.jpg")
+    client = app.app.test_client()
+    failures = []
+
+    def check(ok, message):
+        if not ok:
+            failures.append(message)
+
+    # Cold: one product fetched and resized on request
+    first = app.PRODUCTS[0]['id']
+    response, cold_ms = timed(lambda: client.get(f"/img/{first}", headers=WEBP))
+    check(response.status_code == 200 and response.mimetype == "image/webp", "cold request not served as WebP")
+    _, direct_ms = timed(lambda: app.images.session.get(cdn.url("direct.jpg")).content)
+
+    # Warm the rest of the catalog in a process pool
+    failed, warm_ms = timed(lambda: app.images.warm([p['image'] for p in app.PRODUCTS]))
+    check(not failed, f"warm() failed for {failed}")
+    thumbs = len(app.PRODUCTS) * len(THUMB_WIDTHS) * len(FORMATS)
+
+    # Cached
+    ids = [p['id'] for p in app.PRODUCTS]
+    start = time.perf_counter()
+    for n in range(REQUESTS):
+        response = client.get(f"/img/{ids[n % len(ids)]}", headers=WEBP)
+        response.close()
+    cached_ms = (time.perf_counter() - start) * 1000 / REQUESTS
+
+    response = client.get(f"/img/{first}?w=200", headers={"Accept": "image/jpeg"})
+    check(response.mimetype == "image/jpeg", "Accept without WebP not served JPEG")
+    with Image.open(io.BytesIO(response.data)) as image:
+        check(max(image.size) <= 200, f"w=200 thumbnail is {image.size}")
+    check("max-age" in response.headers.get("Cache-Control", ""), "no Cache-Control max-age")
+    etag = response.headers.get("ETag")
+    revalidated = client.get(f"/img/{first}?w=200", headers={"Accept": "image/jpeg", "If-None-Match": etag})
+    check(revalidated.status_code == 304, "If-None-Match with a current ETag did not give 304")
+    check(client.get(f"/img/{first}?w=123").status_code == 400, "unsupported width accepted")
+    check(client.get("/img/no-such-product").status_code == 404, "unknown product not 404")
+
+    over_fetched = {path: hits for path, hits in cdn.hits.items() if path != "direct.jpg" and hits != 1}
+    check(not over_fetched, f"images fetched more than once: {over_fetched}")
+
+    app.PRODUCTS[1]['image'] = cdn.url("gone.png")
+    check(client.get(f"/img/{app.PRODUCTS[1]['id']}").status_code == 302, "unreachable image not redirected")
+
+    original = len(cdn.image(f"{first}.jpg"))
+    thumb = len(client.get(f"/img/{first}", headers=WEBP).data)
+    print(f"{len(app.PRODUCTS)} products, CDN latency {cdn.latency * 1000:.0f} ms, "
+          f"original {original / 1024:.0f} KiB -> {THUMB_WIDTHS[0]}px WebP {thumb / 1024:.0f} KiB")
+    print(f"  straight from the CDN : {direct_ms:7.1f} ms")
+    print(f"  /img cold             : {cold_ms:7.1f} ms (fetch + resize)")
+    print(f"  warm() whole catalog  : {warm_ms:7.1f} ms for {thumbs} thumbnails ({os.cpu_count()} CPUs)")
+    print(f"  /img cached           : {cached_ms:7.2f} ms/request")
+    for failure in failures:
+        print(f"  FAIL {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as path:
+        os.environ["IMAGE_CACHE_DIR"] = os.path.join(path, "images")
+        os.environ["ORDER_LEDGER"] = os.path.join(path, "orders.jsonl")
+        with FixtureImageServer() as cdn:
+            status = main(cdn)
+    sys.exit(status)
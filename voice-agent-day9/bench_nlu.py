@@ -0,0 +1,98 @@
+"""Golden utterances for the chat query parser, and its throughput.
+
+Every utterance must parse to exactly the expected slots; the script
+exits non-zero otherwise. Throughput is measured on the app's catalog and
+on a synthetic catalog with many more categories and product names.
+
+Run with: python bench_nlu.py
+"""
+import sys
+import time
+
+from catalog_index import CatalogIndex
+from query_parser import QueryParser
+
+GOLDEN = [
+    ("Show me mugs", {"category": "mug"}),
+    ("show me coffee mugs", {"category": "mug"}),
+    ("I'm looking for a coffee cup", {"category": "mug"}),
+    ("show t-shirts under 700", {"category": "tshirt", "max_price": 700}),
+    ("find me a black tshirt in size L", {"category": "tshirt", "color": "black", "size": "l"}),
+    ("any shirts below ₹1,000?", {"category": "tshirt", "max_price": 1000}),
+    ("show black hoodies", {"category": "hoodie", "color": "black"}),
+    ("I want a black hoodie", {"category": "hoodie", "color": "black"}),
+    ("grey hoodie, medium please", {"category": "hoodie", "color": "gray", "size": "m"}),
+    ("hoodies between 1500 and 2500", {"category": "hoodie", "min_price": 1500, "max_price": 2500}),
+    ("hoodie from rs 1000 to rs 2000", {"category": "hoodie", "min_price": 1000, "max_price": 2000}),
+    ("search water bottles", {"category": "bottle"}),
+    ("show me bags", {"category": "bag"}),
+    ("i need a travel backpack", {"category": "backpack"}),
+    ("browse watches over 3k", {"category": "watch", "min_price": 3000}),
+    ("smart watch under 5000 rupees", {"category": "watch", "max_price": 5000}),
+    ("running shoes size 9", {"category": "shoes"}),
+    ("show me a pair of blue sneakers", {"category": "shoes", "color": "blue"}),
+    ("wireless headphones at most 4000", {"category": "headphones", "max_price": 4000}),
+    ("anything black", {"color": "black"}),
+    ("show me stuff under 500", {"max_price": 500}),
+    ("products priced 500-1500", {"min_price": 500, "max_price": 1500}),
+    ("hoodies rs 1000-2000", {"category": "hoodie", "min_price": 1000, "max_price": 2000}),
+    ("show me 3-4 mugs", {"category": "mug"}),
+    ("show silver things over 900", {"color": "silver", "min_price": 900}),
+    ("show me what's trending", {}),
+    ("hello there", {})
+]
+
+SYNTHETIC_CATEGORIES = 200
+SYNTHETIC_PRODUCTS = 20000
+COLORS = ["white", "black", "gray", "brown", "blue", "silver", "beige", "red", "green", "navy"]
+ITERATIONS = 20
+
+
+def synthetic_products():
+    products = []
+    for i in range(SYNTHETIC_PRODUCTS):
+        category = f"gadget{i % SYNTHETIC_CATEGORIES}"
+        products.append({
+            "id": f"p{i}",
+            "name": f"Model{i % 997} {category.title()}",
+            "price": 100 + i % 9000,
+            "category": category,
+            "color": COLORS[i % len(COLORS)],
+            "size": ["S", "M", "L", "XL"][i % 4]
+        })
+    return products
+
+
+def throughput(parser, utterances):
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        for utterance in utterances:
+            parser.parse(utterance)
+    return ITERATIONS * len(utterances) / (time.perf_counter() - start)
+
+
+def main():
+    import app
+
+    failures = 0
+    for utterance, expected in GOLDEN:
+        slots = app.PARSER.parse(utterance)
+        if slots != expected:
+            failures += 1
+            print(f"  FAIL {utterance!r}: got {slots}, expected {expected}")
+    print(f"{len(GOLDEN) - failures}/{len(GOLDEN)} golden utterances parsed correctly")
+
+    utterances = [utterance for utterance, _ in GOLDEN]
+    print(f"  app catalog      : {throughput(app.PARSER, utterances):9,.0f} utterances/s "
+          f"({len(app.PARSER.terms)} terms)")
+
+    start = time.perf_counter()
+    parser = QueryParser(CatalogIndex(synthetic_products()))
+    build_ms = (time.perf_counter() - start) * 1000
+    print(f"  {f'{SYNTHETIC_CATEGORIES} categories':17s}: {throughput(parser, utterances):9,.0f} utterances/s "
+          f"({len(parser.terms)} terms, index + parser built in {build_ms:.0f} ms)")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""Concurrency stress test and throughput of the order ledger.
+
+"before" is the old load_orders()/save_orders() pair rewriting orders.json
+for every order; "after" is OrderLedger with group commit and fsync. The
+stress run has many threads checking out at once, some retrying with the
+same idempotency key, and checks that no order is lost or duplicated and
+that the journal reloads to the same orders. It exits non-zero otherwise.
+
+Run with: python bench_orders.py
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from order_ledger import OrderLedger
+
+THREADS = 32
+ORDERS_PER_THREAD = 100
+BEFORE_ORDERS = 500
+ITEM = {"product_id": "mug-001", "name": "Ceramic Coffee Mug", "price": 799, "quantity": 1}
+
+
+def make_order(n):
+    return {"items": [ITEM], "total": 799, "currency": "INR", "status": "CONFIRMED", "created_at": f"t{n}"}
+
+
+def run_threads(target):
+    threads = [threading.Thread(target=target, args=(t,)) for t in range(THREADS)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def before(path):
+    """The old read-modify-write of orders.json, first alone and then racing"""
+    orders_file = os.path.join(path, "orders.json")
+
+    def place(n):
+        orders = []
+        if os.path.exists(orders_file):
+            with open(orders_file) as f:
+                orders = json.load(f)
+        orders.append({"id": f"{n:08x}", **make_order(n)})
+        with open(orders_file, "w") as f:
+            json.dump(orders, f, indent=2)
+
+    start = time.perf_counter()
+    for n in range(BEFORE_ORDERS):
+        place(n)
+    rate = BEFORE_ORDERS / (time.perf_counter() - start)
+
+    os.remove(orders_file)
+    per_thread = BEFORE_ORDERS // THREADS
+
+    def racer(t):
+        for n in range(per_thread):
+            try:
+                place(t * per_thread + n)
+            except ValueError:
+                pass  # read a half-written file
+    run_threads(racer)
+    with open(orders_file) as f:
+        kept = len(json.load(f))
+    print(f"  before : {rate:8,.0f} orders/s sequential ({BEFORE_ORDERS} orders); "
+          f"{THREADS} threads racing kept {kept} of {per_thread * THREADS}")
+
+
+def after(path):
+    ledger = OrderLedger(os.path.join(path, "orders.jsonl"))
+    created = [0] * THREADS
+    keys = [set() for _ in range(THREADS)]
+    # A few keys every thread sends at once, like a client retrying on timeout
+    shared_keys = [f"shared-{i}" for i in range(10)]
+
+    def checkout(t):
+        rng = random.Random(t)
+        for n in range(ORDERS_PER_THREAD):
+            if n < len(shared_keys):
+                key = shared_keys[n]
+            elif keys[t] and rng.random() < 0.1:
+                key = rng.choice(sorted(keys[t]))
+            else:
+                key = f"{t}-{n}"
+            order, was_created = ledger.append(make_order(n), key)
+            created[t] += was_created
+            keys[t].add(key)
+
+    elapsed = run_threads(checkout)
+    requests = THREADS * ORDERS_PER_THREAD
+    expected = len(set().union(*keys))
+    ids = [order["id"] for order in ledger.orders]
+    ledger.close()
+    reloaded = OrderLedger(ledger.path)
+    reloaded.close()
+
+    problems = []
+    if sum(created) != expected or ledger.count() != expected:
+        problems.append(f"expected {expected} orders, created {sum(created)}, ledger has {ledger.count()}")
+    if len(set(ids)) != len(ids):
+        problems.append("duplicate order ids")
+    if reloaded.orders != ledger.orders or reloaded.by_key != ledger.by_key:
+        problems.append("journal reloads to different orders")
+    print(f"  after  : {requests / elapsed:8,.0f} requests/s with {THREADS} threads "
+          f"({requests} requests, {expected} distinct orders, fsync {'on' if ledger.fsync else 'off'})")
+    for problem in problems:
+        print(f"  FAIL {problem}")
+    return not problems
+
+
+def main():
+    print(f"{THREADS} concurrent checkouts")
+    with tempfile.TemporaryDirectory() as path:
+        before(path)
+        ok = after(path)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,220 @@
+"""Shopping carts keyed by session id.
+
+A Cart holds one line per product with a quantity, and keeps its total and
+item count up to date as lines change, so reading them costs nothing.
+
+CartStore keeps carts in an LRU ordered by last use. That is also expiry
+order, so abandoned carts (untouched for CART_TTL seconds) are dropped from
+the cold end as the store is used, and the cart count never exceeds
+CART_MAX. Sessions that only browse never get a cart. With a database path
+(CART_DB), carts pushed out by CART_MAX are written to SQLite instead of
+being lost and are read back when their session returns.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+CART_MAX = int(os.getenv("CART_MAX", "100000"))
+# Seconds a cart may sit untouched before it counts as abandoned
+CART_TTL = float(os.getenv("CART_TTL", str(24 * 3600)))
+CART_DB = os.getenv("CART_DB") or None
+
+
+class Cart:
+    __slots__ = ("lines", "total", "count", "touched")
+
+    def __init__(self):
+        # product_id -> [quantity, price, name, image]
+        self.lines = {}
+        self.total = 0
+        self.count = 0
+        self.touched = time.time()
+
+    def __len__(self):
+        return len(self.lines)
+
+    def add(self, product, quantity=1):
+        """Add `quantity` of a product, merging with its existing line"""
+        line = self.lines.get(product['id'])
+        if line is None:
+            line = self.lines[product['id']] = [0, product['price'], product['name'], product.get('image')]
+        line[0] += quantity
+        self.total += line[1] * quantity
+        self.count += quantity
+        return line[0]
+
+    def set_quantity(self, product_id, quantity):
+        """Change a line's quantity (0 removes it); False if not in the cart"""
+        line = self.lines.get(product_id)
+        if line is None:
+            return False
+        if quantity <= 0:
+            return self.remove(product_id)
+        self.total += line[1] * (quantity - line[0])
+        self.count += quantity - line[0]
+        line[0] = quantity
+        return True
+
+    def remove(self, product_id):
+        line = self.lines.pop(product_id, None)
+        if line is None:
+            return False
+        self.total -= line[1] * line[0]
+        self.count -= line[0]
+        return True
+
+    def items(self):
+        """Line items in the shape orders use"""
+        return [
+            {"product_id": product_id, "name": name, "price": price, "quantity": quantity, "image": image}
+            for product_id, (quantity, price, name, image) in self.lines.items()
+        ]
+
+    def to_dict(self):
+        return {"items": self.items(), "total": self.total, "count": self.count}
+
+    @classmethod
+    def from_items(cls, items):
+        cart = cls()
+        for item in items:
+            cart.add({"id": item['product_id'], "price": item['price'], "name": item['name'],
+                      "image": item.get('image')}, item['quantity'])
+        return cart
+
+
+class CartStore:
+    def __init__(self, max_carts=CART_MAX, ttl=CART_TTL, path=CART_DB):
+        self.max_carts = max_carts
+        self.ttl = ttl
+        self.path = path
+        # session_id -> Cart, least recently used first
+        self._carts = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        if path:
+            self._db()
+
+    def __len__(self):
+        return len(self._carts)
+
+    def _db(self):
+        """Per-thread connection to the spill database"""
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.path, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS carts ("
+                       "session_id TEXT PRIMARY KEY, touched REAL NOT NULL, items TEXT NOT NULL)")
+        return db
+
+    def _expire(self, now):
+        """Drop abandoned carts from the cold end of the LRU"""
+        while self._carts:
+            session_id, cart = next(iter(self._carts.items()))
+            if now - cart.touched < self.ttl:
+                break
+            del self._carts[session_id]
+
+    def _spill(self, session_id, cart):
+        if self.path and cart.lines:
+            with self._db() as db:
+                db.execute("INSERT OR REPLACE INTO carts VALUES (?, ?, ?)",
+                           (session_id, cart.touched, json.dumps(cart.items(), separators=(",", ":"))))
+
+    def _load(self, session_id, now):
+        if not self.path:
+            return None
+        with self._db() as db:
+            row = db.execute("DELETE FROM carts WHERE session_id = ? RETURNING touched, items", (session_id,)).fetchone()
+        if row is None or now - row[0] >= self.ttl:
+            return None
+        cart = Cart.from_items(json.loads(row[1]))
+        cart.touched = row[0]
+        return cart
+
+    def _get(self, session_id, create):
+        """The session's cart, marked as just used (lock held)"""
+        now = time.time()
+        self._expire(now)
+        cart = self._carts.get(session_id)
+        if cart is None:
+            cart = self._load(session_id, now)
+            if cart is None:
+                if not create:
+                    return None
+                cart = Cart()
+            self._carts[session_id] = cart
+            while len(self._carts) > self.max_carts:
+                self._spill(*self._carts.popitem(last=False))
+        else:
+            self._carts.move_to_end(session_id)
+        cart.touched = now
+        return cart
+
+    def get(self, session_id):
+        """The session's cart, or None if it has none"""
+        with self._lock:
+            return self._get(session_id, create=False)
+
+    def snapshot(self, session_id):
+        """Cart contents as a dict; an empty cart for unknown sessions"""
+        with self._lock:
+            cart = self._get(session_id, create=False)
+            return (cart or Cart()).to_dict()
+
+    def add(self, session_id, product, quantity=1):
+        with self._lock:
+            cart = self._get(session_id, create=True)
+            cart.add(product, quantity)
+            return cart.to_dict()
+
+    def set_quantity(self, session_id, product_id, quantity):
+        """New cart contents, or None if the product isn't in the cart"""
+        with self._lock:
+            cart = self._get(session_id, create=False)
+            if cart is None or not cart.set_quantity(product_id, quantity):
+                return None
+            return cart.to_dict()
+
+    def remove(self, session_id, product_id):
+        return self.set_quantity(session_id, product_id, 0)
+
+    def clear(self, session_id):
+        """Empty the cart and return what was in it"""
+        with self._lock:
+            cart = self._get(session_id, create=False)
+            self._carts.pop(session_id, None)
+            return (cart or Cart()).to_dict()
+
+    def restore(self, session_id, items):
+        """Put line items taken by clear() back, e.g. when their order failed;
+        merged with anything added since"""
+        with self._lock:
+            cart = self._get(session_id, create=True)
+            for item in items:
+                cart.add({"id": item['product_id'], "price": item['price'], "name": item['name'],
+                          "image": item.get('image')}, item['quantity'])
+            return cart.to_dict()
+
+    def flush(self):
+        """Write every cart in memory to the spill database, e.g. at shutdown"""
+        if not self.path:
+            return
+        with self._lock:
+            for session_id, cart in self._carts.items():
+                self._spill(session_id, cart)
+
+    def purge_expired(self):
+        """Drop abandoned carts in memory and on disk; returns how many"""
+        now = time.time()
+        with self._lock:
+            before = len(self._carts)
+            self._expire(now)
+            removed = before - len(self._carts)
+            if self.path:
+                with self._db() as db:
+                    removed += db.execute("DELETE FROM carts WHERE touched <= ?", (now - self.ttl,)).rowcount
+        return removed
@@ -0,0 +1,167 @@
+"""Precomputed indexes over the product catalog.
+
+Built once at startup. Filters on category, colour and size are inverted
+indexes stored as bitsets (Python ints, bit i = product i), so combining
+filters is an AND and counting matches is a popcount. Price ranges come
+from a price-sorted array searched with bisect; prefix bitsets at fixed
+rank checkpoints turn a range into a bitset without walking all of it.
+"""
+from bisect import bisect_left, bisect_right
+
+FACETS = ("category", "color", "size")
+SORTS = {
+    "price_asc": ("price", False),
+    "price_desc": ("price", True),
+    "name": ("name", False)
+}
+# Number of rank checkpoints with a precomputed prefix bitset
+PRICE_CHECKPOINTS = 128
+
+
+def _bitset(positions, size):
+    bits = bytearray((size + 7) // 8)
+    for position in positions:
+        bits[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(bits, "little")
+
+
+class CatalogIndex:
+    def __init__(self, products):
+        self.products = list(products)
+        size = len(self.products)
+        self.all = (1 << size) - 1
+        self.by_id = {product['id']: position for position, product in enumerate(self.products)}
+
+        # facet -> value (lowercased) -> bitset
+        self.facets = {}
+        for facet in FACETS:
+            postings = {}
+            for position, product in enumerate(self.products):
+                value = product.get(facet)
+                if value is not None:
+                    postings.setdefault(str(value).lower(), []).append(position)
+            self.facets[facet] = {value: _bitset(positions, size) for value, positions in postings.items()}
+
+        self.orders = {
+            "price": sorted(range(size), key=lambda position: self.products[position]['price']),
+            "name": sorted(range(size), key=lambda position: self.products[position]['name'].lower())
+        }
+        self.prices = [self.products[position]['price'] for position in self.orders["price"]]
+
+        # _rank_prefix[k] has the bits of the k * _step cheapest products
+        self._step = max(1, -(-size // PRICE_CHECKPOINTS))
+        self._rank_prefix = []
+        bits = bytearray((size + 7) // 8)
+        for rank, position in enumerate(self.orders["price"]):
+            if rank % self._step == 0:
+                self._rank_prefix.append(int.from_bytes(bits, "little"))
+            bits[position >> 3] |= 1 << (position & 7)
+        self._rank_prefix.append(int.from_bytes(bits, "little"))
+
+    def get(self, product_id):
+        position = self.by_id.get(product_id)
+        return None if position is None else self.products[position]
+
+    def values(self, facet):
+        """Known values of a facet (lowercased)"""
+        return self.facets[facet].keys()
+
+    def _cheapest(self, count):
+        """Bitset of the `count` cheapest products"""
+        checkpoint = count // self._step
+        mask = self._rank_prefix[checkpoint]
+        extra = self.orders["price"][checkpoint * self._step:count]
+        if extra:
+            mask |= _bitset(extra, len(self.products))
+        return mask
+
+    def price_ranks(self, min_price=None, max_price=None):
+        """[low, high) slice of the price-sorted array within the range"""
+        low = bisect_left(self.prices, min_price) if min_price is not None else 0
+        high = bisect_right(self.prices, max_price) if max_price is not None else len(self.prices)
+        return low, max(low, high)
+
+    def price_mask(self, min_price=None, max_price=None):
+        low, high = self.price_ranks(min_price, max_price)
+        if low == high:
+            return 0
+        return self._cheapest(high) & ~self._cheapest(low)
+
+    def _filter_masks(self, filters, min_price, max_price):
+        masks = {}
+        for facet, value in filters.items():
+            if value:
+                masks[facet] = self.facets[facet].get(str(value).lower(), 0)
+        if min_price is not None or max_price is not None:
+            masks["price"] = self.price_mask(min_price, max_price)
+        return masks
+
+    @staticmethod
+    def _combine(masks, start, skip=None):
+        mask = start
+        for name, value in masks.items():
+            if name != skip:
+                mask &= value
+        return mask
+
+    def _page(self, mask, sort, offset, limit, ranks=None):
+        """Positions of the matches in result order, sliced to one page.
+
+        `ranks` narrows a price sort to the slice already known to match.
+        """
+        if not mask or (limit is not None and limit <= 0):
+            return []
+        # Bit string with bit i at index i, so membership is a string lookup
+        bits = format(mask, "b")[::-1]
+        end = None if limit is None else offset + limit
+        positions = []
+        if sort in SORTS:
+            key, descending = SORTS[sort]
+            order = self.orders[key]
+            if key == "price" and ranks:
+                order = order[ranks[0]:ranks[1]]
+            if descending:
+                order = reversed(order)
+            seen = 0
+            for position in order:
+                if position < len(bits) and bits[position] == "1":
+                    if seen >= offset:
+                        positions.append(position)
+                        if end is not None and seen + 1 >= end:
+                            break
+                    seen += 1
+            return positions
+        position = bits.find("1")
+        seen = 0
+        while position != -1 and (end is None or seen < end):
+            if seen >= offset:
+                positions.append(position)
+            seen += 1
+            position = bits.find("1", position + 1)
+        return positions
+
+    def query(self, category=None, color=None, size=None, min_price=None, max_price=None,
+              sort=None, offset=0, limit=None, facets=True):
+        """Filter, count, facet and page the catalog.
+
+        Facet counts for each field ignore that field's own filter, so they
+        show what the shopper could switch to.
+        """
+        masks = self._filter_masks({"category": category, "color": color, "size": size}, min_price, max_price)
+        mask = self._combine(masks, self.all)
+        ranks = self.price_ranks(min_price, max_price) if "price" in masks else None
+        result = {
+            "products": [self.products[position] for position in self._page(mask, sort, offset, limit, ranks)],
+            "total": mask.bit_count()
+        }
+        if facets:
+            result["facets"] = {}
+            for facet in FACETS:
+                base = self._combine(masks, self.all, skip=facet)
+                counts = {}
+                for value, bits in self.facets[facet].items():
+                    count = (bits & base).bit_count()
+                    if count:
+                        counts[value] = count
+                result["facets"][facet] = counts
+        return result
@@ -0,0 +1,29 @@
+"""Shared pytest fixtures for the day9 app.
+
+The order ledger and image cache read their paths from the environment
+when their modules are imported, so those point at a throwaway directory
+here, before any test module is collected.
+"""
+import importlib.util
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+DATA_DIR = tempfile.mkdtemp(prefix="day9-tests-")
+os.environ["ORDER_LEDGER"] = os.path.join(DATA_DIR, "orders.jsonl")
+os.environ["IMAGE_CACHE_DIR"] = os.path.join(DATA_DIR, "image_cache")
+
+
+@pytest.fixture(scope="session")
+def day9():
+    """app.py, loaded once under a name of its own"""
+    spec = importlib.util.spec_from_file_location("day9_app", os.path.join(os.path.dirname(__file__), "app.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    yield module
+    module.orders.close()
+    shutil.rmtree(DATA_DIR, ignore_errors=True)
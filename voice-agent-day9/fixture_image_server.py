@@ -0,0 +1,101 @@
+"""Local stand-in for the product image CDNs, used by the benchmarks and tests.
+
+GET /<name>.jpg returns a large JPEG (generated once per name with Pillow)
+after `latency` seconds, as does anything registered with serve(); any
+other path is a 404. Hits per path are counted so callers can check each
+image was fetched only once.
+"""
+import io
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+def make_photo(name, width, height):
+    """A smooth colour gradient with some detail, so it compresses like a photo"""
+    seed = zlib.crc32(name.encode())
+    image = Image.linear_gradient("L").resize((width, height))
+    image = Image.merge("RGB", (image, image.rotate(90).resize((width, height)),
+                                Image.effect_noise((width, height), 24 + seed % 40)))
+    out = io.BytesIO()
+    image.save(out, "JPEG", quality=90)
+    return out.getvalue()
+
+
+class FixtureImageServer:
+    def __init__(self, latency=0.08, width=1200, height=1600):
+        self.latency = latency
+        self.width = width
+        self.height = height
+        self.hits = Counter()
+        self._images = {}
+        # name -> (content type, body) set with serve()
+        self._files = {}
+        self._lock = threading.Lock()
+        self._server = _Server(("127.0.0.1", 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def url(self, name):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/{name}"
+
+    def image(self, name):
+        with self._lock:
+            if name not in self._images:
+                self._images[name] = make_photo(name, self.width, self.height)
+            return self._images[name]
+
+    def serve(self, name, body, content_type):
+        """Answer GET /<name> with `body`, e.g. an HTML error page or a broken image"""
+        with self._lock:
+            self._files[name] = (content_type, body)
+
+    def _handler(self):
+        fixture = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                name = self.path.lstrip("/")
+                with fixture._lock:
+                    fixture.hits[name] += 1
+                    served = fixture._files.get(name)
+                time.sleep(fixture.latency)
+                if served:
+                    content_type, body = served
+                elif name.endswith(".jpg"):
+                    content_type, body = "image/jpeg", fixture.image(name)
+                else:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,188 @@
+"""Local cache of product images, served by /img/<product_id>.
+
+Each remote image is fetched once. The original and every resized
+thumbnail are stored as content-addressed blobs (named by their blake2b
+hash) under IMAGE_CACHE_DIR, with small ref files mapping a URL to its
+original and an (original, width, format) to its thumbnail. A thumbnail's
+hash doubles as its ETag.
+
+Thumbnails are WebP for browsers that accept it and JPEG otherwise, made
+with Pillow. Without Pillow installed the original bytes are served as-is.
+Only raster images are fetched and served: anything else the CDN answers
+with (an HTML error page, an SVG, bytes Pillow can't decode) raises
+NotAnImage rather than being served from the app's origin.
+
+Pre-generate thumbnails for the whole catalog with warm(), which spreads
+the work over a process pool.
+"""
+import hashlib
+import io
+import json
+import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import requests
+
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "image_cache"))
+# Thumbnail widths a client may ask for; the first is the default
+THUMB_WIDTHS = (400, 200, 800)
+FETCH_TIMEOUT = float(os.getenv("IMAGE_FETCH_TIMEOUT", "10"))
+# Largest original accepted from a CDN
+MAX_SOURCE_BYTES = 20 * 1024 * 1024
+FORMATS = {"webp": "image/webp", "jpeg": "image/jpeg"}
+
+
+class NotAnImage(Exception):
+    """The URL doesn't hold an image that can be served"""
+
+
+def _is_image(content_type):
+    # SVG can carry script, so it's never served from here
+    return content_type.startswith("image/") and content_type != "image/svg+xml"
+
+
+def _digest(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def make_thumbnail(data, width, fmt):
+    """Resize an image to fit `width` x `width` and encode it; None without
+    Pillow. Raises NotAnImage if Pillow can't (or won't) decode it."""
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.draft("RGB", (width, width))
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((width, width))
+            if image.mode not in ("RGB", "RGBA") or fmt == "jpeg":
+                image = image.convert("RGB")
+            out = io.BytesIO()
+            if fmt == "webp":
+                image.save(out, "WEBP", quality=80, method=4)
+            else:
+                image.save(out, "JPEG", quality=82, optimize=True, progressive=True)
+            return out.getvalue()
+    except (OSError, Image.DecompressionBombError) as e:
+        # OSError covers UnidentifiedImageError and truncated files
+        raise NotAnImage(str(e)) from e
+
+
+class ImageCache:
+    def __init__(self, path=IMAGE_CACHE_DIR, session=None):
+        self.path = path
+        self.session = session or requests.Session()
+        # Refs never change once written, so they're kept after the first read
+        self._refs = {}
+        # One fetch per URL at a time; others wait for it
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def blob_path(self, digest):
+        return os.path.join(self.path, "blobs", digest[:2], digest)
+
+    def _ref_path(self, *parts):
+        return os.path.join(self.path, "refs", _digest("\0".join(map(str, parts)).encode()))
+
+    def _read_ref(self, path):
+        ref = self._refs.get(path)
+        if ref is None:
+            try:
+                with open(path) as f:
+                    ref = self._refs[path] = json.load(f)
+            except FileNotFoundError:
+                return None
+        return ref
+
+    def _write_ref(self, path, ref):
+        _write_atomic(path, json.dumps(ref).encode())
+        self._refs[path] = ref
+
+    def _lock(self, key):
+        with self._locks_lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _put_blob(self, data):
+        digest = _digest(data)
+        path = self.blob_path(digest)
+        if not os.path.exists(path):
+            _write_atomic(path, data)
+        return digest
+
+    def read(self, digest):
+        with open(self.blob_path(digest), "rb") as f:
+            return f.read()
+
+    def source(self, url):
+        """{'digest', 'type'} of the original image, fetching it the first time"""
+        ref_path = self._ref_path("source", url)
+        ref = self._read_ref(ref_path)
+        if ref:
+            return ref
+        with self._lock(("source", url)):
+            ref = self._read_ref(ref_path)
+            if ref:
+                return ref
+            with self.session.get(url, timeout=FETCH_TIMEOUT, stream=True) as response:
+                response.raise_for_status()
+                content_type = response.headers.get("Content-Type", "application/octet-stream").split(";")[0].strip().lower()
+                if not _is_image(content_type):
+                    raise NotAnImage(f"{url} is {content_type}, not an image")
+                data = response.raw.read(MAX_SOURCE_BYTES + 1, decode_content=True)
+            if len(data) > MAX_SOURCE_BYTES:
+                raise ValueError(f"Image larger than {MAX_SOURCE_BYTES} bytes: {url}")
+            ref = {"digest": self._put_blob(data), "type": content_type}
+            self._write_ref(ref_path, ref)
+            return ref
+
+    def thumbnail(self, url, width=THUMB_WIDTHS[0], fmt="webp"):
+        """{'digest', 'type'} of a thumbnail of the image at `url`, made on first use"""
+        source = self.source(url)
+        if not _is_image(source["type"]):
+            # Fetched before only images were kept
+            raise NotAnImage(f"{url} is {source['type']}, not an image")
+        ref_path = self._ref_path("thumb", source["digest"], width, fmt)
+        ref = self._read_ref(ref_path)
+        if ref:
+            return ref
+        with self._lock(("thumb", source["digest"], width, fmt)):
+            ref = self._read_ref(ref_path)
+            if ref:
+                return ref
+            data = make_thumbnail(self.read(source["digest"]), width, fmt)
+            if data is None:
+                return source
+            ref = {"digest": self._put_blob(data), "type": FORMATS[fmt]}
+            self._write_ref(ref_path, ref)
+            return ref
+
+    def warm(self, urls, widths=THUMB_WIDTHS, formats=tuple(FORMATS), processes=None):
+        """Make every thumbnail of every URL ahead of time; returns the URLs that failed"""
+        urls = list(dict.fromkeys(urls))
+        with ProcessPoolExecutor(processes) as pool:
+            results = pool.map(_warm_one, [(self.path, url, widths, formats) for url in urls])
+            return [url for url, ok in zip(urls, results) if not ok]
+
+
+def _warm_one(job):
+    path, url, widths, formats = job
+    cache = ImageCache(path)
+    try:
+        for width in widths:
+            for fmt in formats:
+                cache.thumbnail(url, width, fmt)
+    except (requests.RequestException, ValueError, NotAnImage):
+        return False
+    return True
@@ -0,0 +1,208 @@
+"""Append-only order ledger.
+
+Orders are appended as one JSON line each to a journal file; the file is
+never rewritten. A single writer thread drains everything queued since its
+last write and commits it with one write + fsync (group commit), so many
+concurrent checkouts cost one disk flush rather than one each. append()
+returns once the order is durable, and only durable orders are indexed, so
+readers never see an order that might yet be lost. If a write fails, the
+journal is cut back to its last good length, the orders in flight fail
+(their ids are reused) and the writer carries on with the next ones.
+
+Order ids come from a sequence under the ledger lock, so they never
+collide. An idempotency key sent with an order maps to the order it first
+created; a retry with the same key gets that order back instead of a new
+one.
+"""
+import json
+import os
+import threading
+
+LEDGER_FILE = os.getenv("ORDER_LEDGER", os.path.join(os.path.dirname(os.path.abspath(__file__)), "orders.jsonl"))
+# fsync each group commit (turn off only for throwaway data)
+LEDGER_FSYNC = os.getenv("ORDER_LEDGER_FSYNC", "1") != "0"
+
+
+class OrderLedger:
+    def __init__(self, path=LEDGER_FILE, legacy_file=None, fsync=LEDGER_FSYNC):
+        self.path = path
+        self.fsync = fsync
+        self.orders = []
+        self.by_id = {}
+        # idempotency key -> position in self.orders
+        self.by_key = {}
+        self._cond = threading.Condition()
+        # Appends waiting for the writer, and those by idempotency key
+        self._pending = []
+        self._in_flight = {}
+        # Ids handed out, durable or not
+        self._assigned = 0
+        # Set only if a failed write couldn't be cut back off the journal
+        self._broken = None
+        self._closed = False
+        # Called with each committed order, e.g. to keep rollups current
+        self._subscribers = []
+
+        if os.path.exists(path):
+            self._load()
+        elif legacy_file and os.path.exists(legacy_file):
+            # One-off import of the old orders.json
+            with open(legacy_file) as f:
+                legacy = json.load(f)
+            tmp = f"{path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.writelines(json.dumps({"order": order}, separators=(",", ":")) + "\n" for order in legacy)
+            os.replace(tmp, path)
+            self._load()
+        self._assigned = len(self.orders)
+
+        # Unbuffered, so nothing of a failed write is left to go out later
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._size = os.fstat(self._fd).st_size
+        self._writer = threading.Thread(target=self._run, name="order-ledger", daemon=True)
+        self._writer.start()
+
+    def _load(self):
+        with open(self.path, "rb+") as f:
+            good = 0
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if not line.endswith(b"\n"):
+                    break
+                self._index(record["order"], record.get("idempotency_key"))
+                good += len(line)
+            # Cut off a torn tail from a crash mid-write; it was never acknowledged
+            f.truncate(good)
+
+    def _index(self, order, key):
+        self.orders.append(order)
+        self.by_id[order["id"]] = order
+        if key:
+            self.by_key[key] = len(self.orders) - 1
+
+    def _next_id(self):
+        self._assigned += 1
+        return f"ORD{self._assigned:06d}"
+
+    def append(self, order, idempotency_key=None):
+        """Assign an id, journal the order and return (order, created).
+
+        `order` is everything but the id. If `idempotency_key` was seen
+        before, nothing is written and the original order is returned with
+        created=False.
+        """
+        with self._cond:
+            while True:
+                if self._broken:
+                    raise self._broken
+                if not idempotency_key:
+                    break
+                position = self.by_key.get(idempotency_key)
+                if position is not None:
+                    return self.orders[position], False
+                first = self._in_flight.get(idempotency_key)
+                if first is None:
+                    break
+                # The first request is still waiting on its commit; if that
+                # fails, this one tries again
+                self._cond.wait_for(lambda: first["done"])
+            order = {"id": self._next_id(), **order}
+            record = {"order": order}
+            if idempotency_key:
+                record["idempotency_key"] = idempotency_key
+            entry = {"order": order, "key": idempotency_key, "done": False, "error": None,
+                     "line": (json.dumps(record, separators=(",", ":")) + "\n").encode()}
+            self._pending.append(entry)
+            if idempotency_key:
+                self._in_flight[idempotency_key] = entry
+            self._cond.notify_all()
+            self._cond.wait_for(lambda: entry["done"])
+            if entry["error"]:
+                raise entry["error"]
+            # The order is durable by now; a failing subscriber mustn't fail the request
+            for subscriber in self._subscribers:
+                try:
+                    subscriber(order)
+                except Exception as e:
+                    print(f"Order subscriber failed on {order['id']}: {e!r}")
+        return order, True
+
+    def subscribe(self, callback):
+        """Call `callback(order)` for every order so far and each one committed from now on"""
+        with self._cond:
+            for order in self.orders:
+                callback(order)
+            self._subscribers.append(callback)
+
+    def _write(self, data):
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self._fd, view):]
+        if self.fsync:
+            os.fsync(self._fd)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._closed)
+                if not self._pending:
+                    return
+                batch, self._pending = self._pending, []
+            data = b"".join(entry["line"] for entry in batch)
+            try:
+                self._write(data)
+            except OSError as e:
+                error = e
+                try:
+                    # Drop whatever part of the batch got written
+                    os.ftruncate(self._fd, self._size)
+                except OSError as truncate_error:
+                    error = truncate_error
+                    with self._cond:
+                        self._broken = truncate_error
+                    print(f"Order ledger can't write to {self.path}: {truncate_error!r}")
+                with self._cond:
+                    # Orders queued behind the batch have ids after it; fail them too so ids stay gapless
+                    failed, self._pending = batch + self._pending, []
+                    for entry in failed:
+                        entry["error"], entry["done"] = error, True
+                        self._in_flight.pop(entry["key"], None)
+                    self._assigned = len(self.orders)
+                    self._cond.notify_all()
+                continue
+            with self._cond:
+                self._size += len(data)
+                for entry in batch:
+                    self._index(entry["order"], entry["key"])
+                    self._in_flight.pop(entry["key"], None)
+                    entry["done"] = True
+                self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._writer.join()
+        os.close(self._fd)
+
+    def get(self, order_id):
+        return self.by_id.get(order_id)
+
+    def count(self):
+        return len(self.orders)
+
+    def last(self, count=1):
+        """Most recent `count` orders, oldest first"""
+        with self._cond:
+            return self.orders[-count:] if count else []
+
+    def page(self, offset=0, limit=None, newest_first=True):
+        with self._cond:
+            if not newest_first:
+                return self.orders[offset:None if limit is None else offset + limit]
+            end = len(self.orders) - offset
+            start = 0 if limit is None else max(end - limit, 0)
+            return self.orders[start:max(end, 0)][::-1]
@@ -0,0 +1,155 @@
+"""Slot-filling parser for shopping requests.
+
+The vocabulary comes from the catalog itself: every category, colour and
+size in the CatalogIndex is a term, and so is any word of a product name
+that only ever appears in one category ("coffee" -> mug, "running" ->
+shoes). New products and categories are picked up without code changes.
+Terms are looked up word n-gram by word n-gram in a dict, so parsing cost
+doesn't grow with the catalog; prices are found by a few regexes.
+"""
+import re
+
+# Extra phrasings, used only when the target value is in the catalog
+CATEGORY_ALIASES = {
+    "shirt": "tshirt",
+    "shirts": "tshirt",
+    "tee": "tshirt",
+    "tees": "tshirt",
+    "sneakers": "shoes",
+    "trainers": "shoes",
+    "earphones": "headphones"
+}
+COLOR_ALIASES = {"grey": "gray"}
+SIZE_WORDS = {
+    "xs": ["extra small"],
+    "s": ["small"],
+    "m": ["medium"],
+    "l": ["large"],
+    "xl": ["extra large"],
+    "xxl": ["double extra large"]
+}
+# Name words never treated as a category on their own
+STOPWORDS = {"with", "and", "for", "the", "from"}
+# Lower number wins when two terms fill the same slot
+EXACT, ALIAS, NAME_WORD = 0, 1, 2
+
+_WORD = re.compile(r"[a-z0-9]+")
+_DIGIT = re.compile(r"\d")
+_NUMBER = r"(?:rs\.?|inr)?\s*(\d+(?:\.\d+)?k?)\s*(?:rs|inr|rupees)?"
+_BETWEEN = re.compile(rf"\bbetween\s+{_NUMBER}\s+(?:and|to)\s+{_NUMBER}")
+_RANGE = re.compile(rf"(?:\bfrom\s+)?{_NUMBER}\s*(?:-|to)\s*{_NUMBER}")
+# A bare range ("3-4 mugs") is only a price with one of these in the text
+_PRICE_WORD = re.compile(r"\b(?:rs|inr|rupees?|price[sd]?|pricing|costs?|costing|budget)\b")
+_MAX = re.compile(rf"\b(?:under|below|less than|cheaper than|up to|upto|within|max(?:imum)?|at most|no more than)\s+{_NUMBER}")
+_MIN = re.compile(rf"\b(?:over|above|more than|at least|min(?:imum)?|starting at|from)\s+{_NUMBER}")
+
+
+def normalize(text):
+    """Lowercase, spell ₹ as rs, drop thousands separators and join
+    hyphenated words (t-shirt -> tshirt)"""
+    text = text.lower().replace("₹", " rs ")
+    text = re.sub(r"(?<=\d),(?=\d{3})", "", text)
+    return re.sub(r"(?<=[a-z])-(?=[a-z])", "", text)
+
+
+def _amount(value):
+    if value.endswith("k"):
+        return int(float(value[:-1]) * 1000)
+    return int(float(value))
+
+
+def parse_price(text):
+    """(min_price, max_price) mentioned in normalized text, either may be None"""
+    match = _BETWEEN.search(text) or (_PRICE_WORD.search(text) and _RANGE.search(text))
+    if match:
+        low, high = sorted((_amount(match.group(1)), _amount(match.group(2))))
+        return low, high
+    low = _MIN.search(text)
+    high = _MAX.search(text)
+    return (_amount(low.group(1)) if low else None,
+            _amount(high.group(1)) if high else None)
+
+
+class QueryParser:
+    def __init__(self, index):
+        # term -> (slot, value, priority)
+        self.terms = {}
+        categories = set(index.values("category"))
+        colors = set(index.values("color"))
+        sizes = set(index.values("size"))
+
+        for category in categories:
+            forms = {category, category + "s", category + "es"}
+            if category.endswith("s"):
+                forms.add(category[:-1])
+            for form in forms:
+                self._add(form, "category", category, EXACT)
+        for alias, category in CATEGORY_ALIASES.items():
+            if category in categories:
+                self._add(alias, "category", category, ALIAS)
+
+        for color in colors:
+            self._add(color, "color", color, EXACT)
+        for alias, color in COLOR_ALIASES.items():
+            if color in colors:
+                self._add(alias, "color", color, ALIAS)
+
+        for size in sizes:
+            self._add(f"size {size}", "size", size, EXACT)
+            if len(size) > 1:
+                self._add(size, "size", size, EXACT)
+            for word in SIZE_WORDS.get(size, ()):
+                self._add(word, "size", size, ALIAS)
+
+        # Name words that point at exactly one category
+        seen = {}
+        for product in index.products:
+            for word in _WORD.findall(normalize(product['name'])):
+                seen.setdefault(word, set()).add(product['category'].lower())
+        for word, owners in seen.items():
+            if len(owners) == 1 and len(word) > 2 and word.isalpha() and word not in STOPWORDS:
+                self._add(word, "category", next(iter(owners)), NAME_WORD)
+
+        # First word -> longest term starting with it, for multi-word terms
+        self._phrases = {}
+        for term in self.terms:
+            words = term.split()
+            if len(words) > 1:
+                self._phrases[words[0]] = max(self._phrases.get(words[0], 1), len(words))
+
+    def _add(self, term, slot, value, priority):
+        current = self.terms.get(term)
+        if current is None or priority < current[2]:
+            self.terms[term] = (slot, value, priority)
+
+    def parse(self, text):
+        """Slots found in `text`, as CatalogIndex.query() keyword arguments"""
+        text = normalize(text)
+        slots = {}
+        priorities = {}
+        words = _WORD.findall(text)
+        i = 0
+        while i < len(words):
+            n = 1
+            found = None
+            # Longest match first so "extra large" wins over "large"
+            for n in range(min(self._phrases.get(words[i], 1), len(words) - i), 0, -1):
+                found = self.terms.get(" ".join(words[i:i + n]) if n > 1 else words[i])
+                if found:
+                    break
+            if not found:
+                i += 1
+                continue
+            slot, value, priority = found
+            if slot not in slots or priority < priorities[slot]:
+                slots[slot] = value
+                priorities[slot] = priority
+            i += n
+        if not _DIGIT.search(text):
+            return slots
+        min_price, max_price = parse_price(text)
+        if min_price is not None:
+            slots["min_price"] = min_price
+        if max_price is not None:
+            slots["max_price"] = max_price
+        return slots
@@ -0,0 +1,111 @@
+"""Image cache and /img/<product_id> against a local stand-in for the CDNs.
+
+Run with: python -m pytest test_image_cache.py
+"""
+import io
+
+import pytest
+from PIL import Image
+
+from fixture_image_server import FixtureImageServer
+from image_cache import ImageCache, NotAnImage, make_thumbnail
+
+HTML = b"<html><body>Access denied</body></html>"
+SVG = b'<svg xmlns="http://www.w3.org/2000/svg"><script>alert(1)</script></svg>'
+WEBP = {"Accept": "image/avif,image/webp,*/*"}
+
+
+@pytest.fixture(scope="module")
+def cdn():
+    with FixtureImageServer(latency=0, width=600, height=800) as server:
+        server.serve("denied.jpg", HTML, "text/html")
+        server.serve("logo.svg", SVG, "image/svg+xml")
+        server.serve("broken.jpg", b"\xff\xd8\xff\xe0 not really a jpeg", "image/jpeg")
+        yield server
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ImageCache(str(tmp_path / "images"))
+
+
+@pytest.fixture
+def product(day9, cdn, monkeypatch):
+    """The first product, with its image moved to the fixture CDN"""
+    product = day9.PRODUCTS[0]
+    monkeypatch.setitem(product, "image", cdn.url(f"{product['id']}.jpg"))
+    return product
+
+
+def test_thumbnail_fits_width_and_is_fetched_once(cdn, cache):
+    url = cdn.url("once.jpg")
+    for width in (400, 200):
+        for fmt in ("webp", "jpeg"):
+            ref = cache.thumbnail(url, width, fmt)
+            with Image.open(cache.blob_path(ref["digest"])) as image:
+                assert max(image.size) <= width
+                assert image.format == fmt.upper()
+    assert cdn.hits["once.jpg"] == 1
+
+    # A new cache over the same directory finds everything on disk
+    ImageCache(cache.path).thumbnail(url)
+    assert cdn.hits["once.jpg"] == 1
+
+
+@pytest.mark.parametrize("name", ["denied.jpg", "logo.svg", "broken.jpg"])
+def test_non_images_are_refused(cdn, cache, name):
+    with pytest.raises(NotAnImage):
+        cache.thumbnail(cdn.url(name))
+
+
+def test_refused_page_is_not_stored(cdn, cache):
+    with pytest.raises(NotAnImage):
+        cache.source(cdn.url("denied.jpg"))
+    assert cache._read_ref(cache._ref_path("source", cdn.url("denied.jpg"))) is None
+
+
+def test_decompression_bomb_is_not_an_image(monkeypatch):
+    out = io.BytesIO()
+    Image.new("RGB", (100, 100)).save(out, "PNG")
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1000)
+    with pytest.raises(NotAnImage):
+        make_thumbnail(out.getvalue(), 400, "webp")
+
+
+def test_warm_reports_the_urls_that_failed(cdn, cache):
+    good, bad = cdn.url("warm.jpg"), cdn.url("denied.jpg")
+    assert cache.warm([good, bad], widths=(200,), formats=("jpeg",), processes=2) == [bad]
+
+
+def test_img_serves_webp_and_revalidates(day9, product):
+    client = day9.app.test_client()
+    response = client.get(f"/img/{product['id']}", headers=WEBP)
+    assert response.status_code == 200 and response.mimetype == "image/webp"
+    assert "max-age" in response.headers["Cache-Control"]
+    assert "Accept" in response.headers["Vary"]
+
+    response = client.get(f"/img/{product['id']}?w=200", headers={"Accept": "image/jpeg"})
+    assert response.mimetype == "image/jpeg"
+    revalidated = client.get(f"/img/{product['id']}?w=200",
+                             headers={"Accept": "image/jpeg", "If-None-Match": response.headers["ETag"]})
+    assert revalidated.status_code == 304
+
+
+def test_img_rejects_bad_requests(day9, product):
+    client = day9.app.test_client()
+    assert client.get(f"/img/{product['id']}?w=123").status_code == 400
+    assert client.get("/img/no-such-product").status_code == 404
+
+
+def test_img_does_not_serve_a_non_image(day9, cdn, product, monkeypatch):
+    monkeypatch.setitem(product, "image", cdn.url("denied.jpg"))
+    response = day9.app.test_client().get(f"/img/{product['id']}")
+    assert response.status_code == 404
+    assert b"Access denied" not in response.data
+
+
+def test_img_redirects_when_the_cdn_fails(day9, cdn, product, monkeypatch):
+    monkeypatch.setitem(product, "image", cdn.url("gone.png"))
+    response = day9.app.test_client().get(f"/img/{product['id']}")
+    assert response.status_code == 302
+    assert response.headers["Location"] == cdn.url("gone.png")
@@ -0,0 +1,43 @@
+"""Chat query parsing: the golden utterances, and which messages pick a product.
+
+Run with: python -m pytest test_nlu.py
+"""
+import pytest
+
+from bench_nlu import GOLDEN, synthetic_products
+from catalog_index import CatalogIndex
+from query_parser import QueryParser
+
+
+@pytest.mark.parametrize("utterance, expected", GOLDEN, ids=[utterance for utterance, _ in GOLDEN])
+def test_golden_utterance(day9, utterance, expected):
+    assert day9.PARSER.parse(utterance) == expected
+
+
+def test_parse_does_not_depend_on_case(day9):
+    assert day9.PARSER.parse("SHOW BLACK HOODIES") == {"category": "hoodie", "color": "black"}
+
+
+def test_synthetic_catalog_categories_are_found():
+    parser = QueryParser(CatalogIndex(synthetic_products()))
+    assert parser.parse("show me gadget17 under 2000") == {"category": "gadget17", "max_price": 2000}
+
+
+def test_description_that_fits_one_product_picks_it(day9):
+    product = day9.find_product("i want a black hoodie")
+    assert product is not None
+    assert (product["category"], product["color"]) == ("hoodie", "black")
+
+
+def test_product_named_by_id_is_picked(day9):
+    assert day9.find_product("add mug-002 please")["id"] == "mug-002"
+
+
+@pytest.mark.parametrize("message", [
+    "i want something under 500",
+    "anything black",
+    "show me 3-4 mugs",
+    "hello there",
+])
+def test_no_pick_without_a_single_match(day9, message):
+    assert day9.find_product(message) is None
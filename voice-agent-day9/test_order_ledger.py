@@ -0,0 +1,140 @@
+"""Order ledger: concurrent checkouts, idempotency retries and write failures.
+
+Run with: python -m pytest test_order_ledger.py
+"""
+import json
+import os
+import threading
+
+import pytest
+
+from order_ledger import OrderLedger
+
+THREADS = 16
+ORDERS_PER_THREAD = 40
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "orders.jsonl")
+
+
+def reload(path):
+    ledger = OrderLedger(path, fsync=False)
+    try:
+        return ledger.orders, dict(ledger.by_key)
+    finally:
+        ledger.close()
+
+
+def test_concurrent_appends_lose_and_duplicate_nothing(path):
+    ledger = OrderLedger(path, fsync=False)
+    results = [[] for _ in range(THREADS)]
+    errors = []
+    start = threading.Barrier(THREADS)
+
+    def checkout(worker):
+        start.wait()
+        try:
+            for n in range(ORDERS_PER_THREAD):
+                key = f"w{worker}-{n}"
+                order, created = ledger.append({"worker": worker, "n": n}, idempotency_key=key)
+                # A client retrying the same request gets the same order back
+                retried, again = ledger.append({"worker": worker, "n": n}, idempotency_key=key)
+                results[worker].append((order, created, retried, again))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=checkout, args=(worker,)) for worker in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    ledger.close()
+
+    assert not errors
+    total = THREADS * ORDERS_PER_THREAD
+    for worker_results in results:
+        for order, created, retried, again in worker_results:
+            assert created and not again and retried is order
+    ids = [order["id"] for order in ledger.orders]
+    assert sorted(ids) == [f"ORD{n:06d}" for n in range(1, total + 1)]
+    assert len(ledger.by_key) == total
+
+    orders, by_key = reload(path)
+    assert orders == ledger.orders
+    assert by_key == ledger.by_key
+
+
+def test_concurrent_retries_of_one_key_create_one_order(path):
+    ledger = OrderLedger(path, fsync=False)
+    created = []
+    start = threading.Barrier(THREADS)
+
+    def checkout():
+        start.wait()
+        created.append(ledger.append({"item": "mug-001"}, idempotency_key="same")[1])
+
+    threads = [threading.Thread(target=checkout) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    ledger.close()
+
+    assert created.count(True) == 1
+    assert ledger.count() == 1
+
+
+def test_failed_write_is_cut_back_and_the_next_order_goes_through(path, monkeypatch):
+    ledger = OrderLedger(path, fsync=False)
+    first, _ = ledger.append({"item": "mug-001"})
+    size = os.path.getsize(path)
+
+    write = ledger._write
+
+    def torn_write(data):
+        # Half the batch reaches the disk before the write fails
+        monkeypatch.setattr(ledger, "_write", write)
+        os.write(ledger._fd, data[:len(data) // 2])
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(ledger, "_write", torn_write)
+    with pytest.raises(OSError):
+        ledger.append({"item": "mug-002"}, idempotency_key="retry-me")
+    assert os.path.getsize(path) == size
+    assert ledger.count() == 1 and "retry-me" not in ledger.by_key
+
+    second, created = ledger.append({"item": "mug-002"}, idempotency_key="retry-me")
+    ledger.close()
+    assert created and second["id"] == "ORD000002"
+
+    orders, by_key = reload(path)
+    assert orders == [first, second]
+    assert by_key == {"retry-me": 1}
+
+
+def test_torn_tail_is_dropped_on_load(path):
+    ledger = OrderLedger(path, fsync=False)
+    order, _ = ledger.append({"item": "mug-001"})
+    ledger.close()
+    with open(path, "a") as f:
+        f.write('{"order":{"id":"ORD0000')
+
+    orders, _ = reload(path)
+    assert orders == [order]
+    with open(path) as f:
+        assert [json.loads(line)["order"] for line in f] == [order]
+
+
+def test_legacy_orders_are_imported_once(tmp_path, path):
+    legacy = tmp_path / "orders.json"
+    legacy.write_text(json.dumps([{"id": "ORD000001", "item": "mug-001"}]))
+    ledger = OrderLedger(path, legacy_file=str(legacy), fsync=False)
+    order, _ = ledger.append({"item": "mug-002"})
+    ledger.close()
+    assert order["id"] == "ORD000002"
+
+    ledger = OrderLedger(path, legacy_file=str(legacy), fsync=False)
+    ledger.close()
+    assert [order["id"] for order in ledger.orders] == ["ORD000001", "ORD000002"]
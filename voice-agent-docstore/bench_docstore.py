@@ -0,0 +1,201 @@
+"""Insert and lookup throughput at 1M documents.
+
+Times, on DOCS order-like documents:
+  - the whole-file json.load/json.dump(indent=2) the apps used, per insert,
+    at OLD_STYLE_DOCS documents (it only gets slower from there)
+  - put() one at a time and put_many() in batches (fsync off), then a few
+    fsynced put()s
+  - get() by random key, shared (checks the log with os.stat) and not
+  - find() through a secondary index and with a limit
+  - reopening (replaying the log), and compaction after rewriting half
+  - WRITERS processes inserting into one collection at once
+Checks a reopened store equals the one written, index results match a
+scan, a torn last line is dropped, compaction keeps every document and
+no process's writes are lost. Exits non-zero if a check fails.
+
+Run with: python bench_docstore.py
+"""
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+import docstore
+from docstore import DocumentStore
+
+DOCS = 1_000_000
+BATCH = 10_000
+SINGLE_PUTS = 100_000
+LOOKUPS = 200_000
+FINDS = 2000
+FSYNC_PUTS = 200
+OLD_STYLE_DOCS = 5000
+OLD_STYLE_INSERTS = 50
+WRITERS = 4
+WRITER_DOCS = 5000
+STATUSES = ["received", "confirmed", "being_prepared", "out_for_delivery", "delivered"]
+
+
+def make_doc(n, rng):
+    return {"order_id": f"ORD{n:07d}", "timestamp": f"2025-11-{1 + n % 28:02d}T10:{n % 60:02d}:00",
+            "customer": f"customer {rng.randrange(50_000)}", "status": rng.choice(STATUSES),
+            "items": [{"id": f"item_{rng.randrange(300)}", "quantity": rng.randint(1, 4),
+                       "price": rng.randrange(20, 400)} for _ in range(rng.randint(1, 4))],
+            "total": rng.randrange(50, 3000)}
+
+
+def rate(count, seconds):
+    return f"{count / seconds:12,.0f}/s"
+
+
+def old_style(path, rng):
+    """Per-insert cost of the read-everything, rewrite-everything pattern"""
+    file = os.path.join(path, "orders_history.json")
+    with open(file, "w") as f:
+        json.dump([make_doc(n, rng) for n in range(OLD_STYLE_DOCS)], f, indent=2)
+    start = time.perf_counter()
+    for n in range(OLD_STYLE_INSERTS):
+        with open(file) as f:
+            orders = json.load(f)
+        orders.append(make_doc(OLD_STYLE_DOCS + n, rng))
+        with open(file, "w") as f:
+            json.dump(orders, f, indent=2)
+    return time.perf_counter() - start
+
+
+def writer(path, number):
+    store = DocumentStore(path, fsync=False)
+    orders = store.collection("orders", key="order_id")
+    rng = random.Random(number)
+    for n in range(WRITER_DOCS):
+        orders.put(make_doc(number * WRITER_DOCS + n, rng))
+    store.close()
+
+
+def main(path):
+    failures = []
+
+    def check(ok, message):
+        if not ok:
+            failures.append(message)
+
+    rng = random.Random(46)
+    print(f"serializer: {'orjson' if docstore.orjson else 'json'}")
+    old_s = old_style(path, rng)
+    print(f"  json.dump per insert ({OLD_STYLE_DOCS:,} docs)  {rate(OLD_STYLE_INSERTS, old_s)}")
+
+    docs = [make_doc(n, rng) for n in range(DOCS)]
+    store = DocumentStore(os.path.join(path, "store"), fsync=False)
+    orders = store.collection("orders", key="order_id", indexes=("status", "customer"))
+    start = time.perf_counter()
+    for doc in docs[:SINGLE_PUTS]:
+        orders.put(doc)
+    put_s = time.perf_counter() - start
+    start = time.perf_counter()
+    for first in range(SINGLE_PUTS, DOCS, BATCH):
+        orders.put_many(docs[first:first + BATCH])
+    many_s = time.perf_counter() - start
+    print(f"  put()                              {rate(SINGLE_PUTS, put_s)}")
+    print(f"  put_many({BATCH:,})                  {rate(DOCS - SINGLE_PUTS, many_s)}")
+    check(len(orders) == DOCS, f"{len(orders)} documents after inserting {DOCS}")
+
+    synced = DocumentStore(os.path.join(path, "synced"), fsync=True).collection("orders", key="order_id")
+    start = time.perf_counter()
+    for doc in docs[:FSYNC_PUTS]:
+        synced.put(doc)
+    print(f"  put(), fsync each                  {rate(FSYNC_PUTS, time.perf_counter() - start)}")
+
+    keys = [f"ORD{rng.randrange(DOCS):07d}" for _ in range(LOOKUPS)]
+    start = time.perf_counter()
+    for key in keys:
+        orders.get(key)
+    shared_s = time.perf_counter() - start
+    local = DocumentStore(os.path.join(path, "store"), fsync=False, shared=False)
+    start = time.perf_counter()
+    local_orders = local.collection("orders", key="order_id", indexes=("status", "customer"))
+    reopen_s = time.perf_counter() - start
+    start = time.perf_counter()
+    for key in keys:
+        local_orders.get(key)
+    local_s = time.perf_counter() - start
+    print(f"  get(), shared=True                 {rate(LOOKUPS, shared_s)}")
+    print(f"  get(), shared=False                {rate(LOOKUPS, local_s)}")
+    size = os.path.getsize(orders.path)
+    print(f"  reopen ({size / 2**20:,.0f} MiB log)              {rate(DOCS, reopen_s)} ({reopen_s:.1f} s)")
+    check(all(local_orders.get(doc["order_id"]) == doc for doc in docs[::997]), "reopened store differs")
+
+    customers = [f"customer {rng.randrange(50_000)}" for _ in range(FINDS)]
+    start = time.perf_counter()
+    for customer in customers:
+        orders.find(customer=customer)
+    find_s = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(FINDS):
+        orders.find(status="delivered", limit=10, reverse=True)
+    latest_s = time.perf_counter() - start
+    print(f"  find(customer=)                    {rate(FINDS, find_s)}")
+    print(f"  find(status=, limit=10)            {rate(FINDS, latest_s)}")
+    customer = customers[0]
+    check([d["order_id"] for d in orders.find(customer=customer)]
+          == [d["order_id"] for d in docs if d["customer"] == customer], "index lookup differs from scan")
+    check(orders.find(status="delivered", limit=10, reverse=True)
+          == [d for d in docs if d["status"] == "delivered"][-10:][::-1], "latest by status differs")
+
+    local.close()
+    del local_orders, docs
+
+    # Rewrite half the documents, then compact; another handle on the store
+    # picks up the rewritten log
+    other = DocumentStore(os.path.join(path, "store"), fsync=False).collection("orders", key="order_id")
+    start = time.perf_counter()
+    for first in range(0, DOCS, 2 * BATCH):
+        orders.put_many([{**orders.get(f"ORD{n:07d}"), "status": "delivered"} for n in range(first, first + BATCH)])
+    before = os.path.getsize(orders.path)
+    orders.compact()
+    compact_s = time.perf_counter() - start
+    print(f"  rewrite half + compact             {compact_s:12.1f} s ({before / 2**20:,.0f} -> "
+          f"{os.path.getsize(orders.path) / 2**20:,.0f} MiB)")
+    check(len(other) == DOCS and other.get("ORD0000000")["status"] == "delivered",
+          "another handle lost documents across a compaction")
+    other.close()
+    store.close()
+
+    # A crash mid-write leaves a torn line; it is dropped and the log stays appendable
+    small = DocumentStore(os.path.join(path, "torn"))
+    carts = small.collection("carts")
+    carts.put({"id": "current", "items": []})
+    with open(carts.path, "ab") as f:
+        f.write(b'{"put":{"id":"current","ite')
+    small.close()
+    small = DocumentStore(os.path.join(path, "torn"))
+    carts = small.collection("carts")
+    check(carts.get("current") == {"id": "current", "items": []}, "torn line not dropped")
+    carts.update("current", {"items": ["milk"]})
+    small.close()
+    check(DocumentStore(os.path.join(path, "torn")).collection("carts").get("current")["items"] == ["milk"],
+          "write after a torn line lost")
+
+    shared_path = os.path.join(path, "shared")
+    start = time.perf_counter()
+    processes = [multiprocessing.Process(target=writer, args=(shared_path, n)) for n in range(WRITERS)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    shared_s = time.perf_counter() - start
+    merged = DocumentStore(shared_path).collection("orders", key="order_id")
+    print(f"  put(), {WRITERS} processes at once         {rate(WRITERS * WRITER_DOCS, shared_s)}")
+    check(len(merged) == WRITERS * WRITER_DOCS, f"{len(merged)} of {WRITERS * WRITER_DOCS} concurrent writes kept")
+
+    for failure in failures:
+        print(f"  FAIL {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as path:
+        status = main(path)
+    sys.exit(status)
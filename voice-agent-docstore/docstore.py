@@ -0,0 +1,382 @@
+"""Local JSON document store shared by the voice agents.
+
+A DocumentStore is a directory; each collection in it is an append-only
+log, <name>.log, of one JSON line per change ({"put": doc} or {"del": key}).
+Opening a collection replays its log into a dict keyed by the primary key,
+so get() is a dict lookup; secondary indexes, if asked for, map each value
+of a field to the keys of the documents that have it, for find(). A write
+appends its lines (and fsyncs, unless fsync=False) and is never rewritten
+in place. Once the log is mostly superseded lines the collection is
+compacted: rewritten with just the live documents and swapped in with
+os.replace. A torn last line left by a crash is dropped on the next write.
+
+Several processes may use the same store. A write holds an exclusive
+flock on <name>.lock and first replays whatever other processes appended;
+a read checks with one os.stat whether the log has grown (or been replaced
+by a compaction) and if so catches up under a shared lock. shared=False
+skips this for a store only one process uses.
+
+Documents go in and come out as plain JSON-compatible dicts, serialized
+with orjson when it is installed (else json). The store keeps its own copy
+of what was written, and what get() and find() return is that copy:
+treat it as read-only, and change a document with put() or update().
+"""
+import contextlib
+import json
+import os
+import re
+import threading
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # No flock (Windows): only one process may use a store
+    fcntl = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# fsync each write (turn off only for throwaway data)
+STORE_FSYNC = os.getenv("DOCSTORE_FSYNC", "1") != "0"
+# Compact once the log is at least this big and has this many lines per live document
+COMPACT_MIN_BYTES = 1 << 20
+COMPACT_RATIO = 2
+NAME = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+if orjson is not None:
+    dumps = orjson.dumps
+    loads = orjson.loads
+else:
+    def dumps(obj):
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+
+    loads = json.loads
+
+
+def _index_values(value):
+    """The values a document is filed under in a secondary index: the
+    field's value, or each element if it is a list"""
+    if isinstance(value, (str, int, float)):
+        return (value,)
+    if isinstance(value, list):
+        return [v for v in value if isinstance(v, (str, int, float))]
+    return ()
+
+
+def _matches(value, wanted):
+    return value == wanted or (isinstance(value, list) and wanted in value)
+
+
+class Collection:
+    """Documents keyed by doc[key]; get it from DocumentStore.collection()"""
+
+    def __init__(self, store, name, key="id", indexes=(), legacy_file=None):
+        self.name = name
+        self.key = key
+        self.path = os.path.join(store.path, f"{name}.log")
+        self.fsync = store.fsync
+        self.shared = store.shared and fcntl is not None
+        self._docs = {}
+        # field -> value -> {key: None} (a dict, so find() keeps insertion order)
+        self._indexes = {field: {} for field in indexes}
+        self._lock = threading.RLock()
+        self._fd = None
+        self._ino = None
+        self._offset = 0
+        # Lines in the log, live or superseded
+        self._records = 0
+        self._lock_fd = os.open(os.path.join(store.path, f"{name}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        with self._lock:
+            self._flock(exclusive=True)
+            try:
+                if legacy_file and not os.path.exists(self.path):
+                    self._import(legacy_file)
+                self._catch_up()
+            finally:
+                self._unlock()
+
+    def _flock(self, exclusive):
+        if self.shared:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+
+    def _unlock(self):
+        if self.shared:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    @contextlib.contextmanager
+    def _exclusive(self):
+        """For a write: this thread and process alone, caught up"""
+        with self._lock:
+            self._flock(exclusive=True)
+            try:
+                self._catch_up()
+                yield
+            finally:
+                self._unlock()
+
+    def _stale(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return True
+        return st.st_ino != self._ino or st.st_size != self._offset
+
+    def _refresh(self):
+        """Catch up with other processes' writes before a read"""
+        if self.shared and self._stale():
+            self._flock(exclusive=False)
+            try:
+                self._catch_up()
+            finally:
+                self._unlock()
+
+    def _catch_up(self):
+        """Replay lines appended since we last looked; start over if the log
+        was replaced (compacted) under us"""
+        try:
+            ino = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            ino = None
+        if self._fd is None or ino != self._ino:
+            if self._fd is not None:
+                os.close(self._fd)
+            self._fd = os.open(self.path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+            self._ino = os.fstat(self._fd).st_ino
+            self._offset = self._records = 0
+            self._docs = {}
+            self._indexes = {field: {} for field in self._indexes}
+        size = os.fstat(self._fd).st_size
+        if size <= self._offset:
+            return
+        data = os.pread(self._fd, size - self._offset, self._offset)
+        start = 0
+        while True:
+            end = data.find(b"\n", start)
+            if end < 0:
+                # A torn tail from a crash mid-write: never acknowledged; the
+                # next write cuts it off
+                break
+            try:
+                record = loads(data[start:end])
+            except ValueError:
+                break
+            self._apply(record)
+            start = end + 1
+        self._offset += start
+
+    def _apply(self, record):
+        self._records += 1
+        if "put" in record:
+            doc = record["put"]
+            key = doc[self.key]
+            old = self._docs.get(key)
+            if old is not None:
+                self._unindex(key, old)
+            self._docs[key] = doc
+            for field, index in self._indexes.items():
+                for value in _index_values(doc.get(field)):
+                    index.setdefault(value, {})[key] = None
+        else:
+            key = record["del"]
+            old = self._docs.pop(key, None)
+            if old is not None:
+                self._unindex(key, old)
+
+    def _unindex(self, key, doc):
+        for field, index in self._indexes.items():
+            for value in _index_values(doc.get(field)):
+                bucket = index.get(value)
+                if bucket is not None:
+                    bucket.pop(key, None)
+                    if not bucket:
+                        del index[value]
+
+    def _import(self, legacy_file):
+        """One-off import of an old whole-file JSON list (or single document)"""
+        try:
+            with open(legacy_file, "rb") as f:
+                legacy = loads(f.read())
+        except (OSError, ValueError):
+            return
+        if isinstance(legacy, dict):
+            legacy = [legacy]
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "wb") as f:
+            f.writelines(dumps({"put": self._keyed(doc)}) + b"\n" for doc in legacy)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def _keyed(self, doc):
+        if self.key in doc:
+            return doc
+        return {self.key: uuid.uuid4().hex, **doc}
+
+    def _append(self, records):
+        """Write records to the log and apply them; call inside _exclusive()"""
+        if os.fstat(self._fd).st_size != self._offset:
+            os.ftruncate(self._fd, self._offset)
+        data = b"".join(dumps(record) + b"\n" for record in records)
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self._fd, view):]
+        if self.fsync:
+            os.fsync(self._fd)
+        # Apply what a reload would read back, not the caller's objects
+        start = 0
+        for _ in records:
+            end = data.index(b"\n", start)
+            self._apply(loads(data[start:end]))
+            start = end + 1
+        self._offset += len(data)
+        if self._offset >= COMPACT_MIN_BYTES and self._records > COMPACT_RATIO * max(len(self._docs), 1):
+            self._compact()
+
+    def _compact(self):
+        tmp = f"{self.path}.compact"
+        with open(tmp, "wb") as f:
+            f.writelines(dumps({"put": doc}) + b"\n" for doc in self._docs.values())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        if self.fsync:
+            dir_fd = os.open(os.path.dirname(self.path), os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+        # Other processes see the new inode and reload
+        os.close(self._fd)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_APPEND)
+        st = os.fstat(self._fd)
+        self._ino, self._offset, self._records = st.st_ino, st.st_size, len(self._docs)
+
+    def put(self, doc):
+        """Insert or replace a document; one without a key gets a random one.
+        Returns the key."""
+        doc = self._keyed(doc)
+        with self._exclusive():
+            self._append([{"put": doc}])
+        return doc[self.key]
+
+    def put_many(self, docs):
+        """put() for many documents with one write; returns their keys"""
+        docs = [self._keyed(doc) for doc in docs]
+        if docs:
+            with self._exclusive():
+                self._append([{"put": doc} for doc in docs])
+        return [doc[self.key] for doc in docs]
+
+    def update(self, key, changes):
+        """Merge changes into a document, as one atomic read-modify-write even
+        across processes. changes is a dict, or a function of the current
+        document returning one. Returns the new document, or None if there
+        is no document with that key."""
+        with self._exclusive():
+            doc = self._docs.get(key)
+            if doc is None:
+                return None
+            if callable(changes):
+                changes = changes(doc)
+            self._append([{"put": {**doc, **changes}}])
+            return self._docs[key]
+
+    def delete(self, key):
+        """Remove a document; False if there was none"""
+        with self._exclusive():
+            if key not in self._docs:
+                return False
+            self._append([{"del": key}])
+            return True
+
+    def compact(self):
+        """Rewrite the log with only the live documents"""
+        with self._exclusive():
+            self._compact()
+
+    def get(self, key, default=None):
+        with self._lock:
+            self._refresh()
+            return self._docs.get(key, default)
+
+    def find(self, limit=None, reverse=False, **criteria):
+        """Documents whose fields equal the given values (or, for a list
+        field, contain them), in insertion order (newest first if reverse).
+        With no criteria, every document. Uses the smallest matching
+        secondary index, if any of the fields has one."""
+        with self._lock:
+            self._refresh()
+            keys = None
+            for field, value in criteria.items():
+                if field in self._indexes:
+                    bucket = self._indexes[field].get(value, {})
+                    if keys is None or len(bucket) < len(keys):
+                        keys = bucket
+            if keys is None:
+                keys = self._docs
+            if reverse:
+                keys = reversed(keys)
+            found = []
+            for key in keys:
+                doc = self._docs[key]
+                if all(_matches(doc.get(field), value) for field, value in criteria.items()):
+                    found.append(doc)
+                    if limit is not None and len(found) >= limit:
+                        break
+            return found
+
+    def add_index(self, field):
+        with self._lock:
+            if field in self._indexes:
+                return
+            index = self._indexes[field] = {}
+            for key, doc in self._docs.items():
+                for value in _index_values(doc.get(field)):
+                    index.setdefault(value, {})[key] = None
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return len(self._docs)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+            os.close(self._lock_fd)
+
+
+class DocumentStore:
+    def __init__(self, path, fsync=STORE_FSYNC, shared=True):
+        self.path = path
+        self.fsync = fsync
+        self.shared = shared
+        os.makedirs(path, exist_ok=True)
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def collection(self, name, key="id", indexes=(), legacy_file=None):
+        """The named collection, opened (and its log replayed) on first use.
+        legacy_file is an old JSON file of documents to import if the
+        collection does not exist yet."""
+        if not NAME.fullmatch(name):
+            raise ValueError(f"bad collection name: {name!r}")
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is None:
+                collection = self._collections[name] = Collection(self, name, key, indexes, legacy_file)
+        for field in indexes:
+            collection.add_index(field)
+        return collection
+
+    def close(self):
+        with self._lock:
+            for collection in self._collections.values():
+                collection.close()
+            self._collections.clear()
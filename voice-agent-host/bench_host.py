@@ -0,0 +1,177 @@
+"""Requests/sec and latency: Flask dev servers vs the shared ASGI host.
+
+Each case drives one endpoint with a number of virtual users (own
+connection and cookie jar each) for DURATION seconds and reports
+requests/s, p50 and p99, against:
+
+  flask dev   the agent's own `app.run(debug=True)` server, as each day runs today
+  host x1     host.py with every agent mounted, one worker
+  host x4     host.py --workers 4 --agents day4,day8 (the multi-process-safe ones)
+
+day8's /send_message goes to a local mock chat completions API (in its own
+process) that takes LLM_LATENCY seconds per call, so it measures how many
+waiting turns each server can hold; the other cases are short CPU-bound
+requests. (The mock answers each connection on its own thread, and past
+about a hundred connections it, not the servers, is what's measured.) The
+load generator runs on the same machine, so on few cores the CPU-bound
+cases mostly show how much CPU each server spends per request. Every
+server gets the same environment, writing to a temporary directory. Exits
+non-zero if any request fails.
+
+Run with: python bench_host.py
+"""
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+DURATION = 5.0
+CONCURRENCY = 32
+LLM_CONCURRENCY = 48
+LLM_LATENCY = 0.25
+# (agent, method, path, JSON body or None, virtual users)
+CASES = [
+    ("day4", "POST", "api/mode", {"mode": "learn", "concept_id": "variables"}, CONCURRENCY),
+    ("day9", "GET", "api/catalog?category=hoodies&sort=price_asc", None, CONCURRENCY),
+    ("day10", "GET", "scenarios/next?player={user}", None, CONCURRENCY),
+    ("day8", "POST", "send_message", {"message": "I light the torch and look around"}, LLM_CONCURRENCY),
+]
+MULTI_WORKER = ("day4", "day8")
+WORKERS = 4
+MOCK_LLM = f"""
+import sys, time
+sys.path.insert(0, {os.path.join(ROOT, "voice-agent-day8")!r})
+from mock_llm_server import MockLLMServer
+with MockLLMServer(base_latency={LLM_LATENCY}, latency_per_kb=0) as server:
+    print(server.url, flush=True)
+    time.sleep(3600)
+"""
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(url, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server for {url} exited with {process.returncode}")
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.TransportError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up")
+
+
+def start(args, cwd, env, url):
+    process = subprocess.Popen(args, cwd=cwd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    wait_until_up(url, process)
+    return process
+
+
+def start_flask(agent, env):
+    port = free_port()
+    run = f"import app; app.app.run(debug=True, use_reloader=False, port={port})"
+    process = start([sys.executable, "-c", run], os.path.join(ROOT, f"voice-agent-{agent}"), env,
+                    f"http://127.0.0.1:{port}/")
+    return process, f"http://127.0.0.1:{port}/"
+
+
+def start_host(env, workers=1, agents=None):
+    port = free_port()
+    args = [sys.executable, "host.py", "--port", str(port), "--workers", str(workers)]
+    if agents:
+        args += ["--agents", ",".join(agents)]
+    process = start(args, HERE, env, f"http://127.0.0.1:{port}/")
+    return process, f"http://127.0.0.1:{port}"
+
+
+async def load(base, method, path, body, users):
+    """(requests/s, p50 ms, p99 ms, failures) for `users` users over DURATION"""
+    latencies, failures = [], []
+    deadline = time.perf_counter() + DURATION
+
+    async def user(n):
+        limits = httpx.Limits(max_connections=1)
+        async with httpx.AsyncClient(base_url=base, limits=limits, timeout=30) as client:
+            url = path.format(user=n)
+            while time.perf_counter() < deadline:
+                began = time.perf_counter()
+                try:
+                    response = await client.request(method, url, json=body)
+                    if response.status_code != 200:
+                        failures.append(f"{method} {url}: {response.status_code}")
+                except httpx.HTTPError as e:
+                    failures.append(f"{method} {url}: {e!r}")
+                latencies.append(time.perf_counter() - began)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(user(n) for n in range(users)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    return len(latencies) / elapsed, p50, p99, failures
+
+
+def main(path):
+    env = dict(os.environ, ARCHIVE_DIR=os.path.join(path, "archive"), SESSION_DIR=os.path.join(path, "sessions"),
+               SNAPSHOT_DIR=os.path.join(path, "snapshots"), ORDER_LEDGER=os.path.join(path, "orders.jsonl"),
+               IMAGE_CACHE_DIR=os.path.join(path, "images"), CART_DB=os.path.join(path, "carts.sqlite3"),
+               DOCSTORE_DIR=os.path.join(path, "store"),
+               LLM_RATE_LIMIT="100000", LLM_RATE_BURST="100000", LLM_MAX_CONCURRENCY=str(LLM_CONCURRENCY),
+               GROQ_API_KEY="bench", PYTHONUNBUFFERED="1")
+    mock = subprocess.Popen([sys.executable, "-c", MOCK_LLM], stdout=subprocess.PIPE, text=True)
+    env["GROQ_API_URL"] = mock.stdout.readline().strip()
+    processes = [mock]
+    failures = []
+    try:
+        servers = {}
+        for agent in dict.fromkeys(case[0] for case in CASES):
+            process, url = start_flask(agent, env)
+            processes.append(process)
+            servers[("flask dev", agent)] = url
+        process, url = start_host(env)
+        processes.append(process)
+        for agent in dict.fromkeys(case[0] for case in CASES):
+            servers[("host x1", agent)] = f"{url}/{agent}/"
+        process, url = start_host(env, WORKERS, MULTI_WORKER)
+        processes.append(process)
+        for agent in MULTI_WORKER:
+            servers[(f"host x{WORKERS}", agent)] = f"{url}/{agent}/"
+
+        print(f"{DURATION:.0f} s per run; mock LLM latency {LLM_LATENCY * 1000:.0f} ms ({os.cpu_count()} CPUs)")
+        for agent, method, path_, body, users in CASES:
+            print(f"{agent} {method} /{path_.split('?')[0]}, {users} users")
+            for server in ("flask dev", "host x1", f"host x{WORKERS}"):
+                if (server, agent) not in servers:
+                    continue
+                rps, p50, p99, errors = asyncio.run(load(servers[(server, agent)], method, path_, body, users))
+                print(f"  {server:10s} {rps:8,.0f} req/s  p50 {p50:7.1f} ms  p99 {p99:7.1f} ms"
+                      + (f"  {len(errors)} failed" if errors else ""))
+                failures.extend(f"{server} {error}" for error in errors[:3])
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+    for failure in failures:
+        print(f"  FAIL {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as path:
+        status = main(path)
+    sys.exit(status)
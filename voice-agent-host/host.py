@@ -0,0 +1,174 @@
+"""Shared ASGI host for the voice agents.
+
+Mounts each day's Flask app under /<day>/ (/day3/ ... /day10/) in one
+uvicorn server, in place of one `app.run(debug=True, port=5000)` per day.
+The Flask apps run unchanged on a thread pool each (a2wsgi); an agent that
+also has an asgi.py gets its make_routes(app_module) routes mounted ahead
+of its Flask app, which is how day8's LLM-bound endpoints are served as
+async handlers. Middleware shared by every agent tags each response with
+X-Request-ID and Server-Timing, and gzips large responses. /metrics has
+every mounted agent's request and phase timings (see voice-agent-metrics);
+/traces, /traces/chrome.json and /traces/otlp.json have every agent's
+sampled voice turns (see voice-agent-tracing). With several workers, each
+answers with its own.
+
+Agents that keep state in process memory or rewrite their own JSON files
+(everything but day4 and day8) must run in a single worker. --workers N
+refuses to start with any of those; run them in a separate single-worker
+host with --agents.
+
+Run with: python host.py [--port 8000] [--workers 1] [--agents day4,day8]
+"""
+import argparse
+import importlib.util
+import os
+import sys
+import time
+import uuid
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import HTMLResponse, JSONResponse, RedirectResponse, Response
+from starlette.routing import Mount, Route
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "voice-agent-metrics"))
+sys.path.insert(0, os.path.join(ROOT, "voice-agent-tracing"))
+import metrics
+import tracing
+# name -> (directory, whether it can run in several worker processes)
+AGENTS = {
+    "day3": ("voice-agent-day3", False),
+    "day4": ("voice-agent-day4", True),
+    "day5": ("voice-agent-day5", False),
+    "day6": ("voice-agent-day6", False),
+    "day7": ("voice-agent-day7", False),
+    "day8": ("voice-agent-day8", True),
+    "day9": ("voice-agent-day9", False),
+    "day10": ("voice-agent-day10", False),
+}
+# Threads each Flask app may use at once
+WSGI_THREADS = int(os.getenv("WSGI_THREADS", "16"))
+GZIP_MIN_SIZE = 1024
+
+
+def _load(name, directory, filename):
+    """Import <directory>/<filename> as module `name` (every agent's is app.py)"""
+    spec = importlib.util.spec_from_file_location(name, os.path.join(directory, filename))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_agent(name):
+    """(Flask app module, async routes) for an agent"""
+    directory = os.path.join(ROOT, AGENTS[name][0])
+    # For the agent's own imports (session_store, catalog_index, ...)
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+    module = _load(f"{name}_app", directory, "app.py")
+    # Agents share the host's cookie jar, so each needs its own session cookie
+    module.app.config["SESSION_COOKIE_NAME"] = f"{name}_session"
+    routes = []
+    if os.path.exists(os.path.join(directory, "asgi.py")):
+        routes = _load(f"{name}_asgi", directory, "asgi.py").make_routes(module)
+    return module, routes
+
+
+class RequestContextMiddleware:
+    """Gives every request an X-Request-ID (the caller's, or a new one),
+    visible to the agents as a request header, and adds it and
+    Server-Timing (time to the response headers) to every response"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        request_id = next((value for key, value in scope["headers"] if key == b"x-request-id"), None)
+        if request_id is None:
+            request_id = uuid.uuid4().hex.encode()
+            scope = dict(scope, headers=list(scope["headers"]) + [(b"x-request-id", request_id)])
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                elapsed = (time.perf_counter() - start) * 1000
+                message = dict(message, headers=list(message.get("headers", [])) + [
+                    (b"x-request-id", request_id), (b"server-timing", f"app;dur={elapsed:.1f}".encode())])
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+
+def build(names=None):
+    names = names or list(AGENTS)
+    unknown = [name for name in names if name not in AGENTS]
+    if unknown:
+        raise ValueError(f"unknown agents: {', '.join(unknown)}")
+    routes = []
+    for name in names:
+        module, async_routes = load_agent(name)
+        routes.append(Route(f"/{name}", RedirectResponse(f"/{name}/", status_code=308)))
+        routes.append(Mount(f"/{name}", routes=async_routes + [
+            Mount("", app=WSGIMiddleware(module.app, workers=WSGI_THREADS))]))
+
+    async def index(request):
+        return JSONResponse({"agents": {name: f"/{name}/" for name in names}})
+
+    async def metrics_text(request):
+        return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+    async def traces(request):
+        try:
+            limit = int(request.query_params.get("limit", 20))
+        except ValueError:
+            limit = 20
+        rows = tracing.breakdown(limit)
+        if request.query_params.get("format") == "json":
+            return JSONResponse({"sample_rate": tracing.SAMPLE_RATE, "turns": rows})
+        return HTMLResponse(tracing.render_breakdown(rows))
+
+    def download(export, filename):
+        async def endpoint(request):
+            return JSONResponse(export(), headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+        return endpoint
+
+    return Starlette(routes=[Route("/", index), Route("/metrics", metrics_text), Route("/traces", traces),
+                             Route("/traces/chrome.json", download(tracing.chrome_trace, "voice-turns.json")),
+                             Route("/traces/otlp.json", download(tracing.otlp, "voice-turns-otlp.json"))] + routes,
+                     middleware=[Middleware(RequestContextMiddleware),
+                                 Middleware(GZipMiddleware, minimum_size=GZIP_MIN_SIZE)])
+
+
+def create_app():
+    """What each uvicorn worker calls; VOICE_AGENTS picks the agents"""
+    names = os.getenv("VOICE_AGENTS")
+    return build(names.split(",") if names else None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--agents", help="comma-separated, e.g. day4,day8 (default: all)")
+    args = parser.parse_args()
+    names = args.agents.split(",") if args.agents else list(AGENTS)
+    single = [name for name in names if name in AGENTS and not AGENTS[name][1]]
+    if args.workers > 1 and single:
+        parser.error(f"{', '.join(single)} keep state in one process; "
+                     f"run them with --workers 1 (or leave them out with --agents)")
+    import uvicorn
+    os.environ["VOICE_AGENTS"] = ",".join(names)
+    uvicorn.run("host:create_app", factory=True, host=args.host, port=args.port, workers=args.workers,
+                app_dir=os.path.dirname(os.path.abspath(__file__)))
+
+
+if __name__ == "__main__":
+    main()
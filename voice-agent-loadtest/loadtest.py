@@ -0,0 +1,337 @@
+"""Load tests for the agents' conversational endpoints, and comparison of runs.
+
+    python loadtest.py run [--agents day4,day8] [--levels 1,8,32] [--out results/x.json]
+    python loadtest.py compare results/before.json results/after.json [--threshold 10]
+
+`run` loads each agent's Flask app in a process of its own (so its memory
+and I/O are its own), with every data directory pointed into a temporary
+directory, and drives it through the Flask test client with the
+synthetic conversations in workloads.py: at each concurrency level, that
+many virtual users (one thread and one cookie jar each) send the level's
+requests as fast as they are answered. Every level is run --rounds
+times, the rounds taking turns with the other levels; throughput, latency
+and CPU are the best of the rounds, as with the bench_*.py timings, since
+a busy machine only ever makes them worse, and how far the rounds
+disagreed is kept alongside as that metric's spread. A local mock chat
+completions API (voice-agent-day8's) stands in for Groq, taking
+--llm-latency seconds per call. No agent calls Murf from the server (the browser fetches the audio),
+so there is nothing to stub for it.
+
+For each agent and level it records throughput, p50/p95/p99 latency, CPU
+time per request, RSS (current and peak) and I/O bytes from
+/proc/self/io: read_bytes/write_bytes (what reached the disk) and
+read_chars/write_chars (every read and write call, which includes the
+day8 app's socket traffic to the mock LLM). Latency and CPU include the
+test client's own work, which is the same from run to run. Results go to
+a JSON file with the run's configuration, commit and machine.
+
+`compare` matches the rows of two result files and flags every metric
+that got worse by more than --threshold percent, by more than its spread
+in either run (a shared VM can swing by tens of percent from one minute
+to the next) and by more than a small absolute amount (so microsecond
+jitter isn't a regression). It exits non-zero if anything regressed.
+"""
+import argparse
+import concurrent.futures
+import datetime
+import importlib
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from workloads import WORKLOADS
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+LEVELS = (1, 8, 32)
+LLM_LATENCY = 0.02
+ROUNDS = 3
+THRESHOLD = 10.0
+# Taken at their best over a level's rounds; the rest come from the last round
+TIMINGS = {"throughput_rps": max, "p50_ms": min, "p95_ms": min, "p99_ms": min, "max_ms": min,
+           "cpu_ms_per_request": min}
+# metric -> (higher is better, smallest change that counts)
+METRICS = {
+    "throughput_rps": (True, 1.0),
+    "p50_ms": (False, 0.2),
+    "p95_ms": (False, 0.2),
+    "p99_ms": (False, 0.5),
+    "cpu_ms_per_request": (False, 0.05),
+    "peak_rss_mb": (False, 2.0),
+    "write_bytes_per_request": (False, 256),
+    "write_chars_per_request": (False, 256),
+    "read_chars_per_request": (False, 256),
+}
+
+
+class _Discard:
+    """stdout for the apps' prints, without a write call each (which would
+    count as I/O)"""
+
+    def write(self, text):
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+def _proc_io():
+    try:
+        with open("/proc/self/io") as f:
+            fields = dict(line.split(": ") for line in f.read().splitlines())
+    except OSError:
+        return None
+    return {"read_bytes": int(fields["read_bytes"]), "write_bytes": int(fields["write_bytes"]),
+            "read_chars": int(fields["rchar"]), "write_chars": int(fields["wchar"])}
+
+
+def _rss_mb():
+    """(current, peak) resident set size in MiB; current is None off Linux"""
+    try:
+        with open("/proc/self/status") as f:
+            fields = dict(line.split(":", 1) for line in f.read().splitlines() if ":" in line)
+        return int(fields["VmRSS"].split()[0]) / 1024, int(fields["VmHWM"].split()[0]) / 1024
+    except (OSError, KeyError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return None, peak / (2**20 if sys.platform == "darwin" else 1024)
+
+
+def _percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))] * 1000
+
+
+def _user_turns(workload, user):
+    field = workload.get("session_field")
+    turns = workload["turns"]
+    if field:
+        turns = [{**turn, field: f"loadtest-user-{user}"} for turn in turns]
+    # Each user starts somewhere else in the conversation
+    return turns[user % len(turns):] + turns[:user % len(turns)]
+
+
+def run_level(app, workload, users, requests):
+    """One concurrency level against an already loaded app"""
+    method, path = workload["method"], workload["path"]
+    per_user = max(1, requests // users)
+    latencies, errors = [], []
+    before = {}
+
+    def mark_start():
+        # Run by the last user to finish its setup, before any is let go
+        before.update(io=_proc_io(), cpu=os.times(), start=time.perf_counter())
+    ready = threading.Barrier(users, action=mark_start)
+
+    def user(n):
+        client = app.test_client()
+        turns = _user_turns(workload, n)
+        try:
+            for setup_method, setup_path, body in workload["setup"]:
+                client.open(setup_path, method=setup_method, json=body)
+        finally:
+            ready.wait()
+        for i in range(per_user):
+            body = turns[i % len(turns)]
+            began = time.perf_counter()
+            try:
+                response = client.open(path, method=method, json=body)
+                if response.status_code >= 400:
+                    errors.append(f"{response.status_code} for {body}")
+            except Exception as e:
+                errors.append(repr(e))
+            latencies.append(time.perf_counter() - began)
+
+    threads = [threading.Thread(target=user, args=(n,)) for n in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - before["start"]
+    io_before, cpu_before = before["io"], before["cpu"]
+    io_after, cpu_after = _proc_io(), os.times()
+    rss, peak_rss = _rss_mb()
+
+    count = len(latencies)
+    latencies.sort()
+    cpu = (cpu_after.user - cpu_before.user) + (cpu_after.system - cpu_before.system)
+    result = {
+        "concurrency": users,
+        "requests": count,
+        "errors": len(errors),
+        "error_sample": errors[:3],
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(count / elapsed, 1),
+        "p50_ms": round(_percentile(latencies, 0.50), 3),
+        "p95_ms": round(_percentile(latencies, 0.95), 3),
+        "p99_ms": round(_percentile(latencies, 0.99), 3),
+        "max_ms": round(latencies[-1] * 1000, 3),
+        "cpu_ms_per_request": round(cpu / count * 1000, 4),
+        "rss_mb": round(rss, 1) if rss is not None else None,
+        "peak_rss_mb": round(peak_rss, 1),
+    }
+    if io_before is not None:
+        for field in io_before:
+            result[field] = io_after[field] - io_before[field]
+            result[f"{field}_per_request"] = round(result[field] / count, 1)
+    return result
+
+
+def best_of(rounds):
+    """One result from several rounds of a level"""
+    result = dict(rounds[-1])
+    result["spread"] = {}
+    for metric, best in TIMINGS.items():
+        values = [row[metric] for row in rounds]
+        result[metric] = best(values)
+        # How far apart the rounds were, relative to the best of them
+        result["spread"][metric] = round((max(values) - min(values)) / result[metric], 3) if result[metric] else 0
+    result["errors"] = sum(row["errors"] for row in rounds)
+    result["error_sample"] = [error for row in rounds for error in row["error_sample"]][:3]
+    return result
+
+
+def run_agent(agent, levels, requests, rounds, data_dir, llm_url):
+    """Load one agent's app in this (fresh) process and run every level"""
+    os.makedirs(data_dir, exist_ok=True)
+    os.environ.update(
+        DOCSTORE_DIR=os.path.join(data_dir, "store"), SESSION_DIR=os.path.join(data_dir, "sessions"),
+        SNAPSHOT_DIR=os.path.join(data_dir, "snapshots"), ARCHIVE_DIR=os.path.join(data_dir, "archive"),
+        ORDER_LEDGER=os.path.join(data_dir, "orders.jsonl"), CART_DB=os.path.join(data_dir, "carts.sqlite3"),
+        IMAGE_CACHE_DIR=os.path.join(data_dir, "images"), GROQ_API_URL=llm_url, GROQ_API_KEY="loadtest",
+        LLM_RATE_LIMIT="1000000", LLM_RATE_BURST="1000000", LLM_MAX_CONCURRENCY=str(max(levels)))
+    sys.stdout = _Discard()
+    random.seed(0)
+    sys.path.insert(0, os.path.join(ROOT, f"voice-agent-{agent}"))
+    app = importlib.import_module("app").app
+    workload = WORKLOADS[agent]
+    # Warm up (imports, caches, first files) with one pass of the conversation
+    run_level(app, workload, 1, len(workload["turns"]))
+    requests = requests or workload["requests"]
+    results = {users: [] for users in levels}
+    for _ in range(rounds):
+        for users in levels:
+            results[users].append(run_level(app, workload, users, requests))
+    return [best_of(results[users]) for users in levels]
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(agents, levels, requests, rounds, llm_latency, out):
+    sys.path.insert(0, os.path.join(ROOT, "voice-agent-day8"))
+    from mock_llm_server import MockLLMServer
+
+    report = {
+        "started_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(),
+                    "cpus": os.cpu_count()},
+        "config": {"levels": list(levels), "requests": requests, "rounds": rounds, "llm_latency": llm_latency},
+        "results": [],
+    }
+    spawn = multiprocessing.get_context("spawn")
+    with MockLLMServer(base_latency=llm_latency, latency_per_kb=0) as llm, tempfile.TemporaryDirectory() as tmp:
+        for agent in agents:
+            workload = WORKLOADS[agent]
+            endpoint = f"{workload['method']} {workload['path']}"
+            print(f"{agent} {endpoint}")
+            with concurrent.futures.ProcessPoolExecutor(1, mp_context=spawn) as pool:
+                rows = pool.submit(run_agent, agent, levels, requests, rounds, os.path.join(tmp, agent), llm.url).result()
+            for row in rows:
+                report["results"].append({"agent": agent, "endpoint": endpoint, **row})
+                print(f"  c={row['concurrency']:<3d} {row['throughput_rps']:9,.1f} req/s  p50 {row['p50_ms']:8.2f}  "
+                      f"p95 {row['p95_ms']:8.2f}  p99 {row['p99_ms']:8.2f} ms  "
+                      f"cpu {row['cpu_ms_per_request']:6.2f} ms/req  rss {row['peak_rss_mb']:6.1f} MiB  "
+                      f"write {row.get('write_chars_per_request', 0):8,.0f} B/req"
+                      + (f"  {row['errors']} FAILED, e.g. {row['error_sample'][0]}" if row["errors"] else ""))
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"wrote {out}")
+    return 1 if any(row["errors"] for row in report["results"]) else 0
+
+
+def compare(base_file, new_file, threshold):
+    with open(base_file) as f:
+        base = json.load(f)
+    with open(new_file) as f:
+        new = json.load(f)
+    print(f"{base.get('commit')} ({base['started_at']}) -> {new.get('commit')} ({new['started_at']})")
+    for section in ("config", "machine"):
+        if base[section] != new[section]:
+            print(f"  warning: different {section}: {base[section]} vs {new[section]}")
+
+    before = {(row["agent"], row["concurrency"]): row for row in base["results"]}
+    regressions = 0
+    for row in new["results"]:
+        old = before.get((row["agent"], row["concurrency"]))
+        if old is None:
+            continue
+        notes = []
+        for metric, (higher_is_better, noise) in METRICS.items():
+            if old.get(metric) is None or row.get(metric) is None:
+                continue
+            change = row[metric] - old[metric]
+            worse = -change if higher_is_better else change
+            if abs(change) <= noise or not old[metric]:
+                continue
+            percent = abs(change) / old[metric] * 100
+            spread = max(old.get("spread", {}).get(metric, 0), row.get("spread", {}).get(metric, 0)) * 100
+            if percent <= max(threshold, spread):
+                continue
+            if worse > 0:
+                regressions += 1
+            notes.append(f"{'REGRESSED' if worse > 0 else 'improved '} {metric:24s} "
+                         f"{old[metric]:12,.2f} -> {row[metric]:12,.2f} ({change / old[metric] * 100:+.0f}%)")
+        status = "regressed" if any(note.startswith("REGRESSED") for note in notes) else "ok"
+        print(f"{row['agent']:6s} {row['endpoint']:22s} c={row['concurrency']:<3d} "
+              f"{old['throughput_rps']:9,.1f} -> {row['throughput_rps']:9,.1f} req/s  "
+              f"p99 {old['p99_ms']:7.2f} -> {row['p99_ms']:7.2f} ms  {status}")
+        for note in notes:
+            print(f"    {note}")
+    print(f"{regressions} regression(s) beyond {threshold:g}%")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="load test the agents and write a result file")
+    run_parser.add_argument("--agents", default=",".join(WORKLOADS), help="comma-separated (default: all)")
+    run_parser.add_argument("--levels", default=",".join(map(str, LEVELS)), help="concurrency levels")
+    run_parser.add_argument("--requests", type=int, help="timed requests per level (default: per workload)")
+    run_parser.add_argument("--rounds", type=int, default=ROUNDS, help="runs of each level (default: 3)")
+    run_parser.add_argument("--llm-latency", type=float, default=LLM_LATENCY, help="mock LLM seconds per call")
+    run_parser.add_argument("--out", help="result file (default: results/<time>.json)")
+    compare_parser = commands.add_parser("compare", help="compare two result files")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=THRESHOLD, help="percent (default: 10)")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        return compare(args.base, args.new, args.threshold)
+    agents = args.agents.split(",")
+    unknown = [agent for agent in agents if agent not in WORKLOADS]
+    if unknown:
+        parser.error(f"no workload for {', '.join(unknown)}")
+    out = args.out or os.path.join(HERE, "results", time.strftime("%Y%m%d-%H%M%S") + ".json")
+    return run(agents, [int(level) for level in args.levels.split(",")], args.requests, args.rounds,
+               args.llm_latency, out)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""Synthetic conversations for loadtest.py, one per agent.
+
+Each workload drives one endpoint. Every virtual user first sends its
+`setup` requests (untimed; e.g. starting a day8 game), then walks the
+`turns` in a loop, starting at its own offset so that at any moment users
+are at different points of the conversation. A turn is the JSON body to
+send (None for a GET). With `session_field`, each user's turns also carry
+its own session id in that field. `requests` is how many timed requests
+make up one concurrency level, split evenly between the users.
+
+The scripts are fixed, so two runs send the same requests in the same
+order per user; only the interleaving between users varies.
+"""
+
+WORKLOADS = {
+    "day4": {
+        "method": "POST",
+        "path": "/api/respond",
+        "setup": [],
+        "turns": [
+            {"mode": "quiz", "concept_id": "variables",
+             "user_text": "a variable stores a value like a number or text so you can reuse it later"},
+            {"mode": "teach_back", "concept_id": "loops",
+             "user_text": "loops repeat an action, a for loop runs a known number of times and a while loop "
+                          "runs until a condition changes"},
+            {"mode": "quiz", "concept_id": "functions", "user_text": "i'm not sure, something about code"},
+            {"mode": "teach_back", "concept_id": "functions",
+             "user_text": "functions are named blocks of code that do one task so programs are modular and "
+                          "reusable and easier to test"},
+            {"mode": "quiz", "concept_id": "loops", "user_text": "they repeat things"},
+            {"mode": "teach_back", "concept_id": "variables", "user_text": "labeled boxes"},
+        ],
+        "requests": 3000,
+    },
+    "day5": {
+        "method": "POST",
+        "path": "/api/query",
+        "setup": [],
+        "turns": [
+            {"query": "Hi, what does Razorpay do?"},
+            {"query": "Which features do you have for subscriptions"},
+            {"query": "How is the pricing structured"},
+            {"query": "Is it a fit for early-stage startups, who are your customers"},
+            {"query": "Can I get a free trial first"},
+            {"query": "How long does the integration take"},
+            {"query": "Is support available at night"},
+            {"query": "Great, I think that's all for now"},
+        ],
+        "requests": 3000,
+    },
+    "day6": {
+        "method": "GET",
+        "path": "/api/cases",
+        "setup": [],
+        "turns": [None],
+        "requests": 3000,
+    },
+    "day7": {
+        "method": "POST",
+        "path": "/api/message",
+        "setup": [],
+        "turns": [
+            {"message": "Hello"},
+            {"message": "What can I order?"},
+            {"message": "Add 2 fresh milk"},
+            {"message": "Get me whole wheat bread"},
+            {"message": "I want to make pasta"},
+            {"message": "What's in my cart?"},
+            {"message": "Remove the chips"},
+            {"message": "Place order"},
+            {"message": "Where is my order?"},
+            {"message": "Thanks"},
+        ],
+        "requests": 2000,
+    },
+    "day8": {
+        "method": "POST",
+        "path": "/send_message",
+        "setup": [("POST", "/start", None)],
+        "turns": [
+            {"message": "I take the path deeper into the forest"},
+            {"message": "I hold my torch high and look for tracks"},
+            {"message": "I follow the melody towards its source"},
+            {"message": "I call out to whoever is singing"},
+            {"message": "I draw my sword and step into the clearing"},
+            {"message": "I ask the spirit what happened to the villagers"},
+        ],
+        "requests": 400,
+    },
+    "day9": {
+        "method": "POST",
+        "path": "/api/chat",
+        "setup": [],
+        "session_field": "session_id",
+        "turns": [
+            {"message": "Show me mugs"},
+            {"message": "Show me black hoodies under 2000"},
+            {"message": "I want the ceramic coffee mug"},
+            {"message": "What's in my cart?"},
+            {"message": "Checkout"},
+            {"message": "What did I buy in my last order"},
+            {"message": "Show my orders"},
+            {"message": "Hello"},
+        ],
+        "requests": 3000,
+    },
+}
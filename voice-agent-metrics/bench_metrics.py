@@ -0,0 +1,149 @@
+"""What instrumentation costs a request.
+
+Times, per call:
+  - what instrument() adds to a request: the WSGI wrapper around a
+    stand-in app that does nothing, minus calling that app directly
+  - a phase() timer, a turn() count and a bare histogram observe()
+  - whole requests through the Flask test client with and without
+    instrument(), for context (that difference is noisy)
+and renders /metrics with a few hundred series. Checks the per-request
+cost stays under BUDGET_US, counts and in-flight come out right (also with several
+threads recording at once) and the output parses as Prometheus text.
+Exits non-zero if a check fails.
+
+Run with: python bench_metrics.py
+"""
+import re
+import sys
+import threading
+import time
+
+from flask import Flask
+
+import metrics
+from metrics import REGISTRY, instrument
+
+BUDGET_US = 5.0
+CALLS = 200_000
+REQUESTS = 20_000
+ROUNDS = 5
+THREADS = 8
+SAMPLE = re.compile(r'^[a-z_]+(\{([a-z_]+="([^"\\]|\\.)*",?)*\})? -?[0-9.e+-]+$|^# (HELP|TYPE) ')
+
+
+def per_call_us(fn, calls=CALLS):
+    """Best of ROUNDS, in microseconds per call"""
+    best = float("inf")
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        best = min(best, (time.perf_counter() - start) / calls * 1e6)
+    return best
+
+
+def make_app(instrumented):
+    app = Flask(f"bench_{instrumented}")
+    app_metrics = instrument(app, "bench" if instrumented else "unused") if instrumented else None
+
+    @app.route("/ping/<name>")
+    def ping(name):
+        return "pong"
+
+    return app, app_metrics
+
+
+def main():
+    failures = []
+
+    def check(ok, message):
+        if not ok:
+            failures.append(message)
+
+    app, app_metrics = make_app(True)
+    # A stand-in Flask app that answers without doing anything, and the
+    # environ of a request it matched
+    with app.test_request_context("/ping/x") as ctx:
+        environ = dict(ctx.request.environ)
+    body = [b"pong"]
+
+    def bare_app(environ, start_response):
+        start_response("200 OK", [])
+        return body
+
+    def start_response(status, headers, exc_info=None):
+        pass
+    timed = metrics._TimedApp(bare_app, app_metrics)
+    bare_us = per_call_us(lambda: bare_app(environ, start_response))
+    timed_us = per_call_us(lambda: timed(environ, start_response))
+    request_us = timed_us - bare_us
+    check(request_us < BUDGET_US, f"instrumentation adds {request_us:.2f} us a request (budget {BUDGET_US} us)")
+
+    def phase():
+        with app_metrics.phase("disk"):
+            pass
+    phase_us = per_call_us(phase)
+    turn_us = per_call_us(lambda: app_metrics.turn("session 1"))
+    histogram = metrics.PHASE_SECONDS.labels("bench", "observe")
+    observe_us = per_call_us(lambda: histogram.observe(0.003))
+    print(f"per request                           {request_us:6.2f} us  (budget {BUDGET_US:.0f} us)")
+    print(f"phase() timer                         {phase_us:6.2f} us")
+    print(f"turn()                                {turn_us:6.2f} us")
+    print(f"histogram observe()                   {observe_us:6.2f} us")
+
+    plain, _ = make_app(False)
+    clients = {"plain": plain.test_client(), "instrumented": app.test_client()}
+    best = {name: float("inf") for name in clients}
+    for _ in range(ROUNDS):
+        for name, client in clients.items():
+            began = time.perf_counter()
+            for n in range(REQUESTS // ROUNDS):
+                client.get(f"/ping/{n % 50}")
+            best[name] = min(best[name], (time.perf_counter() - began) / (REQUESTS // ROUNDS) * 1e6)
+    print(f"test client request, plain            {best['plain']:6.1f} us")
+    print(f"test client request, instrumented     {best['instrumented']:6.1f} us "
+          f"({best['instrumented'] - best['plain']:+.1f} us)")
+
+    route = metrics.REQUEST_SECONDS.labels("bench", "/ping/<name>", "GET", "200")
+    before = route.counts[:]
+    client = clients["instrumented"]
+    errors = []
+
+    def hammer():
+        try:
+            for n in range(2000):
+                client.get(f"/ping/{n}")
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=hammer) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    check(not errors, f"errors under threads: {errors[:1]}")
+    check(sum(route.counts) - sum(before) == THREADS * 2000, "requests lost under threads")
+    check(app_metrics.in_flight.value == 0, f"{app_metrics.in_flight.value} requests still in flight")
+
+    for n in range(metrics.MAX_SESSIONS + 50):
+        app_metrics.turn(f"visitor {n}")
+    check(metrics.SESSION_TURNS.get("bench", "visitor 0") == 0, "oldest session not dropped")
+    check(metrics.SESSION_TURNS.get("bench", f"visitor {metrics.MAX_SESSIONS + 49}") == 1, "newest session missing")
+
+    response = client.get("/metrics")
+    text = response.get_data(as_text=True)
+    render_us = per_call_us(REGISTRY.render, calls=20)
+    lines = text.splitlines()
+    print(f"/metrics                              {render_us / 1000:6.2f} ms for {len(lines):,} lines")
+    check(response.content_type.startswith("text/plain; version=0.0.4"), "wrong content type")
+    bad = [line for line in lines if not SAMPLE.match(line)]
+    check(not bad, f"unparseable lines, e.g. {bad[:2]}")
+    check(f'voice_agent_request_seconds_count{{app="bench",route="/ping/<name>",method="GET",status="200"}} '
+          f'{sum(route.counts)}' in text, "request count missing from /metrics")
+
+    for failure in failures:
+        print(f"  FAIL {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,318 @@
+"""Request and phase timing for the voice agents, as Prometheus text.
+
+instrument(app, "day8") hooks a Flask app so that every request is timed,
+until its response is ready (for a streamed one, until it starts), into
+voice_agent_request_seconds{app, route, method, status} (route is the URL
+rule, e.g. /sessions/<session_id>, so there are only as many series as
+routes) and counted in voice_agent_requests_in_flight{app} while it runs,
+and adds a /metrics route. It returns the app's AppMetrics, for timing the
+slow phases inside a request:
+
+    with metrics.phase("llm"):
+        api_response = chat_completion(messages)
+
+into voice_agent_phase_seconds{app, phase} ("intent", "llm", "tts",
+"disk"), and for counting turns: voice_agent_turns_total{app}, plus
+voice_agent_session_turns{app, session} for the MAX_SESSIONS sessions most
+recently active (older ones are dropped, so a long-running server doesn't
+grow a series per visitor).
+
+Every app in a process shares REGISTRY, so under the shared host each
+app's /metrics, and the host's own, lists all of them.
+
+Recording is a bisect and a few additions under a lock, with no
+dependencies; bench_metrics.py holds what it adds to a request to under
+5 us.
+"""
+import os
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from time import perf_counter
+
+from flask import Response
+
+# Where a request's matched URL rule is kept in its WSGI environ
+_RULE = "metrics.url_rule"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Upper bounds in seconds, from a cache hit to a slow LLM reply
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+MAX_SESSIONS = int(os.getenv("METRICS_MAX_SESSIONS", "1000"))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Counter:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self):
+        """(name suffix, extra label, value) for each line"""
+        yield "", "", self.value
+
+
+class _Gauge(_Counter):
+    __slots__ = ()
+
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "sum", "_lock")
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        # The last count is for values above every bucket (+Inf)
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def samples(self):
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            yield "_bucket", f'le="{_number(bound)}"', cumulative
+        cumulative += counts[-1]
+        yield "_bucket", 'le="+Inf"', cumulative
+        yield "_sum", "", total
+        yield "_count", "", cumulative
+
+
+class Family:
+    """A metric with labels; labels(*values) gets (or makes) one series"""
+
+    def __init__(self, kind, name, help, labelnames, make):
+        self.kind = kind
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._make = make
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._make())
+        return child
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in list(self._children.items()):
+            for suffix, extra, value in child.samples():
+                lines.append(f"{self.name}{suffix}{_labels(self.labelnames, values, extra)} {_number(value)}")
+        return lines
+
+
+class SessionTurns:
+    """Turns per session, for the `limit` most recently active sessions"""
+
+    kind = "gauge"
+
+    def __init__(self, name, help, limit=MAX_SESSIONS):
+        self.name = name
+        self.help = help
+        self.limit = limit
+        self._turns = OrderedDict()
+        self._lock = threading.Lock()
+
+    def inc(self, app, session):
+        key = (app, session)
+        with self._lock:
+            self._turns[key] = self._turns.pop(key, 0) + 1
+            if len(self._turns) > self.limit:
+                self._turns.popitem(last=False)
+
+    def get(self, app, session):
+        return self._turns.get((app, session), 0)
+
+    def render(self):
+        with self._lock:
+            turns = list(self._turns.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{self.name}{_labels(('app', 'session'), key)} {count}" for key, count in turns)
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self.register(Family("counter", name, help, labelnames, _Counter))
+
+    def gauge(self, name, help, labelnames=()):
+        return self.register(Family("gauge", name, help, labelnames, _Gauge))
+
+    def histogram(self, name, help, labelnames=(), buckets=BUCKETS):
+        return self.register(Family("histogram", name, help, labelnames, lambda: _Histogram(buckets)))
+
+    def render(self):
+        """Everything in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+REQUEST_SECONDS = REGISTRY.histogram("voice_agent_request_seconds", "Time to handle a request",
+                                     ("app", "route", "method", "status"))
+IN_FLIGHT = REGISTRY.gauge("voice_agent_requests_in_flight", "Requests being handled", ("app",))
+PHASE_SECONDS = REGISTRY.histogram("voice_agent_phase_seconds", "Time spent waiting on the LLM, TTS or disk",
+                                   ("app", "phase"))
+TURNS = REGISTRY.counter("voice_agent_turns_total", "Conversation turns handled", ("app",))
+SESSION_TURNS = REGISTRY.register(SessionTurns("voice_agent_session_turns",
+                                               "Turns in each recently active session"))
+
+
+# Called as listener(phase, start, end) (perf_counter seconds) after each
+# phase() timer, by whoever else wants the phases (voice-agent-tracing)
+PHASE_LISTENERS = []
+
+
+class _Timer:
+    __slots__ = ("histogram", "phase", "start")
+
+    def __init__(self, histogram, phase):
+        self.histogram = histogram
+        self.phase = phase
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = perf_counter()
+        self.histogram.observe(end - self.start)
+        for listener in PHASE_LISTENERS:
+            listener(self.phase, self.start, end)
+
+
+class AppMetrics:
+    """One app's series; get it from instrument()"""
+
+    def __init__(self, name):
+        self.name = name
+        self.in_flight = IN_FLIGHT.labels(name)
+        self.turns = TURNS.labels(name)
+        self._phases = {}
+        self._routes = {}
+
+    def phase(self, phase):
+        """Context manager timing one phase of a request"""
+        histogram = self._phases.get(phase)
+        if histogram is None:
+            histogram = self._phases[phase] = PHASE_SECONDS.labels(self.name, phase)
+        return _Timer(histogram, phase)
+
+    def request(self, route, method, status, seconds):
+        key = (route, method, status)
+        histogram = self._routes.get(key)
+        if histogram is None:
+            histogram = self._routes[key] = REQUEST_SECONDS.labels(self.name, route, method, status)
+        histogram.observe(seconds)
+
+    def turn(self, session):
+        self.turns.inc()
+        SESSION_TURNS.inc(self.name, session)
+
+
+def metrics_response():
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+
+def _recording_rule(request_class):
+    """request_class, keeping the URL rule Flask matches in the environ,
+    where _TimedApp still finds it after Flask is done with the request"""
+
+    class Request(request_class):
+        @property
+        def url_rule(self):
+            return self.environ.get(_RULE)
+
+        @url_rule.setter
+        def url_rule(self, rule):
+            self.environ[_RULE] = rule
+
+    return Request
+
+
+class _TimedApp:
+    """WSGI wrapper around a Flask app's wsgi_app that records each request.
+    (Flask's before/after_request hooks would cost several microseconds
+    a request just to dispatch.)"""
+
+    def __init__(self, wsgi_app, metrics):
+        self.wsgi_app = wsgi_app
+        self.metrics = metrics
+
+    def __call__(self, environ, start_response):
+        start = perf_counter()
+        in_flight = self.metrics.in_flight
+        in_flight.inc()
+        status = "500"
+
+        def start_response_recorded(status_line, headers, exc_info=None):
+            nonlocal status
+            status = status_line[:3]
+            return start_response(status_line, headers, exc_info)
+
+        try:
+            return self.wsgi_app(environ, start_response_recorded)
+        finally:
+            in_flight.dec()
+            rule = environ.get(_RULE)
+            self.metrics.request(rule.rule if rule is not None else "<unmatched>", environ["REQUEST_METHOD"],
+                                 status, perf_counter() - start)
+
+
+def instrument(app, name):
+    """Time every request to a Flask app and add /metrics; returns the
+    app's AppMetrics"""
+    metrics = AppMetrics(name)
+    app.request_class = _recording_rule(app.request_class)
+    app.wsgi_app = _TimedApp(app.wsgi_app, metrics)
+    app.add_url_rule("/metrics", "metrics", metrics_response)
+    app.extensions["metrics"] = metrics
+    return metrics
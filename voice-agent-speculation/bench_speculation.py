@@ -0,0 +1,191 @@
+"""How often speculation has the answer ready, what it saves, and whether
+it is safe.
+
+Replays the load test's conversations (voice-agent-loadtest/workloads.py)
+for day4, day5 and day7 as a browser would: every turn's transcript
+arrives as growing interim transcripts (a word at a time) sent to
+api/speculate, then the final one goes to the endpoint. Run twice:
+  - final = the last interim transcript, recased
+  - every REVISED_EVERY-th turn the recogniser changes the last word in
+    the final transcript, so nothing speculated matches
+and reports per agent the hit rate, the handler time saved on hits (and
+wasted on unused speculations), and the final request's time with and
+without speculation (the same conversation with no utterance ids).
+
+Checks:
+  - a hit answers exactly what the endpoint answers without speculation
+  - day7: speculating "add ..." or "place order" changes nothing; the
+    final commits it once; a speculation whose cart or orders changed in
+    the meantime is dropped (stale) and worked out again; a revised
+    final commits only what it says
+Exits non-zero if a check fails.
+
+Run with: python bench_speculation.py
+"""
+import importlib.util
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "voice-agent-loadtest"))
+from workloads import WORKLOADS
+
+# agent -> (endpoint, transcript field)
+ENDPOINTS = {
+    "day4": ("/api/respond", "user_text"),
+    "day5": ("/api/query", "query"),
+    "day7": ("/api/message", "message"),
+}
+PASSES = 5
+REVISED_EVERY = 4
+
+
+def load(agent):
+    directory = os.path.join(ROOT, f"voice-agent-{agent}")
+    spec = importlib.util.spec_from_file_location(f"{agent}_app", os.path.join(directory, "app.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def interims(text):
+    words = text.split()
+    return [" ".join(words[:n]) for n in range(1, len(words) + 1)]
+
+
+def revise(text):
+    words = text.split()
+    return " ".join(words[:-1] + ["um"])
+
+
+def post(client, path, body):
+    start = time.perf_counter()
+    response = client.post(path, json=body)
+    return response, time.perf_counter() - start
+
+
+def converse(client, path, field, turns, speculate, revised_every=0):
+    """Final request times, and (response, what it says without speculation)
+    pairs for the hits' comparisons"""
+    times = []
+    for n, turn in enumerate(turns):
+        text = turn[field]
+        final = dict(turn, **{field: text[:1].upper() + text[1:]})
+        if revised_every and n % revised_every == revised_every - 1:
+            final[field] = revise(text)
+        if speculate:
+            utterance = uuid.uuid4().hex
+            for partial in interims(text):
+                client.post("/api/speculate", json=dict(turn, **{field: partial, "utterance_id": utterance}))
+            final["utterance_id"] = utterance
+        _, seconds = post(client, path, final)
+        times.append(seconds)
+    return times
+
+
+def median_ms(times):
+    return sorted(times)[len(times) // 2] * 1000
+
+
+def main():
+    failures = []
+
+    def check(ok, message):
+        if not ok:
+            failures.append(message)
+
+    data_dir = tempfile.mkdtemp(prefix="bench_speculation_")
+    os.environ["DOCSTORE_DIR"] = os.path.join(data_dir, "store")
+    sys.stdout, real_stdout = open(os.devnull, "w"), sys.stdout
+    try:
+        apps = {agent: load(agent) for agent in ENDPOINTS}
+    finally:
+        sys.stdout = real_stdout
+
+    print(f"{'':6} {'scenario':10} {'hit rate':>8} {'saved':>9} {'wasted':>9} {'final, plain':>13} {'speculated':>11}")
+    for agent, (path, field) in ENDPOINTS.items():
+        module = apps[agent]
+        speculator = module.speculator
+        client = module.app.test_client()
+        turns = WORKLOADS[agent]["turns"]
+        for scenario, revised_every in (("as spoken", 0), ("revised", REVISED_EVERY)):
+            before = speculator.stats()
+            plain, speculated = [], []
+            for _ in range(PASSES):
+                plain += converse(client, path, field, turns, False)
+                speculated += converse(client, path, field, turns, True, revised_every)
+            after = speculator.stats()
+            hits = after["hits"] - before["hits"]
+            finals = hits + after["misses"] - before["misses"] + after["stale"] - before["stale"]
+            saved = (after["saved_ms"] - before["saved_ms"]) / (hits or 1)
+            wasted = (after["wasted_ms"] - before["wasted_ms"]) / finals
+            print(f"{agent:6} {scenario:10} {hits / finals:8.0%} {saved:6.3f} ms {wasted:6.3f} ms "
+                  f"{median_ms(plain):10.3f} ms {median_ms(speculated):8.3f} ms")
+            if agent != "day7" and not revised_every:
+                check(hits == finals, f"{agent}: {finals - hits} of {finals} final transcripts missed")
+
+        # A hit answers what the endpoint would have
+        if agent != "day7":
+            for turn in turns:
+                utterance = uuid.uuid4().hex
+                for partial in interims(turn[field]):
+                    client.post("/api/speculate", json=dict(turn, **{field: partial, "utterance_id": utterance}))
+                hits = speculator.stats()["hits"]
+                fast = client.post(path, json=dict(turn, utterance_id=utterance)).get_json()
+                check(speculator.stats()["hits"] == hits + 1, f"{agent}: {turn[field]!r} missed")
+                check(fast == client.post(path, json=turn).get_json(), f"{agent}: hit answered differently")
+
+    # day7: speculating changes nothing until the final transcript takes it
+    day7 = apps["day7"]
+    client = day7.app.test_client()
+    speculator = day7.speculator
+    random.seed(0)
+
+    def cart():
+        return client.get("/api/cart").get_json()
+
+    def quantity(name):
+        return sum(item["quantity"] for item in cart()["items"] if item["name"].lower() == name)
+
+    def speculate(text):
+        utterance = uuid.uuid4().hex
+        for partial in interims(text):
+            client.post("/api/speculate", json={"message": partial, "utterance_id": utterance})
+        return utterance
+
+    client.post("/api/message", json={"message": "place order"})
+    orders = len(day7.orders)
+    utterance = speculate("add 2 fresh milk")
+    check(cart()["items"] == [], "speculating an add changed the cart")
+    reply = client.post("/api/message", json={"message": "Add 2 fresh milk", "utterance_id": utterance}).get_json()
+    check(quantity("fresh milk") == 2 and reply["cart"] == cart(), f"add committed wrong: {cart()}")
+
+    utterance = speculate("place order")
+    check(len(day7.orders) == orders and quantity("fresh milk") == 2, "speculating an order placed it")
+    # The cart changes before the final transcript: the speculated order is stale
+    client.post("/api/message", json={"message": "get me whole wheat bread"})
+    stale = speculator.stats()["stale"]
+    reply = client.post("/api/message", json={"message": "place order", "utterance_id": utterance}).get_json()
+    check(speculator.stats()["stale"] == stale + 1, "changed cart did not make the speculation stale")
+    placed = day7.orders.find(limit=1, reverse=True)[0]
+    check(len(day7.orders) == orders + 1 and {item["name"].lower() for item in placed["items"]} >= {"fresh milk"}
+          and len(placed["items"]) == 2 and cart()["items"] == [] and reply["action"] == "order_placed",
+          f"stale order not redone right: {placed}")
+
+    # A revised final transcript commits only itself
+    utterance = speculate("add 3 fresh milk")
+    reply = client.post("/api/message", json={"message": "what's in my cart", "utterance_id": utterance}).get_json()
+    check(cart()["items"] == [] and reply["action"] is None, "a dropped speculation's add was committed")
+
+    for failure in failures:
+        print(f"  FAIL {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+// Browser side of voice-agent-speculation: sends interim transcripts to
+// api/speculate so the answer is ready when the final transcript is.
+//
+//   const utterance = voiceSpeculation.utterance(reply => ...)  // speech started
+//   utterance.interim({ query: interimText })   // each interim transcript
+//   fetch("api/query", { ..., body: JSON.stringify(utterance.final({ query: finalText })) })
+//
+// interim() only sends a body it hasn't sent already, one request at a
+// time (a newer transcript waits for the one in flight, older waiting ones
+// are skipped). The optional callback gets each speculative reply, e.g.
+// to start fetching its audio.
+(function () {
+  function newId() {
+    const bytes = new Uint8Array(8)
+    crypto.getRandomValues(bytes)
+    return Array.from(bytes, b => b.toString(16).padStart(2, "0")).join("")
+  }
+
+  function utterance(onReply = null) {
+    const id = newId()
+    let last = null
+    let inFlight = false
+    let waiting = null
+
+    function send(body) {
+      inFlight = true
+      fetch("api/speculate", {
+        method: "POST",
+        headers: { "content-type": "application/json" },
+        body: JSON.stringify({ ...body, utterance_id: id })
+      })
+        .then(res => (res.ok ? res.json() : null))
+        .then(reply => { if (reply && onReply) onReply(reply) })
+        .catch(() => {})
+        .finally(() => {
+          inFlight = false
+          if (waiting) {
+            const next = waiting
+            waiting = null
+            send(next)
+          }
+        })
+    }
+
+    return {
+      id,
+
+      interim(body) {
+        const key = JSON.stringify(body)
+        if (key === last) return
+        last = key
+        if (inFlight) waiting = body
+        else send(body)
+      },
+
+      final(body) {
+        waiting = null
+        return { ...body, utterance_id: id }
+      }
+    }
+  }
+
+  window.voiceSpeculation = { utterance }
+})()
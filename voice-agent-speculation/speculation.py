@@ -0,0 +1,189 @@
+"""Answers worked out while the user is still speaking.
+
+Browser speech recognition gives interim transcripts well before the final
+one, and the final one is usually the last interim one. The browser sends
+each new interim transcript (speculate.js does this, and is served by every
+app that speculates at speculate.js) to api/speculate, with the body the
+final request would have and an utterance_id, and the app works out its
+answer right away. When the final request comes in with the same
+utterance_id and the same transcript (by the handler's own normalisation),
+the answer is already there; otherwise it is worked out as usual, and the
+utterance's speculations are dropped.
+
+An answer that changes something (adding to a cart, placing an order) must
+not change it while speculating. compute(body) returns (response, commit):
+the response to send, and None or a function that makes the changes, called
+only when the final transcript takes the answer. With state(), an answer is
+also dropped if state() has changed since it was worked out (the cart it
+priced was changed by another request, say), so what is committed is what
+would have been done anyway. Final requests to a Speculator with state()
+are answered one at a time, so nothing commits between that check (or
+working the answer out afresh) and the commit.
+
+Each app's counts go to /metrics (voice_agent_speculations_total{app,
+outcome}: hit, miss, stale; voice_agent_speculation_saved_seconds_total and
+..._wasted_seconds_total: handler time skipped on hits, and spent on
+speculations never used) and, with the hit rate, to GET api/speculate.
+bench_speculation.py replays the load test's conversations as interim
+transcripts through day4, day5 and day7 and reports the same.
+"""
+import contextlib
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+from time import perf_counter
+
+from flask import jsonify, request, send_from_directory
+
+# Counts go into the metrics module's registry; it lives next to this folder
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "voice-agent-metrics"))
+import metrics
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+UTTERANCE_FIELD = "utterance_id"
+MAX_UTTERANCES = int(os.getenv("SPECULATION_MAX_UTTERANCES", "1000"))
+# Kept per utterance; the final transcript is nearly always one of the last few
+MAX_PER_UTTERANCE = 4
+
+SPECULATIONS = metrics.REGISTRY.counter("voice_agent_speculations_total",
+                                        "Final transcripts, by whether a speculative answer was used",
+                                        ("app", "outcome"))
+SAVED_SECONDS = metrics.REGISTRY.counter("voice_agent_speculation_saved_seconds_total",
+                                         "Handler time skipped by using speculative answers", ("app",))
+WASTED_SECONDS = metrics.REGISTRY.counter("voice_agent_speculation_wasted_seconds_total",
+                                          "Handler time spent on speculative answers never used", ("app",))
+
+
+def normalise(text):
+    """What every speculating handler does to a transcript first"""
+    return text.lower().strip()
+
+
+class _Speculation:
+    __slots__ = ("response", "commit", "state", "seconds")
+
+    def __init__(self, response, commit, state, seconds):
+        self.response = response
+        self.commit = commit
+        self.state = state
+        self.seconds = seconds
+
+
+class Speculator:
+    """Speculative answers for one endpoint, for the `limit` most recent
+    utterances"""
+
+    def __init__(self, name, compute, text_field, state=None, normalise=normalise, limit=MAX_UTTERANCES):
+        self.name = name
+        self.compute = compute
+        self.text_field = text_field
+        self.state = state
+        self.normalise = normalise
+        self.limit = limit
+        self._utterances = OrderedDict()
+        self._lock = threading.Lock()
+        # Held from checking state() to committing; only state() can go stale
+        self._answer_lock = threading.Lock() if state else contextlib.nullcontext()
+        self.outcomes = {outcome: SPECULATIONS.labels(name, outcome) for outcome in ("hit", "miss", "stale")}
+        self.saved = SAVED_SECONDS.labels(name)
+        self.wasted = WASTED_SECONDS.labels(name)
+
+    def _key(self, body):
+        fields = {field: value for field, value in body.items() if field != UTTERANCE_FIELD}
+        fields[self.text_field] = self.normalise(str(fields.get(self.text_field) or ""))
+        return json.dumps(fields, sort_keys=True)
+
+    def speculate(self, body):
+        """Work out the answer to body (an interim transcript's request) and
+        keep it for its utterance; returns the response"""
+        utterance = body.get(UTTERANCE_FIELD)
+        key = self._key(body)
+        with self._lock:
+            known = self._utterances.get(utterance, {}).get(key)
+        if known is not None:
+            return known.response
+        state = self.state() if self.state else None
+        start = perf_counter()
+        response, commit = self.compute(body)
+        speculation = _Speculation(response, commit, state, perf_counter() - start)
+        wasted = 0.0
+        with self._lock:
+            speculations = self._utterances.pop(utterance, None)
+            if speculations is None:
+                speculations = OrderedDict()
+                if len(self._utterances) >= self.limit:
+                    _, dropped = self._utterances.popitem(last=False)
+                    wasted += sum(old.seconds for old in dropped.values())
+            self._utterances[utterance] = speculations
+            speculations[key] = speculation
+            if len(speculations) > MAX_PER_UTTERANCE:
+                _, dropped = speculations.popitem(last=False)
+                wasted += dropped.seconds
+        if wasted:
+            self.wasted.inc(wasted)
+        return response
+
+    def take(self, body):
+        """(response, commit) worked out for body ahead of time, or None;
+        either way the utterance's other speculations are dropped. Call
+        commit, if there is one, before sending the response; answer() does
+        both under the lock that keeps state() from changing in between."""
+        utterance = body.get(UTTERANCE_FIELD)
+        if utterance is None:
+            return None
+        with self._lock:
+            speculations = self._utterances.pop(utterance, None) or {}
+        speculation = speculations.pop(self._key(body), None)
+        wasted = sum(old.seconds for old in speculations.values())
+        if speculation is None:
+            outcome = "miss"
+        elif self.state and self.state() != speculation.state:
+            outcome = "stale"
+            wasted += speculation.seconds
+            speculation = None
+        else:
+            outcome = "hit"
+            self.saved.inc(speculation.seconds)
+        self.outcomes[outcome].inc()
+        if wasted:
+            self.wasted.inc(wasted)
+        return None if speculation is None else (speculation.response, speculation.commit)
+
+    def answer(self, body):
+        """The response to a final request: the speculative one, committed,
+        if it is there and still good, else worked out and committed now"""
+        with self._answer_lock:
+            taken = self.take(body)
+            response, commit = taken if taken is not None else self.compute(body)
+            if commit is not None:
+                commit()
+        return response
+
+    def stats(self):
+        hits, misses, stale = (self.outcomes[outcome].value for outcome in ("hit", "miss", "stale"))
+        finals = hits + misses + stale
+        return {"hits": hits, "misses": misses, "stale": stale,
+                "hit_rate": round(hits / finals, 4) if finals else None,
+                "saved_ms": round(self.saved.value * 1000, 3), "wasted_ms": round(self.wasted.value * 1000, 3)}
+
+
+def speculate(app, name, compute, text_field, state=None, normalise=normalise):
+    """A Speculator for one of a Flask app's endpoints, with api/speculate
+    (POST an interim transcript's body, GET the counts) and speculate.js
+    added to the app; the endpoint answers with speculator.answer(body)"""
+    speculator = Speculator(name, compute, text_field, state, normalise)
+
+    def speculate_view():
+        if request.method == "GET":
+            return jsonify(speculator.stats())
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict) or not isinstance(body.get(UTTERANCE_FIELD), str) \
+                or not isinstance(body.get(text_field), str):
+            return jsonify({"error": f"expected {UTTERANCE_FIELD} and {text_field}"}), 400
+        return jsonify({"speculative": True, **speculator.speculate(body)})
+
+    app.add_url_rule("/api/speculate", "speculate", speculate_view, methods=["GET", "POST"])
+    app.add_url_rule("/speculate.js", "speculate_js", lambda: send_from_directory(HERE, "speculate.js"))
+    return speculator
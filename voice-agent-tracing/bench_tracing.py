@@ -0,0 +1,227 @@
+"""What tracing costs a request, and whether the traces come out right.
+
+Times, per call, what trace_turns() adds to a request over the app it
+wraps (a stand-in that does nothing): with sampling off (the default,
+checked against OFF_BUDGET_US), for a request with no X-Turn-ID with
+sampling on, and for a sampled turn's request. Then, through a small
+instrumented and traced Flask app:
+  - a sampled turn's request gets X-Turn-Sampled and a span, with its
+    intent phase, and the disk phase inside that, as children
+  - a streamed response's llm phase is caught while the body is sent
+  - browser spans posted to traces/spans line up before the request
+  - unsampled turns and sampling off leave nothing behind
+  - the breakdown counts nested phases once, and the exports are valid
+  - sampling is the same decision every time, at about the set rate
+  - only the newest MAX_TURNS turns are kept
+Exits non-zero if a check fails.
+
+Run with: python bench_tracing.py
+"""
+import json
+import sys
+import time
+
+from flask import Flask, Response, stream_with_context
+
+import tracing
+from metrics import instrument
+from tracing import TURNS, trace_turns
+
+OFF_BUDGET_US = 0.5
+CALLS = 200_000
+ROUNDS = 5
+
+
+def per_call_us(fn, calls=CALLS):
+    """Best of ROUNDS, in microseconds per call"""
+    best = float("inf")
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        best = min(best, (time.perf_counter() - start) / calls * 1e6)
+    return best
+
+
+def sampled_id(prefix="turn"):
+    """A turn id that is sampled at the current rate"""
+    n = 0
+    while not tracing.sampled(f"{prefix}-{n}"):
+        n += 1
+    return f"{prefix}-{n}"
+
+
+def make_app():
+    app = Flask("bench_tracing")
+    app_metrics = instrument(app, "bench")
+    trace_turns(app, "bench")
+
+    @app.route("/respond", methods=["POST"])
+    def respond():
+        with app_metrics.phase("intent"):
+            time.sleep(0.004)
+            with app_metrics.phase("disk"):
+                time.sleep(0.002)
+        return {"ok": True}
+
+    @app.route("/stream", methods=["POST"])
+    def stream():
+        def generate():
+            yield "event: start\n\n"
+            with app_metrics.phase("llm"):
+                time.sleep(0.005)
+                yield "event: token\n\n"
+            yield "event: done\n\n"
+        return Response(stream_with_context(generate()), mimetype="text/event-stream")
+
+    return app
+
+
+def main():
+    failures = []
+
+    def check(ok, message):
+        if not ok:
+            failures.append(message)
+
+    body = [b"{}"]
+
+    def bare_app(environ, start_response):
+        start_response("200 OK", [])
+        return body
+
+    def start_response(status, headers, exc_info=None):
+        pass
+
+    def drain(result):
+        for _ in result:
+            pass
+        if hasattr(result, "close"):
+            result.close()
+
+    traced = tracing._TracedApp(bare_app, "bench")
+    plain = {"REQUEST_METHOD": "POST", "PATH_INFO": "/respond"}
+    with_turn = dict(plain, HTTP_X_TURN_ID="bench-turn")
+    tracing.set_sample_rate(0)
+    bare_us = per_call_us(lambda: drain(bare_app(with_turn, start_response)))
+    off_us = per_call_us(lambda: drain(traced(with_turn, start_response))) - bare_us
+    check(off_us < OFF_BUDGET_US, f"sampling off adds {off_us:.2f} us a request (budget {OFF_BUDGET_US} us)")
+    tracing.set_sample_rate(1.0)
+    no_header_us = per_call_us(lambda: drain(traced(plain, start_response))) - bare_us
+    sampled_us = per_call_us(lambda: drain(traced(with_turn, start_response)), calls=20_000) - bare_us
+    TURNS.clear()
+    print(f"per request, sampling off             {off_us:6.2f} us  (budget {OFF_BUDGET_US} us)")
+    print(f"per request, sampling on, no turn id  {no_header_us:6.2f} us")
+    print(f"per request, sampled turn             {sampled_us:6.2f} us")
+
+    app_client = make_app().test_client()
+
+    class Client:
+        """The test client, reading each response through like a server
+        sending it would (a traced request's span ends when it's sent)"""
+        def __getattr__(self, name):
+            call = getattr(app_client, name)
+
+            def read(*args, **kwargs):
+                response = call(*args, **kwargs)
+                response.get_data()
+                response.close()
+                return response
+            return read
+    client = Client()
+
+    # A sampled turn: the request, its phases and the browser's spans
+    turn_id = sampled_id()
+    response = client.post("/respond", headers={tracing.TURN_HEADER: turn_id})
+    check(response.headers.get(tracing.SAMPLED_HEADER) == "1", "sampled request not marked sampled")
+    spans = TURNS.turns().get(turn_id, [])
+    requests = [span for span in spans if span.kind == "request"]
+    phases = {span.name: span for span in spans if span.kind == "phase"}
+    check(len(requests) == 1 and requests[0].status == "200", f"expected one 200 request span, got {requests}")
+    check(set(phases) == {"intent", "disk"}, f"expected intent and disk phases, got {sorted(phases)}")
+    if requests and set(phases) == {"intent", "disk"}:
+        request = requests[0]
+        check(all(span.parent_id == request.span_id for span in phases.values()), "phases not under their request")
+        check(request.start <= phases["intent"].start <= phases["disk"].start
+              and phases["disk"].end <= phases["intent"].end <= request.end, "phases outside their request")
+        response = client.post("/traces/spans", json={
+            "turn_id": turn_id, "first_request_ms": 0,
+            "spans": [{"name": "asr", "start_ms": -800, "end_ms": 0},
+                      {"name": "tts", "start_ms": 20, "end_ms": 60},
+                      {"name": "playback", "start_ms": 60, "end_ms": 1500}]})
+        check(response.status_code == 204, f"client spans answered {response.status_code}")
+        asr = next((span for span in TURNS.turns()[turn_id] if span.name == "asr"), None)
+        check(asr is not None and abs(asr.end - request.start) < 1e-6 and abs(asr.start - request.start + 0.8) < 1e-6,
+              "browser spans not lined up with the first request")
+        row = next(row for row in tracing.breakdown() if row["turn_id"] == turn_id)
+        stages = row["stages"]
+        check(abs(stages["intent"] + stages["disk"] - (phases["intent"].end - phases["intent"].start) * 1000) < 0.01,
+              f"nested phases counted twice: {stages}")
+        check(3.5 < stages["intent"] < 10 and 1.5 < stages["disk"] < 10, f"phase times off: {stages}")
+        check(abs(row["total_ms"] - 2300) < 5, f"turn total {row['total_ms']} ms, expected about 2300")
+        check(list(stages)[:len(tracing.STAGES)] == list(tracing.STAGES), "stages out of order")
+    check(client.post("/traces/spans", json={"turn_id": "bad id!", "first_request_ms": 0, "spans": []})
+          .status_code == 400, "bad client turn id accepted")
+
+    # The llm phase of a streamed response runs while the body is sent
+    stream_id = sampled_id("stream")
+    response = client.post("/stream", headers={tracing.TURN_HEADER: stream_id})
+    check(response.get_data(as_text=True).count("event:") == 3, "stream cut short")
+    response.close()
+    spans = TURNS.turns().get(stream_id, [])
+    request = next((span for span in spans if span.kind == "request"), None)
+    llm = next((span for span in spans if span.name == "llm"), None)
+    check(request is not None and llm is not None and llm.parent_id == request.span_id and llm.end <= request.end,
+          "streamed llm phase not caught in its request")
+
+    # Unsampled turns, and everything with sampling off, leave no trace
+    tracing.set_sample_rate(0.25)
+    unsampled = next(f"skip-{n}" for n in range(1000) if not tracing.sampled(f"skip-{n}"))
+    response = client.post("/respond", headers={tracing.TURN_HEADER: unsampled})
+    check(tracing.SAMPLED_HEADER not in response.headers and unsampled not in TURNS.turns(), "unsampled turn traced")
+    ids = [f"rate-{n}" for n in range(20_000)]
+    picked = [tracing.sampled(turn) for turn in ids]
+    check(picked == [tracing.sampled(turn) for turn in ids], "sampling not deterministic")
+    check(abs(sum(picked) / len(ids) - 0.25) < 0.02, f"sampled {sum(picked) / len(ids):.3f} of turns at 0.25")
+    tracing.set_sample_rate(0)
+    off_id = "off-turn"
+    response = client.post("/respond", headers={tracing.TURN_HEADER: off_id})
+    check(tracing.SAMPLED_HEADER not in response.headers and off_id not in TURNS.turns(), "traced with sampling off")
+    check(tracing._on_phase not in tracing.metrics.PHASE_LISTENERS, "phase listener left on with sampling off")
+
+    # Exports
+    chrome = json.loads(client.get("/traces/chrome.json").get_data())
+    events = [event for event in chrome["traceEvents"] if event["ph"] == "X"]
+    check(len(events) == sum(len(spans) for spans in TURNS.turns().values()), "chrome trace is missing spans")
+    check(all(event["dur"] >= 0 and event["ts"] > 1e15 for event in events), "chrome trace times off")
+    otlp = json.loads(client.get("/traces/otlp.json").get_data())
+    spans = otlp["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    ids = {span["spanId"] for span in spans}
+    check(all(len(span["traceId"]) == 32 and len(span["spanId"]) == 16 for span in spans), "bad OTLP ids")
+    check(all(span.get("parentSpanId") in ids for span in spans if span["name"] != "voice turn"),
+          "OTLP span with a missing parent")
+    check(all(int(span["startTimeUnixNano"]) <= int(span["endTimeUnixNano"]) for span in spans), "OTLP times off")
+    disk = next(span for span in spans if span["name"] == "disk")
+    intent = next(span for span in spans if span["name"] == "intent")
+    check(disk["parentSpanId"] == intent["spanId"], "disk phase not under the intent phase it ran in")
+    page = client.get("/traces")
+    check(page.status_code == 200 and turn_id in page.get_data(as_text=True), "traces page missing the turn")
+    check(client.get("/trace.js").status_code == 200, "trace.js not served")
+
+    # Only the newest turns are kept
+    tracing.set_sample_rate(1.0)
+    limit, TURNS.limit = TURNS.limit, 50
+    for n in range(80):
+        tracing.finish(tracing.start("bench", f"ring-{n}", "GET /"))
+    kept = TURNS.turns()
+    check(len(kept) == 50 and "ring-79" in kept and "ring-29" not in kept, f"kept {len(kept)} turns, not the newest 50")
+    TURNS.limit = limit
+    tracing.set_sample_rate(0)
+
+    for failure in failures:
+        print(f"  FAIL {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+// Browser side of voice-agent-tracing: tags a voice turn's requests with
+// an X-Turn-ID and, if the server sampled the turn, posts the turn's
+// browser spans (asr, tts, playback) to traces/spans once it is over.
+//
+//   voiceTrace.listening()              // recognition started
+//   const turn = voiceTrace.turn()      // final transcript is in
+//   const r = await turn.fetch("api/respond", {...})
+//   turn.play(audio)  or  turn.speak(utterance)   // before it starts
+//   turn.finish()                       // sent when playback has ended
+//
+// Span times are ms from turn(); the server lines them up with its own by
+// the time of the turn's first request.
+(function () {
+  let listeningSince = null
+
+  function newId() {
+    const bytes = new Uint8Array(8)
+    crypto.getRandomValues(bytes)
+    return Array.from(bytes, b => b.toString(16).padStart(2, "0")).join("")
+  }
+
+  function turn() {
+    const t0 = performance.now()
+    const now = () => performance.now() - t0
+    const id = newId()
+    const spans = []
+    let firstRequest = null
+    let sampled = false
+    let pending = 0
+    let finished = false
+    let sent = false
+
+    if (listeningSince !== null) {
+      spans.push({ name: "asr", start_ms: listeningSince - t0, end_ms: 0 })
+      listeningSince = null
+    }
+
+    function send() {
+      if (sent || !finished || pending > 0) return
+      sent = true
+      if (!sampled || firstRequest === null) return
+      fetch("traces/spans", {
+        method: "POST",
+        headers: { "content-type": "application/json" },
+        body: JSON.stringify({ turn_id: id, first_request_ms: firstRequest, spans }),
+        keepalive: true
+      }).catch(() => {})
+    }
+
+    // Calls done() once, from whichever of the events comes first
+    function waitFor(target, events, done) {
+      pending++
+      let over = false
+      const once = () => {
+        if (over) return
+        over = true
+        done()
+        pending--
+        send()
+      }
+      events.forEach(e => target.addEventListener(e, once, { once: true }))
+    }
+
+    return {
+      id,
+
+      async fetch(url, opts = {}) {
+        const headers = new Headers(opts.headers || {})
+        headers.set("X-Turn-ID", id)
+        if (firstRequest === null) firstRequest = now()
+        const res = await fetch(url, { ...opts, headers })
+        if (res.headers.get("X-Turn-Sampled")) sampled = true
+        return res
+      },
+
+      span(name, start_ms, end_ms) {
+        spans.push({ name, start_ms, end_ms })
+      },
+
+      // speechSynthesis: tts until it starts talking, playback until done
+      speak(utterance) {
+        const asked = now()
+        let started = null
+        utterance.addEventListener("start", () => {
+          started = now()
+          spans.push({ name: "tts", start_ms: asked, end_ms: started })
+        })
+        waitFor(utterance, ["end", "error"], () => {
+          if (started !== null) spans.push({ name: "playback", start_ms: started, end_ms: now() })
+        })
+      },
+
+      // An <audio> or Audio(): tts (fetching it) until it plays, playback until done
+      play(audio) {
+        const asked = now()
+        let started = null
+        audio.addEventListener("playing", () => {
+          started = now()
+          spans.push({ name: "tts", start_ms: asked, end_ms: started })
+        }, { once: true })
+        waitFor(audio, ["ended", "error", "pause"], () => {
+          if (started !== null) spans.push({ name: "playback", start_ms: started, end_ms: now() })
+        })
+      },
+
+      finish() {
+        finished = true
+        send()
+      }
+    }
+  }
+
+  window.voiceTrace = {
+    listening() { listeningSince = performance.now() },
+    turn
+  }
+})()
@@ -0,0 +1,422 @@
+"""Per-turn tracing for the voice agents: where a voice turn's time goes.
+
+A voice turn is browser ASR -> HTTP -> intent handling -> (LLM) -> TTS ->
+playback. The browser makes up a turn id when the final transcript is in
+and sends it as X-Turn-ID on the turn's requests (trace.js does this, and
+is served by every traced app at trace.js). For a sampled turn:
+
+  - every request is a span, from the app getting it until its response
+    body has been sent
+  - every metrics phase() timer inside the request (intent, llm, tts, disk;
+    see voice-agent-metrics) is a span inside that one
+  - the browser posts its own spans (asr, tts, playback) to traces/spans
+    afterwards, if a response came back with X-Turn-Sampled; they are
+    placed relative to the turn's first request, so on a remote client
+    they are off by about the one-way network time
+
+Spans are kept per turn for the TRACE_MAX_TURNS most recent turns (the
+oldest turn is dropped first). trace_turns(app, name) adds to a Flask app:
+
+  traces               the slowest turns, stage by stage (?limit=, ?format=json)
+  traces/chrome.json   everything, in the Chrome trace event format
+                       (chrome://tracing, ui.perfetto.dev)
+  traces/otlp.json     everything, as OTLP/JSON resource spans
+  traces/spans         POST, for the browser's spans
+
+and with TRACE_FILE set, the Chrome trace is written there at exit.
+
+TRACE_SAMPLE (0 to 1, default 0) is the fraction of turns traced, picked
+by a hash of the turn id, so every request of a turn, in whichever app or
+process, makes the same decision. At 0 the apps' X-Turn-ID headers are
+ignored and phase timers are not listened to; bench_tracing.py checks
+that what is left costs a request well under a microsecond.
+"""
+import atexit
+import contextlib
+import contextvars
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import zlib
+from collections import OrderedDict
+from time import perf_counter, time_ns
+
+from flask import Response, jsonify, request, send_from_directory
+
+# Spans come from the metrics module's phase timers; it lives next to this folder
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "voice-agent-metrics"))
+import metrics
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TURN_HEADER = "X-Turn-ID"
+SAMPLED_HEADER = "X-Turn-Sampled"
+SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE", "0"))
+MAX_TURNS = int(os.getenv("TRACE_MAX_TURNS", "1000"))
+TRACE_FILE = os.getenv("TRACE_FILE")
+# A turn that keeps going (a client reusing its id) stops collecting here
+MAX_SPANS = 256
+MAX_CLIENT_SPANS = 16
+TURN_ID = re.compile(r"[A-Za-z0-9_-]{1,64}")
+SPAN_NAME = re.compile(r"[a-z_]{1,32}")
+# Breakdown columns, in the order a turn goes through them
+STAGES = ("asr", "intent", "llm", "disk", "server other", "tts", "playback", "network and client")
+
+# perf_counter() is what the spans are timed with; this maps it to wall time
+_PERF0 = perf_counter()
+_WALL0_NS = time_ns()
+
+
+def _unix_ns(t):
+    return _WALL0_NS + int((t - _PERF0) * 1e9)
+
+
+class Span:
+    __slots__ = ("turn_id", "name", "app", "kind", "start", "end", "span_id", "parent_id", "status")
+
+    def __init__(self, turn_id, name, app, kind, start, end=None, parent_id=None):
+        self.turn_id = turn_id
+        self.name = name
+        self.app = app
+        # "request", "phase" or "client"
+        self.kind = kind
+        self.start = start
+        self.end = end
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.status = None
+
+
+class TurnBuffer:
+    """Spans of the `limit` most recent turns"""
+
+    def __init__(self, limit=MAX_TURNS):
+        self.limit = limit
+        self._turns = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            spans = self._turns.pop(span.turn_id, None)
+            if spans is None:
+                spans = []
+                if len(self._turns) >= self.limit:
+                    self._turns.popitem(last=False)
+            self._turns[span.turn_id] = spans
+            if len(spans) < MAX_SPANS:
+                spans.append(span)
+
+    def add_client(self, turn_id, first_request_ms, spans):
+        """The browser's spans, timed in ms from when it had the final
+        transcript; placed by lining up its first request with the first
+        request the server saw. False if the turn isn't here."""
+        with self._lock:
+            recorded = self._turns.get(turn_id)
+            requests = [span.start for span in recorded or () if span.kind == "request"]
+            if not requests:
+                return False
+            anchor = min(requests) - first_request_ms / 1000
+            for name, start_ms, end_ms in spans[:MAX_CLIENT_SPANS]:
+                if len(recorded) < MAX_SPANS:
+                    recorded.append(Span(turn_id, name, "browser", "client",
+                                         anchor + start_ms / 1000, anchor + end_ms / 1000))
+            return True
+
+    def turns(self):
+        """{turn id: spans}, oldest turn first"""
+        with self._lock:
+            return {turn_id: list(spans) for turn_id, spans in self._turns.items()}
+
+    def clear(self):
+        with self._lock:
+            self._turns.clear()
+
+
+TURNS = TurnBuffer()
+# The request span phases inside it belong to
+_current = contextvars.ContextVar("trace_request", default=None)
+
+
+def sampled(turn_id):
+    return SAMPLE_RATE > 0 and zlib.crc32(turn_id.encode()) < SAMPLE_RATE * 2**32
+
+
+def _on_phase(phase, start, end):
+    parent = _current.get()
+    if parent is not None:
+        TURNS.add(Span(parent.turn_id, phase, parent.app, "phase", start, end, parent.span_id))
+
+
+def set_sample_rate(rate):
+    """Change TRACE_SAMPLE at run time"""
+    global SAMPLE_RATE
+    SAMPLE_RATE = rate
+    if rate > 0 and _on_phase not in metrics.PHASE_LISTENERS:
+        metrics.PHASE_LISTENERS.append(_on_phase)
+    elif rate <= 0 and _on_phase in metrics.PHASE_LISTENERS:
+        metrics.PHASE_LISTENERS.remove(_on_phase)
+
+
+set_sample_rate(SAMPLE_RATE)
+
+
+def start(app, turn_id, name):
+    """A request span for turn_id if it is a sampled turn, else None.
+    Phases only land in it while it is active()."""
+    if not SAMPLE_RATE or turn_id is None or not TURN_ID.fullmatch(turn_id) or not sampled(turn_id):
+        return None
+    return Span(turn_id, name, app, "request", perf_counter())
+
+
+@contextlib.contextmanager
+def active(span):
+    token = _current.set(span)
+    try:
+        yield
+    finally:
+        try:
+            _current.reset(token)
+        except ValueError:  # closed from another thread or task than it was opened in
+            pass
+
+
+def finish(span, status=None):
+    """End a request span and keep it (again is a no-op)"""
+    if span.end is None:
+        span.end = perf_counter()
+        span.status = status
+        TURNS.add(span)
+
+
+class _TracedBody:
+    """A traced response's body: the span stays active while it is sent,
+    for streamed responses' phases, and ends when it is done"""
+
+    def __init__(self, body, span, status):
+        self.body = body
+        self.span = span
+        self.status = status
+
+    def __iter__(self):
+        with active(self.span):
+            yield from self.body
+        finish(self.span, self.status[0])
+
+    def close(self):
+        try:
+            if hasattr(self.body, "close"):
+                self.body.close()
+        finally:
+            finish(self.span, self.status[0])
+
+
+class _TracedApp:
+    """WSGI wrapper around a Flask app's wsgi_app that traces sampled turns"""
+
+    def __init__(self, wsgi_app, name):
+        self.wsgi_app = wsgi_app
+        self.name = name
+
+    def __call__(self, environ, start_response):
+        turn_id = environ.get("HTTP_X_TURN_ID")
+        if turn_id is None or not SAMPLE_RATE:
+            return self.wsgi_app(environ, start_response)
+        span = start(self.name, turn_id, f"{environ['REQUEST_METHOD']} {environ.get('PATH_INFO', '/')}")
+        if span is None:
+            return self.wsgi_app(environ, start_response)
+        status = ["500"]
+
+        def start_response_sampled(status_line, headers, exc_info=None):
+            status[0] = status_line[:3]
+            return start_response(status_line, headers + [(SAMPLED_HEADER, "1")], exc_info)
+
+        try:
+            with active(span):
+                body = self.wsgi_app(environ, start_response_sampled)
+        except BaseException:
+            finish(span, "500")
+            raise
+        return _TracedBody(body, span, status)
+
+
+def _enclosing(spans):
+    """{phase span: the innermost other phase of its request it ran inside}
+    (the intent phase takes in the disk phase when an intent saves)"""
+    phases = [span for span in spans if span.kind == "phase"]
+    enclosing = {}
+    for span in phases:
+        outer = [other for other in phases if other is not span and other.parent_id == span.parent_id
+                 and other.start <= span.start and span.end <= other.end]
+        if outer:
+            enclosing[span] = min(outer, key=lambda other: other.end - other.start)
+    return enclosing
+
+
+def breakdown(limit=20):
+    """The slowest turns, longest first, with the time in each stage (ms)"""
+    rows = []
+    for turn_id, spans in TURNS.turns().items():
+        stages = dict.fromkeys(STAGES, 0.0)
+        server = phases = client = 0.0
+        enclosing = _enclosing(spans)
+        for span in spans:
+            ms = (span.end - span.start) * 1000
+            if span.kind == "request":
+                server += ms
+            elif span.kind == "phase":
+                # A phase's time is its own, less the phases inside it
+                if span in enclosing:
+                    outer = enclosing[span]
+                    stages[outer.name] = stages.get(outer.name, 0.0) - ms
+                else:
+                    phases += ms
+                stages[span.name] = stages.get(span.name, 0.0) + ms
+            else:
+                client += ms
+                stages[span.name] = stages.get(span.name, 0.0) + ms
+        total = (max(span.end for span in spans) - min(span.start for span in spans)) * 1000
+        stages["server other"] = max(server - phases, 0.0)
+        stages["network and client"] = max(total - server - client, 0.0)
+        rows.append({"turn_id": turn_id, "apps": sorted({span.app for span in spans if span.kind != "client"}),
+                     "started_at_ns": _unix_ns(min(span.start for span in spans)), "total_ms": round(total, 3),
+                     "server_ms": round(server, 3),
+                     "stages": {name: round(ms, 3) for name, ms in stages.items()}})
+    rows.sort(key=lambda row: row["total_ms"], reverse=True)
+    return rows[:limit]
+
+
+def render_breakdown(rows):
+    """breakdown() as an HTML page: a table, and a bar per turn"""
+    names = list(dict.fromkeys(name for row in rows for name in row["stages"]))
+    colors = ["#5b8def", "#f2a541", "#e05d5d", "#8e6bd8", "#9aa5b1", "#3fb68b", "#2d9cdb", "#d0d4d9",
+              "#c97b2c", "#6c8a3d"]
+    palette = {name: colors[n % len(colors)] for n, name in enumerate(names)}
+    longest = max((row["total_ms"] for row in rows), default=0) or 1
+    head = "".join(f'<th><span class="key" style="background:{palette[n]}"></span>{n}</th>' for n in names)
+    body = []
+    for row in rows:
+        bar = "".join(f'<span style="width:{ms / longest * 100:.2f}%;background:{palette[name]}" '
+                      f'title="{name} {ms:.1f} ms"></span>' for name, ms in row["stages"].items() if ms > 0)
+        cells = "".join(f"<td>{row['stages'].get(name, 0):.1f}</td>" for name in names)
+        body.append(f"<tr><td><code>{row['turn_id']}</code></td><td>{', '.join(row['apps'])}</td>"
+                    f"<td><b>{row['total_ms']:.1f}</b></td>{cells}<td class=\"bar\">{bar}</td></tr>")
+    return f"""<!doctype html>
+<meta charset="utf-8">
+<title>Slowest voice turns</title>
+<style>
+body {{ font: 14px system-ui, sans-serif; margin: 2em; }}
+table {{ border-collapse: collapse; }}
+th, td {{ padding: 4px 8px; text-align: right; border-bottom: 1px solid #eee; white-space: nowrap; }}
+td:first-child, td:nth-child(2) {{ text-align: left; }}
+.key {{ display: inline-block; width: 10px; height: 10px; margin-right: 4px; }}
+.bar {{ width: 400px; }}
+.bar span {{ display: inline-block; height: 12px; }}
+</style>
+<h1>Slowest voice turns</h1>
+<p>{len(rows)} turns, times in ms; sampling {SAMPLE_RATE:g} of turns.
+Also as <a href="traces?format=json">JSON</a>, a <a href="traces/chrome.json">Chrome trace</a>
+and <a href="traces/otlp.json">OTLP</a>.</p>
+<table>
+<tr><th>turn</th><th>apps</th><th>total</th>{head}<th></th></tr>
+{"".join(body)}
+</table>
+"""
+
+
+def chrome_trace():
+    """Every kept turn in the Chrome trace event format, a row per turn"""
+    events = [{"name": "process_name", "ph": "M", "pid": 1, "tid": 0, "args": {"name": "voice turns"}}]
+    for tid, (turn_id, spans) in enumerate(TURNS.turns().items(), 1):
+        events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": turn_id}})
+        for span in sorted(spans, key=lambda span: span.start):
+            args = {"turn_id": turn_id, "app": span.app}
+            if span.status:
+                args["status"] = span.status
+            events.append({"name": span.name, "cat": span.kind, "ph": "X", "pid": 1, "tid": tid,
+                           "ts": _unix_ns(span.start) / 1000, "dur": (span.end - span.start) * 1e6, "args": args})
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def _attribute(key, value):
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def otlp():
+    """Every kept turn as OTLP/JSON: a trace per turn, with a root span
+    covering it; requests and browser spans under the root, phases under
+    their request (or the phase they ran inside)"""
+    kinds = {"request": 2, "phase": 1, "client": 3}
+    out = []
+    for turn_id, spans in TURNS.turns().items():
+        enclosing = _enclosing(spans)
+        trace_id = hashlib.sha256(turn_id.encode()).hexdigest()[:32]
+        root_id = trace_id[:16]
+        out.append({"traceId": trace_id, "spanId": root_id, "name": "voice turn", "kind": 1,
+                    "startTimeUnixNano": str(_unix_ns(min(span.start for span in spans))),
+                    "endTimeUnixNano": str(_unix_ns(max(span.end for span in spans))),
+                    "attributes": [_attribute("voice.turn_id", turn_id)]})
+        for span in spans:
+            attributes = [_attribute("voice.turn_id", turn_id), _attribute("voice.app", span.app)]
+            if span.status:
+                attributes.append({"key": "http.response.status_code", "value": {"intValue": span.status}})
+            parent = enclosing[span].span_id if span in enclosing else span.parent_id or root_id
+            out.append({"traceId": trace_id, "spanId": span.span_id, "parentSpanId": parent,
+                        "name": span.name, "kind": kinds[span.kind],
+                        "startTimeUnixNano": str(_unix_ns(span.start)), "endTimeUnixNano": str(_unix_ns(span.end)),
+                        "attributes": attributes})
+    return {"resourceSpans": [{
+        "resource": {"attributes": [_attribute("service.name", "voice-agents")]},
+        "scopeSpans": [{"scope": {"name": "voice-agent-tracing"}, "spans": out}],
+    }]}
+
+
+def write(path, format="chrome"):
+    """Export every kept turn to a file, as "chrome" or "otlp" JSON"""
+    with open(path, "w") as f:
+        json.dump(chrome_trace() if format == "chrome" else otlp(), f)
+
+
+if TRACE_FILE:
+    atexit.register(write, TRACE_FILE)
+
+
+def _traces():
+    rows = breakdown(request.args.get("limit", 20, type=int))
+    if request.args.get("format") == "json":
+        return jsonify({"sample_rate": SAMPLE_RATE, "turns": rows})
+    return Response(render_breakdown(rows), mimetype="text/html")
+
+
+def _download(document, filename):
+    return Response(json.dumps(document), mimetype="application/json",
+                    headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+def _client_spans():
+    data = request.get_json(silent=True)
+    try:
+        turn_id = data["turn_id"]
+        first_request_ms = float(data["first_request_ms"])
+        spans = [(span["name"], float(span["start_ms"]), float(span["end_ms"])) for span in data["spans"]]
+    except (TypeError, KeyError, ValueError):
+        return jsonify({"error": "expected turn_id, first_request_ms and spans"}), 400
+    if not isinstance(turn_id, str) or not TURN_ID.fullmatch(turn_id) \
+            or not all(isinstance(name, str) and SPAN_NAME.fullmatch(name) and end >= start
+                       for name, start, end in spans):
+        return jsonify({"error": "bad turn_id or span"}), 400
+    if sampled(turn_id):
+        TURNS.add_client(turn_id, first_request_ms, spans)
+    return "", 204
+
+
+def trace_turns(app, name):
+    """Trace sampled turns' requests to a Flask app, and add the traces
+    views and trace.js"""
+    app.wsgi_app = _TracedApp(app.wsgi_app, name)
+    app.add_url_rule("/traces", "traces", _traces)
+    app.add_url_rule("/traces/chrome.json", "traces_chrome", lambda: _download(chrome_trace(), "voice-turns.json"))
+    app.add_url_rule("/traces/otlp.json", "traces_otlp", lambda: _download(otlp(), "voice-turns-otlp.json"))
+    app.add_url_rule("/traces/spans", "traces_spans", _client_spans, methods=["POST"])
+    app.add_url_rule("/trace.js", "trace_js", lambda: send_from_directory(HERE, "trace.js"))